@@ -7,7 +7,8 @@ components about the location of API endpoints in a general way.
 
 The current workflow for impersonating a customer is as follows:
 
-#. Authenticate as our service account (username: autoscale)
+#. Authenticate as our service account (username: autoscale), reusing the
+   token from a previous authentication until it is about to expire
 #. Given a tenant ID
 
  #. Find a user for that tenant ID.
@@ -37,17 +38,26 @@ a token.)
 """
 
 import json
+import random
+from calendar import timegm
+from collections import OrderedDict
 from itertools import groupby
 
 from twisted.internet.defer import succeed, Deferred
 
 from zope.interface import Interface, implementer
 
-import treq
-
 from otter.log import log
 from otter.util.http import (
-    headers, check_success, append_segments, wrap_request_error)
+    APIError, RequestError, headers, check_success, append_segments,
+    wrap_request_error)
+from otter.util.pool import treq
+from otter.util.timestamp import from_timestamp
+
+
+# How long before a token expires to stop using it, so that requests made with
+# it do not fail because it expired on the way.
+TOKEN_EXPIRY_MARGIN = 300
 
 
 class IAuthenticator(Interface):
@@ -62,24 +72,70 @@ class IAuthenticator(Interface):
         """
 
 
+class IExpiringAuthenticator(IAuthenticator):
+    """
+    Authenticators that know when the tokens they get expire.
+    """
+    def authenticate_tenant_with_expiry(tenant_id):
+        """
+        :param tenant_id: A keystone tenant ID to authenticate as.
+
+        :returns: 3-tuple of auth token, service catalog, and when the token
+            expires in seconds since the epoch, or ``None`` if that is not
+            known.
+        """
+
+
+# Number of tenant authentications served from the cache, authenticated
+# because nothing usable was cached, refreshed ahead of expiry, and evicted to
+# keep the cache within its size, across all caching authenticators
+_cache_counts = {'hits': 0, 'misses': 0, 'refreshes': 0, 'evictions': 0}
+
+
+def cache_stats():
+    """
+    :return: ``dict`` of the number of tenant authentication cache hits,
+        misses, refreshes and evictions
+    """
+    return dict(_cache_counts)
+
+
 @implementer(IAuthenticator)
 class CachingAuthenticator(object):
     """
     An authenticator which cases the result of the provided auth_function
     based on the tenant_id.
 
+    If the authenticator provides :class:`IExpiringAuthenticator`, an entry
+    lasts until shortly before its token expires, otherwise it lasts ``ttl``
+    seconds.  Each entry's lifetime is shortened by a random fraction of up to
+    ``jitter`` of it, so that entries cached together do not all expire
+    together.  An entry used within ``refresh_window`` seconds of expiring is
+    refreshed in the background, so that callers do not wait for it to be
+    authenticated again.  Beyond ``max_size`` entries, the least recently used
+    are evicted.
+
     :param IReactorTime reactor: An IReactorTime provider used for enforcing
         the cache TTL.
     :param IAuthenticator authenticator:
     :param int ttl: An integer indicating the TTL of a cache entry in seconds.
+    :param int max_size: The most tenants to cache, or ``None`` for no limit.
+    :param int refresh_window: How many seconds before an entry expires using
+        it refreshes it.
+    :param float jitter: The largest fraction of an entry's lifetime it may be
+        shortened by.
     """
-    def __init__(self, reactor, authenticator, ttl):
+    def __init__(self, reactor, authenticator, ttl, max_size=None,
+                 refresh_window=0, jitter=0):
         self._reactor = reactor
         self._authenticator = authenticator
         self._ttl = ttl
+        self._max_size = max_size
+        self._refresh_window = refresh_window
+        self._jitter = jitter
 
         self._waiters = {}
-        self._cache = {}
+        self._cache = OrderedDict()
         self._log = log.bind(system='otter.auth.cache',
                              authenticator=authenticator,
                              cache_ttl=ttl)
@@ -91,11 +147,21 @@ class CachingAuthenticator(object):
         log = self._log.bind(tenant_id=tenant_id)
 
         if tenant_id in self._cache:
-            (created, data) = self._cache[tenant_id]
+            # Popped and put back so that it becomes the most recently used
+            (created, expires, data) = self._cache.pop(tenant_id)
             now = self._reactor.seconds()
 
-            if now - created <= self._ttl:
+            if now <= expires:
+                self._cache[tenant_id] = (created, expires, data)
                 log.msg('otter.auth.cache.hit', age=now - created)
+                _cache_counts['hits'] += 1
+
+                if now > expires - self._refresh_window and tenant_id not in self._waiters:
+                    log.msg('otter.auth.cache.refresh', age=now - created)
+                    _cache_counts['refreshes'] += 1
+                    d = self._authenticate(tenant_id, log)
+                    d.addErrback(log.err, 'otter.auth.cache.refresh_failed')
+
                 return succeed(data)
 
             log.msg('otter.auth.cache.expired', age=now - created)
@@ -107,9 +173,30 @@ class CachingAuthenticator(object):
                     waiters=len(self._waiters[tenant_id]))
             return d
 
-        def when_authenticated(result):
+        log.msg('otter.auth.cache.miss')
+        _cache_counts['misses'] += 1
+        return self._authenticate(tenant_id, log)
+
+    def _authenticate(self, tenant_id, log):
+        """
+        Authenticate ``tenant_id`` with the wrapped authenticator and cache the
+        result, firing the callers waiting for it.
+        """
+        def when_authenticated((token, catalog, token_expires)):
             log.msg('otter.auth.cache.populate')
-            self._cache[tenant_id] = (self._reactor.seconds(), result)
+            now = self._reactor.seconds()
+            if token_expires is None:
+                lifetime = self._ttl
+            else:
+                lifetime = token_expires - TOKEN_EXPIRY_MARGIN - now
+            lifetime -= lifetime * self._jitter * random.random()
+
+            result = (token, catalog)
+            self._cache.pop(tenant_id, None)
+            self._cache[tenant_id] = (now, now + lifetime, result)
+            while self._max_size is not None and len(self._cache) > self._max_size:
+                self._cache.popitem(last=False)
+                _cache_counts['evictions'] += 1
 
             waiters = self._waiters.pop(tenant_id, [])
             for waiter in waiters:
@@ -124,63 +211,156 @@ class CachingAuthenticator(object):
 
             return failure
 
-        log.msg('otter.auth.cache.miss')
         self._waiters[tenant_id] = []
-        d = self._authenticator.authenticate_tenant(tenant_id)
+        if IExpiringAuthenticator.providedBy(self._authenticator):
+            d = self._authenticator.authenticate_tenant_with_expiry(tenant_id)
+        else:
+            d = self._authenticator.authenticate_tenant(tenant_id)
+            d.addCallback(lambda (token, catalog): (token, catalog, None))
         d.addCallback(when_authenticated)
         d.addErrback(when_auth_fails)
 
         return d
 
 
-@implementer(IAuthenticator)
+@implementer(IExpiringAuthenticator)
 class ImpersonatingAuthenticator(object):
     """
     An authentication handler that first uses a identity admin account to authenticate
     and then impersonates the desired tenant_id.
+
+    The identity admin token is reused for every tenant until shortly before it
+    expires, or until the admin API rejects it, rather than authenticating as
+    the identity admin for each tenant.
+
+    :param IReactorTime reactor: An IReactorTime provider whose ``seconds`` is
+        the time since the epoch, used to tell when the identity admin token
+        expires.  Defaults to the global reactor.
     """
-    def __init__(self, identity_admin_user, identity_admin_password, url, admin_url):
+    def __init__(self, identity_admin_user, identity_admin_password, url, admin_url,
+                 reactor=None):
         self._identity_admin_user = identity_admin_user
         self._identity_admin_password = identity_admin_password
         self._url = url
         self._admin_url = admin_url
 
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+
+        self._token = None
+        self._token_expires = None
+        self._token_waiters = None
+        self._log = log.bind(system='otter.auth.impersonating')
+
+    def _identity_admin_token(self):
+        """
+        Get an identity admin token, authenticating as the identity admin only
+        if there is no cached token or it is about to expire.  Only one
+        authentication request is made at a time; calls made while it is in
+        flight wait for its result.
+
+        :return: Deferred that fires with the token
+        """
+        if self._token is not None:
+            if (self._token_expires is None or
+                    self._reactor.seconds() < self._token_expires - TOKEN_EXPIRY_MARGIN):
+                return succeed(self._token)
+            self._log.msg('otter.auth.admin_token.expired')
+            self._token = None
+
+        d = Deferred()
+        if self._token_waiters is not None:
+            self._token_waiters.append(d)
+            return d
+        self._token_waiters = [d]
+
+        def authenticated((token, expires)):
+            self._token, self._token_expires = token, expires
+            self._log.msg('otter.auth.admin_token.populate',
+                          expires=self._token_expires)
+            waiters, self._token_waiters = self._token_waiters, None
+            for waiter in waiters:
+                waiter.callback(self._token)
+
+        def auth_failed(failure):
+            waiters, self._token_waiters = self._token_waiters, None
+            for waiter in waiters:
+                waiter.errback(failure)
+
+        self._log.msg('otter.auth.admin_token.authenticate')
+        auth_d = authenticate_user(self._url,
+                                   self._identity_admin_user,
+                                   self._identity_admin_password)
+        auth_d.addCallback(lambda auth_response: (extract_token(auth_response),
+                                                  extract_token_expiry(auth_response)))
+        auth_d.addCallbacks(authenticated, auth_failed)
+        return d
+
+    def _invalidate_identity_admin_token(self, token):
+        """
+        Forget the identity admin token ``token`` if it is still the cached
+        one, so that the next request authenticates again.
+        """
+        if self._token == token:
+            self._log.msg('otter.auth.admin_token.invalidate')
+            self._token = None
+
     def authenticate_tenant(self, tenant_id):
         """
         see :meth:`IAuthenticator.authenticate_tenant`
         """
-        d = authenticate_user(self._url,
-                              self._identity_admin_user,
-                              self._identity_admin_password)
-        d.addCallback(extract_token)
-
-        def find_user(identity_admin_token):
-            d = user_for_tenant(self._admin_url,
-                                self._identity_admin_user,
-                                self._identity_admin_password,
-                                tenant_id)
-            d.addCallback(lambda username: (identity_admin_token, username))
+        d = self.authenticate_tenant_with_expiry(tenant_id)
+        d.addCallback(lambda (token, catalog, expires): (token, catalog))
+        return d
+
+    def authenticate_tenant_with_expiry(self, tenant_id):
+        """
+        see :meth:`IExpiringAuthenticator.authenticate_tenant_with_expiry`
+        """
+        d = user_for_tenant(self._admin_url,
+                            self._identity_admin_user,
+                            self._identity_admin_password,
+                            tenant_id)
+
+        def impersonate(user, retry):
+            def unauthorized(failure, identity_admin_token):
+                if retry and is_unauthorized(failure):
+                    self._invalidate_identity_admin_token(identity_admin_token)
+                    return impersonate(user, False)
+                return failure
+
+            def with_token(identity_admin_token):
+                idd = self._impersonate(identity_admin_token, user)
+                idd.addErrback(unauthorized, identity_admin_token)
+                return idd
+
+            d = self._identity_admin_token()
+            d.addCallback(with_token)
             return d
 
-        d.addCallback(find_user)
+        d.addCallback(impersonate, True)
+        return d
 
-        def impersonate((identity_admin_token, user)):
-            iud = impersonate_user(self._admin_url,
-                                   identity_admin_token,
-                                   user)
-            iud.addCallback(extract_token)
-            iud.addCallback(lambda token: (identity_admin_token, token))
-            return iud
+    def _impersonate(self, identity_admin_token, user):
+        """
+        Impersonate ``user`` and get the endpoints for the impersonation
+        token, using ``identity_admin_token``.
 
-        d.addCallback(impersonate)
+        :return: Deferred that fires with the 3-tuple of the impersonation
+            token, service catalog, and when the token expires
+        """
+        d = impersonate_user(self._admin_url, identity_admin_token, user)
 
-        def endpoints((identity_admin_token, token)):
+        def endpoints(auth_response):
+            token = extract_token(auth_response)
             scd = endpoints_for_token(self._admin_url, identity_admin_token, token)
-            scd.addCallback(lambda endpoints: (token, _endpoints_to_service_catalog(endpoints)))
+            scd.addCallback(lambda endpoints: (token,
+                                               _endpoints_to_service_catalog(endpoints),
+                                               extract_token_expiry(auth_response)))
             return scd
 
         d.addCallback(endpoints)
-
         return d
 
 
@@ -195,6 +375,35 @@ def extract_token(auth_response):
     return auth_response['access']['token']['id'].encode('ascii')
 
 
+def extract_token_expiry(auth_response):
+    """
+    Extract when an auth token expires from an authentication response.
+
+    :param dict auth_response: A dictionary containing the decoded response
+        from the authentication API.
+    :return: the expiry time in seconds since the epoch, or ``None`` if the
+        response does not say when the token expires.
+    """
+    expires = auth_response['access']['token'].get('expires')
+    if expires is None:
+        return None
+    return timegm(from_timestamp(expires).utctimetuple())
+
+
+def is_unauthorized(failure):
+    """
+    Whether a failed request to the identity API was rejected with a 401,
+    meaning the token it was made with is no longer valid.
+
+    :param failure: a :class:`Failure` of :class:`RequestError` or
+        :class:`APIError`
+    :rtype: bool
+    """
+    if failure.check(RequestError):
+        failure = failure.value.reason
+    return bool(failure.check(APIError)) and failure.value.code == 401
+
+
 def endpoints_for_token(auth_endpoint, identity_admin_token, user_token):
     """
     Get the list of endpoints from the service_catalog for the specified token.
@@ -292,10 +501,41 @@ def impersonate_user(auth_endpoint, identity_admin_token, username, expire_in=10
     return d
 
 
+class ServiceCatalog(list):
+    """
+    A service catalog in the format from the authentication API, that is a
+    list of services each with a list of endpoints, indexed by service name
+    and region so that an endpoint can be found without searching the list.
+
+    Since authenticators are cached per tenant, the index is built once for
+    all the launches and deletes made for the tenant.
+    """
+    def __init__(self, services):
+        super(ServiceCatalog, self).__init__(services)
+        self._endpoints = {}
+        for service in self:
+            for endpoint in service['endpoints']:
+                self._endpoints.setdefault(
+                    (service['name'], endpoint.get('region')), endpoint)
+
+    def endpoint(self, service_name, region):
+        """
+        :param str service_name: Name of service.  Example: 'cloudServersOpenStack'
+        :param str region: Region of service.  Example: 'ORD'
+
+        :return: the first endpoint of the service in the region, or ``None``
+            if there is none.
+        """
+        return self._endpoints.get((service_name, region))
+
+
 def _endpoints_to_service_catalog(endpoints):
     """
     Convert the endpoint list from the endpoints API to the service catalog format
     from the authentication API.
+
+    :rtype: :class:`ServiceCatalog`
     """
-    return [{'endpoints': list(e), 'name': n, 'type': t}
-            for (n, t), e in groupby(endpoints['endpoints'], lambda i: (i['name'], i['type']))]
+    return ServiceCatalog(
+        {'endpoints': list(e), 'name': n, 'type': t}
+        for (n, t), e in groupby(endpoints['endpoints'], lambda i: (i['name'], i['type'])))
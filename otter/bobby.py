@@ -39,7 +39,7 @@ class BobbyClient(object):
         self.server_endpoint = server_endpoint
         self.treq_client = treq_client
         if self.treq_client is None:
-            import treq
+            from otter.util.pool import treq
             self.treq_client = treq
 
     def create_policy(self, tenant_id, group_id, policy_id, check_template, alarm_template):
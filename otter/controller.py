@@ -23,6 +23,7 @@ Storage model for state information:
 from datetime import datetime
 from decimal import Decimal, ROUND_UP
 from functools import partial
+import hashlib
 import iso8601
 import json
 
@@ -31,7 +32,7 @@ from twisted.internet import defer
 from otter.models.interface import NoSuchScalingGroupError
 from otter.supervisor import get_supervisor
 from otter.json_schema.group_schemas import MAX_ENTITIES
-from otter.util.deferredutils import unwrap_first_error
+from otter.util.hashkey import generate_job_id
 from otter.util.timestamp import from_timestamp
 
 
@@ -94,19 +95,117 @@ def obey_config_change(log, transaction_id, config, scaling_group, state):
     delta = calculate_delta(bound_log, state, config, {'change': 0})
 
     if delta == 0:
-        return defer.succeed(state)
+        deferred = defer.succeed(None)
     elif delta > 0:
         deferred = scaling_group.view_launch_config()
         deferred.addCallback(partial(execute_launch_config, bound_log,
                                      transaction_id, state,
                                      scaling_group=scaling_group, delta=delta))
-        deferred.addCallback(lambda _: state)
-        return deferred
     else:
         # delta < 0 (scale down)
         deferred = exec_scale_down(bound_log, transaction_id, state, scaling_group, -delta)
-        deferred.addCallback(lambda _: state)
-        return deferred
+
+    deferred.addCallback(lambda _: maintain_warm_pool(bound_log, transaction_id, config,
+                                                      None, scaling_group, state))
+    return deferred
+
+
+def launch_config_key(launch):
+    """
+    Identify a launch config, so that servers built for the warm pool from a
+    launch config that has since been replaced are not launched.
+
+    :param dict launch: the scaling group's launch config
+    :return: ``str`` that is the same for equal launch configs
+    """
+    return hashlib.sha1(json.dumps(launch, sort_keys=True)).hexdigest()
+
+
+def maintain_warm_pool(log, transaction_id, config, launch, scaling_group, state):
+    """
+    Keep as many servers in the group's warm pool, built or being built from
+    its launch config, as its config's ``warmPool`` asks for (none if it does
+    not ask for any).
+
+    Servers in the pool that were built from another launch config or are not
+    wanted are removed from the state, and deleted once it has been saved.
+    Jobs building servers that are not wanted are removed, and their servers
+    deleted when they are built.  Jobs building the servers that are missing
+    are added, and started once the state has been saved.
+
+    :param log: A twiggy bound log for logging
+    :param str transaction_id: the transaction id
+    :param dict config: the scaling group config
+    :param dict launch: the scaling group's launch config, which is looked up
+        if it is needed and not given
+    :param scaling_group: an IScalingGroup provider
+    :param state: a :class:`otter.models.interface.GroupState` representing the
+        state
+
+    :return: a ``Deferred`` that fires with the updated
+        :class:`otter.models.interface.GroupState`
+    """
+    size = config.get('warmPool', 0)
+    if not (size or state.warm_servers or state.warm_jobs):
+        return defer.succeed(state)
+
+    if launch is None and size:
+        deferred = scaling_group.view_launch_config()
+    else:
+        deferred = defer.succeed(launch)
+
+    def maintain(launch):
+        key = launch and launch_config_key(launch)
+        supervisor = get_supervisor()
+        wanted = size
+
+        for server_id, info in state.warm_servers.items():
+            if info['launch'] == key and wanted > 0:
+                wanted -= 1
+            else:
+                state.remove_warm_server(server_id)
+                state.after_save(supervisor.execute_delete_server, log, transaction_id,
+                                 scaling_group, {'id': server_id, 'lb_info': {}})
+
+        for job_id, info in state.warm_jobs.items():
+            if info['launch'] == key and wanted > 0:
+                wanted -= 1
+            else:
+                state.remove_warm_job(job_id)
+
+        log.msg('Building {building} servers for the warm pool', building=wanted,
+                warm_pool_size=size)
+        for i in range(wanted):
+            job_id = generate_job_id(scaling_group.uuid)
+            state.add_warm_job(job_id, {'launch': key})
+            state.after_save(_WarmPoolJob(log, transaction_id, scaling_group, supervisor).start,
+                             launch, job_id)
+        return state
+
+    return deferred.addCallback(maintain)
+
+
+def claim_warm_server(state, launch):
+    """
+    Remove a server built from ``launch`` from the group's warm pool, if there
+    is one, so that it can be launched.  Its details are those it had when it
+    was built, so the worker checks it is still active before launching it,
+    and builds another server instead if it is not.
+
+    :param state: a :class:`otter.models.interface.GroupState` representing the
+        state
+    :param dict launch: the scaling group's launch config
+
+    :return: the details of the server claimed, or ``None``
+    """
+    if not state.warm_servers:
+        return None
+    key = launch_config_key(launch)
+    for server_id, info in state.warm_servers.items():
+        if info['launch'] == key:
+            state.remove_warm_server(server_id)
+            return info['server']
+    return None
 
 
 def maybe_execute_scaling_policy(
@@ -138,23 +237,15 @@ def maybe_execute_scaling_policy(
     bound_log = log.bind(scaling_group_id=scaling_group.uuid, policy_id=policy_id)
     bound_log.msg("beginning to execute scaling policy")
 
-    # make sure that the policy (and the group) exists before doing anything else
-    deferred = scaling_group.get_policy(policy_id)
+    # make sure that the policy (and the group) exists before doing anything
+    # else
+    deferred = scaling_group.view_execution_bundle(policy_id)
 
-    def _do_get_configs(policy):
-        deferred = defer.gatherResults([
-            scaling_group.view_config(),
-            scaling_group.view_launch_config()
-        ])
-        return deferred.addCallback(lambda results: results + [policy])
-
-    deferred.addCallbacks(_do_get_configs, unwrap_first_error)
-
-    def _do_maybe_execute(config_launch_policy):
+    def _do_maybe_execute(bundle):
         """
         state_config_policy should be returned by ``check_cooldowns``
         """
-        config, launch, policy = config_launch_policy
+        config, launch, policy = bundle
         error_msg = "Cooldowns not met."
 
         def mark_executed(_):
@@ -179,6 +270,9 @@ def maybe_execute_scaling_policy(
                 execute_bound_log.msg("cooldowns checked, Scaling down")
                 d = exec_scale_down(execute_bound_log, transaction_id, state,
                                     scaling_group, -delta)
+            d.addCallback(lambda _: maintain_warm_pool(execute_bound_log, transaction_id,
+                                                       config, launch, scaling_group,
+                                                       state))
             return d.addCallback(mark_executed)
 
         raise CannotExecutePolicyError(scaling_group.tenant_id,
@@ -292,10 +386,8 @@ def find_servers_to_evict(log, state, delta):
 def delete_active_servers(log, transaction_id, scaling_group,
                           delta, state):
     """
-    Start deleting active servers
-
-    Returns a list of Deferreds corresponding to deletion of a server. Each Deferred
-    in the list gets fired when that server is deleted
+    Remove active servers from the state, and delete them once the state
+    without them has been saved
     """
 
     # find servers to evict
@@ -305,10 +397,11 @@ def delete_active_servers(log, transaction_id, scaling_group,
     for server in servers_to_evict:
         state.remove_active(server['id'])
 
-    # then start deleting those servers
-    return [get_supervisor().execute_delete_server(log, transaction_id,
-                                                   scaling_group, server_info)
-            for server_info in servers_to_evict]
+    # then delete those servers once that has been saved
+    supervisor = get_supervisor()
+    for server_info in servers_to_evict:
+        state.after_save(supervisor.execute_delete_server, log, transaction_id,
+                         scaling_group, server_info)
 
 
 def exec_scale_down(log, transaction_id, state, scaling_group, delta):
@@ -350,13 +443,19 @@ class _Job(object):
         self.supervisor = supervisor
         self.job_id = None
 
-    def start(self, launch_config):
+    def start(self, launch_config, job_id, warm_server=None):
         """
-        Kick off a job by calling the supervisor with a launch config.
+        Kick off a job by calling the supervisor with a launch config, and
+        the server claimed from the warm pool for it if there is one.  The
+        job should already be pending in the group's state, and is removed
+        from it if it cannot be started.
         """
+        self.job_id = job_id
+        self.log = self.log.bind(job_id=job_id)
         deferred = self.supervisor.execute_config(
-            self.log, self.transaction_id, self.scaling_group, launch_config)
-        deferred.addCallback(self.job_started)
+            self.log, self.transaction_id, self.scaling_group, launch_config, job_id,
+            warm_server=warm_server)
+        deferred.addCallbacks(self.job_started, self._job_failed)
         return deferred
 
     def _job_failed(self, f):
@@ -392,8 +491,8 @@ class _Job(object):
                 # server was slated to be deleted when it completed building.
                 # So, deleting it now
                 self.log.msg('Job removed. Deleting server')
-                self.supervisor.execute_delete_server(
-                    self.log, self.transaction_id, self.scaling_group, result)
+                state.after_save(self.supervisor.execute_delete_server,
+                                 self.log, self.transaction_id, self.scaling_group, result)
             else:
                 state.remove_job(self.job_id)
                 state.add_active(result['id'], result)
@@ -420,7 +519,6 @@ class _Job(object):
         from pending.
         """
         self.job_id, completion_deferred = result
-        self.log = self.log.bind(job_id=self.job_id)
 
         completion_deferred.addCallbacks(
             self._job_succeeded, self._job_failed)
@@ -429,32 +527,104 @@ class _Job(object):
         return self.job_id
 
 
-def execute_launch_config(log, transaction_id, state, launch, scaling_group, delta):
+class _WarmPoolJob(object):
     """
-    Execute a launch config some number of times.
-
-    :return: Deferred
+    Private class representing a job building a server for a group's warm
+    pool.  This calls the supervisor to build one server, and adds it to the
+    warm pool when it has been built.
     """
+    def __init__(self, log, transaction_id, scaling_group, supervisor):
+        """
+        :param log: a bound logger instance that can be used for logging
+        :param str transaction_id: a transaction id
+        :param IScalingGroup scaling_group: the scaling group for which a
+            server should be built
+        :param ISupervisor supervisor: the supervisor that builds the server
+        """
+        self.log = log
+        self.transaction_id = transaction_id
+        self.scaling_group = scaling_group
+        self.supervisor = supervisor
+        self.job_id = None
+
+    def start(self, launch_config, job_id):
+        """
+        Kick off a job by calling the supervisor with a launch config.  The
+        job should already be in the group's warm pool.
+        """
+        self.job_id = job_id
+        self.log = self.log.bind(warm_pool_job_id=job_id)
+        d = self.supervisor.execute_build_server(
+            self.log, self.transaction_id, self.scaling_group, launch_config)
+        d.addCallbacks(self._job_succeeded, self._job_failed)
+        d.addErrback(self.log.err)
 
-    def _update_state(pending_results):
+    def _delete_server(self, server):
+        return self.supervisor.execute_delete_server(
+            self.log, self.transaction_id, self.scaling_group,
+            {'id': server['server']['id'], 'lb_info': {}})
+
+    def _job_failed(self, f):
         """
-        :param pending_results: ``list`` of tuples of
-        ``(job_id, {'created': <job creation time>, 'jobType': [create/delete]})``
+        Job has failed.  Remove the job, if it exists, and log the error.  The
+        server is built again the next time the warm pool is maintained.
         """
-        log.msg('updating state')
+        self.log.msg('Warm pool job failed', reason=f)
 
-        for job_id in pending_results:
-            state.add_job(job_id)
+        def handle_failure(group, state):
+            if self.job_id in state.warm_jobs:
+                state.remove_warm_job(self.job_id)
+            return state
+
+        d = self.scaling_group.modify_state(handle_failure)
+        d.addErrback(lambda f: f.trap(NoSuchScalingGroupError))
+        return d
+
+    def _job_succeeded(self, server):
+        """
+        Job succeeded.  If the job still exists, add the server to the warm
+        pool.  If not, the server is no longer wanted, so delete it.
+        """
+        def handle_success(group, state):
+            if self.job_id not in state.warm_jobs:
+                self.log.msg('Warm pool job removed. Deleting server')
+                state.after_save(self._delete_server, server)
+            else:
+                info = state.warm_jobs[self.job_id]
+                state.remove_warm_job(self.job_id)
+                state.add_warm_server(server['server']['id'],
+                                      {'server': server, 'launch': info['launch']})
+                self.log.bind(server_id=server['server']['id']).msg(
+                    "Warm pool job completed, resulting in a warm server.")
+            return state
+
+        d = self.scaling_group.modify_state(handle_success)
+
+        def delete_if_group_deleted(f):
+            f.trap(NoSuchScalingGroupError)
+            self.log.msg('Relevant scaling group has been removed. '
+                         'Deleting server.')
+            self._delete_server(server)
 
+        d.addErrback(delete_if_group_deleted)
+        return d
+
+
+def execute_launch_config(log, transaction_id, state, launch, scaling_group, delta):
+    """
+    Execute a launch config some number of times: add that many jobs to the
+    state, to be started once it has been saved.  Each job launches a server
+    claimed from the warm pool if there is one left.
+
+    :return: Deferred
+    """
     if delta > 0:
         log.msg("Launching some servers.")
         supervisor = get_supervisor()
-        deferreds = [
-            _Job(log, transaction_id, scaling_group, supervisor).start(launch)
-            for i in range(delta)
-        ]
-
-    pendings_deferred = defer.gatherResults(deferreds, consumeErrors=True)
-    pendings_deferred.addCallback(_update_state)
-    pendings_deferred.addErrback(unwrap_first_error)
-    return pendings_deferred
+        for i in range(delta):
+            job_id = generate_job_id(scaling_group.uuid)
+            state.add_job(job_id)
+            state.after_save(_Job(log, transaction_id, scaling_group, supervisor).start,
+                             launch, job_id, claim_warm_server(state, launch))
+
+    return defer.succeed(None)
@@ -0,0 +1,140 @@
+"""
+Event listener that tells whatever is waiting on a server when Nova has
+finished creating or deleting it, from the notifications in an AtomHopper feed
+polled by :class:`otter.indexer.poller.FeedPollerService`.
+"""
+import json
+from collections import OrderedDict
+
+from twisted.internet import defer
+from twisted.python import log
+
+from otter.indexer.atom import content, summary
+
+CREATED = 'compute.instance.create.end'
+DELETED = 'compute.instance.delete.end'
+
+# How many seconds an event is remembered for, so that waiting for it just
+# after its entry has been seen, as when a server is built quickly, does not
+# miss it
+RECENT_EVENT_TTL = 60
+
+
+def instance_id(entry):
+    """
+    Get the ID of the server a Nova notification is about
+
+    :type entry: :class:`Element`
+
+    :return: the ``instance_id`` of the notification's payload, or ``None`` if
+        the entry's content is not a notification about a server
+    """
+    try:
+        return json.loads(content(entry))['payload']['instance_id']
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+class ServerEventListener(object):
+    """
+    An event listener, for :class:`otter.indexer.poller.FeedPollerService`,
+    that fires the Deferreds waiting for a server to be created or deleted when
+    an entry for that event is seen.
+
+    Events are remembered for ``ttl`` seconds after their entry is seen, so
+    that waiting for an event seen in that time fires at once.
+
+    :ivar clock: IReactorTime provider used to expire remembered events
+    :ivar ttl: seconds to remember each event for
+    """
+    def __init__(self, clock=None, ttl=RECENT_EVENT_TTL):
+        if clock is None:  # pragma: no cover
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+        self.ttl = ttl
+        self._waiting = {}
+        # (event_type, server_id) -> when its entry was seen, oldest first
+        self._recent = OrderedDict()
+
+    def wait_for(self, event_type, server_id):
+        """
+        Wait for an entry for an event about a server
+
+        :param str event_type: the type of the event, such as :data:`CREATED`
+            or :data:`DELETED`
+        :param str server_id: Opaque nova server id.
+
+        :return: Deferred that fires with the entry's summary when the event
+            is seen, or at once if it was seen recently.  Cancelling it stops
+            waiting.
+        """
+        key = (event_type, server_id)
+        self._expire()
+        if key in self._recent:
+            return defer.succeed(event_type)
+
+        def cancel(d):
+            waiting = self._waiting.get(key, [])
+            if d in waiting:
+                waiting.remove(d)
+                if not waiting:
+                    del self._waiting[key]
+
+        d = defer.Deferred(cancel)
+        self._waiting.setdefault(key, []).append(d)
+        return d
+
+    def __call__(self, entry):
+        """
+        Fire the Deferreds waiting for the event in ``entry``, if any
+
+        :type entry: :class:`Element`
+        """
+        event_type = summary(entry)
+        if event_type not in (CREATED, DELETED):
+            return
+
+        server_id = instance_id(entry)
+        if server_id is None:
+            return
+
+        key = (event_type, server_id)
+        self._expire()
+        self._recent.pop(key, None)
+        self._recent[key] = self.clock.seconds()
+
+        waiting = self._waiting.pop(key, [])
+        if waiting:
+            log.msg(format="Got %(event_type)s for server %(server_id)s",
+                    event_type=event_type, server_id=server_id)
+        for d in waiting:
+            d.callback(event_type)
+
+    def _expire(self):
+        """
+        Forget the events seen more than ``ttl`` seconds ago
+        """
+        oldest = self.clock.seconds() - self.ttl
+        while self._recent and next(self._recent.itervalues()) <= oldest:
+            self._recent.popitem(last=False)
+
+
+_listener = None
+
+
+def get_server_event_listener():
+    """
+    :return: the :class:`ServerEventListener` of the notification feeds being
+        polled, or ``None`` if no feeds are being polled
+    """
+    return _listener
+
+
+def set_server_event_listener(listener):
+    """
+    Set the :class:`ServerEventListener` of the notification feeds being
+    polled, or ``None`` if no feeds are being polled
+    """
+    global _listener
+    _listener = listener
@@ -2,11 +2,39 @@
 Draft 3 JSON schemas (http://tools.ietf.org/html/draft-zyp-json-schema-03)
 of data that will be transmitted to and from otter.
 """
-import functools
-
-from jsonschema import Draft3Validator, validate, FormatChecker
+from jsonschema import Draft3Validator, FormatChecker
 
 # This is there since later modules need to add specific format validators to this.
 format_checker = FormatChecker()
 
-validate = functools.partial(validate, cls=Draft3Validator, format_checker=format_checker)
+# Validators already made, keyed by the id of their schema.  The schemas are
+# module level dicts that are never changed once made, and each validator keeps
+# a reference to its schema so that the id can not be reused.
+_validators = {}
+
+
+def validator(schema):
+    """
+    Get the validator of a schema, checking the schema and making the
+    validator the first time the schema is validated against.
+
+    :param dict schema: a Draft 3 JSON schema
+    :return: :class:`Draft3Validator` that checks formats with
+        :data:`format_checker`
+    """
+    schema_validator = _validators.get(id(schema))
+    if schema_validator is None:
+        Draft3Validator.check_schema(schema)
+        schema_validator = _validators[id(schema)] = Draft3Validator(
+            schema, format_checker=format_checker)
+    return schema_validator
+
+
+def validate(instance, schema):
+    """
+    Validate ``instance`` against ``schema``, like :func:`jsonschema.validate`
+    but using the schema's validator from :func:`validator`.
+
+    :raises: :class:`jsonschema.ValidationError` if ``instance`` is invalid
+    """
+    validator(schema).validate(instance)
@@ -216,6 +216,16 @@ config = {
             "maximum": MAX_ENTITIES,
             "default": None
         },
+        "warmPool": {
+            "type": "integer",
+            "description": ("Number of servers to keep built from the launch "
+                            "configuration, but not added to any load "
+                            "balancers, so that scaling up can use them "
+                            "instead of waiting for new servers to be built.  "
+                            "Defaults to 0, meaning no servers are kept."),
+            "minimum": 0,
+            "maximum": MAX_ENTITIES
+        },
         "metadata": metadata
     },
     "additionalProperties": False,
@@ -13,10 +13,12 @@ from otter.json_schema import group_schemas
 
 
 # unlike updating or inputing a group config, the returned config must actually
-# have all the properties
+# have all the properties, apart from the warm pool size which groups without
+# a warm pool do not have
 group_config = deepcopy(group_schemas.config)
 for property_name in group_config['properties']:
-    group_config['properties'][property_name]['required'] = True
+    if property_name != 'warmPool':
+        group_config['properties'][property_name]['required'] = True
 
 
 _id = {
@@ -0,0 +1,166 @@
+"""
+Read-through caching of the rarely changing parts of scaling groups
+"""
+from copy import deepcopy
+
+from zope.interface import implementer
+
+from twisted.internet import defer
+
+from otter.models.interface import IScalingGroup
+
+# Marks a key that is not in the cache
+_NOT_CACHED = object()
+
+
+@implementer(IScalingGroup)
+class CachingScalingGroup(object):
+    """
+    .. autointerface:: otter.models.interface.IScalingGroup
+
+    Wraps another scaling group, serving its config, launch config and
+    policies from a cache shared by all the groups of a collection.  Cached
+    entries are invalidated when they are updated or deleted through any group
+    sharing the cache, and expire after the cache's time-to-live to bound how
+    stale they can be when they are changed on another node.
+
+    Everything else, including the reads the wrapped group does to check that
+    it exists before it is written to, goes straight to the wrapped group.
+
+    :ivar group: the wrapped scaling group
+    :type group: provider of :class:`otter.models.interface.IScalingGroup`
+
+    :ivar cache: cache shared by the groups of a collection
+    :type cache: :class:`otter.util.cache.LRUCache`
+    """
+    def __init__(self, group, cache):
+        self.group = group
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.group, name)
+
+    def _key(self, *parts):
+        return (self.group.tenant_id, self.group.uuid) + parts
+
+    def _cached(self, key, view, *args):
+        """
+        Return a copy of the value of ``key`` from the cache, or call ``view``
+        to read and cache it.  The value read is not cached if anything was
+        invalidated while it was being read, since it may be stale.
+        """
+        value = self.cache.get(key, _NOT_CACHED)
+        if value is not _NOT_CACHED:
+            return defer.succeed(deepcopy(value))
+
+        generation = self.cache.generation
+
+        def _cache(value):
+            if self.cache.generation == generation:
+                self.cache.set(key, deepcopy(value))
+            return value
+
+        return view(*args).addCallback(_cache)
+
+    def _invalidate(self, result, *keys):
+        for key in keys:
+            self.cache.invalidate(key)
+        return result
+
+    def view_config(self):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.view_config`
+        """
+        return self._cached(self._key('config'), self.group.view_config)
+
+    def view_launch_config(self):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.view_launch_config`
+        """
+        return self._cached(self._key('launch'), self.group.view_launch_config)
+
+    def get_policy(self, policy_id):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.get_policy`
+        """
+        return self._cached(self._key('policy', policy_id), self.group.get_policy,
+                            policy_id)
+
+    def view_execution_bundle(self, policy_id=None):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.view_execution_bundle`
+
+        If the config, launch config and policy are all cached, nothing is
+        read.
+        """
+        keys = [self._key('config'), self._key('launch')]
+        if policy_id is not None:
+            keys.append(self._key('policy', policy_id))
+        values = [self.cache.get(key, _NOT_CACHED) for key in keys]
+
+        if not any(value is _NOT_CACHED for value in values):
+            values = deepcopy(values)
+            if policy_id is None:
+                values.append(None)
+            return defer.succeed(tuple(values))
+
+        generation = self.cache.generation
+
+        def _cache(bundle):
+            if self.cache.generation == generation:
+                for key, value in zip(keys, bundle):
+                    self.cache.set(key, deepcopy(value))
+            return bundle
+
+        return self.group.view_execution_bundle(policy_id).addCallback(_cache)
+
+    def modify_state(self, modifier_callable, *args, **kwargs):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.modify_state`
+
+        The modifier is called with this group rather than the wrapped one,
+        so that what it reads through the group is served from the cache.
+        """
+        return self.group.modify_state(
+            lambda _group, state, *a, **kw: modifier_callable(self, state, *a, **kw),
+            *args, **kwargs)
+
+    def update_config(self, data):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.update_config`
+        """
+        d = self.group.update_config(data)
+        return d.addCallback(self._invalidate, self._key('config'))
+
+    def update_launch_config(self, data):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.update_launch_config`
+        """
+        d = self.group.update_launch_config(data)
+        return d.addCallback(self._invalidate, self._key('launch'))
+
+    def update_policy(self, policy_id, data):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.update_policy`
+        """
+        d = self.group.update_policy(policy_id, data)
+        return d.addCallback(self._invalidate, self._key('policy', policy_id))
+
+    def delete_policy(self, policy_id):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.delete_policy`
+        """
+        d = self.group.delete_policy(policy_id)
+        return d.addCallback(self._invalidate, self._key('policy', policy_id))
+
+    def delete_group(self):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.delete_group`
+        """
+        group_key = self._key()
+
+        def _invalidate_group(result):
+            self.cache.invalidate_where(lambda key: key[:2] == group_key)
+            return result
+
+        return self.group.delete_group().addCallback(_invalidate_group)
@@ -6,29 +6,99 @@ import time
 from zope.interface import implementer
 
 from twisted.internet import defer
+from twisted.python.failure import Failure
 from jsonschema import ValidationError
 
+from otter.log import log as otter_log
+from otter.models.caching import CachingScalingGroup
 from otter.models.interface import (
     GroupState, GroupNotEmptyError, IScalingGroup,
     IScalingGroupCollection, NoSuchScalingGroupError, NoSuchPolicyError,
     NoSuchWebhookError, UnrecognizedCapabilityError,
     IScalingScheduleCollection, IAdmin)
-from otter.util.cqlbatch import Batch
+from otter.util.cache import LRUCache
+from otter.util.cqlbatch import Batch, BatchType
+from otter.util.cqlprepared import prepared_statements
 from otter.util.hashkey import generate_capability, generate_key_str
 from otter.util import timestamp
 from otter.util.config import config_value
+from otter.util.deferredutils import unwrap_first_error
+from otter.util.histogram import Histogram
 from otter.scheduler import next_cron_occurrence
 
 from silverberg.client import ConsistencyLevel
 from silverberg.lock import BasicLock, with_lock
 
+import binascii
 import json
 import random
+import re
+from copy import deepcopy
 from datetime import datetime
+from functools import wraps
 
 
 LOCK_TABLE_NAME = 'locks'
 
+# Table holding scheduled events partitioned into buckets, used instead of
+# ``scaling_schedule`` when ``cassandra.schedule_buckets`` is configured
+BUCKET_EVENT_TABLE_NAME = 'scaling_schedule_buckets'
+
+# Table mapping each policy to the bucket and trigger of its bucketed event, so
+# that the event can be deleted by its full key
+BUCKET_TRIGGER_TABLE_NAME = 'scaling_schedule_bucket_triggers'
+
+# Number of times an optimistic (compare-and-set) state write is re-attempted
+# with a fresh read before giving up
+CAS_MAX_RETRIES = 5
+
+# Marks a webhook lookup that is not in the webhook cache, since ``None`` is
+# cached for capability hashes that are known not to exist
+_NOT_CACHED = object()
+
+
+class StateConflictError(Exception):
+    """
+    Error to be raised when an optimistic write of a scaling group's state
+    keeps losing to concurrent writers.
+    """
+    def __init__(self, tenant_id, group_id, attempts):
+        super(StateConflictError, self).__init__(
+            "Could not write state of group {g} for tenant {t} after {a} "
+            "conflicting attempts".format(t=tenant_id, g=group_id, a=attempts))
+
+
+# Tables partitioned by tenant ID.  Cassandra applies the writes to all of
+# them for a tenant together, as one mutation of the tenant's partition.
+_TENANT_PARTITIONED_TABLES = ('scaling_group', 'scaling_policies', 'policy_webhooks')
+
+_written_table = re.compile(r'\s*(?:INSERT INTO|UPDATE|DELETE FROM)\s+(\w+)')
+
+
+def _batch_type(queries):
+    """
+    Get the type of batch to write ``queries`` with.
+
+    A batch whose statements all write to tenant partitioned tables, keyed by
+    the ``:tenantId`` parameter, only writes to that tenant's partition.  It
+    is applied all or nothing without the batchlog, so it is unlogged.  Any
+    other batch is logged.
+    """
+    for query in queries:
+        match = _written_table.match(query)
+        if (match is None or match.group(1) not in _TENANT_PARTITIONED_TABLES or
+                ':tenantId' not in query):
+            return BatchType.LOGGED
+    return BatchType.UNLOGGED
+
+
+def _batch(queries, params, consistency):
+    """
+    Make a :class:`Batch` of ``queries``, of the type :func:`_batch_type`
+    picks for them.
+    """
+    return Batch(queries, params, consistency, batch_type=_batch_type(queries))
+
 
 def serialize_json_data(data, ver):
     """
@@ -50,6 +120,8 @@ def serialize_json_data(data, ver):
 # Thus, selects have a semicolon, everything else doesn't.
 _cql_view = ('SELECT {column}, created_at FROM {cf} WHERE "tenantId" = :tenantId AND '
              '"groupId" = :groupId;')
+_cql_view_configs = ('SELECT group_config, launch_config, created_at FROM {cf} WHERE '
+                     '"tenantId" = :tenantId AND "groupId" = :groupId;')
 _cql_view_policy = ('SELECT data FROM {cf} WHERE "tenantId" = :tenantId AND '
                     '"groupId" = :groupId AND "policyId" = :policyId;')
 _cql_view_webhook = ('SELECT data, capability FROM {cf} WHERE "tenantId" = :tenantId AND '
@@ -66,11 +138,23 @@ _cql_view_manifest = ('SELECT "tenantId", "groupId", group_config, launch_config
 _cql_insert_policy = ('INSERT INTO {cf}("tenantId", "groupId", "policyId", data) '
                       'VALUES (:tenantId, :groupId, {name}Id, {name})')
 _cql_insert_group_state = ('INSERT INTO {cf}("tenantId", "groupId", active, pending, "groupTouched", '
-                           '"policyTouched", paused) VALUES(:tenantId, :groupId, :active, '
-                           ':pending, :groupTouched, :policyTouched, :paused)')
+                           '"policyTouched", paused, warm_pool, version) VALUES(:tenantId, '
+                           ':groupId, :active, :pending, :groupTouched, :policyTouched, :paused, '
+                           ':warm_pool, :newVersion)')
 _cql_view_group_state = ('SELECT "tenantId", "groupId", group_config, active, pending, "groupTouched", '
                          '"policyTouched", paused, created_at FROM {cf} WHERE '
                          '"tenantId" = :tenantId AND "groupId" = :groupId;')
+_cql_view_versioned_state = ('SELECT "tenantId", "groupId", group_config, active, pending, '
+                             '"groupTouched", "policyTouched", paused, warm_pool, version, '
+                             'created_at FROM {cf} WHERE "tenantId" = :tenantId AND '
+                             '"groupId" = :groupId;')
+_cql_cas_group_state = ('UPDATE {cf} SET active = :active, pending = :pending, '
+                        '"groupTouched" = :groupTouched, "policyTouched" = :policyTouched, '
+                        'paused = :paused, warm_pool = :warm_pool, version = :newVersion '
+                        'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+                        'IF version = {expected};')
+_cql_cas_delete_group = ('DELETE FROM {cf} WHERE "tenantId" = :tenantId AND '
+                         '"groupId" = :groupId IF version = {expected};')
 _cql_insert_event = ('INSERT INTO {cf}("tenantId", "groupId", "policyId", trigger) '
                      'VALUES (:tenantId, :groupId, {name}Id, {name}Trigger)')
 _cql_insert_event_with_cron = ('INSERT INTO {cf}("tenantId", "groupId", "policyId", '
@@ -84,6 +168,28 @@ _cql_fetch_batch_of_events = (
     'SELECT "tenantId", "groupId", "policyId", "trigger", cron FROM {cf} WHERE '
     'trigger <= :now LIMIT :size ALLOW FILTERING;')
 _cql_delete_policy_events = 'DELETE FROM {cf} WHERE "policyId" = :policyId;'
+_cql_insert_bucket_event = ('INSERT INTO {cf}(bucket, "tenantId", "groupId", "policyId", '
+                            'trigger) VALUES ({name}bucket, :tenantId, :groupId, '
+                            '{name}Id, {name}Trigger)')
+_cql_insert_bucket_event_with_cron = ('INSERT INTO {cf}(bucket, "tenantId", "groupId", '
+                                      '"policyId", trigger, cron) '
+                                      'VALUES ({name}bucket, :tenantId, :groupId, {name}Id, '
+                                      '{name}Trigger, {name}cron)')
+_cql_insert_bucket_event_batch = ('INSERT INTO {cf}(bucket, "tenantId", "groupId", "policyId", '
+                                  'trigger, cron) VALUES ({name}bucket, '
+                                  '{name}tenantId, {name}groupId, {name}policyId, '
+                                  '{name}trigger, {name}cron)')
+_cql_fetch_bucket_events = (
+    'SELECT bucket, "tenantId", "groupId", "policyId", trigger, cron FROM {cf} '
+    'WHERE bucket = :bucket AND trigger <= :now LIMIT :size;')
+_cql_delete_bucket_event = ('DELETE FROM {cf} WHERE bucket = {name}bucket AND '
+                            'trigger = {name}trigger AND "policyId" = {name}policyId')
+_cql_insert_bucket_trigger = ('INSERT INTO {cf}("policyId", bucket, trigger) '
+                              'VALUES ({name}Id, {name}bucket, {name}Trigger)')
+_cql_insert_bucket_trigger_batch = ('INSERT INTO {cf}("policyId", bucket, trigger) '
+                                    'VALUES ({name}policyId, {name}bucket, {name}trigger)')
+_cql_find_bucket_triggers = ('SELECT "policyId", bucket, trigger FROM {cf} '
+                             'WHERE "policyId" IN ({policy_ids});')
 _cql_insert_webhook = (
     'INSERT INTO {cf}("tenantId", "groupId", "policyId", "webhookId", data, capability, '
     '"webhookKey") VALUES (:tenantId, :groupId, :policyId, :{name}Id, :{name}, '
@@ -112,6 +218,15 @@ _cql_list_webhook = ('SELECT "webhookId", data, capability FROM {cf} '
 
 _cql_find_webhook_token = ('SELECT "tenantId", "groupId", "policyId" FROM {cf} WHERE '
                            '"webhookKey" = :webhookKey;')
+_cql_insert_webhook_key = ('INSERT INTO {cf}("webhookKey", "tenantId", "groupId", "policyId") '
+                           'VALUES ({name}, :tenantId, :groupId, :policyId)')
+_cql_find_webhook_key = ('SELECT "tenantId", "groupId", "policyId" FROM {cf} WHERE '
+                         '"webhookKey" = :webhookKey;')
+_cql_delete_webhook_key = 'DELETE FROM {cf} WHERE "webhookKey" = :webhookKey'
+_cql_list_group_webhook_keys = ('SELECT "webhookKey" FROM {cf} WHERE "tenantId" = :tenantId '
+                                'AND "groupId" = :groupId;')
+_cql_list_policy_webhook_keys = ('SELECT "webhookKey" FROM {cf} WHERE "tenantId" = :tenantId '
+                                 'AND "groupId" = :groupId AND "policyId" = :policyId;')
 
 _cql_count_for_tenant = ('SELECT COUNT(*) FROM {cf} WHERE "tenantId" = :tenantId;')
 
@@ -185,6 +300,9 @@ def _paginated_list(tenant_id, group_id=None, policy_id=None, limit=100,
 _consistency_levels = {'event': {'list': ConsistencyLevel.QUORUM, 'insert': ConsistencyLevel.QUORUM,
                        'delete': ConsistencyLevel.QUORUM}}
 
+# the misspelled consistency levels configured, so that each is logged once
+_invalid_consistency_levels = set()
+
 
 def get_consistency_level(operation, resource):
     """
@@ -195,14 +313,28 @@ def get_consistency_level(operation, resource):
 
     :param resource: one of (group, partial, policy, webhook) -
         "partial" covers group views such as the config, the launch
-        config, or the state
+        config, or the state, including the read of the state that
+        :meth:`CassScalingGroup.modify_state` and
+        :meth:`CassScalingGroup.delete_group` make before writing it
     :type resource: ``str``
 
-    :return: the consistency level
+    :return: the consistency level named by the configured
+        ``cassandra.consistency.<resource>.<operation>``, if there is one and
+        it names a consistency level, or else the default for the operation
     :rtype: one of the consistency levels in :class:`ConsistencyLevel`
     """
-    # TODO: configurable consistency level, possibly different for read
-    # and write operations
+    name = 'cassandra.consistency.{0}.{1}'.format(resource, operation)
+    configured = config_value(name)
+    if configured is not None:
+        level = getattr(ConsistencyLevel, str(configured).upper(), None)
+        if level is not None:
+            return level
+        if (name, configured) not in _invalid_consistency_levels:
+            _invalid_consistency_levels.add((name, configured))
+            otter_log.bind(system='otter.models.cass').msg(
+                'Unknown consistency level {level} configured in {name}, using the default',
+                level=configured, name=name)
+
     resource_operations = _consistency_levels.get(resource)
     if resource_operations:
         return resource_operations.get(operation, ConsistencyLevel.ONE)
@@ -210,6 +342,36 @@ def get_consistency_level(operation, resource):
         return ConsistencyLevel.ONE
 
 
+# Latency histograms, in milliseconds, of store operations, keyed by the name of
+# the operation and the name of the consistency level it was done at
+_latencies = {}
+
+
+def _timed(operation, resource):
+    """
+    Decorate a method that returns a ``Deferred`` so that its latency is
+    recorded in ``_latencies``, along with the consistency level configured for
+    ``operation`` on ``resource`` (see :func:`get_consistency_level`).
+    """
+    def decorator(method):
+        @wraps(method)
+        def timed_method(*args, **kwargs):
+            level = get_consistency_level(operation, resource)
+            key = (method.__name__, ConsistencyLevel._VALUES_TO_NAMES.get(level, str(level)))
+            start = time.time()
+
+            def _record(result):
+                histogram = _latencies.get(key)
+                if histogram is None:
+                    histogram = _latencies[key] = Histogram()
+                histogram.record((time.time() - start) * 1000)
+                return result
+
+            return method(*args, **kwargs).addBoth(_record)
+        return timed_method
+    return decorator
+
+
 def _build_policies(policies, policies_table, event_table, queries, data):
     """
     Because inserting many values into a table with compound keys with one
@@ -253,11 +415,38 @@ def _build_policies(policies, policies_table, event_table, queries, data):
     return outpolicies
 
 
+def _schedule_buckets():
+    """
+    The number of buckets scheduled events are partitioned into, or ``None`` if
+    events are kept in the unpartitioned ``scaling_schedule`` table.
+
+    The number of buckets must not be changed once events have been written to
+    :data:`BUCKET_EVENT_TABLE_NAME`, since it decides which bucket an event is in.
+    """
+    buckets = config_value('cassandra.schedule_buckets')
+    return buckets and int(buckets)
+
+
+def schedule_bucket(policy_id, buckets):
+    """
+    Return the bucket that the events of the given policy belong to. This uses
+    CRC32 rather than ``hash`` so that every otter node agrees on it.
+
+    :param str policy_id: the policy ID
+    :param int buckets: the number of buckets
+    :return: bucket number in ``range(buckets)``
+    """
+    return (binascii.crc32(policy_id) & 0xffffffff) % buckets
+
+
 def _build_schedule_policy(policy, event_table, queries, data, polname):
     """
     Build schedule-type policy
     """
-    if 'at' in policy["args"]:
+    buckets = _schedule_buckets()
+    if buckets:
+        _build_bucket_schedule_policy(policy, buckets, queries, data, polname)
+    elif 'at' in policy["args"]:
         queries.append(_cql_insert_event.format(cf=event_table, name=':' + polname))
         data[polname + "Trigger"] = timestamp.from_timestamp(policy["args"]["at"])
     elif 'cron' in policy["args"]:
@@ -267,10 +456,73 @@ def _build_schedule_policy(policy, event_table, queries, data, polname):
         data[polname + 'cron'] = cron
 
 
+def _build_bucket_schedule_policy(policy, buckets, queries, data, polname):
+    """
+    Build schedule-type policy event in its bucket of :data:`BUCKET_EVENT_TABLE_NAME`,
+    recording its bucket and trigger in :data:`BUCKET_TRIGGER_TABLE_NAME`
+    """
+    data[polname + 'bucket'] = schedule_bucket(data[polname + 'Id'], buckets)
+    if 'at' in policy["args"]:
+        queries.append(_cql_insert_bucket_event.format(cf=BUCKET_EVENT_TABLE_NAME,
+                                                       name=':' + polname))
+        data[polname + "Trigger"] = timestamp.from_timestamp(policy["args"]["at"])
+    elif 'cron' in policy["args"]:
+        queries.append(_cql_insert_bucket_event_with_cron.format(cf=BUCKET_EVENT_TABLE_NAME,
+                                                                 name=':' + polname))
+        cron = policy["args"]["cron"]
+        data[polname + "Trigger"] = next_cron_occurrence(cron)
+        data[polname + 'cron'] = cron
+    queries.append(_cql_insert_bucket_trigger.format(cf=BUCKET_TRIGGER_TABLE_NAME,
+                                                     name=':' + polname))
+
+
+def _delete_bucket_policy_events(connection, policy_ids):
+    """
+    Delete the events of the given policies from their buckets of
+    :data:`BUCKET_EVENT_TABLE_NAME`, if events are bucketed.
+
+    Bucketed events can only be deleted by their full key, so the bucket and
+    trigger of each policy's event are first looked up in
+    :data:`BUCKET_TRIGGER_TABLE_NAME`, and deleted from there along with the
+    event.
+
+    :param list policy_ids: the IDs of the policies whose events to delete
+    :return: Deferred that fires with None
+    """
+    if not _schedule_buckets() or not policy_ids:
+        return defer.succeed(None)
+
+    def _delete(rows):
+        if not rows:
+            return
+        queries, data = [], {}
+        for i, row in enumerate(rows):
+            name = 'event{}'.format(i)
+            queries.append(_cql_delete_bucket_event.format(cf=BUCKET_EVENT_TABLE_NAME,
+                                                           name=':' + name))
+            data.update({name + key: row[key] for key in ('bucket', 'trigger', 'policyId')})
+        query, params = _delete_many_query_and_params(
+            BUCKET_TRIGGER_TABLE_NAME, '"policyId"', [row['policyId'] for row in rows],
+            'trigger_policy')
+        queries.append(query)
+        data.update(params)
+        b = _batch(queries, data, get_consistency_level('delete', 'event'))
+        return b.execute(connection)
+
+    params = {'policy{}'.format(i): policy_id for i, policy_id in enumerate(policy_ids)}
+    query = _cql_find_bucket_triggers.format(
+        cf=BUCKET_TRIGGER_TABLE_NAME,
+        policy_ids=','.join(':policy{}'.format(i) for i in range(len(policy_ids))))
+    d = connection.execute(query, params, get_consistency_level('list', 'event'))
+    d.addCallback(_delete)
+    return d.addCallback(lambda _: None)
+
+
 def _update_schedule_policy(connection, policy, policy_id, event_table, tenant_id, group_id):
-    # Delete existing entry in event table
+    # Delete existing entry in event table, and in its bucket if events are bucketed
     d = connection.execute(_cql_delete_policy_events.format(cf=event_table),
                            {'policyId': policy_id}, get_consistency_level('delete', 'event'))
+    d.addCallback(lambda _: _delete_bucket_policy_events(connection, [policy_id]))
 
     def _insert_event(_):
         queries, data = [], {}
@@ -278,12 +530,13 @@ def _update_schedule_policy(connection, policy, policy_id, event_table, tenant_i
         data['groupId'] = group_id
         data['policyId'] = policy_id
         _build_schedule_policy(policy, event_table, queries, data, 'policy')
-        return Batch(queries, data, get_consistency_level('update', 'event')).execute(connection)
+        return _batch(queries, data, get_consistency_level('update', 'event')).execute(connection)
 
     return d.addCallback(_insert_event)
 
 
-def _build_webhooks(bare_webhooks, webhooks_table, queries, cql_parameters):
+def _build_webhooks(bare_webhooks, webhooks_table, webhook_keys_table, queries,
+                    cql_parameters):
     """
     Because inserting many values into a table with compound keys with one
     insert statement is hard. This builds a bunch of insert statements and a
@@ -296,6 +549,10 @@ def _build_webhooks(bare_webhooks, webhooks_table, queries, cql_parameters):
     :param webhooks_table: the name of the webhooks table
     :type webhooks_table: ``str``
 
+    :param webhook_keys_table: the name of the table mapping webhook keys to
+        the policies they execute
+    :type webhook_keys_table: ``str``
+
     :param queries: a list of existing CQL queries to add to
     :type queries: ``list`` of ``str``
 
@@ -312,6 +569,8 @@ def _build_webhooks(bare_webhooks, webhooks_table, queries, cql_parameters):
         webhook_id = generate_key_str('webhook')
         queries.append(_cql_insert_webhook.format(cf=webhooks_table,
                                                   name=name))
+        queries.append(_cql_insert_webhook_key.format(cf=webhook_keys_table,
+                                                      name=':{0}Key'.format(name)))
 
         # generate the real data that will be stored, which includes the webhook
         # token, the capability stuff, and metadata by default
@@ -369,6 +628,10 @@ def _jsonloads_data(raw_data):
 
 
 def _unmarshal_state(state_dict):
+    # only the state read to be modified includes the warm pool, which is
+    # also null for groups that have never had one
+    warm_pool = state_dict.get("warm_pool")
+    warm_pool = _jsonloads_data(warm_pool) if warm_pool else {}
     return GroupState(
         state_dict["tenantId"], state_dict["groupId"],
         _jsonloads_data(state_dict["group_config"])["name"],
@@ -376,10 +639,78 @@ def _unmarshal_state(state_dict):
         _jsonloads_data(state_dict["pending"]),
         state_dict["groupTouched"],
         _jsonloads_data(state_dict["policyTouched"]),
-        bool(ord(state_dict["paused"]))
+        bool(ord(state_dict["paused"])),
+        warm_servers=warm_pool.get("servers"),
+        warm_jobs=warm_pool.get("jobs")
     )
 
 
+def _is_empty(state):
+    """
+    Whether the group has no servers, including servers in its warm pool, and
+    is building none, so that it can be deleted without leaving any behind.
+    """
+    return not (state.active or state.pending or state.warm_servers or state.warm_jobs)
+
+
+class _StoreQueries(object):
+    """
+    The single statements the store executes most, formatted for its tables
+    once when it is constructed rather than on every call.  Their text is
+    what each is prepared and looked up as by
+    :class:`otter.util.cqlprepared.PreparedStatementCache`.
+
+    :param store: the :class:`CassScalingGroupCollection` or
+        :class:`CassScalingGroup` whose tables to format the queries for
+    """
+    def __init__(self, store):
+        group_table = store.group_table
+        self.delete_all_in_group = _cql_delete_all_in_group.format(cf=group_table)
+        self.view_manifest = _cql_view_manifest.format(cf=group_table)
+        self.view_config = _cql_view.format(cf=group_table, column='group_config')
+        self.view_launch_config = _cql_view.format(cf=group_table, column='launch_config')
+        self.view_state = _cql_view_group_state.format(cf=group_table)
+        self.view_configs = _cql_view_configs.format(cf=group_table)
+        self.view_versioned_state = _cql_view_versioned_state.format(cf=group_table)
+        self.insert_group_state = _cql_insert_group_state.format(cf=group_table)
+        # keyed by the expected version, as given by _version_condition
+        self.cas_group_state = dict(
+            (expected, _cql_cas_group_state.format(cf=group_table, expected=expected))
+            for expected in ('null', ':version'))
+        self.cas_delete_group = dict(
+            (expected, _cql_cas_delete_group.format(cf=group_table, expected=expected))
+            for expected in ('null', ':version'))
+        self.view_policy = _cql_view_policy.format(cf=store.policies_table)
+        self.view_webhook = _cql_view_webhook.format(cf=store.webhooks_table)
+        self.update_webhook = _cql_update_webhook.format(cf=store.webhooks_table)
+        self.find_webhook_token = _cql_find_webhook_token.format(cf=store.webhooks_table)
+        self.find_webhook_key = _cql_find_webhook_key.format(cf=store.webhook_keys_table)
+        self.fetch_batch_of_events = _cql_fetch_batch_of_events.format(cf=store.event_table)
+        self.fetch_bucket_events = _cql_fetch_bucket_events.format(cf=BUCKET_EVENT_TABLE_NAME)
+
+
+def _cas_applied(result):
+    """
+    Conditional (``IF ...``) statements return a single row whose
+    ``[applied]`` column says whether the condition held.  Booleans are not
+    unmarshalled by silverberg, so this may be the raw byte.
+    """
+    applied = result[0]['[applied]']
+    if isinstance(applied, basestring):
+        return bool(ord(applied))
+    return bool(applied)
+
+
+def _optimistic_concurrency():
+    """
+    Whether state writes should be versioned compare-and-set writes rather
+    than writes guarded by a lock in the lock table.  Writes guarded by a lock
+    still increment the version, so that the setting can be changed one node
+    at a time, which is why the ``version`` column is needed either way.
+    """
+    return config_value('cassandra.state_concurrency') == 'optimistic'
+
+
 def verified_view(connection, view_query, del_query, data, consistency, exception_if_empty, log):
     """
     Ensures the view query does not get resurrected row, i.e. one that does not have "created_at" in it.
@@ -392,9 +723,11 @@ def verified_view(connection, view_query, del_query, data, consistency, exceptio
         if result[0].get('created_at'):
             return result[0]
         else:
-            # resurrected row, trigger its deletion and raise empty exception
+            # resurrected row, trigger its deletion in the background and raise
+            # empty exception
             log.msg('Resurrected row', row=result[0], row_params=data)
-            connection.execute(del_query, data, consistency)
+            d = connection.execute(del_query, data, consistency)
+            d.addErrback(log.err, 'Failed to delete resurrected row')
             raise exception_if_empty
 
     d = connection.execute(view_query, data, consistency)
@@ -416,6 +749,14 @@ class CassScalingGroup(object):
     :ivar connection: silverberg client used to connect to cassandra
     :type connection: :class:`silverberg.client.CQLClient`
 
+    :ivar state_queue: if not ``None``, state modifications are coalesced
+        with those of other group objects sharing the same queue
+    :type state_queue: :class:`StateModifierQueue`
+
+    :ivar webhook_cache: if not ``None``, the cache of webhook lookups whose
+        entries are invalidated when webhooks are deleted
+    :type webhook_cache: :class:`otter.util.cache.LRUCache`
+
     IMPORTANT REMINDER: In CQL, update will create a new row if one doesn't
     exist.  Therefore, before doing an update, a read must be performed first
     else an entry is created where none should have been.
@@ -427,9 +768,12 @@ class CassScalingGroup(object):
     Also, because deletes are done as tombstones rather than actually deleting,
     deletes are also updates and hence a read must be performed before deletes.
     """
-    def __init__(self, log, tenant_id, uuid, connection):
+    def __init__(self, log, tenant_id, uuid, connection, state_queue=None,
+                 webhook_cache=None, queries=None):
         """
-        Creates a CassScalingGroup object.
+        Creates a CassScalingGroup object.  ``queries`` is the
+        :class:`_StoreQueries` of the collection it belongs to, or ``None`` to
+        format its own.
         """
         self.log = log.bind(system=self.__class__.__name__,
                             tenant_id=tenant_id,
@@ -437,13 +781,18 @@ class CassScalingGroup(object):
         self.tenant_id = tenant_id
         self.uuid = uuid
         self.connection = connection
+        self.state_queue = state_queue
+        self.webhook_cache = webhook_cache
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
         self.policies_table = "scaling_policies"
         self.state_table = "group_state"
         self.webhooks_table = "policy_webhooks"
+        self.webhook_keys_table = "webhook_keys"
         self.event_table = "scaling_schedule"
+        self.queries = queries or _StoreQueries(self)
 
+    @_timed('view', 'group')
     def view_manifest(self):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_manifest`
@@ -463,8 +812,8 @@ class CassScalingGroup(object):
             })
             return d
 
-        view_query = _cql_view_manifest.format(cf=self.group_table)
-        del_query = _cql_delete_all_in_group.format(cf=self.group_table)
+        view_query = self.queries.view_manifest
+        del_query = self.queries.delete_all_in_group
         d = verified_view(self.connection, view_query, del_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
@@ -473,12 +822,13 @@ class CassScalingGroup(object):
         d.addCallback(_get_policies)
         return d
 
+    @_timed('view', 'partial')
     def view_config(self):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_config`
         """
-        view_query = _cql_view.format(cf=self.group_table, column='group_config')
-        del_query = _cql_delete_all_in_group.format(cf=self.group_table)
+        view_query = self.queries.view_config
+        del_query = self.queries.delete_all_in_group
         d = verified_view(self.connection, view_query, del_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
@@ -487,12 +837,13 @@ class CassScalingGroup(object):
 
         return d.addCallback(lambda group: _jsonloads_data(group['group_config']))
 
+    @_timed('view', 'partial')
     def view_launch_config(self):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_launch_config`
         """
-        view_query = _cql_view.format(cf=self.group_table, column='launch_config')
-        del_query = _cql_delete_all_in_group.format(cf=self.group_table)
+        view_query = self.queries.view_launch_config
+        del_query = self.queries.delete_all_in_group
         d = verified_view(self.connection, view_query, del_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
@@ -501,12 +852,13 @@ class CassScalingGroup(object):
 
         return d.addCallback(lambda group: _jsonloads_data(group['launch_config']))
 
+    @_timed('view', 'partial')
     def view_state(self):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_state`
         """
-        view_query = _cql_view_group_state.format(cf=self.group_table)
-        del_query = _cql_delete_all_in_group.format(cf=self.group_table)
+        view_query = self.queries.view_state
+        del_query = self.queries.delete_all_in_group
         d = verified_view(self.connection, view_query, del_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
@@ -515,31 +867,165 @@ class CassScalingGroup(object):
 
         return d.addCallback(_unmarshal_state)
 
+    @_timed('view', 'group')
+    def view_execution_bundle(self, policy_id=None):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.view_execution_bundle`
+
+        The config and launch config are both read from one row of the group
+        table, at the same time as the policy is read.
+        """
+        def _assemble(results):
+            # report a missing group rather than a missing policy
+            for success, result in results:
+                if not success:
+                    return result
+            group, policy = [result for _, result in results]
+            return (_jsonloads_data(group['group_config']),
+                    _jsonloads_data(group['launch_config']),
+                    policy)
+
+        view_query = self.queries.view_configs
+        del_query = self.queries.delete_all_in_group
+        ds = [verified_view(self.connection, view_query, del_query,
+                            {"tenantId": self.tenant_id,
+                             "groupId": self.uuid},
+                            get_consistency_level('view', 'group'),
+                            NoSuchScalingGroupError(self.tenant_id, self.uuid), self.log)]
+        if policy_id is None:
+            ds.append(defer.succeed(None))
+        else:
+            ds.append(self.get_policy(policy_id))
+
+        d = defer.DeferredList(ds, consumeErrors=True)
+        return d.addCallback(_assemble)
+
+    def _view_versioned_state(self):
+        """
+        Like :meth:`view_state`, but also reads the state's version.
+
+        :return: a :class:`twisted.internet.defer.Deferred` that fires with a
+            2-tuple of :class:`GroupState` and the version (``None`` if the
+            state has never been written with a version)
+        """
+        view_query = self.queries.view_versioned_state
+        del_query = self.queries.delete_all_in_group
+        d = verified_view(self.connection, view_query, del_query,
+                          {"tenantId": self.tenant_id,
+                           "groupId": self.uuid},
+                          get_consistency_level('view', 'partial'),
+                          NoSuchScalingGroupError(self.tenant_id, self.uuid), self.log)
+
+        return d.addCallback(lambda row: (_unmarshal_state(row), row.get('version')))
+
+    def _state_params(self, new_state):
+        """
+        :return: the CQL parameters needed to write ``new_state``
+        """
+        assert (new_state.tenant_id == self.tenant_id and
+                new_state.group_id == self.uuid)
+        return {
+            'tenantId': new_state.tenant_id,
+            'groupId': new_state.group_id,
+            'active': serialize_json_data(new_state.active, 1),
+            'pending': serialize_json_data(new_state.pending, 1),
+            'paused': new_state.paused,
+            'groupTouched': new_state.group_touched,
+            'policyTouched': serialize_json_data(new_state.policy_touched, 1),
+            'warm_pool': serialize_json_data({'servers': new_state.warm_servers,
+                                              'jobs': new_state.warm_jobs}, 1)
+        }
+
+    def _version_condition(self, params, version):
+        """
+        Add the expected version to ``params`` and return the value to compare
+        against in the ``IF`` clause of a compare-and-set statement.  Rows
+        written before versioning was introduced have no version, and are
+        matched with ``null``.
+        """
+        if version is None:
+            return 'null'
+        params['version'] = version
+        return ':version'
+
+    def _modify_state_optimistic(self, log, modifier_callable, *args, **kwargs):
+        """
+        Modify the state without taking a lock: read the state along with
+        its version, apply the modifier and write the result only if the
+        version is unchanged.  If another writer got there first, the whole
+        read-modify-write is retried up to :data:`CAS_MAX_RETRIES` times.
+
+        Note that this means ``modifier_callable`` may be called more than
+        once, so the actions it defers with :meth:`GroupState.after_save` are
+        only called for the state that is written.
+        """
+        attempts = [0]
+
+        def _check_applied(result, new_state, version):
+            if _cas_applied(result):
+                return new_state.saved(log)
+
+            attempts[0] += 1
+            if attempts[0] > CAS_MAX_RETRIES:
+                raise StateConflictError(self.tenant_id, self.uuid, attempts[0])
+            log.msg('State changed since it was read, retrying',
+                    expected_version=version, attempt=attempts[0])
+            return _modify_state()
+
+        def _write_state(new_state, version):
+            params = self._state_params(new_state)
+            params['newVersion'] = (version or 0) + 1
+            expected = self._version_condition(params, version)
+            query = self.queries.cas_group_state[expected]
+            d = self.connection.execute(query, params, get_consistency_level('update', 'state'))
+            return d.addCallback(_check_applied, new_state, version)
+
+        def _modify((state, version)):
+            d = defer.maybeDeferred(modifier_callable, self, state, *args, **kwargs)
+            return d.addCallback(_write_state, version)
+
+        def _modify_state():
+            return self._view_versioned_state().addCallback(_modify)
+
+        return _modify_state()
+
     def modify_state(self, modifier_callable, *args, **kwargs):
         """
         see :meth:`otter.models.interface.IScalingGroup.modify_state`
         """
+        if self.state_queue is not None:
+            return self.state_queue.modify_state(self, modifier_callable, *args, **kwargs)
+        return self._modify_state(modifier_callable, *args, **kwargs)
+
+    def _modify_state(self, modifier_callable, *args, **kwargs):
+        """
+        Read, modify and write the state, guarded either by a lock or by a
+        versioned write.  Either way the version is incremented, so that
+        optimistic writers notice writes made under the lock.
+
+        Both ways read and write the ``version`` and ``warm_pool`` columns, so
+        the ``control_70_add_state_version`` and ``control_95_add_warm_pool``
+        migrations must have been applied whatever
+        ``cassandra.state_concurrency`` is set to.
+        """
         log = self.log.bind(system='CassScalingGroup.modify_state')
 
-        def _write_state(new_state):
-            assert (new_state.tenant_id == self.tenant_id and
-                    new_state.group_id == self.uuid)
-            params = {
-                'tenantId': new_state.tenant_id,
-                'groupId': new_state.group_id,
-                'active': serialize_json_data(new_state.active, 1),
-                'pending': serialize_json_data(new_state.pending, 1),
-                'paused': new_state.paused,
-                'groupTouched': new_state.group_touched,
-                'policyTouched': serialize_json_data(new_state.policy_touched, 1)
-            }
-            return self.connection.execute(_cql_insert_group_state.format(cf=self.group_table),
-                                           params, get_consistency_level('update', 'state'))
+        if _optimistic_concurrency():
+            return self._modify_state_optimistic(log, modifier_callable, *args, **kwargs)
+
+        def _write_state(new_state, version):
+            params = self._state_params(new_state)
+            params['newVersion'] = (version or 0) + 1
+            d = self.connection.execute(self.queries.insert_group_state, params,
+                                        get_consistency_level('update', 'state'))
+            return d.addCallback(lambda _: new_state.saved(log))
+
+        def _modify((state, version)):
+            d = defer.maybeDeferred(modifier_callable, self, state, *args, **kwargs)
+            return d.addCallback(_write_state, version)
 
         def _modify_state():
-            d = self.view_state()
-            d.addCallback(lambda state: modifier_callable(self, state, *args, **kwargs))
-            return d.addCallback(_write_state)
+            return self._view_versioned_state().addCallback(_modify)
 
         lock = BasicLock(self.connection, LOCK_TABLE_NAME, self.uuid,
                          max_retry=5, retry_wait=random.uniform(3, 5),
@@ -557,10 +1043,10 @@ class CassScalingGroup(object):
             queries = [_cql_update.format(cf=self.group_table, column='group_config',
                                           name=":scaling")]
 
-            b = Batch(queries, {"tenantId": self.tenant_id,
-                                "groupId": self.uuid,
-                                "scaling": serialize_json_data(data, 1)},
-                      consistency=get_consistency_level('update', 'partial'))
+            b = _batch(queries, {"tenantId": self.tenant_id,
+                                 "groupId": self.uuid,
+                                 "scaling": serialize_json_data(data, 1)},
+                       consistency=get_consistency_level('update', 'partial'))
             return b.execute(self.connection)
 
         d = self.view_config()
@@ -577,10 +1063,10 @@ class CassScalingGroup(object):
             queries = [_cql_update.format(cf=self.group_table, column='launch_config',
                                           name=":launch")]
 
-            b = Batch(queries, {"tenantId": self.tenant_id,
-                                "groupId": self.uuid,
-                                "launch": serialize_json_data(data, 1)},
-                      consistency=get_consistency_level('update', 'partial'))
+            b = _batch(queries, {"tenantId": self.tenant_id,
+                                 "groupId": self.uuid,
+                                 "launch": serialize_json_data(data, 1)},
+                       consistency=get_consistency_level('update', 'partial'))
             d = b.execute(self.connection)
             return d
 
@@ -630,7 +1116,7 @@ class CassScalingGroup(object):
         """
         see :meth:`otter.models.interface.IScalingGroup.get_policy`
         """
-        query = _cql_view_policy.format(cf=self.policies_table)
+        query = self.queries.view_policy
         d = self.connection.execute(query,
                                     {"tenantId": self.tenant_id,
                                      "groupId": self.uuid,
@@ -654,8 +1140,8 @@ class CassScalingGroup(object):
             outpolicies = _build_policies(data, self.policies_table,
                                           self.event_table, queries, cqldata)
 
-            b = Batch(queries, cqldata,
-                      consistency=get_consistency_level('create', 'policy'))
+            b = _batch(queries, cqldata,
+                       consistency=get_consistency_level('create', 'policy'))
             d = b.execute(self.connection)
             return d.addCallback(lambda _: outpolicies)
 
@@ -679,11 +1165,11 @@ class CassScalingGroup(object):
 
         def _do_update_policy(_):
             queries = [_cql_update_policy.format(cf=self.policies_table, name=":policy")]
-            b = Batch(queries, {"tenantId": self.tenant_id,
-                                "groupId": self.uuid,
-                                "policyId": policy_id,
-                                "policy": serialize_json_data(data, 1)},
-                      consistency=get_consistency_level('update', 'policy'))
+            b = _batch(queries, {"tenantId": self.tenant_id,
+                                 "groupId": self.uuid,
+                                 "policyId": policy_id,
+                                 "policy": serialize_json_data(data, 1)},
+                       consistency=get_consistency_level('update', 'policy'))
             return b.execute(self.connection)
 
         d = self.get_policy(policy_id)
@@ -697,21 +1183,69 @@ class CassScalingGroup(object):
         """
         self.log.bind(policy_id=policy_id).msg("Deleting policy")
 
-        def _do_delete(_):
+        def _do_delete(webhook_keys):
             queries = [
                 _cql_delete_all_in_policy.format(cf=self.policies_table),
                 _cql_delete_all_in_policy.format(cf=self.webhooks_table),
                 _cql_delete_policy_events.format(cf=self.event_table)]
-            b = Batch(queries, {"tenantId": self.tenant_id,
-                                "groupId": self.uuid,
-                                "policyId": policy_id},
-                      consistency=get_consistency_level('delete', 'policy'))
-            return b.execute(self.connection)
+            params = {"tenantId": self.tenant_id,
+                      "groupId": self.uuid,
+                      "policyId": policy_id}
+            if len(webhook_keys) > 0:
+                keys_query, keys_params = _delete_many_query_and_params(
+                    self.webhook_keys_table, '"webhookKey"', webhook_keys, 'webhook_key')
+                queries.append(keys_query)
+                params.update(keys_params)
+            b = _batch(queries, params,
+                       consistency=get_consistency_level('delete', 'policy'))
+            d = b.execute(self.connection)
+            return d.addCallback(self._invalidate_webhook_keys, webhook_keys)
+
+        def _delete_bucket_events(result, policy):
+            if policy.get('type') != 'schedule':
+                return result
+            d = _delete_bucket_policy_events(self.connection, [policy_id])
+            return d.addCallback(lambda _: result)
+
+        def _delete_policy(policy):
+            d = self._list_webhook_keys(policy_id)
+            d.addCallback(_do_delete)
+            return d.addCallback(_delete_bucket_events, policy)
 
         d = self.get_policy(policy_id)
-        d.addCallback(_do_delete)
+        d.addCallback(_delete_policy)
         return d
 
+    def _invalidate_webhook_keys(self, result, webhook_keys):
+        """
+        Remove the given webhook keys from the webhook cache, if there is one,
+        once their webhooks have been deleted.
+
+        :return: ``result``, so that this can be used as a callback
+        """
+        if self.webhook_cache is not None:
+            for webhook_key in webhook_keys:
+                self.webhook_cache.invalidate(webhook_key)
+        return result
+
+    def _list_webhook_keys(self, policy_id=None):
+        """
+        List the webhook keys of all the webhooks of this group, or only of the
+        webhooks of the given policy, so that their entries in the webhook keys
+        table can be deleted along with them.
+
+        :return: a ``Deferred`` that fires with a ``list`` of webhook keys
+        """
+        params = {"tenantId": self.tenant_id, "groupId": self.uuid}
+        if policy_id is None:
+            query = _cql_list_group_webhook_keys
+        else:
+            query = _cql_list_policy_webhook_keys
+            params["policyId"] = policy_id
+        d = self.connection.execute(query.format(cf=self.webhooks_table), params,
+                                    get_consistency_level('list', 'webhook'))
+        return d.addCallback(lambda rows: [row['webhookKey'] for row in rows])
+
     def _naive_list_webhooks(self, policy_id, limit, marker):
         """
         Like :meth:`otter.models.cass.CassScalingGroup.list_webhooks`, but gets
@@ -756,11 +1290,11 @@ class CassScalingGroup(object):
                           "groupId": self.uuid,
                           "policyId": policy_id}
 
-            output = _build_webhooks(data, self.webhooks_table, queries,
-                                     cql_params)
+            output = _build_webhooks(data, self.webhooks_table,
+                                     self.webhook_keys_table, queries, cql_params)
 
-            b = Batch(queries, cql_params,
-                      consistency=get_consistency_level('create', 'webhook'))
+            b = _batch(queries, cql_params,
+                       consistency=get_consistency_level('create', 'webhook'))
             d = b.execute(self.connection)
             return d.addCallback(lambda _: output)
 
@@ -778,7 +1312,7 @@ class CassScalingGroup(object):
                                          webhook_id)
             return _assemble_webhook_from_row(cass_data[0])
 
-        query = _cql_view_webhook.format(cf=self.webhooks_table)
+        query = self.queries.view_webhook
         d = self.connection.execute(query,
                                     {"tenantId": self.tenant_id,
                                      "groupId": self.uuid,
@@ -797,7 +1331,7 @@ class CassScalingGroup(object):
 
         def _update_data(lastRev):
             data.setdefault('metadata', {})
-            query = _cql_update_webhook.format(cf=self.webhooks_table)
+            query = self.queries.update_webhook
             return self.connection.execute(
                 query,
                 {"tenantId": self.tenant_id,
@@ -817,15 +1351,17 @@ class CassScalingGroup(object):
         self.log.bind(policy_id=policy_id, webhook_id=webhook_id).msg("Deleting webhook")
 
         def _do_delete(lastRev):
-            query = _cql_delete_one_webhook.format(cf=self.webhooks_table)
-
-            d = self.connection.execute(query,
-                                        {"tenantId": self.tenant_id,
-                                         "groupId": self.uuid,
-                                         "policyId": policy_id,
-                                         "webhookId": webhook_id},
-                                        get_consistency_level('delete', 'webhook'))
-            return d
+            queries = [_cql_delete_one_webhook.format(cf=self.webhooks_table),
+                       _cql_delete_webhook_key.format(cf=self.webhook_keys_table)]
+            b = _batch(queries, {"tenantId": self.tenant_id,
+                                 "groupId": self.uuid,
+                                 "policyId": policy_id,
+                                 "webhookId": webhook_id,
+                                 "webhookKey": lastRev['capability']['hash']},
+                       consistency=get_consistency_level('delete', 'webhook'))
+            d = b.execute(self.connection)
+            return d.addCallback(self._invalidate_webhook_keys,
+                                 [lastRev['capability']['hash']])
 
         return self.get_webhook(policy_id, webhook_id).addCallback(_do_delete)
 
@@ -837,7 +1373,7 @@ class CassScalingGroup(object):
 
         # Events can only be deleted by policy id, since that and trigger are
         # the only parts of the compound key
-        def _delete_everything(policies):
+        def _delete_everything((policies, webhook_keys)):
             params = {
                 'tenantId': self.tenant_id,
                 'groupId': self.uuid
@@ -852,43 +1388,202 @@ class CassScalingGroup(object):
                 queries.append(events_query)
                 params.update(events_params)
 
-            b = Batch(queries, params,
-                      consistency=get_consistency_level('delete', 'group'))
+            if len(webhook_keys) > 0:
+                keys_query, keys_params = _delete_many_query_and_params(
+                    self.webhook_keys_table, '"webhookKey"', webhook_keys, 'webhook_key')
+                queries.append(keys_query)
+                params.update(keys_params)
 
-            return b.execute(self.connection)
+            b = _batch(queries, params,
+                       consistency=get_consistency_level('delete', 'group'))
+
+            d = b.execute(self.connection)
+            d.addCallback(lambda _: _delete_bucket_policy_events(
+                self.connection, [p['id'] for p in policies if p.get('type') == 'schedule']))
+            return d.addCallback(self._invalidate_webhook_keys, webhook_keys)
 
         def _maybe_delete(state):
-            if len(state.active) + len(state.pending) > 0:
+            if not _is_empty(state):
                 raise GroupNotEmptyError(self.tenant_id, self.uuid)
 
-            d = self._naive_list_policies()
-            d.addCallback(_delete_everything)
+            d = defer.gatherResults([self._naive_list_policies(),
+                                     self._list_webhook_keys()], consumeErrors=True)
+            d.addCallbacks(_delete_everything, unwrap_first_error)
             return d
 
         def _delete_group():
-            d = self.view_state()
-            d.addCallback(_maybe_delete)
+            d = self._view_versioned_state()
+            d.addCallback(lambda (state, version): _maybe_delete(state))
             return d
 
+        if _optimistic_concurrency():
+            return self._delete_group_optimistic(log, _maybe_delete)
+
         lock = BasicLock(self.connection, LOCK_TABLE_NAME, self.uuid,
                          max_retry=5, retry_wait=random.uniform(3, 5),
                          log=log.bind(category='locking'))
 
         return with_lock(lock, _delete_group)
 
+    def _delete_group_optimistic(self, log, delete_rest):
+        """
+        Delete the group row only if the state has not changed since it was
+        checked to be empty, so that a concurrent optimistic
+        :meth:`modify_state` cannot add servers to a group being deleted.
+        Once the group row is gone, ``delete_rest`` is called with the state
+        to delete everything else belonging to the group.
+        """
+        attempts = [0]
+
+        def _check_applied(result, state, version):
+            if _cas_applied(result):
+                return delete_rest(state)
+
+            attempts[0] += 1
+            if attempts[0] > CAS_MAX_RETRIES:
+                raise StateConflictError(self.tenant_id, self.uuid, attempts[0])
+            log.msg('State changed since it was read, retrying',
+                    expected_version=version, attempt=attempts[0])
+            return _delete_group()
+
+        def _maybe_delete((state, version)):
+            if not _is_empty(state):
+                raise GroupNotEmptyError(self.tenant_id, self.uuid)
+
+            params = {'tenantId': self.tenant_id, 'groupId': self.uuid}
+            expected = self._version_condition(params, version)
+            query = self.queries.cas_delete_group[expected]
+            d = self.connection.execute(query, params, get_consistency_level('delete', 'group'))
+            return d.addCallback(_check_applied, state, version)
+
+        def _delete_group():
+            return self._view_versioned_state().addCallback(_maybe_delete)
+
+        return _delete_group()
+
+
+class StateModifierQueue(object):
+    """
+    Coalesces :meth:`CassScalingGroup.modify_state` calls for the same group
+    made on this node.  Modifiers queued while the group's state is being
+    modified (or while the lock to modify it is being acquired) are applied
+    one after another to a single read of the state, and the result is saved
+    with a single write.
+
+    Each caller's ``Deferred`` fires with its own result: a modifier that
+    fails has its changes discarded and its ``Deferred`` errbacks, without
+    affecting the other modifiers in the batch.  If the state cannot be read
+    or written, every modifier in the batch fails with that error.
+
+    :ivar dict _queued: mapping of ``(tenant_id, group_id)`` to a list of
+        ``(group, modifier_callable, args, kwargs, deferred)`` waiting for the
+        next read of that group's state
+    :ivar set _running: ``(tenant_id, group_id)`` of the groups whose state
+        is being modified
+    """
+    def __init__(self):
+        self._queued = {}
+        self._running = set()
+
+    def modify_state(self, group, modifier_callable, *args, **kwargs):
+        """
+        Queue ``modifier_callable`` to be applied to the state of ``group``.
+
+        :return: a ``Deferred`` that fires with ``None`` once the modified
+            state has been saved, or with the modifier's failure
+        """
+        key = (group.tenant_id, group.uuid)
+        d = defer.Deferred()
+        self._queued.setdefault(key, []).append(
+            (group, modifier_callable, args, kwargs, d))
+        self._maybe_start(key)
+        return d
+
+    def _maybe_start(self, key):
+        """
+        Start modifying the state of the group identified by ``key`` if
+        anything is queued for it and it is not already being modified.
+        """
+        if key in self._running or key not in self._queued:
+            return
+
+        batch = []
+        outcomes = {}
+
+        def apply_one(state, entry):
+            group, modifier_callable, args, kwargs, _ = entry
+            snapshot = deepcopy(state)
+
+            def succeeded(new_state):
+                outcomes[id(entry)] = None
+                return new_state
+
+            def failed(f):
+                outcomes[id(entry)] = f
+                return snapshot
+
+            d = defer.maybeDeferred(modifier_callable, group, state, *args, **kwargs)
+            return d.addCallbacks(succeeded, failed)
+
+        def apply_all(group, state):
+            # the batch is taken as late as possible, once the state has been
+            # read, so that everything queued in the meantime is included
+            if not batch:
+                batch.extend(self._queued.pop(key))
+                group.log.msg('Applying {num_modifiers} queued state modifiers',
+                              num_modifiers=len(batch))
+            outcomes.clear()
+
+            d = defer.succeed(state)
+            for entry in batch:
+                d.addCallback(apply_one, entry)
+
+            def check_any_succeeded(new_state):
+                failures = [outcomes[id(entry)] for entry in batch]
+                if all(failures):
+                    # nothing to save
+                    return failures[0]
+                return new_state
+
+            return d.addCallback(check_any_succeeded)
+
+        def finished(result):
+            self._running.remove(key)
+            if not batch:
+                # the state was never read, so nothing queued was applied
+                batch.extend(self._queued.pop(key))
+
+            for entry in batch:
+                failure = outcomes.get(id(entry))
+                if failure is None and isinstance(result, Failure):
+                    failure = result
+
+                if failure is None:
+                    entry[-1].callback(None)
+                else:
+                    entry[-1].errback(failure)
+
+            self._maybe_start(key)
+
+        self._running.add(key)
+        group = self._queued[key][0][0]
+        group._modify_state(apply_all).addBoth(finished)
 
-def _delete_many_query_and_params(cf, column, column_values):
+
+def _delete_many_query_and_params(cf, column, column_values, param_name='column_value'):
     """
     Creates query and parameters that deletes many rows based on given column and values
 
     :param cf: column family
     :param column: column name based on which row will be deleted
     :return: iterable column_values, column values that will match deleted row
+    :param param_name: prefix of the generated parameter names, to keep them apart
+        from the parameters of other queries in the same batch
     """
     column_values = list(column_values)
     column_values_args = ','.join(
-        [':column_value{}'.format(i) for i in range(len(column_values))])
-    params = {'column_value{}'.format(i): column_value
+        [':{}{}'.format(param_name, i) for i in range(len(column_values))])
+    params = {'{}{}'.format(param_name, i): column_value
               for i, column_value in enumerate(column_values)}
     query = _cql_delete_many.format(cf=cf, column=column, column_values=column_values_args)
     return (query, params)
@@ -931,17 +1626,27 @@ class CassScalingGroupCollection:
         """
         Init
 
-        :param connection: Thrift connection to use
+        :param connection: Thrift connection to use.  If it can prepare
+            statements, queries are executed as prepared statements.
 
         :param cflist: Column family list
         """
-        self.connection = connection
+        self.connection = prepared_statements(connection)
+        self.state_queue = StateModifierQueue()
+        self.webhook_cache = LRUCache(
+            config_value('cassandra.webhook_cache.size') or 10000,
+            config_value('cassandra.webhook_cache.ttl') or 60)
+        self.group_cache = LRUCache(
+            config_value('cassandra.group_cache.size') or 10000,
+            config_value('cassandra.group_cache.ttl') or 30)
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
         self.policies_table = "scaling_policies"
         self.webhooks_table = "policy_webhooks"
+        self.webhook_keys_table = "webhook_keys"
         self.state_table = "group_state"
         self.event_table = "scaling_schedule"
+        self.queries = _StoreQueries(self)
 
     def create_scaling_group(self, log, tenant_id, config, launch, policies=None):
         """
@@ -978,8 +1683,8 @@ class CassScalingGroupCollection:
         outpolicies = _build_policies(policies, self.policies_table,
                                       self.event_table, queries, data)
 
-        b = Batch(queries, data,
-                  consistency=get_consistency_level('create', 'group'))
+        b = _batch(queries, data,
+                   consistency=get_consistency_level('create', 'group'))
         d = b.execute(self.connection)
         d.addCallback(lambda _: {
             'groupConfiguration': config,
@@ -1031,14 +1736,16 @@ class CassScalingGroupCollection:
         """
         see :meth:`otter.models.interface.IScalingGroupCollection.get_scaling_group`
         """
-        return CassScalingGroup(log, tenant_id, scaling_group_id,
-                                self.connection)
+        group = CassScalingGroup(log, tenant_id, scaling_group_id,
+                                 self.connection, self.state_queue,
+                                 self.webhook_cache, self.queries)
+        return CachingScalingGroup(group, self.group_cache)
 
     def fetch_batch_of_events(self, now, size=100):
         """
         see :meth:`otter.models.interface.IScalingScheduleCollection.fetch_batch_of_events`
         """
-        d = self.connection.execute(_cql_fetch_batch_of_events.format(cf=self.event_table),
+        d = self.connection.execute(self.queries.fetch_batch_of_events,
                                     {"size": size, "now": now},
                                     get_consistency_level('list', 'event'))
         return d
@@ -1060,11 +1767,50 @@ class CassScalingGroupCollection:
                 polname = 'policy{}'.format(i)
                 queries.append(_cql_insert_event_batch.format(cf=self.event_table, name=':' + polname))
                 data.update({polname + key: event[key] for key in event})
-            b = Batch(queries, data, get_consistency_level('insert', 'event'))
+            b = _batch(queries, data, get_consistency_level('insert', 'event'))
             return b.execute(self.connection)
 
         return update_events and d.addCallback(_do_update) or d
 
+    def fetch_bucket_events(self, bucket, now, size=100):
+        """
+        see :meth:`otter.models.interface.IScalingScheduleCollection.fetch_bucket_events`
+        """
+        return self.connection.execute(
+            self.queries.fetch_bucket_events,
+            {"bucket": bucket, "size": size, "now": now},
+            get_consistency_level('list', 'event'))
+
+    def reschedule_events(self, processed_events, cron_events):
+        """
+        see :meth:`otter.models.interface.IScalingScheduleCollection.reschedule_events`
+        """
+        queries, data = [], {}
+        for i, event in enumerate(processed_events):
+            name = 'event{}'.format(i)
+            queries.append(_cql_delete_bucket_event.format(cf=BUCKET_EVENT_TABLE_NAME,
+                                                           name=':' + name))
+            data.update({name + key: event[key] for key in ('bucket', 'trigger', 'policyId')})
+        for i, event in enumerate(cron_events):
+            name = 'cron{}'.format(i)
+            queries.append(_cql_insert_bucket_event_batch.format(cf=BUCKET_EVENT_TABLE_NAME,
+                                                                 name=':' + name))
+            queries.append(_cql_insert_bucket_trigger_batch.format(cf=BUCKET_TRIGGER_TABLE_NAME,
+                                                                   name=':' + name))
+            data.update({name + key: event[key] for key in event})
+        # the triggers of rescheduled events are overwritten above, and must
+        # not also be deleted in the same batch, or the deletion would win
+        rescheduled = set(event['policyId'] for event in cron_events)
+        done = [event['policyId'] for event in processed_events
+                if event['policyId'] not in rescheduled]
+        if done:
+            query, params = _delete_many_query_and_params(
+                BUCKET_TRIGGER_TABLE_NAME, '"policyId"', done, 'trigger_policy')
+            queries.append(query)
+            data.update(params)
+        b = _batch(queries, data, get_consistency_level('insert', 'event'))
+        return b.execute(self.connection)
+
     def webhook_info_by_hash(self, log, capability_hash):
         """
         see :meth:`otter.models.interface.IScalingGroupCollection.webhook_info_by_hash`
@@ -1076,11 +1822,57 @@ class CassScalingGroupCollection:
             res = res[0]
             return (res['tenantId'], res['groupId'], res['policyId'])
 
-        query = _cql_find_webhook_token.format(cf=self.webhooks_table)
+        def _add_missing_key(webhook_rec):
+            # webhooks created before the webhook keys table existed, and not yet
+            # backfilled by scripts/backfill_webhook_keys.py, are only in the
+            # index on the webhooks table. Add them so the next lookup is direct.
+            # The index is only searched while cassandra.webhook_index_fallback
+            # is set, since it is queried on every node for every unknown key.
+            if len(webhook_rec) > 0:
+                log.bind(webhook_key=capability_hash).msg('Adding missing webhook key')
+                query = _cql_insert_webhook_key.format(cf=self.webhook_keys_table,
+                                                       name=':webhookKey')
+                params = dict(webhook_rec[0], webhookKey=capability_hash)
+                d = self.connection.execute(query + ';', params,
+                                            get_consistency_level('create', 'webhook'))
+                d.addErrback(log.err, 'Failed to add missing webhook key')
+            return webhook_rec
+
+        def _find_in_index(webhook_rec):
+            if len(webhook_rec) > 0 or not config_value('cassandra.webhook_index_fallback'):
+                return webhook_rec
+            query = self.queries.find_webhook_token
+            d = self.connection.execute(query,
+                                        {"webhookKey": capability_hash},
+                                        get_consistency_level('list', 'group'))
+            return d.addCallback(_add_missing_key)
+
+        def _cache_found(info):
+            self.webhook_cache.set(capability_hash, info)
+            return info
+
+        def _cache_not_found(failure):
+            # cache unrecognized hashes only briefly, since a webhook with this
+            # hash may yet be created
+            failure.trap(UnrecognizedCapabilityError)
+            self.webhook_cache.set(
+                capability_hash, None,
+                config_value('cassandra.webhook_cache.negative_ttl') or 5)
+            return failure
+
+        cached = self.webhook_cache.get(capability_hash, _NOT_CACHED)
+        if cached is None:
+            return defer.fail(UnrecognizedCapabilityError(capability_hash, 1))
+        elif cached is not _NOT_CACHED:
+            return defer.succeed(cached)
+
+        query = self.queries.find_webhook_key
         d = self.connection.execute(query,
                                     {"webhookKey": capability_hash},
                                     get_consistency_level('list', 'group'))
+        d.addCallback(_find_in_index)
         d.addCallback(_do_webhook_lookup)
+        d.addCallbacks(_cache_found, _cache_not_found)
         return d
 
     def get_counts(self, log, tenant_id):
@@ -1107,8 +1899,17 @@ class CassAdmin(object):
     .. autointerface:: otter.models.interface.IAdmin
     """
 
-    def __init__(self, connection):
-        self.connection = connection
+    def __init__(self, connection, webhook_cache=None):
+        """
+        :param connection: silverberg client used to connect to cassandra.
+            If it can prepare statements, queries are executed as prepared
+            statements.
+        :param webhook_cache: if not ``None``, the
+            :class:`otter.util.cache.LRUCache` of webhook lookups whose
+            counters are reported along with the other metrics
+        """
+        self.connection = prepared_statements(connection)
+        self.webhook_cache = webhook_cache
 
     def get_metrics(self, log):
         """
@@ -1139,5 +1940,32 @@ class CassAdmin(object):
         labels = ['groups', 'policies', 'webhooks']
         mapping = zip(tables, labels)
 
+        def _add_cache_metrics(metrics):
+            if self.webhook_cache is not None:
+                now = int(time.time())
+                for name, value in sorted(self.webhook_cache.stats().items()):
+                    metrics.append(dict(
+                        id="otter.metrics.webhook_cache.{0}".format(name),
+                        value=value,
+                        time=now))
+            return metrics
+
+        def _add_latency_metrics(metrics):
+            now = int(time.time())
+            for (operation, level), histogram in sorted(_latencies.items()):
+                prefix = "otter.metrics.latency.{0}.{1}".format(operation, level)
+                metrics.append(dict(id=prefix + ".count", value=histogram.count,
+                                    time=now))
+                # cumulative counts of the operations that took at most each
+                # bucket's bound in milliseconds
+                cumulative = 0
+                for bound, count in histogram.buckets()[:-1]:
+                    cumulative += count
+                    metrics.append(dict(id="{0}.le_{1}".format(prefix, bound),
+                                        value=cumulative, time=now))
+            return metrics
+
         deferreds = [_get_metric(table, label) for table, label in mapping]
-        return defer.gatherResults(deferreds, consumeErrors=True)
+        d = defer.gatherResults(deferreds, consumeErrors=True)
+        d.addCallback(_add_cache_metrics)
+        return d.addCallback(_add_latency_metrics)
@@ -1,6 +1,9 @@
 """
 Interface to be used by the scaling groups engine
 """
+from copy import deepcopy
+
+from twisted.internet import defer
 from zope.interface import Interface, Attribute
 
 from otter.util import timestamp
@@ -26,11 +29,16 @@ class GroupState(object):
         last time any policy was executed on the group.  Could be None.
     :ivar callable now: callable that returns a ``str`` timestamp - used for
         testing purposes.  Defaults to :func:`timestamp.now`
+    :ivar dict warm_servers: the mapping of the ids of the servers in the
+        group's warm pool, which are built but not yet launched, to their info
+    :ivar dict warm_jobs: the mapping of the ids of the jobs building servers
+        for the group's warm pool to their info
 
     TODO: ``remove_active``, ``pause`` and ``resume`` ?
     """
     def __init__(self, tenant_id, group_id, group_name, active, pending, group_touched,
-                 policy_touched, paused, now=timestamp.now):
+                 policy_touched, paused, now=timestamp.now, warm_servers=None,
+                 warm_jobs=None):
         self.tenant_id = tenant_id
         self.group_id = group_id
         self.group_name = group_name
@@ -44,6 +52,9 @@ class GroupState(object):
             self.group_touched = timestamp.MIN
 
         self.now = now
+        self.warm_servers = warm_servers or {}
+        self.warm_jobs = warm_jobs or {}
+        self._after_save = []
 
     def __eq__(self, other):
         """
@@ -51,7 +62,7 @@ class GroupState(object):
         the now callable)
         """
         params = ('tenant_id', 'group_id', 'group_name', 'active', 'pending', 'paused',
-                  'policy_touched', 'group_touched')
+                  'policy_touched', 'group_touched', 'warm_servers', 'warm_jobs')
         return all((getattr(self, param) == getattr(other, param)
                     for param in params))
 
@@ -71,6 +82,45 @@ class GroupState(object):
             self.paused
         )
 
+    def __deepcopy__(self, memo):
+        """
+        Copy the state.  The actions waiting for it to be saved are not
+        copied, but the copy waits for the same ones.
+        """
+        state = GroupState(self.tenant_id, self.group_id, self.group_name,
+                           deepcopy(self.active, memo), deepcopy(self.pending, memo),
+                           self.group_touched, deepcopy(self.policy_touched, memo),
+                           self.paused, self.now, deepcopy(self.warm_servers, memo),
+                           deepcopy(self.warm_jobs, memo))
+        state._after_save = list(self._after_save)
+        return state
+
+    def after_save(self, action, *args, **kwargs):
+        """
+        Call ``action`` with the given arguments once this state has been
+        saved, rather than now.  Modifiers passed to
+        :meth:`IScalingGroup.modify_state` use this for anything that should
+        not happen unless their changes are saved, such as creating or
+        deleting servers, since they may be called again with a fresh state
+        if saving fails.
+
+        :param callable action: the action to call
+        :returns: None
+        """
+        self._after_save.append((action, args, kwargs))
+
+    def saved(self, log):
+        """
+        Call the actions waiting for this state to be saved, once each.
+
+        :param log: a bound logger to log any of them failing to
+        :returns: None
+        """
+        actions, self._after_save = self._after_save, []
+        for action, args, kwargs in actions:
+            d = defer.maybeDeferred(action, *args, **kwargs)
+            d.addErrback(log.err, 'Action after saving state failed')
+
     def remove_job(self, job_id):
         """
         Removes a pending job from the pending list.  If the job is not in
@@ -120,6 +170,56 @@ class GroupState(object):
         assert server_id in self.active, "Server does not exists: {}".format(server_id)
         del self.active[server_id]
 
+    def add_warm_job(self, job_id, job_info):
+        """
+        Adds a job building a server for the warm pool.
+
+        :param str job_id: the id of the job
+        :param dict job_info: a dictionary containing relevant job info
+        :returns: None
+        :raises: :class:`AssertionError` if the job already exists
+        """
+        assert job_id not in self.warm_jobs, "Warm pool job exists: {0}".format(job_id)
+        job_info.setdefault('created', self.now())
+        self.warm_jobs[job_id] = job_info
+
+    def remove_warm_job(self, job_id):
+        """
+        Removes a job building a server for the warm pool.
+
+        :param str job_id: the id of the job
+        :returns: None
+        :raises: :class:`AssertionError` if the job doesn't exist
+        """
+        assert job_id in self.warm_jobs, "Warm pool job doesn't exist: {0}".format(job_id)
+        del self.warm_jobs[job_id]
+
+    def add_warm_server(self, server_id, server_info):
+        """
+        Adds a built server to the warm pool.  Adds a creation time if there
+        isn't one.
+
+        :param str server_id: the id of the server
+        :param dict server_info: a dictionary containing relevant server info
+        :returns: None
+        :raises: :class:`AssertionError` if the server id already exists
+        """
+        assert server_id not in self.warm_servers, \
+            "Warm pool server already exists: {0}".format(server_id)
+        server_info.setdefault('created', self.now())
+        self.warm_servers[server_id] = server_info
+
+    def remove_warm_server(self, server_id):
+        """
+        Removes a server from the warm pool.
+
+        :param str server_id: the id of the server
+        :raises: :class:`AssertionError` if the server id does not exist
+        """
+        assert server_id in self.warm_servers, \
+            "Warm pool server does not exist: {0}".format(server_id)
+        del self.warm_servers[server_id]
+
     def mark_executed(self, policy_id):
         """
         Record the execution time (now) of a particular policy.  This also
@@ -239,10 +339,33 @@ class IScalingGroup(Interface):
             with this uuid) does not exist
         """
 
+    def view_execution_bundle(policy_id=None):
+        """
+        Everything needed to execute a policy of this scaling group, read in
+        as few round-trips as possible.
+
+        :param policy_id: the uuid of the policy to read as well, if any
+        :type policy_id: ``str``
+
+        The state is not part of the bundle, since a policy is executed
+        against the state being modified by :meth:`modify_state`.
+
+        :return: a ``(config, launch_config, policy)`` tuple, where ``config``
+            and ``launch_config`` are as returned by :meth:`view_config` and
+            :meth:`view_launch_config`, and ``policy`` is as returned by
+            :meth:`get_policy`, or ``None`` if no ``policy_id`` was given
+        :rtype: a :class:`twisted.internet.defer.Deferred` that fires with
+            ``tuple``
+
+        :raises: :class:`NoSuchScalingGroupError` if this scaling group (one
+            with this uuid) does not exist
+        :raises: :class:`NoSuchPolicyError` if the policy id does not exist
+        """
+
     def delete_group():
         """
-        Deletes the scaling group if the state is empty.  This method should
-        handle its own locking, if required.
+        Deletes the scaling group if the state is empty, including its warm
+        pool.  This method should handle its own locking, if required.
 
         :return: a :class:`twisted.internet.defer.Deferred` that fires with None
 
@@ -297,9 +420,14 @@ class IScalingGroup(Interface):
         :param modifier_callable: a ``callable`` that takes as first two
             arguments the :class:`IScalingGroup`, a :class:`GroupState`, and
             returns a :class:`GroupState`.  Other arguments provided to
-            :func:`modify_state` will be passed to the ``callable``.
+            :func:`modify_state` will be passed to the ``callable``.  It may
+            be called more than once, with a freshly read state each time,
+            so anything it should only do once its changes are saved must be
+            passed to :meth:`GroupState.after_save`.
 
         :return: a :class:`twisted.internet.defer.Deferred` that fires with None
+            once the state has been saved and the actions waiting for that
+            have been called
 
         :raises: :class:`NoSuchScalingGroupError` if this scaling group (one
             with this uuid) does not exist
@@ -523,6 +651,40 @@ class IScalingScheduleCollection(Interface):
         :return: None
         """
 
+    def fetch_bucket_events(bucket, now, size=100):
+        """
+        Fetch a batch of scheduled events from one bucket of a bucketed schedule.
+        The events of a policy are deleted from its bucket when the policy is
+        deleted or its schedule changes, so they are not checked against the
+        policy.
+
+        :param bucket: the bucket to fetch events from
+        :type bucket: ``int``
+
+        :param now: the current time
+        :type now: ``datetime``
+
+        :param size: the size of the request
+        :type size: ``int``
+
+        :return: list of dict representing a row
+        """
+
+    def reschedule_events(processed_events, cron_events):
+        """
+        Delete processed events from a bucketed schedule, and add cron events
+        with their next trigger times
+
+        :param processed_events: list of `dict` returned in `fetch_bucket_events`
+        :type processed_events: ``list``
+
+        :param cron_events: list of `dict` returned in `fetch_bucket_events` with
+            the trigger updated to the next time the event should happen
+        :type cron_events: ``list``
+
+        :return: None
+        """
+
 
 class IScalingGroupCollection(Interface):
     """
@@ -164,6 +164,18 @@ class MockScalingGroup:
             return defer.fail(self.error)
         return defer.succeed(self.state)
 
+    def view_execution_bundle(self, policy_id=None):
+        """
+        see :meth:`otter.models.interface.IScalingGroup.view_execution_bundle`
+        """
+        if self.error is not None:
+            return defer.fail(self.error)
+
+        bundle = (self.config.copy(), self.launch.copy())
+        if policy_id is None:
+            return defer.succeed(bundle + (None,))
+        return self.get_policy(policy_id).addCallback(lambda policy: bundle + (policy,))
+
     def modify_state(self, modifier_callable, *args, **kwargs):
         """
         see :meth:`otter.models.interface.IScalingGroup.modify_state`
@@ -172,6 +184,7 @@ class MockScalingGroup:
             assert (new_state.tenant_id == self.tenant_id and
                     new_state.group_id == self.uuid)
             self.state = new_state
+            new_state.saved(self.log)
 
         d = self.view_state()
         d.addCallback(lambda state: modifier_callable(self, state, *args, **kwargs))
@@ -382,7 +395,8 @@ class MockScalingGroup:
         if self.error is not None:
             return defer.fail(self.error)
 
-        if len(self.state.pending) + len(self.state.active) > 0:
+        state = self.state
+        if state.pending or state.active or state.warm_servers or state.warm_jobs:
             return defer.fail(GroupNotEmptyError(self.tenant_id, self.uuid))
 
         collection = self._collection
@@ -446,6 +460,18 @@ class MockScalingGroupCollection:
         """
         return defer.succeed(None)
 
+    def fetch_bucket_events(self, bucket, now, size=100):
+        """
+        see :meth:`otter.models.interface.IScalingScheduleCollection.fetch_bucket_events`
+        """
+        return defer.succeed([])
+
+    def reschedule_events(self, processed_events, cron_events):
+        """
+        see :meth:`otter.models.interface.IScalingScheduleCollection.reschedule_events`
+        """
+        return defer.succeed(None)
+
     def webhook_info_by_hash(self, log, capability_hash):
         """
         see :meth:`otter.models.interface.IScalingGroupCollection.webhook_info_by_hash`
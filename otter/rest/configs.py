@@ -213,8 +213,21 @@ class OtterLaunch(object):
 
         Nova should validate the image before saving the new config.
         Users may have an invalid configuration based on dependencies.
+
+        The servers in the group's warm pool, if it has one, are replaced with
+        servers built from the new launch configuration.
         """
         rec = self.store.get_scaling_group(self.log, self.tenant_id, self.group_id)
-        deferred = get_supervisor().validate_launch_config(self.log, self.tenant_id, data)
+        supervisor = get_supervisor()
+        deferred = supervisor.validate_launch_config(self.log, self.tenant_id, data)
         deferred.addCallback(lambda _: rec.update_launch_config(data))
+        deferred.addCallback(lambda _: rec.view_config())
+
+        def replace_warm_pool(config):
+            if config.get('warmPool'):
+                return rec.modify_state(partial(controller.maintain_warm_pool, self.log,
+                                                transaction_id(request), config, data))
+
+        deferred.addCallback(replace_warm_pool)
+        deferred.addCallback(lambda _: None)
         return deferred
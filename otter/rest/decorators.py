@@ -14,7 +14,7 @@ from otter.util.hashkey import generate_transaction_id
 from otter.util.deferredutils import unwrap_first_error
 from otter.log import log
 
-from otter.json_schema import validate
+from otter.json_schema import validator
 
 
 def fails_with(mapping):
@@ -158,15 +158,20 @@ def validate_body(schema):
     Decorator that validates dependent on the schema passed in.
     See http://json-schema.org/ for schema documentation.
 
+    The schema's validator is made when the decorator is applied, and reused
+    for every request.
+
     :return: decorator
     """
+    schema_validator = validator(schema)
+
     def decorator(f):
         @wraps(f)
         def _(self, request, *args, **kwargs):
             try:
                 request.content.seek(0)
                 data = json.loads(request.content.read())
-                validate(data, schema)
+                schema_validator.validate(data)
             except ValueError as e:
                 return defer.fail(InvalidJsonError())
             except ValidationError, e:
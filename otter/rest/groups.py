@@ -5,10 +5,13 @@ Autoscale REST endpoints having to do with a group or collection of groups
 from functools import partial
 import json
 
+from twisted.internet import defer
+
 from otter import controller
 from otter.supervisor import get_supervisor
 
 from otter.json_schema.rest_schemas import create_group_request
+from otter.models.interface import GroupNotEmptyError
 from otter.json_schema.group_schemas import MAX_ENTITIES
 from otter.rest.configs import OtterConfig, OtterLaunch
 from otter.rest.decorators import (validate_body, fails_with, succeeds_with,
@@ -455,6 +458,10 @@ class OtterGroup(object):
         """
         Delete a scaling group if there are no entities belonging to the scaling
         group.  If successful, no response body will be returned.
+
+        The servers in the group's warm pool, if it has one, are removed from
+        it and deleted first, but only if the group has no other servers and
+        is building none, since otherwise it can not be deleted.
         """
         group = self.store.get_scaling_group(self.log, self.tenant_id,
                                              self.group_id)
@@ -464,9 +471,18 @@ class OtterGroup(object):
             force = False
         if force == 'true':
             d = group.update_config({'minEntities': 0, 'maxEntities': 0})
-            return d.addCallback(lambda _: group.delete_group())
         else:
-            return group.delete_group()
+            d = defer.succeed(None)
+
+        def empty_warm_pool(group, state):
+            if state.active or state.pending:
+                raise GroupNotEmptyError(group.tenant_id, group.uuid)
+            return controller.maintain_warm_pool(self.log, transaction_id(request),
+                                                 {}, None, group, state)
+
+        d.addCallback(lambda _: group.modify_state(empty_warm_pool))
+        d.addCallback(lambda _: group.delete_group())
+        return d
 
     @app.route('/state/', methods=['GET'])
     @fails_with(exception_codes)
@@ -2,10 +2,15 @@
 Classes and functions for managing metrics around Otter.
 """
 import json
+import time
 
+from otter.auth import cache_stats
 from otter.rest.decorators import fails_with, succeeds_with
 from otter.rest.errors import exception_codes
 from otter.rest.otterapp import OtterApp
+from otter.supervisor import get_supervisor
+from otter.util.pool import treq
+from otter.worker.launch_server_v1 import polling_stats
 
 
 class OtterMetrics(object):
@@ -45,6 +50,21 @@ class OtterMetrics(object):
                 ]
             }
         """
+        def _add_process_metrics(metrics):
+            now = int(time.time())
+            supervisor = get_supervisor()
+            rate_limit_stats = supervisor.rate_limit_stats() if supervisor else {}
+            for prefix, stats in (('auth_cache', cache_stats()),
+                                  ('http_pool', treq.stats()),
+                                  ('polling', polling_stats()),
+                                  ('rate_limit', rate_limit_stats)):
+                for name, value in sorted(stats.items()):
+                    metrics.append({'id': 'otter.metrics.{0}.{1}'.format(prefix, name),
+                                    'value': value,
+                                    'time': now})
+            return metrics
+
         deferred = self.store.get_metrics(self.log)
+        deferred.addCallback(_add_process_metrics)
         deferred.addCallback(lambda metrics: json.dumps({'metrics': metrics}))
         return deferred
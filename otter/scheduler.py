@@ -4,8 +4,9 @@ is right all the time and is probably what caused your regular clock to get brok
 in the first place.
 """
 
+from collections import OrderedDict
+from copy import deepcopy
 from datetime import datetime
-from functools import partial
 from croniter import croniter
 
 from twisted.internet import defer
@@ -27,12 +28,27 @@ def next_cron_occurrence(cron):
     return croniter(cron, start_time=datetime.utcnow()).get_next(ret_type=datetime)
 
 
+def group_events(events):
+    """
+    Group events by the scaling group they belong to, preserving the order in
+    which the events were fetched both across and within groups
+
+    :param events: list of event dicts
+    :return: an ``OrderedDict`` mapping ``(tenantId, groupId)`` to a list of events
+    """
+    groups = OrderedDict()
+    for event in events:
+        groups.setdefault((event['tenantId'], event['groupId']), []).append(event)
+    return groups
+
+
 class SchedulerService(TimerService):
     """
     Service to trigger scheduled events
     """
 
-    def __init__(self, batchsize, interval, slv_client, store, clock=None):
+    def __init__(self, batchsize, interval, slv_client, store, clock=None,
+                 max_concurrency=10, buckets=None):
         """
         Initializes the scheduler service with batch size and interval
 
@@ -41,6 +57,12 @@ class SchedulerService(TimerService):
         :param slv_client: a :class:`silverberg.client.CQLClient` or
                     :class:`silverberg.cluster.RoundRobinCassandraCluster` instance used to get lock
         :param clock: An instance of IReactorTime provider that defaults to reactor if not provided
+        :param int max_concurrency: maximum number of scaling groups whose events are
+            executed at the same time, and of buckets processed at the same time
+        :param int buckets: number of buckets the events are partitioned into. If given,
+            each bucket is processed under its own lock, so that several schedulers can
+            process different buckets at the same time. Otherwise, all the events are
+            processed under one global lock.
         """
         from otter.models.cass import LOCK_TABLE_NAME
         self.lock_table = LOCK_TABLE_NAME
@@ -49,37 +71,57 @@ class SchedulerService(TimerService):
         TimerService.__init__(self, interval, self.check_for_events, batchsize)
         self.store = store
         self.clock = clock
+        self.max_concurrency = max_concurrency
+        self.buckets = buckets
 
     def check_for_events(self, batchsize):
         """
         Check for events in the database before the present time.
 
+        When the events are partitioned into buckets, the buckets are checked
+        concurrently, at most ``max_concurrency`` at a time, so that a poll takes
+        about as long as its slowest bucket rather than all of them added up.
+        Buckets whose lock is held by another scheduler are skipped.
+
         :return: a deferred that fires with None
         """
 
-        def check_for_more(events):
+        def check_for_more(events, args):
             if events and len(events) == batchsize:
-                return _do_check()
+                return _do_check(*args)
             return None
 
-        def _do_check():
+        def _do_check(lock_id, *args):
             lock_log = self.log.bind(category='locking')
-            lock = BasicLock(self.slv_client, self.lock_table, 'schedule', max_retry=0,
+            lock = BasicLock(self.slv_client, self.lock_table, lock_id, max_retry=0,
                              log=lock_log)
-            d = with_lock(lock, self.fetch_and_process, batchsize)
-            d.addCallback(check_for_more)
+            d = with_lock(lock, self.fetch_and_process, batchsize, *args)
+            d.addCallback(check_for_more, (lock_id,) + args)
             d.addErrback(ignore_and_log, BusyLockError, lock_log,
                          "Couldn't get lock to process events")
             d.addErrback(self.log.err)
             return d
 
-        return _do_check()
+        if not self.buckets:
+            return _do_check('schedule')
+
+        sem = defer.DeferredSemaphore(self.max_concurrency)
+        d = defer.gatherResults([sem.run(_do_check, 'schedule_{}'.format(bucket), bucket)
+                                 for bucket in range(self.buckets)])
+        return d.addCallback(lambda _: None)
 
-    def fetch_and_process(self, batchsize):
+    def fetch_and_process(self, batchsize, bucket=None):
         """
         Fetch the events to be processed and process them.
         Also delete/update after processing them
 
+        Events are grouped by scaling group. Events of different groups are executed
+        concurrently, at most ``max_concurrency`` groups at a time, and events of the
+        same group are executed one after the other under a single state lock.
+
+        :param int batchsize: number of events to fetch
+        :param int bucket: bucket to fetch the events from, if the events are
+            partitioned into buckets
         :return: a deferred that fires with list of events processed
         """
         def process_events(events):
@@ -90,13 +132,22 @@ class SchedulerService(TimerService):
             log.msg('Processing {num_events} events', num_events=len(events))
 
             deleted_policy_ids = set()
+            groups = group_events(events)
+            stats['num_groups'] = len(groups)
 
+            sem = defer.DeferredSemaphore(self.max_concurrency)
             deferreds = [
-                self.execute_event(log, event, deleted_policy_ids)
-                for event in events
+                sem.run(self.execute_group_events, log, tenant_id, group_id,
+                        grouped, deleted_policy_ids)
+                for (tenant_id, group_id), grouped in groups.iteritems()
             ]
             d = defer.gatherResults(deferreds, consumeErrors=True)
-            return d.addCallback(lambda _: (events, deleted_policy_ids))
+
+            def count_contention(lock_busy):
+                stats['lock_contention'] = sum(lock_busy)
+                return events, deleted_policy_ids
+
+            return d.addCallback(count_contention)
 
         def update_delete_events((events, deleted_policy_ids)):
             """
@@ -109,8 +160,8 @@ class SchedulerService(TimerService):
             events_to_delete, events_to_update = [], []
             for event in events:
                 if event['cron'] and event['policyId'] not in deleted_policy_ids:
-                    event['trigger'] = next_cron_occurrence(event['cron'])
-                    events_to_update.append(event)
+                    events_to_update.append(
+                        dict(event, trigger=next_cron_occurrence(event['cron'])))
                 else:
                     events_to_delete.append(event['policyId'])
 
@@ -118,42 +169,119 @@ class SchedulerService(TimerService):
                     policy_ids_deleting=len(events_to_delete))
             log.msg('Updating {policy_ids_updating} events',
                     policy_ids_updating=len(events_to_update))
-            d = self.store.update_delete_events(events_to_delete, events_to_update)
+            if bucket is None:
+                d = self.store.update_delete_events(events_to_delete, events_to_update)
+            else:
+                # bucketed events can only be deleted by their full key, so all of the
+                # processed events are deleted and the cron ones added back
+                d = self.store.reschedule_events(events, events_to_update)
 
             return d.addCallback(lambda _: events)
 
+        def report(events):
+            if len(events):
+                log.msg('Processed {num_events} events of {num_groups} groups '
+                        'in {time_taken} seconds', num_events=len(events),
+                        time_taken=clock.seconds() - start_time, **stats)
+            return events
+
+        clock = self.clock
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        start_time = clock.seconds()
+        stats = {'num_groups': 0, 'lock_contention': 0}
+
         # utcnow because of cass serialization issues
         utcnow = datetime.utcnow()
         log = self.log.bind(scheduler_run_id=generate_transaction_id(), utcnow=utcnow)
-        deferred = self.store.fetch_batch_of_events(utcnow, batchsize)
+        if bucket is None:
+            deferred = self.store.fetch_batch_of_events(utcnow, batchsize)
+        else:
+            log = log.bind(bucket=bucket)
+            deferred = self.store.fetch_bucket_events(bucket, utcnow, batchsize)
         deferred.addCallback(process_events)
         deferred.addCallback(update_delete_events)
+        deferred.addCallback(report)
         deferred.addErrback(log.err)
         return deferred
 
-    def execute_event(self, log, event, deleted_policy_ids):
+    def execute_group_events(self, log, tenant_id, group_id, events, deleted_policy_ids):
         """
-        Execute a single event
+        Execute all the events of a single scaling group back-to-back in one
+        ``modify_state`` call, so that the group's state lock is acquired only once
+        for all of them
 
         :param log: A bound log for logging
-        :param event: event dict to execute
+        :param str tenant_id: tenant ID of the scaling group
+        :param str group_id: ID of the scaling group
+        :param events: list of event dicts belonging to the scaling group, in the
+            order they should be executed
         :param deleted_policy_ids: Set of policy ids that are deleted. Policy id will be added
                                    to this if its scaling group or policy has been deleted
-        :return: a deferred with the results of execution
+        :return: a deferred that fires with ``True`` if the group's lock could not be
+            acquired and ``False`` otherwise
         """
-        tenant_id, group_id, policy_id = event['tenantId'], event['groupId'], event['policyId']
-        log = log.bind(tenant_id=tenant_id, scaling_group_id=group_id, policy_id=policy_id)
-        log.msg('Executing policy')
+        log = log.bind(tenant_id=tenant_id, scaling_group_id=group_id)
         group = self.store.get_scaling_group(log, tenant_id, group_id)
-        d = group.modify_state(partial(maybe_execute_scaling_policy,
-                                       log, generate_transaction_id(),
-                                       policy_id=policy_id))
-        d.addErrback(ignore_and_log, CannotExecutePolicyError, log, 'Cannot execute policy')
-
-        def collect_deleted_policy(failure):
-            failure.trap(NoSuchScalingGroupError, NoSuchPolicyError)
-            deleted_policy_ids.add(policy_id)
-
-        d.addErrback(collect_deleted_policy)
-        d.addErrback(log.err, 'Scheduler failed to execute policy')
-        return d
+        # indexes of the events whose failure has already been handled
+        handled = set()
+
+        def event_failed(failure, index, policy_id):
+            handled.add(index)
+            _handle_event_failure(failure, log.bind(policy_id=policy_id), policy_id,
+                                  deleted_policy_ids)
+            return failure
+
+        def execute_events(group, state):
+            failures = []
+            # each policy is executed against a copy of the state, which replaces
+            # it only if the policy executes, so that a policy failing part way
+            # through leaves none of its changes (or actions after saving) behind
+            executed = [state]
+
+            def execute_event(_, index, policy_id):
+                event_log = log.bind(policy_id=policy_id)
+                event_log.msg('Executing policy')
+                d = defer.maybeDeferred(maybe_execute_scaling_policy, event_log,
+                                        generate_transaction_id(), group,
+                                        deepcopy(executed[-1]), policy_id=policy_id)
+                d.addCallbacks(executed.append, event_failed, errbackArgs=(index, policy_id))
+                d.addErrback(failures.append)
+                return d
+
+            d = defer.succeed(None)
+            for index, event in enumerate(events):
+                d.addCallback(execute_event, index, event['policyId'])
+
+            def save(_):
+                # do not bother writing the state if none of the policies executed
+                if len(failures) == len(events):
+                    return failures[0]
+                return executed[-1]
+
+            return d.addCallback(save)
+
+        d = group.modify_state(execute_events)
+
+        def group_failed(failure):
+            for index, event in enumerate(events):
+                if index not in handled:
+                    _handle_event_failure(failure, log.bind(policy_id=event['policyId']),
+                                          event['policyId'], deleted_policy_ids)
+            return failure.check(BusyLockError) is not None
+
+        return d.addCallbacks(lambda _: False, group_failed)
+
+
+def _handle_event_failure(failure, log, policy_id, deleted_policy_ids):
+    """
+    Log the failure to execute a policy, and collect the policy id in
+    ``deleted_policy_ids`` if its scaling group or policy has been deleted
+    """
+    if failure.check(CannotExecutePolicyError):
+        log.msg('Cannot execute policy', reason=failure)
+    elif failure.check(NoSuchScalingGroupError, NoSuchPolicyError):
+        deleted_policy_ids.add(policy_id)
+    else:
+        log.err(failure, 'Scheduler failed to execute policy')
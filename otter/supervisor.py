@@ -3,13 +3,14 @@ The Otter Supervisor manages a number of workers to execute a launch config.
 """
 
 from twisted.application.service import Service
-from twisted.internet.defer import Deferred, succeed
+from twisted.internet.defer import Deferred, DeferredSemaphore, succeed
 
 from zope.interface import Interface, implementer
 
 from otter.util.deferredutils import DeferredPool
 from otter.util.hashkey import generate_job_id
 from otter.util.config import config_value
+from otter.util.ratelimit import TokenBucket
 from otter.worker import launch_server_v1, validate_config
 from otter.undo import InMemoryUndoStack
 
@@ -20,7 +21,8 @@ class ISupervisor(Interface):
     deletion jobs.
     """
 
-    def execute_config(log, transaction_id, scaling_group, launch_config):
+    def execute_config(log, transaction_id, scaling_group, launch_config, job_id=None,
+                       warm_server=None):
         """
         Executes a single launch config.
 
@@ -31,6 +33,10 @@ class ISupervisor(Interface):
             service_catalog.
         :param IScalingGroup scaling_group: Scaling Group.
         :param dict launch_config: The launch config for the scaling group.
+        :param str job_id: The ID of the job, which is generated if not given.
+        :param dict warm_server: The details of a server from the group's warm
+            pool, built from the same launch config, to launch instead of
+            creating a new server.
 
         :returns: A deferred that fires with a 3-tuple of job_id, completion deferred,
             and job_info (a dict)
@@ -53,6 +59,21 @@ class ISupervisor(Interface):
             before callback(ing).
         """
 
+    def execute_build_server(log, transaction_id, scaling_group, launch_config):
+        """
+        Builds a server from a launch config for the scaling group's warm
+        pool, without adding it to any load balancers.
+
+        :param log: Bound logger.
+        :param str transaction_id: Transaction ID.
+        :param IScalingGroup scaling_group: Scaling Group.
+        :param dict launch_config: The launch config for the scaling group.
+
+        :returns: ``Deferred`` that callbacks with the server details once
+            the server is active, or errbacks (after deleting the server) if
+            it could not be built.
+        """
+
 
 @implementer(ISupervisor)
 class SupervisorService(object, Service):
@@ -67,19 +88,79 @@ class SupervisorService(object, Service):
 
     :ivar DeferredPool deferred_pool: a pool in which to store deferreds that
         should be waited on
+
+    :ivar DeferredSemaphore delete_semaphore: limits how many servers are
+        deleted at once, to the configured ``worker.delete_concurrency`` or 10
+
+    :ivar dict rate_limiters: the :class:`otter.util.ratelimit.TokenBucket`
+        metering each tenant's jobs calling each upstream service, keyed by
+        tenant ID and service name
     """
     name = "supervisor"
 
-    def __init__(self, auth_function, coiterate):
+    def __init__(self, auth_function, coiterate, clock=None):
         self.auth_function = auth_function
         self.coiterate = coiterate
         self.deferred_pool = DeferredPool()
+        self.delete_semaphore = DeferredSemaphore(
+            config_value('worker.delete_concurrency') or 10)
+        self.rate_limiters = {}
+        if clock is None:  # pragma: no cover
+            from twisted.internet import reactor
+            clock = reactor
+        self.clock = clock
+
+    def _rate_limited(self, scaling_group, services):
+        """
+        Wait for the tenant of ``scaling_group`` to be allowed to start a job
+        calling each of ``services``, which are ``'servers'`` and
+        ``'load_balancers'``.
+
+        Jobs calling a service are started at most
+        ``worker.rate_limits.<service>.rate`` per second per tenant, in bursts
+        of at most ``worker.rate_limits.<service>.burst`` (default 1), with the
+        tenant's groups taking turns.  Services without a configured rate are
+        not limited.
+
+        :return: Deferred that fires with None when the job can start
+        """
+        d = succeed(None)
+        for service in services:
+            limits = config_value('worker.rate_limits.{0}'.format(service))
+            if not limits:
+                continue
+            key = (scaling_group.tenant_id, service)
+            limiter = self.rate_limiters.get(key)
+            if limiter is None:
+                limiter = self.rate_limiters[key] = TokenBucket(
+                    limits['rate'], limits.get('burst') or 1, self.clock)
+            d.addCallback(lambda _, limiter=limiter: limiter.acquire(scaling_group.uuid))
+        return d
 
-    def execute_config(self, log, transaction_id, scaling_group, launch_config):
+    def rate_limit_stats(self):
+        """
+        :return: ``dict`` of the number of jobs waiting, the number started,
+            and the total seconds they waited, for each upstream service across
+            all tenants, keyed by ``'<service>.queued'``, ``'<service>.served'``
+            and ``'<service>.wait_time'``
+        """
+        stats = {}
+        for (tenant_id, service), limiter in self.rate_limiters.iteritems():
+            for name in ('queued', 'served', 'wait_time'):
+                key = '{0}.{1}'.format(service, name)
+                stats[key] = stats.get(key, 0) + getattr(limiter, name)
+        return stats
+
+    def execute_config(self, log, transaction_id, scaling_group, launch_config, job_id=None,
+                       warm_server=None):
         """
         see :meth:`ISupervisor.execute_config`
+
+        The job is started once the tenant's rate limits allow it; see
+        :meth:`_rate_limited`.
         """
-        job_id = generate_job_id(scaling_group.uuid)
+        if job_id is None:
+            job_id = generate_job_id(scaling_group.uuid)
         completion_d = Deferred()
 
         log = log.bind(job_id=job_id,
@@ -99,9 +180,16 @@ class SupervisorService(object, Service):
 
         completion_d.addErrback(when_fails)
 
-        log.msg("Authenticating for tenant")
+        services = ['servers']
+        if launch_config['args'].get('loadBalancers'):
+            services.append('load_balancers')
 
-        d = self.auth_function(scaling_group.tenant_id)
+        def authenticate(_):
+            log.msg("Authenticating for tenant")
+            return self.auth_function(scaling_group.tenant_id)
+
+        d = self._rate_limited(scaling_group, services)
+        d.addCallback(authenticate)
 
         def when_authenticated((auth_token, service_catalog)):
             log.msg("Executing launch config.")
@@ -111,7 +199,8 @@ class SupervisorService(object, Service):
                 scaling_group,
                 service_catalog,
                 auth_token,
-                launch_config['args'], undo)
+                launch_config['args'], undo,
+                warm_server=warm_server)
 
         d.addCallback(when_authenticated)
 
@@ -139,6 +228,9 @@ class SupervisorService(object, Service):
     def execute_delete_server(self, log, transaction_id, scaling_group, server):
         """
         see :meth:`ISupervisor.execute_delete_server`
+
+        At most ``delete_semaphore.limit`` servers are deleted at once, and the
+        rest wait their turn.
         """
         log = log.bind(server_id=server['id'], tenant_id=scaling_group.tenant_id)
 
@@ -151,10 +243,48 @@ class SupervisorService(object, Service):
                 auth_token,
                 (server['id'], server['lb_info']))
 
-        d = self.auth_function(scaling_group.tenant_id)
-        log.msg("Authenticating for tenant")
-        d.addCallback(when_authenticated)
+        services = ['servers']
+        if server['lb_info']:
+            services.append('load_balancers')
+
+        def delete():
+            d = self._rate_limited(scaling_group, services)
+            d.addCallback(lambda _: self.auth_function(scaling_group.tenant_id))
+            log.msg("Authenticating for tenant")
+            return d.addCallback(when_authenticated)
 
+        sem = self.delete_semaphore
+        log.msg("Queueing server deletion: {deleting} deleting, {waiting} waiting",
+                deleting=sem.limit - sem.tokens, waiting=len(sem.waiting))
+        return sem.run(delete)
+
+    def execute_build_server(self, log, transaction_id, scaling_group, launch_config):
+        """
+        see :meth:`ISupervisor.execute_build_server`
+        """
+        log = log.bind(tenant_id=scaling_group.tenant_id)
+        undo = InMemoryUndoStack(self.coiterate)
+
+        def when_authenticated((auth_token, service_catalog)):
+            log.msg("Building server for warm pool.")
+            return launch_server_v1.build_server(
+                log,
+                config_value('region'),
+                scaling_group,
+                service_catalog,
+                auth_token,
+                launch_config['args'], undo)
+
+        def when_fails(result):
+            log.msg("Encountered an error, rewinding warm pool build undo stack.",
+                    exc=result.value)
+            return undo.rewind().addCallback(lambda _: result)
+
+        d = self._rate_limited(scaling_group, ['servers'])
+        d.addCallback(lambda _: self.auth_function(scaling_group.tenant_id))
+        d.addCallback(when_authenticated)
+        d.addErrback(when_fails)
+        self.deferred_pool.add(d)
         return d
 
     def validate_launch_config(self, log, tenant_id, launch_config):
@@ -13,6 +13,7 @@ from twisted.internet.endpoints import clientFromString
 from twisted.application.strports import service
 from twisted.application.service import MultiService
 
+from twisted.web.client import Agent, HTTPConnectionPool
 from twisted.web.server import Site
 
 from otter.rest.admin import OtterAdmin
@@ -24,10 +25,13 @@ from otter.models.mock import MockAdmin, MockScalingGroupCollection
 from otter.scheduler import SchedulerService
 
 from otter.supervisor import SupervisorService, set_supervisor
+from otter.indexer.events import ServerEventListener, set_server_event_listener
+from otter.indexer.poller import FeedPollerService
 from otter.auth import ImpersonatingAuthenticator
 from otter.auth import CachingAuthenticator
 
 from otter.log import log
+from otter.util.cqlprepared import PreparedStatementCluster
 from silverberg.cluster import RoundRobinCassandraCluster
 from silverberg.logger import LoggingCQLClient
 from otter.bobby import BobbyClient
@@ -91,12 +95,15 @@ def makeService(config):
             clientFromString(reactor, str(host))
             for host in config_value('cassandra.seed_hosts')]
 
-        cassandra_cluster = LoggingCQLClient(RoundRobinCassandraCluster(
+        cluster_class = RoundRobinCassandraCluster
+        if config_value('cassandra.prepared_statements'):
+            cluster_class = PreparedStatementCluster
+        cassandra_cluster = LoggingCQLClient(cluster_class(
             seed_endpoints,
             config_value('cassandra.keyspace')), log.bind(system='otter.silverberg'))
 
         store = CassScalingGroupCollection(cassandra_cluster)
-        admin_store = CassAdmin(cassandra_cluster)
+        admin_store = CassAdmin(cassandra_cluster, store.webhook_cache)
     else:
         store = MockScalingGroupCollection()
         admin_store = MockAdmin()
@@ -112,14 +119,30 @@ def makeService(config):
         # science.
         cache_ttl = 300
 
+    cache_max_size = config_value('identity.cache_max_size')
+    if cache_max_size is None:
+        cache_max_size = 10000
+
+    cache_refresh_window = config_value('identity.cache_refresh_window')
+    if cache_refresh_window is None:
+        cache_refresh_window = 60
+
+    cache_jitter = config_value('identity.cache_jitter')
+    if cache_jitter is None:
+        cache_jitter = 0.1
+
     authenticator = CachingAuthenticator(
         reactor,
         ImpersonatingAuthenticator(
             config_value('identity.username'),
             config_value('identity.password'),
             config_value('identity.url'),
-            config_value('identity.admin_url')),
-        cache_ttl)
+            config_value('identity.admin_url'),
+            reactor),
+        cache_ttl,
+        max_size=cache_max_size,
+        refresh_window=cache_refresh_window,
+        jitter=cache_jitter)
 
     s = MultiService()
 
@@ -128,6 +151,19 @@ def makeService(config):
 
     set_supervisor(supervisor)
 
+    # Setup polling of Nova's notification feeds, so that server builds and
+    # deletes are known to be done as soon as they are
+    notification_urls = config_value('notifications.urls')
+    if notification_urls:
+        listener = ServerEventListener()
+        agent = Agent(reactor, pool=HTTPConnectionPool(reactor, persistent=True))
+        for url in notification_urls:
+            feed_poller = FeedPollerService(
+                agent, str(url), [listener],
+                interval=config_value('notifications.interval') or 10)
+            feed_poller.setServiceParent(s)
+        set_server_event_listener(listener)
+
     otter = Otter(store)
     site = Site(otter.app.resource())
     site.displayTracebacks = False
@@ -145,9 +181,18 @@ def makeService(config):
 
     # Setup scheduler service
     if config_value('scheduler') and not config_value('mock'):
+        max_concurrency = config_value('scheduler.max_concurrency')
+        if max_concurrency is None:
+            max_concurrency = 10
+        buckets = config_value('cassandra.schedule_buckets')
+        if buckets is not None:
+            buckets = int(buckets)
+
         scheduler_service = SchedulerService(int(config_value('scheduler.batchsize')),
                                              int(config_value('scheduler.interval')),
-                                             cassandra_cluster, store)
+                                             cassandra_cluster, store,
+                                             max_concurrency=int(max_concurrency),
+                                             buckets=buckets)
         scheduler_service.setServiceParent(s)
 
     return s
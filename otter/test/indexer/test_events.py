@@ -0,0 +1,141 @@
+"""
+Tests for :mod:`otter.indexer.events`
+"""
+import json
+
+from twisted.internet.defer import CancelledError
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from otter.indexer.atom import entries, parse
+from otter.indexer.events import (
+    CREATED, DELETED, ServerEventListener, get_server_event_listener,
+    instance_id, set_server_event_listener)
+from otter.test.utils import fixture
+
+
+def notification(event_type, content):
+    """
+    Make an atom entry for a notification
+    """
+    return entries(parse(
+        '<feed xmlns="http://www.w3.org/2005/Atom"><entry>'
+        '<summary>{0}</summary><content type="application/json">{1}</content>'
+        '</entry></feed>'.format(event_type, content)))[0]
+
+
+def server_notification(event_type, server_id):
+    """
+    Make an atom entry for a notification about a server
+    """
+    return notification(event_type, json.dumps(
+        {'event_type': event_type, 'payload': {'instance_id': server_id}}))
+
+
+class InstanceIdTests(TestCase):
+    """
+    Tests for :func:`instance_id`
+    """
+    def test_instance_id(self):
+        """
+        The instance ID is read from the notification's payload
+        """
+        self.assertEqual(instance_id(server_notification(CREATED, 's1')), 's1')
+
+    def test_not_a_server_notification(self):
+        """
+        Entries without JSON content, or not about a server, have no instance
+        ID
+        """
+        self.assertIsNone(instance_id(notification(CREATED, 'Hello.')))
+        self.assertIsNone(instance_id(notification(CREATED, '{"payload": {}}')))
+        self.assertIsNone(instance_id(entries(parse(fixture('simple.atom')))[0]))
+
+
+class ServerEventListenerTests(TestCase):
+    """
+    Tests for :class:`ServerEventListener`
+    """
+    def setUp(self):
+        """
+        A listener with nothing waiting, that remembers events for 60 seconds
+        """
+        self.clock = Clock()
+        self.listener = ServerEventListener(self.clock, 60)
+
+    def test_fires_waiting(self):
+        """
+        Everything waiting for an event about a server fires when an entry for
+        it is seen, and only then
+        """
+        d1 = self.listener.wait_for(CREATED, 's1')
+        d2 = self.listener.wait_for(CREATED, 's1')
+        deleted = self.listener.wait_for(DELETED, 's1')
+        other = self.listener.wait_for(CREATED, 's2')
+
+        self.listener(server_notification('compute.instance.update', 's1'))
+        self.listener(server_notification(CREATED, 's1'))
+        self.assertEqual(self.successResultOf(d1), CREATED)
+        self.assertEqual(self.successResultOf(d2), CREATED)
+        self.assertNoResult(deleted)
+        self.assertNoResult(other)
+
+        self.listener(server_notification(DELETED, 's1'))
+        self.assertEqual(self.successResultOf(deleted), DELETED)
+
+    def test_recent_events_remembered(self):
+        """
+        Waiting for an event whose entry was seen less than the TTL ago fires
+        at once
+        """
+        self.listener(server_notification(CREATED, 's1'))
+        self.clock.advance(59)
+        self.assertEqual(self.successResultOf(self.listener.wait_for(CREATED, 's1')),
+                         CREATED)
+        self.assertNoResult(self.listener.wait_for(DELETED, 's1'))
+        self.assertNoResult(self.listener.wait_for(CREATED, 's2'))
+
+    def test_recent_events_expire(self):
+        """
+        Events are forgotten once their entry was seen the TTL or more ago,
+        counting from the last time it was seen
+        """
+        self.listener(server_notification(CREATED, 's1'))
+        self.listener(server_notification(CREATED, 's2'))
+        self.clock.advance(30)
+        self.listener(server_notification(CREATED, 's1'))
+        self.clock.advance(30)
+        self.assertNoResult(self.listener.wait_for(CREATED, 's2'))
+        self.assertEqual(self.successResultOf(self.listener.wait_for(CREATED, 's1')),
+                         CREATED)
+        self.clock.advance(30)
+        self.assertNoResult(self.listener.wait_for(CREATED, 's1'))
+        self.assertEqual(len(self.listener._recent), 0)
+
+    def test_entries_not_about_servers(self):
+        """
+        Entries that are not notifications about servers are ignored
+        """
+        self.listener(notification(DELETED, 'Hello.'))
+        self.listener(server_notification('compute.instance.update', 's1'))
+        self.assertEqual(len(self.listener._recent), 0)
+        self.assertNoResult(self.listener.wait_for(DELETED, None))
+
+    def test_cancel(self):
+        """
+        A cancelled wait is forgotten
+        """
+        d = self.listener.wait_for(CREATED, 's1')
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.assertEqual(self.listener._waiting, {})
+        self.listener(server_notification(CREATED, 's1'))
+
+    def test_set_server_event_listener(self):
+        """
+        The listener that is set is the one that is got
+        """
+        self.addCleanup(set_server_event_listener, None)
+        self.assertIsNone(get_server_event_listener())
+        set_server_event_listener(self.listener)
+        self.assertIs(get_server_event_listener(), self.listener)
@@ -5,13 +5,43 @@ from copy import deepcopy
 from datetime import datetime, timedelta
 
 from twisted.trial.unittest import TestCase
-from jsonschema import Draft3Validator, ValidationError
+from jsonschema import Draft3Validator, SchemaError, ValidationError
 
-from otter.json_schema import validate
+from otter.json_schema import format_checker, validate, validator
 from otter.json_schema import group_schemas, group_examples, rest_schemas
 from otter.util.config import set_config_data
 
 
+class ValidatorTestCase(TestCase):
+    """
+    Tests for :func:`otter.json_schema.validator`
+    """
+    def test_made_once(self):
+        """
+        The same validator is returned for the same schema, which checks
+        formats with the format checker
+        """
+        schema_validator = validator(group_schemas.config)
+        self.assertIsInstance(schema_validator, Draft3Validator)
+        self.assertIs(schema_validator.format_checker, format_checker)
+        self.assertIs(validator(group_schemas.config), schema_validator)
+        self.assertIsNot(validator(group_schemas.policy), schema_validator)
+
+    def test_invalid_schema(self):
+        """
+        An invalid schema has no validator
+        """
+        self.assertRaises(SchemaError, validator, {'type': 1})
+
+    def test_validate(self):
+        """
+        ``validate`` validates with the schema's validator
+        """
+        validate({'name': 'who', 'cooldown': 1, 'minEntities': 0},
+                 group_schemas.config)
+        self.assertRaises(ValidationError, validate, {}, group_schemas.config)
+
+
 class ScalingGroupConfigTestCase(TestCase):
     """
     Simple verification that the JSON schema for scaling groups is correct.
@@ -103,7 +133,7 @@ class ScalingGroupConfigTestCase(TestCase):
         Cooldown must be >= 0
         """
         invalid = {
-            'name': ' ',
+            'name': 'who',
             'cooldown': -1,
             'minEntities': 0,
         }
@@ -115,13 +145,28 @@ class ScalingGroupConfigTestCase(TestCase):
         Cooldown must be <= group_schemas.MAX_COOLDOWN
         """
         invalid = {
-            'name': ' ',
+            'name': 'who',
             'cooldown': group_schemas.MAX_COOLDOWN + 1,
             'minEntities': 0,
         }
         self.assertRaisesRegexp(ValidationError, "greater than the maximum",
                                 validate, invalid, group_schemas.config)
 
+    def test_warm_pool(self):
+        """
+        The warm pool size is optional, and must be >= 0
+        """
+        valid = {
+            'name': 'webheads',
+            'cooldown': 60,
+            'minEntities': 0,
+            'warmPool': 2
+        }
+        validate(valid, group_schemas.config)
+        valid['warmPool'] = -1
+        self.assertRaisesRegexp(ValidationError, "less than the minimum",
+                                validate, valid, group_schemas.config)
+
 
 class GeneralLaunchConfigTestCase(TestCase):
     """
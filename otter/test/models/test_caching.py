@@ -0,0 +1,196 @@
+"""
+Tests for :mod:`otter.models.caching`
+"""
+import mock
+
+from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from zope.interface.verify import verifyObject
+
+from otter.models.caching import CachingScalingGroup
+from otter.models.interface import IScalingGroup, NoSuchScalingGroupError
+from otter.test.utils import iMock
+from otter.util.cache import LRUCache
+
+
+class CachingScalingGroupTests(TestCase):
+    """
+    Tests for :class:`CachingScalingGroup`
+    """
+
+    def setUp(self):
+        """
+        Two caching groups sharing a cache, wrapping the same group
+        """
+        self.clock = Clock()
+        self.cache = LRUCache(10, 30, self.clock)
+        self.wrapped = iMock(IScalingGroup, tenant_id='t', uuid='g')
+        self.wrapped.view_config.side_effect = lambda: defer.succeed({'name': 'a'})
+        self.wrapped.view_launch_config.side_effect = (
+            lambda: defer.succeed({'type': 'launch_server'}))
+        self.wrapped.get_policy.side_effect = (
+            lambda policy_id: defer.succeed({'name': policy_id}))
+        self.wrapped.view_state.side_effect = lambda: defer.succeed('state')
+        self.wrapped.view_execution_bundle.side_effect = (
+            lambda policy_id=None: defer.succeed(
+                ({'name': 'a'}, {'type': 'launch_server'},
+                 policy_id and {'name': policy_id})))
+        for method in ('update_config', 'update_launch_config', 'update_policy',
+                       'delete_policy', 'delete_group'):
+            getattr(self.wrapped, method).return_value = defer.succeed(None)
+        self.group = CachingScalingGroup(self.wrapped, self.cache)
+        self.other = CachingScalingGroup(self.wrapped, self.cache)
+
+    def test_implements_interface(self):
+        """
+        :class:`CachingScalingGroup` provides
+        :class:`otter.models.interface.IScalingGroup`
+        """
+        verifyObject(IScalingGroup, self.group)
+
+    def test_delegates_other_attributes(self):
+        """
+        Anything that is not cached comes from the wrapped group
+        """
+        self.assertEqual(self.successResultOf(self.group.view_state()), 'state')
+        self.assertEqual(self.group.tenant_id, 't')
+        self.assertEqual(self.group.uuid, 'g')
+
+    def test_modify_state_passes_caching_group(self):
+        """
+        The modifier passed to ``modify_state`` is called with the caching
+        group, the state and the other arguments, rather than with the wrapped
+        group
+        """
+        self.wrapped.modify_state.side_effect = (
+            lambda modifier, *args, **kwargs: defer.maybeDeferred(
+                modifier, self.wrapped, 'state', *args, **kwargs))
+        modifier = mock.Mock(return_value='new state')
+
+        d = self.group.modify_state(modifier, 'arg', kwarg='kwarg')
+        self.assertEqual(self.successResultOf(d), 'new state')
+        modifier.assert_called_once_with(self.group, 'state', 'arg', kwarg='kwarg')
+
+    def test_reads_cached(self):
+        """
+        The config, launch config and policies are read once, and then served
+        from the cache by every group sharing it until they expire
+        """
+        for group in (self.group, self.other):
+            self.assertEqual(self.successResultOf(group.view_config()), {'name': 'a'})
+            self.assertEqual(self.successResultOf(group.view_launch_config()),
+                             {'type': 'launch_server'})
+            self.assertEqual(self.successResultOf(group.get_policy('p')), {'name': 'p'})
+        self.assertEqual(self.wrapped.view_config.call_count, 1)
+        self.assertEqual(self.wrapped.view_launch_config.call_count, 1)
+        self.assertEqual(self.wrapped.get_policy.call_count, 1)
+
+        self.clock.advance(30)
+        self.successResultOf(self.group.view_config())
+        self.assertEqual(self.wrapped.view_config.call_count, 2)
+
+    def test_cached_values_are_copies(self):
+        """
+        Changing a value that was read does not change the cached value
+        """
+        self.successResultOf(self.group.view_config())['name'] = 'b'
+        self.successResultOf(self.group.view_config())['name'] = 'c'
+        self.assertEqual(self.successResultOf(self.group.view_config()), {'name': 'a'})
+
+    def test_failures_not_cached(self):
+        """
+        Failures to read are not cached
+        """
+        self.wrapped.view_config.side_effect = lambda: defer.fail(
+            NoSuchScalingGroupError('t', 'g'))
+        self.failureResultOf(self.group.view_config(), NoSuchScalingGroupError)
+        self.failureResultOf(self.group.view_config(), NoSuchScalingGroupError)
+        self.assertEqual(self.wrapped.view_config.call_count, 2)
+
+    def test_updates_invalidate(self):
+        """
+        Updating the config, launch config or a policy through any group
+        sharing the cache invalidates the cached value once it is written
+        """
+        self.successResultOf(self.group.view_config())
+        self.successResultOf(self.group.view_launch_config())
+        self.successResultOf(self.group.get_policy('p'))
+        self.successResultOf(self.group.get_policy('q'))
+
+        self.successResultOf(self.other.update_config({'name': 'b'}))
+        self.successResultOf(self.other.update_launch_config({}))
+        self.successResultOf(self.other.update_policy('p', {}))
+        self.wrapped.update_config.assert_called_once_with({'name': 'b'})
+        self.wrapped.update_policy.assert_called_once_with('p', {})
+
+        for method, args in (('view_config', ()), ('view_launch_config', ()),
+                             ('get_policy', ('p',)), ('get_policy', ('q',))):
+            self.successResultOf(getattr(self.group, method)(*args))
+        self.assertEqual(self.wrapped.view_config.call_count, 2)
+        self.assertEqual(self.wrapped.view_launch_config.call_count, 2)
+        self.assertEqual(self.wrapped.get_policy.call_count, 3)
+
+    def test_delete_policy_invalidates(self):
+        """
+        Deleting a policy invalidates its cached value
+        """
+        self.successResultOf(self.group.get_policy('p'))
+        self.successResultOf(self.other.delete_policy('p'))
+        self.successResultOf(self.group.get_policy('p'))
+        self.assertEqual(self.wrapped.get_policy.call_count, 2)
+
+    def test_delete_group_invalidates_only_that_group(self):
+        """
+        Deleting a group invalidates everything cached for it, and nothing
+        cached for other groups
+        """
+        self.cache.set(('t', 'h', 'config'), {'name': 'h'})
+        self.successResultOf(self.group.view_config())
+        self.successResultOf(self.group.get_policy('p'))
+        self.successResultOf(self.other.delete_group())
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(('t', 'h', 'config')), {'name': 'h'})
+
+    def test_read_during_invalidation_not_cached(self):
+        """
+        A value read while something is invalidated may be stale, so it is
+        returned but not cached
+        """
+        read = defer.Deferred()
+        self.wrapped.view_config.side_effect = lambda: read
+        d = self.group.view_config()
+        self.successResultOf(self.other.update_config({'name': 'b'}))
+        read.callback({'name': 'a'})
+        self.assertEqual(self.successResultOf(d), {'name': 'a'})
+        self.assertEqual(len(self.cache), 0)
+
+    def test_execution_bundle_cached(self):
+        """
+        Reading an execution bundle caches its config, launch config and
+        policy, so that the next bundle is not read at all
+        """
+        bundle = ({'name': 'a'}, {'type': 'launch_server'}, {'name': 'p'})
+        self.assertEqual(
+            self.successResultOf(self.group.view_execution_bundle('p')), bundle)
+        self.assertEqual(
+            self.successResultOf(self.other.view_execution_bundle('p')), bundle)
+        self.assertEqual(
+            self.successResultOf(self.other.view_execution_bundle()),
+            bundle[:2] + (None,))
+        self.wrapped.view_execution_bundle.assert_called_once_with('p')
+        self.assertFalse(self.wrapped.view_state.called)
+        self.assertEqual(self.successResultOf(self.group.get_policy('p')), {'name': 'p'})
+        self.assertEqual(self.wrapped.get_policy.call_count, 0)
+
+    def test_execution_bundle_partly_cached(self):
+        """
+        If any part of an execution bundle is not cached, the whole bundle is
+        read
+        """
+        self.successResultOf(self.group.view_config())
+        self.successResultOf(self.group.view_launch_config())
+        self.successResultOf(self.group.view_execution_bundle('p'))
+        self.wrapped.view_execution_bundle.assert_called_once_with('p')
+        self.assertEqual(self.wrapped.view_state.call_count, 0)
@@ -17,8 +17,14 @@ from otter.models.cass import (
     CassAdmin,
     serialize_json_data,
     get_consistency_level,
-    verified_view)
-
+    verified_view,
+    CAS_MAX_RETRIES,
+    StateConflictError,
+    StateModifierQueue,
+    schedule_bucket,
+    _batch_type)
+
+from otter.models.caching import CachingScalingGroup
 from otter.models.interface import (
     GroupState, GroupNotEmptyError, NoSuchScalingGroupError, NoSuchPolicyError,
     NoSuchWebhookError, UnrecognizedCapabilityError)
@@ -29,13 +35,19 @@ from otter.test.models.test_interface import (
     IScalingGroupCollectionProviderMixin,
     IScalingScheduleCollectionProviderMixin)
 
-from otter.test.utils import patch, matches
+from otter.test.utils import patch, matches, CheckFailure
 from testtools.matchers import IsInstance
+from otter.util.cache import LRUCache
+from otter.util.cqlbatch import BatchType
+from otter.util.histogram import Histogram
 from otter.util.timestamp import from_timestamp
+from otter.util.config import set_config_data
 
 from otter.scheduler import next_cron_occurrence
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 from silverberg.client import ConsistencyLevel
 from silverberg.lock import BusyLockError
 
@@ -130,6 +142,72 @@ class GetConsistencyTests(TestCase):
         level = get_consistency_level('list', 'event')
         self.assertEqual(level, ConsistencyLevel.QUORUM)
 
+    def test_configured(self):
+        """
+        The consistency level named in ``cassandra.consistency`` for the
+        resource and operation is used instead of the default
+        """
+        set_config_data({'cassandra': {'consistency': {
+            'partial': {'view': 'quorum'}, 'event': {'list': 'ONE'}}}})
+        self.addCleanup(set_config_data, {})
+        self.assertEqual(get_consistency_level('view', 'partial'),
+                         ConsistencyLevel.QUORUM)
+        self.assertEqual(get_consistency_level('list', 'event'), ConsistencyLevel.ONE)
+        self.assertEqual(get_consistency_level('view', 'group'), ConsistencyLevel.ONE)
+
+    def test_configured_unknown(self):
+        """
+        A configured consistency level that does not name one is logged, once,
+        and the default used instead
+        """
+        log = patch(self, 'otter.models.cass.otter_log')
+        patch(self, 'otter.models.cass._invalid_consistency_levels', new=set())
+        set_config_data({'cassandra': {'consistency': {'event': {'list': 'quorom'}}}})
+        self.addCleanup(set_config_data, {})
+        self.assertEqual(get_consistency_level('list', 'event'), ConsistencyLevel.QUORUM)
+        self.assertEqual(get_consistency_level('list', 'event'), ConsistencyLevel.QUORUM)
+        log.bind.return_value.msg.assert_called_once_with(
+            'Unknown consistency level {level} configured in {name}, using the default',
+            level='quorom', name='cassandra.consistency.event.list')
+
+
+class BatchTypeTests(TestCase):
+    """
+    Tests for `_batch_type`
+    """
+    def test_tenant_partition(self):
+        """
+        Writes to tables partitioned by tenant ID, keyed by the ``:tenantId``
+        parameter, are written with an unlogged batch
+        """
+        self.assertEqual(
+            _batch_type([
+                'INSERT INTO scaling_group("tenantId", "groupId", group_config) '
+                'VALUES (:tenantId, :groupId, :scaling)',
+                'DELETE FROM policy_webhooks WHERE "tenantId" = :tenantId AND '
+                '"groupId" = :groupId']),
+            BatchType.UNLOGGED)
+
+    def test_other_partitions(self):
+        """
+        A batch that also writes to a table not partitioned by tenant ID, or
+        to a partition not keyed by the ``:tenantId`` parameter, is logged
+        """
+        insert = ('INSERT INTO scaling_policies("tenantId", "groupId", "policyId", data) '
+                  'VALUES (:tenantId, :groupId, :policyId, :policy)')
+        self.assertEqual(
+            _batch_type([insert, 'DELETE FROM webhook_keys WHERE "webhookKey" = :webhookKey']),
+            BatchType.LOGGED)
+        self.assertEqual(
+            _batch_type([insert.replace(':tenantId', ':policy0tenantId')]),
+            BatchType.LOGGED)
+
+    def test_unknown_statement(self):
+        """
+        A batch with a statement whose table is not recognized is logged
+        """
+        self.assertEqual(_batch_type(['TRUNCATE scaling_group']), BatchType.LOGGED)
+
 
 class VerifiedViewTests(TestCase):
     """
@@ -157,7 +235,8 @@ class VerifiedViewTests(TestCase):
         """
         Raise empty error if resurrected view
         """
-        self.connection.execute.return_value = defer.succeed([{'c1': 2, 'created_at': None}])
+        self.connection.execute.side_effect = [
+            defer.succeed([{'c1': 2, 'created_at': None}]), defer.succeed(None)]
         r = verified_view(self.connection, 'vq', 'dq', {'d': 2}, 6, ValueError, self.log)
         self.failureResultOf(r, ValueError)
         self.connection.execute.assert_has_calls([mock.call('vq', {'d': 2}, 6),
@@ -184,6 +263,18 @@ class VerifiedViewTests(TestCase):
         self.connection.execute.assert_has_calls([mock.call('vq', {'d': 2}, 6),
                                                   mock.call('dq', {'d': 2}, 6)])
 
+    def test_failed_del_logged(self):
+        """
+        If deleting a resurrected row fails, the failure is logged
+        """
+        self.connection.execute.side_effect = [
+            defer.succeed([{'c1': 2, 'created_at': None}]),
+            defer.fail(DummyException('no delete'))]
+        r = verified_view(self.connection, 'vq', 'dq', {'d': 2}, 6, ValueError, self.log)
+        self.failureResultOf(r, ValueError)
+        self.log.err.assert_called_once_with(CheckFailure(DummyException),
+                                             'Failed to delete resurrected row')
+
     def test_empty_view(self):
         """
         Raise empty error if no result
@@ -269,6 +360,21 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
                                                         ConsistencyLevel.TWO)
         self.assertEqual(r, {})
 
+    @mock.patch('otter.models.cass.time')
+    def test_view_config_latency_recorded(self, mock_time):
+        """
+        The latency of viewing the config is recorded in milliseconds, in the
+        histogram of ``view_config`` at the consistency level it is read at
+        """
+        latencies = patch(self, 'otter.models.cass._latencies', new={})
+        mock_time.time.side_effect = [10, 10.004]
+        self.returns = [[{'group_config': '{}', 'created_at': 24}]]
+        self.successResultOf(self.group.view_config())
+        self.assertEqual(latencies.keys(), [('view_config', 'TWO')])
+        histogram = latencies[('view_config', 'TWO')]
+        self.assertEqual(histogram.count, 1)
+        self.assertEqual(dict(histogram.buckets())[5], 1)
+
     def test_view_config_recurrected_entry(self):
         """
         If group row returned is resurrected, i.e. does not have 'created_at', then
@@ -357,30 +463,58 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
                                        'a', {'A': 'R'}, {'P': 'R'},
                                        '123', {'PT': 'R'}, True))
 
+    def test_modify_state_calls_modifier_with_group_and_state_and_others(self):
+        """
+        ``modify_state`` calls the modifier callable with the group and the
+        state, read along with its version, as the first two arguments, and
+        the other args and keyword args passed to it.
+        """
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 1)))
+        modifier = mock.Mock(return_value=defer.Deferred())
+        self.group.modify_state(modifier, 'arg1', kwarg1='1')
+        modifier.assert_called_once_with(self.group, 'state', 'arg1', kwarg1='1')
+
+    def test_modify_state_propagates_view_state_error(self):
+        """
+        ``modify_state`` propagates a :class:`NoSuchScalingGroupError` raised
+        when reading the state
+        """
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.fail(NoSuchScalingGroupError(1, 1)))
+
+        modifier = mock.Mock()
+        d = self.group.modify_state(modifier)
+        self.failureResultOf(d, NoSuchScalingGroupError)
+        self.assertEqual(modifier.call_count, 0)
+
     @mock.patch('otter.models.cass.serialize_json_data',
                 side_effect=lambda *args: _S(args[0]))
     def test_modify_state_succeeds(self, mock_serial):
         """
-        ``modify_state`` writes the state the modifier returns to the database
+        ``modify_state`` writes the state the modifier returns to the database,
+        incrementing its version
         """
         def modifier(group, state):
             return GroupState(self.tenant_id, self.group_id, 'a', {}, {}, None, {}, True)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 4)))
 
         d = self.group.modify_state(modifier)
         self.assertEqual(self.successResultOf(d), None)
         expectedCql = (
             'INSERT INTO scaling_group("tenantId", "groupId", active, '
-            'pending, "groupTouched", "policyTouched", paused) VALUES('
+            'pending, "groupTouched", "policyTouched", paused, warm_pool, version) VALUES('
             ':tenantId, :groupId, :active, :pending, :groupTouched, '
-            ':policyTouched, :paused)')
+            ':policyTouched, :paused, :warm_pool, :newVersion)')
 
         expectedData = {"tenantId": self.tenant_id, "groupId": self.group_id,
                         "active": _S({}), "pending": _S({}),
                         "groupTouched": '0001-01-01T00:00:00Z',
                         "policyTouched": _S({}),
-                        "paused": True}
+                        "warm_pool": _S({'servers': {}, 'jobs': {}}),
+                        "paused": True, "newVersion": 5}
         self.connection.execute.assert_called_once_with(expectedCql,
                                                         expectedData,
                                                         ConsistencyLevel.TWO)
@@ -394,6 +528,45 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         self.lock.acquire.assert_called_once_with()
         self.lock.release.assert_called_once_with()
 
+    def test_modify_state_unversioned_state(self):
+        """
+        State that has never been written with a version is written with
+        version 1
+        """
+        def modifier(group, state):
+            return GroupState(self.tenant_id, self.group_id, 'a', {}, {}, None, {}, True)
+
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', None)))
+
+        self.successResultOf(self.group.modify_state(modifier))
+        cql, params, _ = self.connection.execute.call_args[0]
+        self.assertEqual(params['newVersion'], 1)
+
+    def test_modify_state_after_save_actions_called_once_written(self):
+        """
+        The actions the modifier defers until the state is saved are called
+        once it has been written, and not if it is not
+        """
+        actions = []
+        write = defer.Deferred()
+        self.connection.execute.side_effect = lambda *args: write
+
+        def modifier(group, state):
+            new_state = GroupState(self.tenant_id, self.group_id, 'a', {}, {}, None,
+                                   {}, True)
+            new_state.after_save(actions.append, 'action')
+            return new_state
+
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 1)))
+
+        d = self.group.modify_state(modifier)
+        self.assertEqual(actions, [])
+        write.callback(None)
+        self.successResultOf(d)
+        self.assertEqual(actions, ['action'])
+
     @mock.patch('otter.models.cass.serialize_json_data',
                 side_effect=lambda *args: _S(args[0]))
     def test_modify_state_lock_not_acquired(self, mock_serial):
@@ -424,7 +597,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         def modifier(group, state):
             return GroupState(self.tenant_id, self.group_id, 'a', {}, {}, None, {}, True)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group._view_versioned_state = mock.Mock(
+            side_effect=lambda: defer.succeed(('state', 1)))
         self.returns = [None, None]
 
         self.group.modify_state(modifier)
@@ -445,7 +619,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         def modifier(group, state):
             return GroupState(self.tenant_id, self.group_id, 'a', {}, {}, None, {}, True)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 1)))
         self.returns = [None, None]
         log = self.group.log = mock.Mock()
 
@@ -465,7 +640,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         def modifier(group, state):
             raise NoSuchScalingGroupError(self.tenant_id, self.group_id)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 1)))
 
         d = self.group.modify_state(modifier)
         f = self.failureResultOf(d)
@@ -481,7 +657,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         def modifier(group, state):
             return GroupState('tid', self.group_id, 'name', {}, {}, None, {}, True)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 1)))
 
         d = self.group.modify_state(modifier)
         f = self.failureResultOf(d)
@@ -497,7 +674,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         def modifier(group, state):
             return GroupState(self.tenant_id, 'gid', 'name', {}, {}, None, {}, True)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group._view_versioned_state = mock.Mock(
+            return_value=defer.succeed(('state', 1)))
 
         d = self.group.modify_state(modifier)
         f = self.failureResultOf(d)
@@ -603,7 +781,7 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         """
         d = self.group.update_config({"b": "lah"})
         self.assertIsNone(self.successResultOf(d))  # update returns None
-        expectedCql = ('BEGIN BATCH '
+        expectedCql = ('BEGIN UNLOGGED BATCH '
                        'INSERT INTO scaling_group("tenantId", "groupId", group_config) '
                        'VALUES (:tenantId, :groupId, :scaling) '
                        'APPLY BATCH;')
@@ -622,7 +800,7 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         """
         d = self.group.update_launch_config({"b": "lah"})
         self.assertIsNone(self.successResultOf(d))  # update returns None
-        expectedCql = ('BEGIN BATCH '
+        expectedCql = ('BEGIN UNLOGGED BATCH '
                        'INSERT INTO scaling_group("tenantId", "groupId", launch_config) '
                        'VALUES (:tenantId, :groupId, :launch) '
                        'APPLY BATCH;')
@@ -858,8 +1036,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         self.returns = [None]
         d = self.group.create_policies([{"b": "lah"}])
         result = self.successResultOf(d)
-        expectedCql = ('BEGIN BATCH INSERT INTO scaling_policies("tenantId", "groupId", "policyId", '
-                       'data) VALUES (:tenantId, :groupId, :policy0Id, :policy0) '
+        expectedCql = ('BEGIN UNLOGGED BATCH INSERT INTO scaling_policies("tenantId", "groupId", '
+                       '"policyId", data) VALUES (:tenantId, :groupId, :policy0Id, :policy0) '
                        'APPLY BATCH;')
         expectedData = {"policy0": '{"_ver": 1, "b": "lah"}',
                         "groupId": '12345678g',
@@ -901,6 +1079,40 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         pol['id'] = self.mock_key.return_value
         self.assertEqual(result, [pol])
 
+    @mock.patch('otter.models.cass.CassScalingGroup.view_config',
+                return_value=defer.succeed({}))
+    def test_add_scaling_policy_cron_bucketed(self, view_config):
+        """
+        When ``cassandra.schedule_buckets`` is configured, the event of a new
+        schedule policy is added to its bucket, and its bucket and trigger are
+        recorded so that it can be deleted later
+        """
+        set_config_data({'cassandra': {'schedule_buckets': 10}})
+        self.addCleanup(set_config_data, {})
+        self.returns = [None]
+
+        pol = {'cooldown': 5, 'type': 'schedule', 'name': 'scale up by 10', 'change': 10,
+               'args': {'cron': '*/5 * * * *'}}
+        self.successResultOf(self.group.create_policies([pol]))
+        expectedCql = ('BEGIN BATCH INSERT INTO scaling_policies("tenantId", "groupId", "policyId", '
+                       'data) VALUES (:tenantId, :groupId, :policy0Id, :policy0) '
+                       'INSERT INTO scaling_schedule_buckets(bucket, "tenantId", "groupId", '
+                       '"policyId", trigger, cron) VALUES (:policy0bucket, :tenantId, '
+                       ':groupId, :policy0Id, :policy0Trigger, :policy0cron) '
+                       'INSERT INTO scaling_schedule_bucket_triggers("policyId", bucket, trigger) '
+                       'VALUES (:policy0Id, :policy0bucket, :policy0Trigger) '
+                       'APPLY BATCH;')
+        expectedData = {"policy0": ('{"name": "scale up by 10", "args": {"cron": "*/5 * * * *"}, '
+                                    '"cooldown": 5, "_ver": 1, "type": "schedule", "change": 10}'),
+                        "groupId": '12345678g',
+                        "policy0Id": '12345678',
+                        "policy0bucket": schedule_bucket('12345678', 10),
+                        "policy0Trigger": mock.ANY,
+                        "policy0cron": '*/5 * * * *',
+                        "tenantId": '11111'}
+        self.connection.execute.assert_called_with(
+            expectedCql, expectedData, ConsistencyLevel.TWO)
+
     def test_add_first_checks_view_config(self):
         """
         Before a policy is added, `view_config` is first called to determine
@@ -919,6 +1131,7 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         When you delete a scaling policy, it checks if the policy exists and
         if it does, deletes the policy and all its associated webhooks.
         """
+        self.returns = [[{'webhookKey': 'k1'}, {'webhookKey': 'k2'}], None]
         d = self.group.delete_policy('3222')
         # delete returns None
         self.assertIsNone(self.successResultOf(d))
@@ -931,14 +1144,76 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
             'DELETE FROM policy_webhooks WHERE "tenantId" = :tenantId AND '
             '"groupId" = :groupId AND "policyId" = :policyId '
             'DELETE FROM scaling_schedule WHERE "policyId" = :policyId; '
+            'DELETE FROM webhook_keys WHERE "webhookKey" IN (:webhook_key0,:webhook_key1); '
             'APPLY BATCH;')
         expected_data = {
             "tenantId": self.group.tenant_id,
             "groupId": self.group.uuid,
-            "policyId": "3222"}
+            "policyId": "3222",
+            "webhook_key0": "k1",
+            "webhook_key1": "k2"}
 
-        self.connection.execute.assert_called_once_with(
-            expected_cql, expected_data, ConsistencyLevel.TWO)
+        self.assertEqual(self.connection.execute.mock_calls, [
+            mock.call('SELECT "webhookKey" FROM policy_webhooks WHERE "tenantId" = :tenantId '
+                      'AND "groupId" = :groupId AND "policyId" = :policyId;',
+                      {"tenantId": self.group.tenant_id, "groupId": self.group.uuid,
+                       "policyId": "3222"}, ConsistencyLevel.TWO),
+            mock.call(expected_cql, expected_data, ConsistencyLevel.TWO)])
+
+    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+                return_value=defer.succeed({}))
+    def test_delete_policy_invalidates_webhook_cache(self, mock_get_policy):
+        """
+        Deleting a policy removes the keys of its webhooks from the webhook
+        cache, but leaves other keys cached
+        """
+        self.group.webhook_cache = LRUCache(10, 60, Clock())
+        for key in ('k1', 'k2', 'k3'):
+            self.group.webhook_cache.set(key, ('t', 'g', 'p'))
+        self.returns = [[{'webhookKey': 'k1'}, {'webhookKey': 'k2'}], None]
+        d = self.group.delete_policy('3222')
+        self.assertIsNone(self.successResultOf(d))
+        self.assertIsNone(self.group.webhook_cache.get('k1'))
+        self.assertIsNone(self.group.webhook_cache.get('k2'))
+        self.assertEqual(self.group.webhook_cache.get('k3'), ('t', 'g', 'p'))
+
+    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+                return_value=defer.succeed({'type': 'schedule', 'args': {'cron': '* * * * *'}}))
+    def test_delete_policy_deletes_bucket_events(self, mock_get_policy):
+        """
+        When ``cassandra.schedule_buckets`` is configured, deleting a schedule
+        policy also deletes its events from its bucket
+        """
+        set_config_data({'cassandra': {'schedule_buckets': 10}})
+        self.addCleanup(set_config_data, {})
+        self.returns = [[], None, [{'policyId': '3222', 'bucket': 4, 'trigger': 100}], None]
+        self.assertIsNone(self.successResultOf(self.group.delete_policy('3222')))
+        self.assertEqual(self.connection.execute.mock_calls[2:], [
+            mock.call('SELECT "policyId", bucket, trigger FROM scaling_schedule_bucket_triggers '
+                      'WHERE "policyId" IN (:policy0);',
+                      {'policy0': '3222'}, ConsistencyLevel.TWO),
+            mock.call('BEGIN BATCH '
+                      'DELETE FROM scaling_schedule_buckets WHERE bucket = :event0bucket AND '
+                      'trigger = :event0trigger AND "policyId" = :event0policyId '
+                      'DELETE FROM scaling_schedule_bucket_triggers WHERE "policyId" IN '
+                      '(:trigger_policy0); '
+                      'APPLY BATCH;',
+                      {'event0bucket': 4, 'event0trigger': 100, 'event0policyId': '3222',
+                       'trigger_policy0': '3222'},
+                      ConsistencyLevel.TWO)])
+
+    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+                return_value=defer.succeed({'type': 'schedule', 'args': {'cron': '* * * * *'}}))
+    def test_delete_policy_without_bucket_event(self, mock_get_policy):
+        """
+        When a schedule policy has no recorded bucket event, there is nothing
+        to delete from the buckets
+        """
+        set_config_data({'cassandra': {'schedule_buckets': 10}})
+        self.addCleanup(set_config_data, {})
+        self.returns = [[], None, []]
+        self.assertIsNone(self.successResultOf(self.group.delete_policy('3222')))
+        self.assertEqual(len(self.connection.execute.mock_calls), 3)
 
     @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'g', 'p')))
@@ -958,7 +1233,7 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         Validate CQL calls made to update the policy
         """
         expectedCql = (
-            'BEGIN BATCH INSERT INTO scaling_policies("tenantId", "groupId", "policyId", data) '
+            'BEGIN UNLOGGED BATCH INSERT INTO scaling_policies("tenantId", "groupId", "policyId", data) '
             'VALUES (:tenantId, :groupId, :policyId, :policy) APPLY BATCH;')
         expectedData = {"policy": policy_json,
                         "groupId": '12345678g',
@@ -1102,6 +1377,35 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         self.validate_policy_update('{"_ver": 1, "args": {"at": "2015-09-20T10:00:12Z"}, '
                                     '"type": "schedule"}')
 
+    @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
+                return_value=defer.succeed({"type": "schedule", "args": {"cron": "* * * * *"}}))
+    def test_update_scaling_policy_schedule_change_bucketed(self, mock_get_policy):
+        """
+        When ``cassandra.schedule_buckets`` is configured, updating a schedule
+        policy also deletes its existing events from its bucket
+        """
+        set_config_data({'cassandra': {'schedule_buckets': 10}})
+        self.addCleanup(set_config_data, {})
+        bucket = schedule_bucket('12345678', 10)
+        self.returns = [None, [{'policyId': '12345678', 'bucket': bucket, 'trigger': 100}],
+                        None, None, None]
+        d = self.group.update_policy('12345678', {"type": "schedule",
+                                                  "args": {"cron": "2 0 * * *"}})
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.connection.execute.mock_calls[1:3], [
+            mock.call('SELECT "policyId", bucket, trigger FROM scaling_schedule_bucket_triggers '
+                      'WHERE "policyId" IN (:policy0);',
+                      {'policy0': '12345678'}, ConsistencyLevel.TWO),
+            mock.call('BEGIN BATCH '
+                      'DELETE FROM scaling_schedule_buckets WHERE bucket = :event0bucket AND '
+                      'trigger = :event0trigger AND "policyId" = :event0policyId '
+                      'DELETE FROM scaling_schedule_bucket_triggers WHERE "policyId" IN '
+                      '(:trigger_policy0); '
+                      'APPLY BATCH;',
+                      {'event0bucket': bucket, 'event0trigger': 100,
+                       'event0policyId': '12345678', 'trigger_policy0': '12345678'},
+                      ConsistencyLevel.TWO)])
+
     @mock.patch('otter.models.cass.CassScalingGroup.get_policy',
                 return_value=defer.fail(NoSuchPolicyError('t', 'g', 'p')))
     def test_update_scaling_policy_bad(self, mock_get_policy):
@@ -1201,9 +1505,13 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
             'INSERT INTO policy_webhooks("tenantId", "groupId", "policyId", "webhookId", '
             'data, capability, "webhookKey") VALUES (:tenantId, :groupId, :policyId, '
             ':webhook0Id, :webhook0, :webhook0Capability, :webhook0Key) '
+            'INSERT INTO webhook_keys("webhookKey", "tenantId", "groupId", "policyId") '
+            'VALUES (:webhook0Key, :tenantId, :groupId, :policyId) '
             'INSERT INTO policy_webhooks("tenantId", "groupId", "policyId", "webhookId", '
             'data, capability, "webhookKey") VALUES (:tenantId, :groupId, :policyId, '
             ':webhook1Id, :webhook1, :webhook1Capability, :webhook1Key) '
+            'INSERT INTO webhook_keys("webhookKey", "tenantId", "groupId", "policyId") '
+            'VALUES (:webhook1Key, :tenantId, :groupId, :policyId) '
             'APPLY BATCH;')
 
         # can't test the parameters, because they contain serialized JSON.
@@ -1529,17 +1837,33 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
             None]
         d = self.group.delete_webhook('3444', '4555')
         self.assertIsNone(self.successResultOf(d))  # delete returns None
-        expectedCql = ('DELETE FROM policy_webhooks WHERE '
+        expectedCql = ('BEGIN BATCH '
+                       'DELETE FROM policy_webhooks WHERE '
                        '"tenantId" = :tenantId AND "groupId" = :groupId AND '
-                       '"policyId" = :policyId AND "webhookId" = :webhookId')
+                       '"policyId" = :policyId AND "webhookId" = :webhookId '
+                       'DELETE FROM webhook_keys WHERE "webhookKey" = :webhookKey '
+                       'APPLY BATCH;')
         expectedData = {"tenantId": "11111", "groupId": "12345678g",
-                        "policyId": "3444", "webhookId": "4555"}
+                        "policyId": "3444", "webhookId": "4555", "webhookKey": "h"}
 
         self.assertEqual(len(self.connection.execute.mock_calls), 2)  # view, delete
         self.connection.execute.assert_called_with(expectedCql,
                                                    expectedData,
                                                    ConsistencyLevel.TWO)
 
+    def test_delete_webhook_invalidates_webhook_cache(self):
+        """
+        Deleting a webhook removes its key from the webhook cache
+        """
+        self.group.webhook_cache = LRUCache(10, 60, Clock())
+        self.group.webhook_cache.set('h', ('t', 'g', 'p'))
+        self.returns = [
+            _cassandrify_data([{'data': '{}', 'capability': '{"1": "h"}'}]),
+            None]
+        d = self.group.delete_webhook('3444', '4555')
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(len(self.group.webhook_cache), 0)
+
     def test_delete_non_existant_webhooks(self):
         """
         If you try to delete a scaling policy webhook that doesn't exist,
@@ -1551,6 +1875,64 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         self.assertEqual(len(self.connection.execute.mock_calls), 1)  # only view
         self.flushLoggedErrors(NoSuchWebhookError)
 
+    def test_view_execution_bundle(self):
+        """
+        ``view_execution_bundle`` reads the group row and the policy at the
+        same time, and returns the config, launch config and policy
+        """
+        self.returns = [
+            [{'group_config': serialize_json_data(self.config, 1.0),
+              'launch_config': serialize_json_data(self.launch_config, 1.0),
+              'created_at': 23}],
+            [{'data': '{"_ver": 1, "name": "pol"}'}]]
+        d = self.group.view_execution_bundle('3444')
+        self.assertEqual(self.successResultOf(d),
+                         (self.config, self.launch_config, {'name': 'pol'}))
+
+        exp_data = {'tenantId': self.tenant_id, 'groupId': self.group_id}
+        self.assertEqual(self.connection.execute.mock_calls, [
+            mock.call('SELECT group_config, launch_config, created_at FROM scaling_group '
+                      'WHERE "tenantId" = :tenantId AND "groupId" = :groupId;',
+                      exp_data, ConsistencyLevel.TWO),
+            mock.call('SELECT data FROM scaling_policies WHERE "tenantId" = :tenantId '
+                      'AND "groupId" = :groupId AND "policyId" = :policyId;',
+                      dict(exp_data, policyId='3444'), ConsistencyLevel.TWO)])
+
+    def test_view_execution_bundle_without_policy(self):
+        """
+        ``view_execution_bundle`` does not read any policy if none is asked for
+        """
+        self.returns = [
+            [{'group_config': serialize_json_data(self.config, 1.0),
+              'launch_config': serialize_json_data(self.launch_config, 1.0),
+              'created_at': 23}]]
+        d = self.group.view_execution_bundle()
+        self.assertEqual(self.successResultOf(d),
+                         (self.config, self.launch_config, None))
+        self.assertEqual(self.connection.execute.call_count, 1)
+
+    def test_view_execution_bundle_no_such_group(self):
+        """
+        ``view_execution_bundle`` fails with :class:`NoSuchScalingGroupError`
+        rather than :class:`NoSuchPolicyError` if the group does not exist
+        """
+        self.returns = [[], []]
+        d = self.group.view_execution_bundle('3444')
+        self.failureResultOf(d, NoSuchScalingGroupError)
+
+    def test_view_execution_bundle_no_such_policy(self):
+        """
+        ``view_execution_bundle`` fails with :class:`NoSuchPolicyError` if the
+        group exists but the policy does not
+        """
+        self.returns = [
+            [{'group_config': serialize_json_data(self.config, 1.0),
+              'launch_config': serialize_json_data(self.launch_config, 1.0),
+              'created_at': 23}],
+            []]
+        d = self.group.view_execution_bundle('3444')
+        self.failureResultOf(d, NoSuchPolicyError)
+
     @mock.patch('otter.models.cass.config_value', return_value=10)
     @mock.patch('otter.models.cass.verified_view')
     def test_view_manifest_success(self, verified_view, _):
@@ -1630,14 +2012,14 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
             [mock.call(view_cql, exp_data, ConsistencyLevel.TWO),
              mock.call(del_cql, exp_data, ConsistencyLevel.TWO)])
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
     def test_delete_non_empty_scaling_group_fails(self, mock_view_state):
         """
         ``delete_group`` errbacks with :class:`GroupNotEmptyError` if scaling
         group state is not empty
         """
-        mock_view_state.return_value = defer.succeed(GroupState(
-            self.tenant_id, self.group_id, '', {'1': {}}, {}, None, {}, False))
+        mock_view_state.return_value = defer.succeed((GroupState(
+            self.tenant_id, self.group_id, '', {'1': {}}, {}, None, {}, False), 1))
         self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
 
         # nothing else called except view
@@ -1645,7 +2027,19 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         self.assertFalse(self.connection.execute.called)
         self.flushLoggedErrors(GroupNotEmptyError)
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
+    def test_delete_scaling_group_with_warm_pool_fails(self, mock_view_state):
+        """
+        ``delete_group`` errbacks with :class:`GroupNotEmptyError` if the
+        scaling group's warm pool has servers or jobs building them
+        """
+        for warm in ({'warm_servers': {'s': {}}}, {'warm_jobs': {'j': {}}}):
+            mock_view_state.return_value = defer.succeed((GroupState(
+                self.tenant_id, self.group_id, '', {}, {}, None, {}, False, **warm), 1))
+            self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
+        self.assertFalse(self.connection.execute.called)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
     def test_delete_empty_scaling_group_with_policies(self, mock_naive,
                                                       mock_view_state):
@@ -1654,12 +2048,12 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         policies and webhooks and events if the scaling group is empty.
         It uses naive list policies to figure out what events to delete.
         """
-        mock_view_state.return_value = defer.succeed(GroupState(
-            self.tenant_id, self.group_id, '', {}, {}, None, {}, False))
+        mock_view_state.return_value = defer.succeed((GroupState(
+            self.tenant_id, self.group_id, '', {}, {}, None, {}, False), 1))
         mock_naive.return_value = defer.succeed(
             [{'id': 'policyA'}, {'id': 'policyB'}])
 
-        self.returns = [None]
+        self.returns = [[{'webhookKey': 'k1'}], None]
         result = self.successResultOf(self.group.delete_group())
         self.assertIsNone(result)  # delete returns None
         mock_naive.assert_called_once_with()
@@ -1667,22 +2061,60 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         expected_data = {'tenantId': self.tenant_id,
                          'groupId': self.group_id,
                          'column_value0': 'policyA',
-                         'column_value1': 'policyB'}
+                         'column_value1': 'policyB',
+                         'webhook_key0': 'k1'}
         expected_cql = (
             'BEGIN BATCH '
             'DELETE FROM scaling_group WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
             'DELETE FROM scaling_policies WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
             'DELETE FROM policy_webhooks WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
             'DELETE FROM scaling_schedule WHERE "policyId" IN (:column_value0,:column_value1); '
+            'DELETE FROM webhook_keys WHERE "webhookKey" IN (:webhook_key0); '
             'APPLY BATCH;')
 
-        self.connection.execute.assert_called_once_with(
-            expected_cql, expected_data, ConsistencyLevel.TWO)
+        self.assertEqual(self.connection.execute.mock_calls, [
+            mock.call('SELECT "webhookKey" FROM policy_webhooks WHERE "tenantId" = :tenantId '
+                      'AND "groupId" = :groupId;',
+                      {'tenantId': self.tenant_id, 'groupId': self.group_id},
+                      ConsistencyLevel.TWO),
+            mock.call(expected_cql, expected_data, ConsistencyLevel.TWO)])
 
         self.lock.acquire.assert_called_once_with()
         self.lock.release.assert_called_once_with()
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
+    def test_delete_scaling_group_deletes_bucket_events(self, mock_naive,
+                                                        mock_view_state):
+        """
+        When ``cassandra.schedule_buckets`` is configured, ``delete_group``
+        also deletes the events of the group's schedule policies from their
+        buckets
+        """
+        set_config_data({'cassandra': {'schedule_buckets': 10}})
+        self.addCleanup(set_config_data, {})
+        mock_view_state.return_value = defer.succeed((GroupState(
+            self.tenant_id, self.group_id, '', {}, {}, None, {}, False), 1))
+        mock_naive.return_value = defer.succeed(
+            [{'id': 'policyA', 'type': 'webhook'}, {'id': 'policyB', 'type': 'schedule'}])
+
+        self.returns = [[], None, [{'policyId': 'policyB', 'bucket': 2, 'trigger': 100}], None]
+        self.assertIsNone(self.successResultOf(self.group.delete_group()))
+        self.assertEqual(self.connection.execute.mock_calls[2:], [
+            mock.call('SELECT "policyId", bucket, trigger FROM scaling_schedule_bucket_triggers '
+                      'WHERE "policyId" IN (:policy0);',
+                      {'policy0': 'policyB'}, ConsistencyLevel.TWO),
+            mock.call('BEGIN BATCH '
+                      'DELETE FROM scaling_schedule_buckets WHERE bucket = :event0bucket AND '
+                      'trigger = :event0trigger AND "policyId" = :event0policyId '
+                      'DELETE FROM scaling_schedule_bucket_triggers WHERE "policyId" IN '
+                      '(:trigger_policy0); '
+                      'APPLY BATCH;',
+                      {'event0bucket': 2, 'event0trigger': 100,
+                       'event0policyId': 'policyB', 'trigger_policy0': 'policyB'},
+                      ConsistencyLevel.TWO)])
+
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
     def test_delete_empty_scaling_group_with_zero_policies(self, mock_naive,
                                                            mock_view_state):
@@ -1692,11 +2124,11 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         has no policies.
         It uses naive list policies to figure out what events to delete.
         """
-        mock_view_state.return_value = defer.succeed(GroupState(
-            self.tenant_id, self.group_id, '', {}, {}, None, {}, False))
+        mock_view_state.return_value = defer.succeed((GroupState(
+            self.tenant_id, self.group_id, '', {}, {}, None, {}, False), 1))
         mock_naive.return_value = defer.succeed({})
 
-        self.returns = [None]
+        self.returns = [[], None]
         result = self.successResultOf(self.group.delete_group())
         self.assertIsNone(result)  # delete returns None
         mock_naive.assert_called_once_with()
@@ -1704,19 +2136,19 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         expected_data = {'tenantId': self.tenant_id,
                          'groupId': self.group_id}
         expected_cql = (
-            'BEGIN BATCH '
+            'BEGIN UNLOGGED BATCH '
             'DELETE FROM scaling_group WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
             'DELETE FROM scaling_policies WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
             'DELETE FROM policy_webhooks WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
             'APPLY BATCH;')
 
-        self.connection.execute.assert_called_once_with(
+        self.connection.execute.assert_called_with(
             expected_cql, expected_data, ConsistencyLevel.TWO)
 
         self.lock.acquire.assert_called_once_with()
         self.lock.release.assert_called_once_with()
 
-    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
     def test_delete_lock_not_acquired(self, mock_view_state):
         """
         If the lock is not acquired, do not delete the group.
@@ -1725,8 +2157,8 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
             return defer.fail(BusyLockError('', ''))
         self.lock.acquire.side_effect = acquire
 
-        mock_view_state.return_value = defer.succeed(GroupState(
-            self.tenant_id, self.group_id, 'a', {}, {}, None, {}, False))
+        mock_view_state.return_value = defer.succeed((GroupState(
+            self.tenant_id, self.group_id, 'a', {}, {}, None, {}, False), 1))
 
         d = self.group.delete_group()
         result = self.failureResultOf(d)
@@ -1736,7 +2168,7 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
         self.lock.acquire.assert_called_once_with()
 
     @mock.patch('otter.models.cass.random.uniform')
-    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
     def test_delete_lock_with_random_retry(self, mock_view_state, mock_rand_uniform):
         """
         The lock is created with random retry wait
@@ -1750,7 +2182,7 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
                                                      max_retry=5, retry_wait=3.56, log=mock.ANY)
 
     @mock.patch('otter.models.cass.random.uniform')
-    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    @mock.patch('otter.models.cass.CassScalingGroup._view_versioned_state')
     def test_delete_lock_with_log_category_locking(self, mock_view_state, mock_rand_uniform):
         """
         The lock is created with log with category as locking
@@ -1767,6 +2199,412 @@ class CassScalingGroupTestCase(IScalingGroupProviderMixin, LockMixin, TestCase):
             log=log.bind().bind())
 
 
+class CassScalingGroupOptimisticStateTests(TestCase):
+    """
+    Tests for :class:`CassScalingGroup` state writes when
+    ``cassandra.state_concurrency`` is ``optimistic``
+    """
+
+    def setUp(self):
+        """
+        Mock a connection whose responses are popped off ``self.returns``, and
+        turn on optimistic concurrency
+        """
+        self.connection = mock.MagicMock(spec=['execute'])
+        self.returns = []
+
+        def _responses(*args):
+            return defer.succeed(_de_identify(self.returns.pop(0)))
+
+        self.connection.execute.side_effect = _responses
+
+        set_config_data({'cassandra': {'state_concurrency': 'optimistic'}})
+        self.addCleanup(set_config_data, {})
+
+        patch(self, 'otter.models.cass.get_consistency_level',
+              return_value=ConsistencyLevel.TWO)
+        self.basic_lock_mock = patch(self, 'otter.models.cass.BasicLock')
+
+        self.tenant_id = '11111'
+        self.group_id = '12345678g'
+        self.group = CassScalingGroup(mock_log(), self.tenant_id,
+                                      self.group_id, self.connection)
+
+    def _row(self, version, active='{}', pending='{}'):
+        return {'tenantId': self.tenant_id, 'groupId': self.group_id,
+                'group_config': '{"name": "a"}', 'active': active,
+                'pending': pending, 'groupTouched': None,
+                'policyTouched': '{}', 'paused': '\x00',
+                'version': version, 'created_at': 23}
+
+    def _modifier(self, group, state):
+        state.add_active('s1', {'created': 'now'})
+        return state
+
+    def test_view_and_write_use_version(self):
+        """
+        ``modify_state`` reads the state with its version and writes it back
+        conditioned on that version, incrementing it.  No lock is taken.
+        """
+        self.returns = [[self._row(3)], [{'[applied]': True}]]
+        d = self.group.modify_state(self._modifier)
+        self.assertIsNone(self.successResultOf(d))
+
+        view_cql = ('SELECT "tenantId", "groupId", group_config, active, pending, '
+                    '"groupTouched", "policyTouched", paused, warm_pool, version, '
+                    'created_at FROM scaling_group WHERE "tenantId" = :tenantId AND '
+                    '"groupId" = :groupId;')
+        cas_cql = ('UPDATE scaling_group SET active = :active, pending = :pending, '
+                   '"groupTouched" = :groupTouched, "policyTouched" = :policyTouched, '
+                   'paused = :paused, warm_pool = :warm_pool, version = :newVersion '
+                   'WHERE "tenantId" = :tenantId AND "groupId" = :groupId IF version = :version;')
+        self.connection.execute.assert_has_calls([
+            mock.call(view_cql, {'tenantId': self.tenant_id, 'groupId': self.group_id},
+                      ConsistencyLevel.TWO),
+            mock.call(cas_cql, {'tenantId': self.tenant_id, 'groupId': self.group_id,
+                                'active': serialize_json_data({'s1': {'created': 'now'}}, 1),
+                                'pending': serialize_json_data({}, 1),
+                                'groupTouched': '0001-01-01T00:00:00Z',
+                                'policyTouched': serialize_json_data({}, 1),
+                                'paused': False,
+                                'warm_pool': serialize_json_data({'servers': {}, 'jobs': {}}, 1),
+                                'version': 3, 'newVersion': 4},
+                      ConsistencyLevel.TWO)])
+        self.assertFalse(self.basic_lock_mock.called)
+
+    def test_unversioned_state(self):
+        """
+        State that has never been written with a version is matched with
+        ``null`` and written with version 1
+        """
+        self.returns = [[self._row(None)], [{'[applied]': '\x01'}]]
+        d = self.group.modify_state(self._modifier)
+        self.assertIsNone(self.successResultOf(d))
+
+        cql, params, _ = self.connection.execute.call_args[0]
+        self.assertTrue(cql.endswith('IF version = null;'))
+        self.assertNotIn('version', params)
+        self.assertEqual(params['newVersion'], 1)
+
+    def test_warm_pool_read_and_written(self):
+        """
+        The warm pool is read with the state, and written back with the
+        modifier's changes
+        """
+        row = self._row(3)
+        row['warm_pool'] = serialize_json_data(
+            {'servers': {'s1': {'launch': 'key'}}, 'jobs': {'j1': {'launch': 'key'}}}, 1)
+        self.returns = [[row], [{'[applied]': True}]]
+
+        def modifier(group, state):
+            self.assertEqual(state.warm_servers, {'s1': {'launch': 'key'}})
+            self.assertEqual(state.warm_jobs, {'j1': {'launch': 'key'}})
+            state.remove_warm_job('j1')
+            return state
+
+        self.successResultOf(self.group.modify_state(modifier))
+        cql, params, _ = self.connection.execute.call_args[0]
+        self.assertEqual(json.loads(params['warm_pool']),
+                         {'servers': {'s1': {'launch': 'key'}}, 'jobs': {}, '_ver': 1})
+
+    def test_conflict_retries_with_fresh_state(self):
+        """
+        If the conditional write is not applied, the state is read again and
+        the modifier is re-applied to the fresh state
+        """
+        states = []
+
+        def modifier(group, state):
+            states.append(state.active.copy())
+            return self._modifier(group, state)
+
+        self.returns = [[self._row(3)], [{'[applied]': False, 'version': 4}],
+                        [self._row(4, active='{"s0": {}}')], [{'[applied]': True}]]
+        d = self.group.modify_state(modifier)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(states, [{}, {'s0': {}}])
+
+        cql, params, _ = self.connection.execute.call_args[0]
+        self.assertEqual((params['version'], params['newVersion']), (4, 5))
+
+    def test_after_save_actions_only_for_written_state(self):
+        """
+        Only the actions deferred by the modifier for the state that is
+        written are called, and only once it has been written
+        """
+        actions = []
+
+        def modifier(group, state):
+            state.after_save(actions.append, state.active.keys())
+            return self._modifier(group, state)
+
+        self.returns = [[self._row(3)], [{'[applied]': False, 'version': 4}],
+                        [self._row(4, active='{"s0": {}}')], [{'[applied]': True}]]
+        d = self.group.modify_state(modifier)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(actions, [['s0']])
+
+    def test_conflict_gives_up(self):
+        """
+        After :data:`CAS_MAX_RETRIES` retries ``modify_state`` fails with
+        :class:`StateConflictError`
+        """
+        self.returns = [[self._row(3)], [{'[applied]': False}]] * (CAS_MAX_RETRIES + 1)
+        d = self.group.modify_state(self._modifier)
+        self.failureResultOf(d, StateConflictError)
+        self.assertEqual(self.connection.execute.call_count, 2 * (CAS_MAX_RETRIES + 1))
+
+    def test_modifier_error_does_not_write(self):
+        """
+        If the modifier fails, nothing is written
+        """
+        def modifier(group, state):
+            raise DummyException()
+
+        self.returns = [[self._row(3)]]
+        self.failureResultOf(self.group.modify_state(modifier), DummyException)
+        self.assertEqual(self.connection.execute.call_count, 1)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
+    def test_delete_group_conditional(self, mock_naive):
+        """
+        ``delete_group`` deletes the group row conditioned on the version it
+        checked to be empty, and then deletes everything else
+        """
+        mock_naive.return_value = defer.succeed([])
+        self.returns = [[self._row(7)], [{'[applied]': True}], [], None]
+        self.assertIsNone(self.successResultOf(self.group.delete_group()))
+
+        params = {'tenantId': self.tenant_id, 'groupId': self.group_id}
+        self.connection.execute.assert_has_calls([
+            mock.call('DELETE FROM scaling_group WHERE "tenantId" = :tenantId AND '
+                      '"groupId" = :groupId IF version = :version;',
+                      dict(version=7, **params), ConsistencyLevel.TWO),
+            mock.call('SELECT "webhookKey" FROM policy_webhooks WHERE "tenantId" = :tenantId '
+                      'AND "groupId" = :groupId;', params, ConsistencyLevel.TWO),
+            mock.call(
+                'BEGIN UNLOGGED BATCH '
+                'DELETE FROM scaling_group WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+                'DELETE FROM scaling_policies WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+                'DELETE FROM policy_webhooks WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
+                'APPLY BATCH;', params, ConsistencyLevel.TWO)])
+        self.assertFalse(self.basic_lock_mock.called)
+
+    def test_delete_group_not_empty(self):
+        """
+        ``delete_group`` fails with :class:`GroupNotEmptyError` without
+        deleting anything if the state is not empty
+        """
+        self.returns = [[self._row(7, pending='{"j": {}}')]]
+        self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
+        self.assertEqual(self.connection.execute.call_count, 1)
+
+    @mock.patch('otter.models.cass.CassScalingGroup._naive_list_policies')
+    def test_delete_group_conflict_rechecks_state(self, mock_naive):
+        """
+        If the state changed after it was checked, ``delete_group`` checks it
+        again before deleting
+        """
+        self.returns = [[self._row(7)], [{'[applied]': False}],
+                        [self._row(8, pending='{"j": {}}')]]
+        self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
+        self.assertFalse(mock_naive.called)
+
+
+class StateModifierQueueTests(TestCase):
+    """
+    Tests for :class:`StateModifierQueue`
+    """
+
+    def setUp(self):
+        """
+        Mock out the locked read-modify-write of the groups so that it only
+        happens when the test fires it
+        """
+        self.queue = StateModifierQueue()
+        self.modifications = []
+        self.group = self._group('group')
+
+    def _group(self, group_id):
+        group = CassScalingGroup(mock_log(), 'tenant', group_id,
+                                 mock.MagicMock(spec=['execute']), self.queue)
+
+        def _modify_state(modifier):
+            d = defer.Deferred()
+            self.modifications.append((group, modifier, d))
+            return d
+
+        group._modify_state = _modify_state
+        return group
+
+    def _complete(self, index=0, write_result=None):
+        """
+        Apply the ``index``th locked modification to a fresh state and
+        complete it with ``write_result``.  Returns the resulting state, or
+        the failure if nothing would have been written.
+        """
+        group, modifier, d = self.modifications[index]
+        state = GroupState('tenant', group.uuid, 'name', {}, {}, None, {}, False)
+        results = []
+        modifier(group, state).addBoth(results.append)
+        if isinstance(results[0], Failure):
+            d.errback(results[0])
+        else:
+            d.callback(write_result)
+        return results[0]
+
+    def _add_active(self, server_id):
+        def modifier(group, state):
+            state.add_active(server_id, {'created': 'now'})
+            return state
+        return modifier
+
+    def test_modify_state_uses_queue(self):
+        """
+        :meth:`CassScalingGroup.modify_state` goes through the queue if the
+        group has one
+        """
+        self.queue.modify_state = mock.Mock(return_value='result')
+        self.assertEqual(self.group.modify_state('mod', 1, a=2), 'result')
+        self.queue.modify_state.assert_called_once_with(self.group, 'mod', 1, a=2)
+
+    def test_collection_groups_share_queue(self):
+        """
+        Groups from the same collection share that collection's queue
+        """
+        collection = CassScalingGroupCollection(None)
+        group1 = collection.get_scaling_group(mock_log(), 't', 'g')
+        group2 = collection.get_scaling_group(mock_log(), 't', 'g')
+        self.assertIsInstance(group1.state_queue, StateModifierQueue)
+        self.assertIs(group1.state_queue, group2.state_queue)
+
+    def test_concurrent_modifiers_coalesced(self):
+        """
+        Modifiers queued while the first modification is waiting for the
+        lock are all applied in order to one read of the state, which is
+        written once
+        """
+        ds = [self.group.modify_state(self._add_active(s))
+              for s in ('a', 'b', 'c')]
+        self.assertEqual(len(self.modifications), 1)
+        self.assertEqual([d.called for d in ds], [False] * 3)
+
+        state = self._complete()
+        self.assertEqual(sorted(state.active), ['a', 'b', 'c'])
+        self.assertEqual([self.successResultOf(d) for d in ds], [None] * 3)
+
+    def test_modifier_args_and_own_group(self):
+        """
+        Each modifier is called with the group it was queued from, and with
+        its own arguments
+        """
+        other = self._group('group')
+        modifier = mock.Mock(side_effect=lambda group, state, *a, **kw: state)
+        self.group.modify_state(modifier, 1, b=2)
+        other.modify_state(modifier, 3)
+        self._complete()
+        self.assertEqual(modifier.mock_calls, [
+            mock.call(self.group, mock.ANY, 1, b=2),
+            mock.call(other, mock.ANY, 3)])
+
+    def test_failing_modifier_isolated(self):
+        """
+        A failing modifier's changes are discarded and only its ``Deferred``
+        errbacks
+        """
+        def bad(group, state):
+            state.add_active('bad', {})
+            raise DummyException()
+
+        d1 = self.group.modify_state(self._add_active('a'))
+        d2 = self.group.modify_state(bad)
+        d3 = self.group.modify_state(self._add_active('c'))
+
+        state = self._complete()
+        self.assertEqual(sorted(state.active), ['a', 'c'])
+        self.assertIsNone(self.successResultOf(d1))
+        self.failureResultOf(d2, DummyException)
+        self.assertIsNone(self.successResultOf(d3))
+
+    def test_failing_modifier_after_save_actions_discarded(self):
+        """
+        The actions a failing modifier deferred until the state is saved are
+        discarded along with its changes
+        """
+        actions = []
+
+        def deferring(name, fail):
+            def modifier(group, state):
+                state.after_save(actions.append, name)
+                if fail:
+                    raise DummyException()
+                return state
+            return modifier
+
+        self.group.modify_state(deferring('a', False))
+        d = self.group.modify_state(deferring('bad', True))
+        self.group.modify_state(deferring('c', False))
+
+        self._complete().saved(mock.Mock())
+        self.assertEqual(actions, ['a', 'c'])
+        self.failureResultOf(d, DummyException)
+
+    def test_all_modifiers_fail(self):
+        """
+        If every modifier fails, nothing is written and each ``Deferred``
+        errbacks with its own failure
+        """
+        def bad(exc):
+            def modifier(group, state):
+                raise exc
+            return modifier
+
+        d1 = self.group.modify_state(bad(DummyException()))
+        d2 = self.group.modify_state(bad(ValueError()))
+        self.assertTrue(self._complete().check(DummyException))
+        self.failureResultOf(d1, DummyException)
+        self.failureResultOf(d2, ValueError)
+
+    def test_read_or_write_failure(self):
+        """
+        If the state cannot be read, written or locked, every modifier in the
+        batch fails with that error
+        """
+        ds = [self.group.modify_state(self._add_active(s)) for s in 'ab']
+        self.modifications[0][-1].errback(BusyLockError('locks', 'group'))
+        for d in ds:
+            self.failureResultOf(d, BusyLockError)
+
+    def test_modifiers_queued_while_running_go_in_next_batch(self):
+        """
+        Modifiers queued after the state has been read are applied in a
+        separate modification once the current one has finished
+        """
+        d1 = self.group.modify_state(self._add_active('a'))
+        group, modifier, write_d = self.modifications[0]
+        modifier(group, GroupState('tenant', 'group', 'n', {}, {}, None, {}, False))
+
+        d2 = self.group.modify_state(self._add_active('b'))
+        d3 = self.group.modify_state(self._add_active('c'))
+        self.assertEqual(len(self.modifications), 1)
+
+        write_d.callback(None)
+        self.assertIsNone(self.successResultOf(d1))
+        self.assertEqual(len(self.modifications), 2)
+
+        state = self._complete(1)
+        self.assertEqual(sorted(state.active), ['b', 'c'])
+        self.assertEqual([self.successResultOf(d) for d in (d2, d3)], [None] * 2)
+
+    def test_different_groups_not_coalesced(self):
+        """
+        Modifications of different groups proceed independently
+        """
+        self.group.modify_state(self._add_active('a'))
+        self._group('other').modify_state(self._add_active('b'))
+        self.assertEqual(len(self.modifications), 2)
+
+
 # wrapper for serialization mocking - 'serialized' things will just be wrapped
 # with this
 _S = namedtuple('_S', ['thing'])
@@ -1892,6 +2730,66 @@ class CassScalingScheduleCollectionTestCase(IScalingScheduleCollectionProviderMi
         self.assertEqual(result, None)
         self.connection.execute.assert_called_once_with(delcql, deldata, ConsistencyLevel.QUORUM)
 
+    def test_fetch_bucket_events(self):
+        """
+        Events due in the bucket are fetched with one query. Events of deleted
+        or rescheduled policies have already been deleted, so policies are not
+        read to check them
+        """
+        events = [{'bucket': 3, 'tenantId': 't', 'groupId': 'g', 'policyId': 'p{}'.format(i),
+                   'trigger': 100 + i, 'cron': 'c'} for i in range(3)]
+        self.returns = [events]
+
+        result = self.successResultOf(self.collection.fetch_bucket_events(3, 1234, 10))
+
+        self.assertEqual(result, events)
+        self.connection.execute.assert_called_once_with(
+            'SELECT bucket, "tenantId", "groupId", "policyId", trigger, cron '
+            'FROM scaling_schedule_buckets WHERE bucket = :bucket AND trigger <= :now '
+            'LIMIT :size;', {'bucket': 3, 'now': 1234, 'size': 10}, ConsistencyLevel.QUORUM)
+
+    def test_reschedule_events(self):
+        """
+        Processed events are deleted and cron events are added with their new
+        trigger in one batch.  The recorded triggers of the cron events are
+        replaced, and those of the other events deleted
+        """
+        processed = [{'bucket': 1, 'tenantId': 't', 'groupId': 'g', 'policyId': 'p1',
+                      'trigger': 100, 'cron': 'c'},
+                     {'bucket': 1, 'tenantId': 't', 'groupId': 'g', 'policyId': 'p2',
+                      'trigger': 101, 'cron': None}]
+        cron = [dict(processed[0], trigger=200)]
+
+        self.successResultOf(self.collection.reschedule_events(processed, cron))
+
+        self.connection.execute.assert_called_once_with(
+            'BEGIN BATCH '
+            'DELETE FROM scaling_schedule_buckets WHERE bucket = :event0bucket AND '
+            'trigger = :event0trigger AND "policyId" = :event0policyId '
+            'DELETE FROM scaling_schedule_buckets WHERE bucket = :event1bucket AND '
+            'trigger = :event1trigger AND "policyId" = :event1policyId '
+            'INSERT INTO scaling_schedule_buckets(bucket, "tenantId", "groupId", "policyId", '
+            'trigger, cron) VALUES (:cron0bucket, :cron0tenantId, :cron0groupId, '
+            ':cron0policyId, :cron0trigger, :cron0cron) '
+            'INSERT INTO scaling_schedule_bucket_triggers("policyId", bucket, trigger) '
+            'VALUES (:cron0policyId, :cron0bucket, :cron0trigger) '
+            'DELETE FROM scaling_schedule_bucket_triggers WHERE "policyId" IN '
+            '(:trigger_policy0); '
+            'APPLY BATCH;',
+            {'event0bucket': 1, 'event0trigger': 100, 'event0policyId': 'p1',
+             'event1bucket': 1, 'event1trigger': 101, 'event1policyId': 'p2',
+             'cron0bucket': 1, 'cron0tenantId': 't', 'cron0groupId': 'g', 'cron0policyId': 'p1',
+             'cron0trigger': 200, 'cron0cron': 'c', 'trigger_policy0': 'p2'},
+            ConsistencyLevel.QUORUM)
+
+    def test_schedule_bucket(self):
+        """
+        ``schedule_bucket`` consistently maps a policy ID to one of the buckets
+        """
+        self.assertEqual(schedule_bucket('12345678', 10), schedule_bucket('12345678', 10))
+        self.assertEqual(set(schedule_bucket(str(i), 4) for i in range(100)),
+                         set(range(4)))
+
 
 class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
                                           TestCase):
@@ -1948,7 +2846,7 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
             "pending": '{}',
             "policyTouched": '{}',
             "paused": False}
-        expectedCql = ('BEGIN BATCH '
+        expectedCql = ('BEGIN UNLOGGED BATCH '
                        'INSERT INTO scaling_group("tenantId", "groupId", group_config, '
                        'launch_config, active, pending, "policyTouched", '
                        'paused, created_at) '
@@ -1994,7 +2892,7 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
             "paused": False,
             'policy0Id': '12345678',
             'policy0': _S(policy)}
-        expectedCql = ('BEGIN BATCH '
+        expectedCql = ('BEGIN UNLOGGED BATCH '
                        'INSERT INTO scaling_group("tenantId", "groupId", group_config, '
                        'launch_config, active, pending, "policyTouched", '
                        'paused, created_at) '
@@ -2044,7 +2942,7 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
             'policy0': _S(policies[0]),
             'policy1Id': '3',
             'policy1': _S(policies[1])}
-        expectedCql = ('BEGIN BATCH '
+        expectedCql = ('BEGIN UNLOGGED BATCH '
                        'INSERT INTO scaling_group("tenantId", "groupId", group_config, '
                        'launch_config, active, pending, "policyTouched", '
                        'paused, created_at) '
@@ -2243,48 +3141,163 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         (note that it doesn't request the database)
         """
         g = self.collection.get_scaling_group(self.mock_log, '123', '12345678')
-        self.assertTrue(isinstance(g, CassScalingGroup))
+        self.assertTrue(isinstance(g, CachingScalingGroup))
+        self.assertTrue(isinstance(g.group, CassScalingGroup))
+        self.assertIs(g.cache, self.collection.group_cache)
         self.assertEqual(g.uuid, '12345678')
         self.assertEqual(g.tenant_id, '123')
 
     def test_webhook_hash(self):
         """
-        Test that you can get webhook info by hash.
+        Test that you can get webhook info by hash, which is looked up in the
+        webhook keys table.
         """
         self.returns = [_cassandrify_data([
-            {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}]),
-            _cassandrify_data([{'data': '{}'}])
-        ]
+            {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}])]
         expectedData = {'webhookKey': 'x'}
-        expectedCql = ('SELECT "tenantId", "groupId", "policyId" FROM policy_webhooks WHERE '
+        expectedCql = ('SELECT "tenantId", "groupId", "policyId" FROM webhook_keys WHERE '
                        '"webhookKey" = :webhookKey;')
         d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
         r = self.successResultOf(d)
         self.assertEqual(r, ('123', 'group1', 'pol1'))
-        self.connection.execute.assert_called_any(expectedCql,
-                                                  expectedData,
-                                                  ConsistencyLevel.TWO)
+        self.connection.execute.assert_called_once_with(expectedCql,
+                                                        expectedData,
+                                                        ConsistencyLevel.TWO)
 
-        expectedCql = ('SELECT data FROM scaling_policies WHERE "tenantId" = :tenantId '
-                       'AND "groupId" = :groupId AND "policyId" = :policyId;')
-        expectedData = {"tenantId": "123", "groupId": "group1", "policyId": "pol1"}
-        self.connection.execute.assert_called_any(expectedCql,
-                                                  expectedData,
-                                                  ConsistencyLevel.TWO)
+    def test_webhook_hash_prepared(self):
+        """
+        If the connection can prepare statements, the webhook keys table is
+        queried with a prepared statement
+        """
+        connection = mock.MagicMock(spec=['execute', 'prepare', 'execute_prepared'])
+        connection.prepare.return_value = defer.succeed('prepared')
+        connection.execute_prepared.return_value = defer.succeed(_cassandrify_data([
+            {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}]))
+        collection = CassScalingGroupCollection(connection)
+
+        d = collection.webhook_info_by_hash(self.mock_log, 'x')
+
+        self.assertEqual(self.successResultOf(d), ('123', 'group1', 'pol1'))
+        connection.prepare.assert_called_once_with(
+            'SELECT "tenantId", "groupId", "policyId" FROM webhook_keys WHERE '
+            '"webhookKey" = :webhookKey;')
+        connection.execute_prepared.assert_called_once_with(
+            'prepared', {'webhookKey': 'x'}, ConsistencyLevel.TWO)
+        self.assertFalse(connection.execute.called)
+
+    def test_webhook_hash_not_in_keys_table(self):
+        """
+        When ``cassandra.webhook_index_fallback`` is set, a webhook that is not
+        in the webhook keys table is looked up in the webhooks table index,
+        and added to the webhook keys table
+        """
+        set_config_data({'cassandra': {'webhook_index_fallback': True}})
+        self.addCleanup(set_config_data, {})
+        self.returns = [[],
+                        _cassandrify_data([{'tenantId': '123', 'groupId': 'group1',
+                                            'policyId': 'pol1'}]),
+                        None]
+        d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+        r = self.successResultOf(d)
+        self.assertEqual(r, ('123', 'group1', 'pol1'))
+        self.assertEqual(self.connection.execute.mock_calls[1:], [
+            mock.call('SELECT "tenantId", "groupId", "policyId" FROM policy_webhooks WHERE '
+                      '"webhookKey" = :webhookKey;', {'webhookKey': 'x'}, ConsistencyLevel.TWO),
+            mock.call('INSERT INTO webhook_keys("webhookKey", "tenantId", "groupId", '
+                      '"policyId") VALUES (:webhookKey, :tenantId, :groupId, :policyId);',
+                      {'webhookKey': 'x', 'tenantId': '123', 'groupId': 'group1',
+                       'policyId': 'pol1'}, ConsistencyLevel.TWO)])
+
+    def test_webhook_hash_cached(self):
+        """
+        A webhook that has been looked up is found in the webhook cache until
+        its entry expires
+        """
+        clock = Clock()
+        self.collection.webhook_cache = LRUCache(10, 60, clock)
+        self.returns = [_cassandrify_data([
+            {'tenantId': '123', 'groupId': 'group1', 'policyId': 'pol1'}])] * 2
+        for _ in range(2):
+            d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+            self.assertEqual(self.successResultOf(d), ('123', 'group1', 'pol1'))
+        self.assertEqual(self.connection.execute.call_count, 1)
+
+        clock.advance(60)
+        d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+        self.assertEqual(self.successResultOf(d), ('123', 'group1', 'pol1'))
+        self.assertEqual(self.connection.execute.call_count, 2)
+
+    def test_webhook_bad_cached(self):
+        """
+        A webhook that is not found is remembered as not found for the
+        configured ``cassandra.webhook_cache.negative_ttl`` seconds
+        """
+        set_config_data({'cassandra': {'webhook_cache': {'negative_ttl': 2}}})
+        self.addCleanup(set_config_data, {})
+        clock = Clock()
+        self.collection.webhook_cache = LRUCache(10, 60, clock)
+        self.returns = [[], []]
+        for _ in range(2):
+            d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+            self.failureResultOf(d, UnrecognizedCapabilityError)
+        self.assertEqual(self.connection.execute.call_count, 1)
+
+        clock.advance(2)
+        d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+        self.failureResultOf(d, UnrecognizedCapabilityError)
+        self.assertEqual(self.connection.execute.call_count, 2)
+
+    def test_get_scaling_group_shares_webhook_cache(self):
+        """
+        Groups share the collection's webhook cache, so that they can
+        invalidate its entries
+        """
+        g = self.collection.get_scaling_group(self.mock_log, '123', '12345678')
+        self.assertIs(g.webhook_cache, self.collection.webhook_cache)
+
+    def test_get_scaling_group_shares_queries(self):
+        """
+        Groups use the queries the collection formatted for its tables when it
+        was constructed, rather than formatting their own
+        """
+        g = self.collection.get_scaling_group(self.mock_log, '123', '12345678')
+        self.assertIs(g.group.queries, self.collection.queries)
+        self.assertEqual(
+            self.collection.queries.cas_group_state['null'],
+            'UPDATE scaling_group SET active = :active, pending = :pending, '
+            '"groupTouched" = :groupTouched, "policyTouched" = :policyTouched, '
+            'paused = :paused, warm_pool = :warm_pool, version = :newVersion '
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId IF version = null;')
 
     def test_webhook_bad(self):
         """
-        Test that a bad webhook will fail predictably
+        Test that a bad webhook will fail predictably, without searching the
+        webhooks table index by default
         """
         self.returns = [[]]
         expectedData = {'webhookKey': 'x'}
-        expectedCql = ('SELECT "tenantId", "groupId", "policyId" FROM policy_webhooks WHERE '
-                       '"webhookKey" = :webhookKey;')
         d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
         self.failureResultOf(d, UnrecognizedCapabilityError)
-        self.connection.execute.assert_called_once_with(expectedCql,
-                                                        expectedData,
-                                                        ConsistencyLevel.TWO)
+        self.connection.execute.assert_called_once_with(
+            'SELECT "tenantId", "groupId", "policyId" FROM webhook_keys WHERE '
+            '"webhookKey" = :webhookKey;', expectedData, ConsistencyLevel.TWO)
+
+    def test_webhook_bad_index_fallback(self):
+        """
+        When ``cassandra.webhook_index_fallback`` is set, a bad webhook is also
+        searched for in the webhooks table index before failing
+        """
+        set_config_data({'cassandra': {'webhook_index_fallback': True}})
+        self.addCleanup(set_config_data, {})
+        self.returns = [[], []]
+        expectedData = {'webhookKey': 'x'}
+        d = self.collection.webhook_info_by_hash(self.mock_log, 'x')
+        self.failureResultOf(d, UnrecognizedCapabilityError)
+        self.assertEqual(self.connection.execute.mock_calls, [
+            mock.call('SELECT "tenantId", "groupId", "policyId" FROM webhook_keys WHERE '
+                      '"webhookKey" = :webhookKey;', expectedData, ConsistencyLevel.TWO),
+            mock.call('SELECT "tenantId", "groupId", "policyId" FROM policy_webhooks WHERE '
+                      '"webhookKey" = :webhookKey;', expectedData, ConsistencyLevel.TWO)])
 
     def test_get_counts(self):
         """
@@ -2341,6 +3354,7 @@ class CassAdminTestCase(TestCase):
 
         patch(self, 'otter.models.cass.get_consistency_level',
               return_value=ConsistencyLevel.TWO)
+        self.latencies = patch(self, 'otter.models.cass._latencies', new={})
 
     @mock.patch('otter.models.cass.time')
     def test_get_metrics(self, time):
@@ -2385,3 +3399,52 @@ class CassAdminTestCase(TestCase):
         result = self.successResultOf(d)
         self.assertEquals(result, expectedResults)
         self.connection.execute.assert_has_calls(calls)
+
+    @mock.patch('otter.models.cass.time')
+    def test_get_metrics_webhook_cache(self, time):
+        """
+        If given a webhook cache, get_metrics also returns its hits, misses and
+        evictions
+        """
+        time.time.return_value = 1234567890
+        cache = LRUCache(1, 60, Clock())
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.set('b', 2)
+        self.collection = CassAdmin(self.connection, cache)
+        self.returns = [[{'count': 190}], [{'count': 191}], [{'count': 192}]]
+
+        d = self.collection.get_metrics(self.mock_log)
+        result = self.successResultOf(d)
+        self.assertEqual(result[3:], [
+            {'id': 'otter.metrics.webhook_cache.evictions', 'value': 1,
+             'time': 1234567890},
+            {'id': 'otter.metrics.webhook_cache.hits', 'value': 1,
+             'time': 1234567890},
+            {'id': 'otter.metrics.webhook_cache.misses', 'value': 1,
+             'time': 1234567890}])
+
+    @mock.patch('otter.models.cass.time')
+    def test_get_metrics_latencies(self, time):
+        """
+        get_metrics also returns, for each operation and consistency level, the
+        number of operations and how many took at most each bucket's bound
+        """
+        time.time.return_value = 1234567890
+        histogram = Histogram((1, 10))
+        histogram.record(0.5)
+        histogram.record(5)
+        histogram.record(50)
+        self.latencies[('view_config', 'ONE')] = histogram
+        self.returns = [[{'count': 190}], [{'count': 191}], [{'count': 192}]]
+
+        d = self.collection.get_metrics(self.mock_log)
+        result = self.successResultOf(d)
+        self.assertEqual(result[3:], [
+            {'id': 'otter.metrics.latency.view_config.ONE.count', 'value': 3,
+             'time': 1234567890},
+            {'id': 'otter.metrics.latency.view_config.ONE.le_1', 'value': 1,
+             'time': 1234567890},
+            {'id': 'otter.metrics.latency.view_config.ONE.le_10', 'value': 2,
+             'time': 1234567890}])
@@ -2,7 +2,7 @@
 Tests for :mod:`otter.models.interface`
 """
 from collections import namedtuple
-
+from copy import deepcopy
 
 import mock
 
@@ -16,6 +16,7 @@ from otter.models.interface import (
     NoSuchScalingGroupError)
 from otter.json_schema.group_schemas import launch_config
 from otter.json_schema import model_schemas, validate
+from otter.test.utils import CheckFailure, DummyException
 
 
 class GroupStateTestCase(TestCase):
@@ -115,6 +116,49 @@ class GroupStateTestCase(TestCase):
         self.assertRaises(AssertionError, state.remove_job, '1')
         self.assertEqual(state.pending, {})
 
+    def test_add_remove_warm_job(self):
+        """
+        ``add_warm_job`` adds a job to the warm pool along with the creation
+        time, and ``remove_warm_job`` removes it.  Adding a job twice or
+        removing a job that is not there raises an AssertionError.
+        """
+        state = GroupState('tid', 'gid', 'name', {}, {}, None, {}, True,
+                           now=lambda: 'datetime')
+        state.add_warm_job('1', {'launch': 'key'})
+        self.assertEqual(state.warm_jobs, {'1': {'launch': 'key', 'created': 'datetime'}})
+        self.assertRaises(AssertionError, state.add_warm_job, '1', {})
+
+        state.remove_warm_job('1')
+        self.assertEqual(state.warm_jobs, {})
+        self.assertRaises(AssertionError, state.remove_warm_job, '1')
+        self.assertEqual(state.pending, {})
+
+    def test_add_remove_warm_server(self):
+        """
+        ``add_warm_server`` adds a server to the warm pool along with the
+        creation time, and ``remove_warm_server`` removes it.  Adding a server
+        twice or removing a server that is not there raises an AssertionError.
+        """
+        state = GroupState('tid', 'gid', 'name', {}, {}, None, {}, True,
+                           now=lambda: 'datetime')
+        state.add_warm_server('1', {'launch': 'key'})
+        self.assertEqual(state.warm_servers,
+                         {'1': {'launch': 'key', 'created': 'datetime'}})
+        self.assertRaises(AssertionError, state.add_warm_server, '1', {})
+
+        state.remove_warm_server('1')
+        self.assertEqual(state.warm_servers, {})
+        self.assertRaises(AssertionError, state.remove_warm_server, '1')
+        self.assertEqual(state.active, {})
+
+    def test_states_with_different_warm_pools_unequal(self):
+        """
+        Two states whose warm pools differ are unequal
+        """
+        args = ('tid', 'gid', 'name', {}, {}, 'date', {}, True)
+        self.assertNotEqual(GroupState(*args), GroupState(*args, warm_servers={'1': {}}))
+        self.assertNotEqual(GroupState(*args), GroupState(*args, warm_jobs={'1': {}}))
+
     def test_add_active_success_adds_creation_time(self):
         """
         If the server ID is not in the active list, ``add_active`` adds it along
@@ -175,6 +219,54 @@ class GroupStateTestCase(TestCase):
         self.assertEqual(state.group_touched, '0')
         self.assertEqual(state.policy_touched, {'pid': '0'})
 
+    def test_after_save_actions_called_once_saved(self):
+        """
+        Actions deferred with ``after_save`` are called, in order, once the
+        state has been saved, and only once
+        """
+        calls = []
+        state = GroupState('tid', 'gid', 'name', {}, {}, None, {}, True)
+        state.after_save(calls.append, 1)
+        state.after_save(lambda **kwargs: calls.append(kwargs), a=2)
+        self.assertEqual(calls, [])
+
+        state.saved(mock.Mock())
+        self.assertEqual(calls, [1, {'a': 2}])
+        state.saved(mock.Mock())
+        self.assertEqual(calls, [1, {'a': 2}])
+
+    def test_after_save_action_failure_logged(self):
+        """
+        An action that fails is logged, and does not stop the other actions
+        """
+        calls = []
+        log = mock.Mock()
+        state = GroupState('tid', 'gid', 'name', {}, {}, None, {}, True)
+        state.after_save(lambda: defer.fail(DummyException()))
+        state.after_save(calls.append, 1)
+
+        state.saved(log)
+        self.assertEqual(calls, [1])
+        log.err.assert_called_once_with(CheckFailure(DummyException),
+                                        'Action after saving state failed')
+
+    def test_deepcopy_shares_after_save_actions(self):
+        """
+        A deep copy of the state waits for the same actions, without copying
+        them, but actions added to one are not added to the other
+        """
+        action = mock.Mock()
+        state = GroupState('tid', 'gid', 'name', {'s': {}}, {}, None, {}, True)
+        state.after_save(action, 1)
+
+        copied = deepcopy(state)
+        self.assertEqual(copied, state)
+        self.assertIsNot(copied.active, state.active)
+        state.after_save(action, 2)
+
+        copied.saved(mock.Mock())
+        action.assert_called_once_with(1)
+
 
 class IScalingGroupProviderMixin(object):
     """
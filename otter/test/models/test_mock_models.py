@@ -312,6 +312,18 @@ class MockScalingGroupTestCase(IScalingGroupProviderMixin, TestCase):
         self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
         self.assertEqual(len(self.collection.data[self.group.tenant_id]), 1)
 
+    def test_delete_scaling_group_fails_if_warm_pool_not_empty(self):
+        """
+        Deleting a scaling group whose warm pool has servers or jobs building
+        them errbacks with a :class:`GroupNotEmptyError`
+        """
+        self.group.state.warm_servers = {'s1': {}}
+        self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
+        self.group.state.warm_servers = {}
+        self.group.state.warm_jobs = {'j1': {}}
+        self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
+        self.assertEqual(len(self.collection.data[self.group.tenant_id]), 1)
+
     def test_list_empty_policies(self):
         """
         If there are no policies, list policies conforms to the schema and
@@ -381,6 +393,29 @@ class MockScalingGroupTestCase(IScalingGroupProviderMixin, TestCase):
         deferred = self.group.get_policy(uuid)
         self.failureResultOf(deferred, NoSuchPolicyError)
 
+    def test_view_execution_bundle(self):
+        """
+        ``view_execution_bundle`` returns the config, launch config and the
+        policy, if one was asked for
+        """
+        policy_list = self.successResultOf(self.group.list_policies())
+        policy = policy_list[0]
+        uuid = policy.pop('id')
+        config, launch, _ = self.successResultOf(self.group.view_execution_bundle())
+        self.assertEqual(
+            self.successResultOf(self.group.view_execution_bundle(uuid)),
+            (config, launch, policy))
+        self.assertEqual(config, self.successResultOf(self.group.view_config()))
+        self.assertEqual(launch, self.launch_config)
+
+    def test_view_execution_bundle_no_such_policy(self):
+        """
+        ``view_execution_bundle`` fails with :class:`NoSuchPolicyError` if the
+        policy does not exist
+        """
+        self.failureResultOf(self.group.view_execution_bundle('nope'),
+                             NoSuchPolicyError)
+
     def test_delete_policy_succeeds(self):
         """
         Delete a policy, check that it is actually deleted.
@@ -724,6 +759,13 @@ class MockScalingScheduleCollectionTestCase(IScalingScheduleCollectionProviderMi
         deferred = self.collection.fetch_batch_of_events(1234, 100)
         self.assertEqual(self.successResultOf(deferred), [])
 
+    def test_fetch_bucket_events(self):
+        """
+        Fetching the events of a bucket returns no events
+        """
+        deferred = self.collection.fetch_bucket_events(2, 1234, 100)
+        self.assertEqual(self.successResultOf(deferred), [])
+
 
 class MockScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
                                           TestCase):
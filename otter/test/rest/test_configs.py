@@ -297,8 +297,10 @@ class LaunchConfigTestCase(RestAPITestMixin, TestCase):
         """
         super(LaunchConfigTestCase, self).setUp()
         self.mock_group = mock.MagicMock(
-            spec=('uuid', 'view_launch_config', 'update_launch_config'),
+            spec=('uuid', 'view_launch_config', 'update_launch_config',
+                  'view_config', 'modify_state'),
             uuid='1')
+        self.mock_group.view_config.return_value = defer.succeed({})
         self.mock_store.get_scaling_group.return_value = self.mock_group
 
         # Patch supervisor
@@ -415,6 +417,23 @@ class LaunchConfigTestCase(RestAPITestMixin, TestCase):
         self.mock_store.get_scaling_group.assert_called_once_with(mock.ANY, '11111', '1')
         self.mock_group.update_launch_config.assert_called_once_with(
             launch_examples()[0])
+        self.assertFalse(self.mock_group.modify_state.called)
+
+    @mock.patch('otter.rest.configs.controller', spec=['maintain_warm_pool'])
+    def test_update_launch_config_replaces_warm_pool(self, mock_controller):
+        """
+        If the group has a warm pool, its servers are replaced with servers
+        built from the new launch config, under ``modify_state``
+        """
+        self.mock_group.update_launch_config.return_value = defer.succeed(None)
+        self.mock_group.view_config.return_value = defer.succeed({'warmPool': 2})
+        self.mock_group.modify_state.side_effect = (
+            lambda modifier: defer.succeed(modifier('group', 'state')))
+
+        self.assert_status_code(204, method='PUT', body=json.dumps(launch_examples()[0]))
+        mock_controller.maintain_warm_pool.assert_called_once_with(
+            mock.ANY, 'transaction-id', {'warmPool': 2}, launch_examples()[0],
+            'group', 'state')
 
     def test_launch_config_modify_bad_or_missing_input_400(self):
         """
@@ -344,16 +344,18 @@ class ValidateBodyTestCase(TestCase):
 
     def setUp(self):
         """
-        Set up a mock requst object that can be read, also patch jsonschema
+        Set up a mock requst object that can be read, also patch the schema
+        validators
         """
         self.request_content = StringIO()
         self.request = mock.MagicMock(spec=["content"],
                                       content=self.request_content)
 
-        self.validate_patch = mock.patch(
-            'otter.rest.decorators.validate')
-        self.mock_validate = self.validate_patch.start()
-        self.addCleanup(self.validate_patch.stop)
+        self.validator_patch = mock.patch(
+            'otter.rest.decorators.validator')
+        self.mock_validator = self.validator_patch.start()
+        self.mock_validate = self.mock_validator.return_value.validate
+        self.addCleanup(self.validator_patch.stop)
 
     def test_success_case(self):
         """
@@ -380,7 +382,8 @@ class ValidateBodyTestCase(TestCase):
         result = self.successResultOf(d)
 
         # assert that it was validated
-        self.mock_validate.assert_called_once_with(expected_value, schema)
+        self.mock_validator.assert_called_once_with(schema)
+        self.mock_validate.assert_called_once_with(expected_value)
 
         # assert that the json was parsed and passed back in the 'data' keyword
         expected_kwargs = dict(kwargs)
@@ -420,6 +423,22 @@ class ValidateBodyTestCase(TestCase):
 
         self.failureResultOf(FakeApp().handle_body(self.request), ValidationError)
 
+    def test_validator_made_once(self):
+        """
+        The schema's validator is made when the decorator is applied, not for
+        each request
+        """
+        class FakeApp(object):
+            @validate_body({})
+            def handle_body(self, request, *args, **kwargs):
+                return defer.succeed((args, kwargs))
+
+        self.request.content.write('{}')
+        for i in range(2):
+            self.successResultOf(FakeApp().handle_body(self.request))
+        self.mock_validator.assert_called_once_with({})
+        self.assertEqual(self.mock_validate.call_count, 2)
+
 
 class LogArgumentsTestCase(TestCase):
     """
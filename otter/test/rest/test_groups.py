@@ -579,6 +579,9 @@ class OneGroupTestCase(RestAPITestMixin, TestCase):
         """
         super(OneGroupTestCase, self).setUp()
         self.mock_group.uuid = "one"
+        self.mock_state = GroupState('11111', 'one', '', {}, {}, None, {}, False)
+        self.mock_controller = patch(self, 'otter.rest.groups.controller',
+                                     spec=['maintain_warm_pool'])
 
     def test_view_manifest_404(self):
         """
@@ -673,6 +676,44 @@ class OneGroupTestCase(RestAPITestMixin, TestCase):
             mock.ANY, '11111', 'one')
         self.mock_group.delete_group.assert_called_once_with()
 
+    def test_group_delete_empties_warm_pool(self):
+        """
+        The group's warm pool is emptied, under ``modify_state``, before the
+        group is deleted.
+        """
+        state = GroupState('11111', 'one', '', {}, {}, None, {}, False,
+                           warm_servers={'s1': {}})
+
+        def modify_state(modifier):
+            self.assertFalse(self.mock_group.delete_group.called)
+            return defer.succeed(modifier(self.mock_group, state))
+
+        self.mock_group.modify_state.side_effect = modify_state
+        self.mock_group.delete_group.return_value = defer.succeed(None)
+        self.assert_status_code(204, method="DELETE")
+        self.mock_controller.maintain_warm_pool.assert_called_once_with(
+            mock.ANY, 'transaction-id', {}, None, self.mock_group, state)
+        self.mock_group.delete_group.assert_called_once_with()
+
+    def test_group_delete_not_empty_keeps_warm_pool(self):
+        """
+        If the group has servers besides those in its warm pool, deleting it
+        fails with a 403 without emptying the warm pool.
+        """
+        self.mock_group.tenant_id = '11111'
+        state = GroupState('11111', 'one', '', {'a': {}}, {}, None, {}, False,
+                           warm_servers={'s1': {}})
+
+        def modify_state(modifier):
+            return defer.maybeDeferred(modifier, self.mock_group, state)
+
+        self.mock_group.modify_state.side_effect = modify_state
+        response_body = self.assert_status_code(403, method="DELETE")
+        self.assertEqual(json.loads(response_body)['type'], 'GroupNotEmptyError')
+        self.assertFalse(self.mock_controller.maintain_warm_pool.called)
+        self.assertFalse(self.mock_group.delete_group.called)
+        self.flushLoggedErrors(GroupNotEmptyError)
+
     def test_group_delete_force(self):
         """
         Deleting a group with force sets min/max to zero and deletes it.
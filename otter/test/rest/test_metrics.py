@@ -8,6 +8,7 @@ from twisted.internet import defer
 from twisted.trial.unittest import TestCase
 
 from otter.test.rest.request import AdminRestAPITestMixin
+from otter.test.utils import patch
 
 
 class MetricsEndpointsTestCase(AdminRestAPITestMixin, TestCase):
@@ -17,6 +18,21 @@ class MetricsEndpointsTestCase(AdminRestAPITestMixin, TestCase):
     """
     endpoint = '/metrics'
 
+    def setUp(self):
+        """
+        Mock the shared HTTP connection pool, the auth cache and polling
+        stats, the supervisor and the time
+        """
+        super(MetricsEndpointsTestCase, self).setUp()
+        self.treq = patch(self, 'otter.rest.metrics.treq')
+        self.cache_stats = patch(self, 'otter.rest.metrics.cache_stats',
+                                 return_value={})
+        self.polling_stats = patch(self, 'otter.rest.metrics.polling_stats',
+                                   return_value={})
+        self.get_supervisor = patch(self, 'otter.rest.metrics.get_supervisor',
+                                    return_value=None)
+        self.time = patch(self, 'otter.rest.metrics.time')
+
     def test_metrics_endpoint_contains_metrics_string(self):
         """
         Requests for metrics returns a json payload of all available metrics.
@@ -34,9 +50,72 @@ class MetricsEndpointsTestCase(AdminRestAPITestMixin, TestCase):
             }
         ]
 
-        self.mock_store.get_metrics.return_value = defer.succeed(metrics)
+        self.mock_store.get_metrics.return_value = defer.succeed(metrics[:])
+        self.treq.stats.return_value = {}
 
         response_body = json.loads(self.assert_status_code(200))
         self.assertEqual(response_body, {'metrics': metrics})
 
         self.mock_store.get_metrics.assert_called_once_with(mock.ANY)
+
+    def test_metrics_endpoint_contains_http_pool_metrics(self):
+        """
+        The metrics include the hits, misses and requests in flight of the
+        shared HTTP connection pool.
+        """
+        self.mock_store.get_metrics.return_value = defer.succeed([])
+        self.treq.stats.return_value = {'hits': 5, 'misses': 2, 'in_flight': 1}
+        self.time.time.return_value = 1234567890
+
+        response_body = json.loads(self.assert_status_code(200))
+        self.assertEqual(response_body, {'metrics': [
+            {'id': 'otter.metrics.http_pool.hits', 'value': 5, 'time': 1234567890},
+            {'id': 'otter.metrics.http_pool.in_flight', 'value': 1, 'time': 1234567890},
+            {'id': 'otter.metrics.http_pool.misses', 'value': 2, 'time': 1234567890}]})
+
+    def test_metrics_endpoint_contains_polling_metrics(self):
+        """
+        The metrics include the number of builds and deletes seen to be
+        completed by polling, and how many polls they took.
+        """
+        self.mock_store.get_metrics.return_value = defer.succeed([])
+        self.treq.stats.return_value = {}
+        self.polling_stats.return_value = {'build.jobs': 2, 'build.polls': 9}
+        self.time.time.return_value = 1234567890
+
+        response_body = json.loads(self.assert_status_code(200))
+        self.assertEqual(response_body, {'metrics': [
+            {'id': 'otter.metrics.polling.build.jobs', 'value': 2, 'time': 1234567890},
+            {'id': 'otter.metrics.polling.build.polls', 'value': 9, 'time': 1234567890}]})
+
+    def test_metrics_endpoint_contains_auth_cache_metrics(self):
+        """
+        The metrics include the hits, misses, refreshes and evictions of the
+        tenant authentication cache.
+        """
+        self.mock_store.get_metrics.return_value = defer.succeed([])
+        self.treq.stats.return_value = {}
+        self.cache_stats.return_value = {'hits': 7, 'misses': 2}
+        self.time.time.return_value = 1234567890
+
+        response_body = json.loads(self.assert_status_code(200))
+        self.assertEqual(response_body, {'metrics': [
+            {'id': 'otter.metrics.auth_cache.hits', 'value': 7, 'time': 1234567890},
+            {'id': 'otter.metrics.auth_cache.misses', 'value': 2, 'time': 1234567890}]})
+
+    def test_metrics_endpoint_contains_rate_limit_metrics(self):
+        """
+        The metrics include the supervisor's rate limiting stats, if there is
+        a supervisor.
+        """
+        self.mock_store.get_metrics.return_value = defer.succeed([])
+        self.treq.stats.return_value = {}
+        self.get_supervisor.return_value = mock.Mock(spec=['rate_limit_stats'])
+        self.get_supervisor.return_value.rate_limit_stats.return_value = {
+            'servers.queued': 3}
+        self.time.time.return_value = 1234567890
+
+        response_body = json.loads(self.assert_status_code(200))
+        self.assertEqual(response_body, {'metrics': [
+            {'id': 'otter.metrics.rate_limit.servers.queued', 'value': 3,
+             'time': 1234567890}]})
@@ -10,6 +10,8 @@ from twisted.internet import reactor
 from twisted.application.service import MultiService
 from twisted.trial.unittest import TestCase
 
+from otter.indexer.events import (
+    ServerEventListener, get_server_event_listener, set_server_event_listener)
 from otter.supervisor import get_supervisor, set_supervisor, SupervisorService
 from otter.tap.api import Options, makeService
 from otter.test.utils import patch
@@ -186,6 +188,21 @@ class APIMakeServiceTests(TestCase):
             [self.clientFromString.return_value],
             'otter_test')
 
+    @mock.patch('otter.tap.api.PreparedStatementCluster')
+    def test_cassandra_cluster_with_prepared_statements(self, prepared_cluster):
+        """
+        makeService configures a PreparedStatementCluster instead if
+        ``cassandra.prepared_statements`` is set.
+        """
+        mock_config = test_config.copy()
+        mock_config['cassandra'] = dict(mock_config['cassandra'], prepared_statements=True)
+        makeService(mock_config)
+        prepared_cluster.assert_called_once_with(
+            [self.clientFromString.return_value], 'otter_test')
+        self.assertFalse(self.RoundRobinCassandraCluster.called)
+        self.LoggingCQLClient.assert_called_once_with(prepared_cluster.return_value,
+                                                      self.log.bind.return_value)
+
     def test_cassandra_scaling_group_collection_with_cluster(self):
         """
         makeService configures a CassScalingGroupCollection with the
@@ -253,9 +270,63 @@ class APIMakeServiceTests(TestCase):
         expected_parent = makeService(mock_config)
         scheduler_service.assert_called_once_with(100, 10,
                                                   self.LoggingCQLClient.return_value,
-                                                  self.CassScalingGroupCollection.return_value)
+                                                  self.CassScalingGroupCollection.return_value,
+                                                  max_concurrency=10, buckets=None)
         scheduler_service.return_value.setServiceParent.assert_called_with(expected_parent)
 
+    @mock.patch('otter.tap.api.SchedulerService')
+    def test_scheduler_service_max_concurrency(self, scheduler_service):
+        """
+        SchedulerService is given the configured ``max_concurrency``
+        """
+        mock_config = test_config.copy()
+        mock_config['scheduler'] = {'interval': 10, 'batchsize': 100, 'max_concurrency': 3}
+
+        makeService(mock_config)
+        scheduler_service.assert_called_once_with(100, 10,
+                                                  self.LoggingCQLClient.return_value,
+                                                  self.CassScalingGroupCollection.return_value,
+                                                  max_concurrency=3, buckets=None)
+
+    @mock.patch('otter.tap.api.SchedulerService')
+    def test_scheduler_service_buckets(self, scheduler_service):
+        """
+        SchedulerService is given the number of schedule buckets, as an int, if
+        the store partitions events into buckets
+        """
+        mock_config = test_config.copy()
+        mock_config['scheduler'] = {'interval': 10, 'batchsize': 100}
+        mock_config['cassandra'] = dict(mock_config['cassandra'], schedule_buckets='4')
+
+        makeService(mock_config)
+        scheduler_service.assert_called_once_with(100, 10,
+                                                  self.LoggingCQLClient.return_value,
+                                                  self.CassScalingGroupCollection.return_value,
+                                                  max_concurrency=10, buckets=4)
+
+    @mock.patch('otter.tap.api.CachingAuthenticator')
+    def test_authenticator_cache_defaults(self, caching_authenticator):
+        """
+        The authenticator's cache is given default settings if none are
+        configured
+        """
+        makeService(test_config)
+        caching_authenticator.assert_called_once_with(
+            reactor, mock.ANY, 300, max_size=10000, refresh_window=60, jitter=0.1)
+
+    @mock.patch('otter.tap.api.CachingAuthenticator')
+    def test_authenticator_cache_zero_settings(self, caching_authenticator):
+        """
+        Settings of the authenticator's cache that are configured as 0 are
+        used rather than replaced by the defaults
+        """
+        mock_config = dict(test_config, identity={
+            'cache_ttl': 30, 'cache_max_size': 0, 'cache_refresh_window': 0,
+            'cache_jitter': 0})
+        makeService(mock_config)
+        caching_authenticator.assert_called_once_with(
+            reactor, mock.ANY, 30, max_size=0, refresh_window=0, jitter=0)
+
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
     def test_supervisor_service_set_by_default(self, supervisor):
         """
@@ -267,3 +338,34 @@ class APIMakeServiceTests(TestCase):
         supervisor_service = parent.getServiceNamed('supervisor')
 
         self.assertEqual(get_supervisor(), supervisor_service)
+
+    @mock.patch('otter.tap.api.FeedPollerService')
+    def test_notification_feeds(self, feed_poller):
+        """
+        A FeedPollerService for each configured notification feed is added to
+        the MultiService, all sharing the server event listener that is set as
+        the current one
+        """
+        self.addCleanup(set_server_event_listener, None)
+        mock_config = test_config.copy()
+        mock_config['notifications'] = {'urls': [u'http://feed1', u'http://feed2'],
+                                        'interval': 3}
+
+        parent = makeService(mock_config)
+        listener = get_server_event_listener()
+        self.assertIsInstance(listener, ServerEventListener)
+        feed_poller.assert_has_calls([
+            mock.call(mock.ANY, 'http://feed1', [listener], interval=3),
+            mock.call().setServiceParent(parent),
+            mock.call(mock.ANY, 'http://feed2', [listener], interval=3),
+            mock.call().setServiceParent(parent)])
+
+    @mock.patch('otter.tap.api.FeedPollerService')
+    def test_no_notification_feeds(self, feed_poller):
+        """
+        No feeds are polled, and there is no server event listener, unless
+        notification feeds are configured
+        """
+        makeService(test_config)
+        self.assertFalse(feed_poller.called)
+        self.assertIsNone(get_server_event_listener())
@@ -6,10 +6,11 @@ import mock
 from twisted.trial.unittest import TestCase
 from twisted.internet.defer import succeed, fail, Deferred
 from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 
 from zope.interface.verify import verifyObject
 
-from otter.test.utils import patch, SameJSON, iMock
+from otter.test.utils import patch, SameJSON, iMock, CheckFailure
 
 from otter.util.http import APIError, RequestError
 
@@ -21,6 +22,9 @@ from otter.auth import user_for_tenant
 from otter.auth import ImpersonatingAuthenticator
 from otter.auth import CachingAuthenticator
 from otter.auth import IAuthenticator
+from otter.auth import IExpiringAuthenticator
+from otter.auth import ServiceCatalog
+from otter.auth import cache_stats
 
 expected_headers = {'accept': ['application/json'],
                     'content-type': ['application/json'],
@@ -247,6 +251,50 @@ class HelperTests(TestCase):
         self.assertEqual(real_failure.value.body, 'error_body')
 
 
+class ServiceCatalogTests(TestCase):
+    """
+    Tests for :class:`ServiceCatalog`
+    """
+    def setUp(self):
+        """
+        A catalog with two regions of one service, and a service with an
+        endpoint that has no region
+        """
+        self.services = [
+            {'name': 'cloudServersOpenStack', 'type': 'compute',
+             'endpoints': [{'region': 'DFW', 'publicURL': 'http://dfw/'},
+                           {'region': 'ORD', 'publicURL': 'http://ord/'},
+                           {'region': 'DFW', 'publicURL': 'http://dfw2/'}]},
+            {'name': 'cloudDNS', 'type': 'rax:dns',
+             'endpoints': [{'publicURL': 'http://dns/'}]}]
+        self.catalog = ServiceCatalog(self.services)
+
+    def test_is_list_of_services(self):
+        """
+        A ServiceCatalog is the list of services it was made from
+        """
+        self.assertEqual(self.catalog, self.services)
+
+    def test_endpoint(self):
+        """
+        ``endpoint`` gets the first endpoint of a service in a region
+        """
+        self.assertEqual(self.catalog.endpoint('cloudServersOpenStack', 'DFW'),
+                         {'region': 'DFW', 'publicURL': 'http://dfw/'})
+        self.assertEqual(self.catalog.endpoint('cloudServersOpenStack', 'ORD'),
+                         {'region': 'ORD', 'publicURL': 'http://ord/'})
+        self.assertEqual(self.catalog.endpoint('cloudDNS', None),
+                         {'publicURL': 'http://dns/'})
+
+    def test_endpoint_missing(self):
+        """
+        ``endpoint`` gets ``None`` if the service has no endpoint in the
+        region
+        """
+        self.assertIsNone(self.catalog.endpoint('cloudServersOpenStack', 'SYD'))
+        self.assertIsNone(self.catalog.endpoint('cloudLoadBalancers', 'DFW'))
+
+
 class ImpersonatingAuthenticatorTests(TestCase):
     """
     Tests for the end-to-end impersonation workflow.
@@ -273,8 +321,22 @@ class ImpersonatingAuthenticatorTests(TestCase):
         self.admin_url = 'http://identity_admin/v2.0'
         self.user = 'service_user'
         self.password = 'service_password'
+        self.clock = Clock()
         self.ia = ImpersonatingAuthenticator(self.user, self.password,
-                                             self.url, self.admin_url)
+                                             self.url, self.admin_url,
+                                             self.clock)
+
+    def respond_to_each_call(self):
+        """
+        Make each mocked helper return a new Deferred for every call, so that
+        tests can authenticate more than one tenant.
+        """
+        def respond(result):
+            return lambda *args, **kwargs: succeed(result)
+
+        for helper in (self.authenticate_user, self.user_for_tenant,
+                       self.impersonate_user, self.endpoints_for_token):
+            helper.side_effect = respond(self.successResultOf(helper.return_value))
 
     def test_verifyObject(self):
         """
@@ -330,6 +392,7 @@ class ImpersonatingAuthenticatorTests(TestCase):
         result = self.successResultOf(self.ia.authenticate_tenant(1111111))
 
         self.assertEqual(result[0], 'impersonation_token')
+        self.assertIsInstance(result[1], ServiceCatalog)
         self.assertEqual(result[1],
                          [{'name': 'anEndpoint',
                            'type': 'anType',
@@ -372,6 +435,129 @@ class ImpersonatingAuthenticatorTests(TestCase):
         failure = self.failureResultOf(self.ia.authenticate_tenant(111111))
         self.assertTrue(failure.check(APIError))
 
+    def test_authenticate_tenant_with_expiry(self):
+        """
+        authenticate_tenant_with_expiry also returns when the impersonation
+        token expires, in seconds since the epoch.
+        """
+        self.impersonate_user.return_value = succeed(
+            {'access': {'token': {'id': 'impersonation_token',
+                                  'expires': '1970-01-02T00:00:00Z'}}})
+        verifyObject(IExpiringAuthenticator, self.ia)
+
+        result = self.successResultOf(self.ia.authenticate_tenant_with_expiry(111111))
+
+        self.assertEqual(result[0], 'impersonation_token')
+        self.assertEqual(result[2], 86400)
+
+    def test_authenticate_tenant_reuses_admin_token(self):
+        """
+        authenticate_tenant authenticates as the service user once, and uses
+        the same token to impersonate users of other tenants.
+        """
+        self.respond_to_each_call()
+        self.successResultOf(self.ia.authenticate_tenant(111111))
+        self.successResultOf(self.ia.authenticate_tenant(222222))
+
+        self.authenticate_user.assert_called_once_with(self.url, self.user,
+                                                       self.password)
+        self.assertEqual(self.impersonate_user.call_count, 2)
+
+    def test_authenticate_tenant_authenticates_admin_once_at_a_time(self):
+        """
+        Tenants authenticated while the service user is being authenticated
+        wait for that authentication rather than starting another.
+        """
+        self.respond_to_each_call()
+        auth_d = Deferred()
+        self.authenticate_user.side_effect = lambda *args: auth_d
+
+        d1 = self.ia.authenticate_tenant(111111)
+        d2 = self.ia.authenticate_tenant(222222)
+        self.assertNoResult(d1)
+        self.assertNoResult(d2)
+
+        auth_d.callback({'access': {'token': {'id': 'auth-token'}}})
+        self.successResultOf(d1)
+        self.successResultOf(d2)
+        self.assertEqual(self.authenticate_user.call_count, 1)
+
+    def test_authenticate_tenant_admin_auth_failure_not_cached(self):
+        """
+        If authenticating as the service user fails, every waiting tenant
+        fails, and the next tenant authenticates as the service user again.
+        """
+        self.respond_to_each_call()
+        auth_d = Deferred()
+        self.authenticate_user.side_effect = lambda *args: auth_d
+
+        d1 = self.ia.authenticate_tenant(111111)
+        d2 = self.ia.authenticate_tenant(222222)
+        auth_d.errback(APIError(500, '500'))
+        self.failureResultOf(d1, APIError)
+        self.failureResultOf(d2, APIError)
+
+        self.authenticate_user.side_effect = lambda *args: succeed(
+            {'access': {'token': {'id': 'auth-token'}}})
+        self.successResultOf(self.ia.authenticate_tenant(111111))
+        self.assertEqual(self.authenticate_user.call_count, 2)
+
+    def test_authenticate_tenant_refreshes_admin_token_before_expiry(self):
+        """
+        The service user is authenticated again once its token is about to
+        expire.
+        """
+        self.authenticate_user.return_value = succeed(
+            {'access': {'token': {'id': 'auth-token',
+                                  'expires': '1970-01-01T01:00:00Z'}}})
+        self.respond_to_each_call()
+
+        self.successResultOf(self.ia.authenticate_tenant(111111))
+        self.clock.advance(3600 - 301)
+        self.successResultOf(self.ia.authenticate_tenant(111111))
+        self.assertEqual(self.authenticate_user.call_count, 1)
+
+        self.clock.advance(1)
+        self.successResultOf(self.ia.authenticate_tenant(111111))
+        self.assertEqual(self.authenticate_user.call_count, 2)
+
+    def test_authenticate_tenant_reauthenticates_on_unauthorized(self):
+        """
+        If the admin API rejects the service user's token, the service user
+        is authenticated again and the impersonation is retried once.
+        """
+        self.respond_to_each_call()
+        tokens = ['auth-token', 'new-auth-token']
+        self.authenticate_user.side_effect = lambda *args: succeed(
+            {'access': {'token': {'id': tokens.pop(0)}}})
+        responses = [
+            fail(RequestError(Failure(APIError(401, '401')), self.admin_url)),
+            succeed({'access': {'token': {'id': 'impersonation_token'}}})]
+        self.impersonate_user.side_effect = lambda *args: responses.pop(0)
+
+        result = self.successResultOf(self.ia.authenticate_tenant(111111))
+
+        self.assertEqual(result[0], 'impersonation_token')
+        self.assertEqual(self.authenticate_user.call_count, 2)
+        self.assertEqual(self.impersonate_user.mock_calls,
+                         [mock.call(self.admin_url, 'auth-token', 'test_user'),
+                          mock.call(self.admin_url, 'new-auth-token', 'test_user')])
+        self.endpoints_for_token.assert_called_once_with(
+            self.admin_url, 'new-auth-token', 'impersonation_token')
+
+    def test_authenticate_tenant_unauthorized_retried_once(self):
+        """
+        If the admin API rejects a freshly authenticated token as well, the
+        failure is propagated.
+        """
+        self.respond_to_each_call()
+        self.impersonate_user.side_effect = lambda *args: fail(APIError(401, '401'))
+
+        failure = self.failureResultOf(self.ia.authenticate_tenant(111111))
+        self.assertTrue(failure.check(APIError))
+        self.assertEqual(self.authenticate_user.call_count, 2)
+        self.assertEqual(self.impersonate_user.call_count, 2)
+
 
 class CachingAuthenticatorTests(TestCase):
     """
@@ -391,6 +577,8 @@ class CachingAuthenticatorTests(TestCase):
 
         self.clock = Clock()
         self.ca = CachingAuthenticator(self.clock, self.authenticator, 10)
+        self.counts = patch(self, 'otter.auth._cache_counts',
+                            new={'hits': 0, 'misses': 0, 'refreshes': 0, 'evictions': 0})
 
     def test_verifyObject(self):
         """
@@ -505,3 +693,118 @@ class CachingAuthenticatorTests(TestCase):
         d = self.ca.authenticate_tenant(1)
         failure = self.failureResultOf(d)
         self.assertTrue(failure.check(APIError))
+
+    def test_counts_hits_and_misses(self):
+        """
+        Authentications served from the cache are counted as hits, and the
+        others as misses.
+        """
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.successResultOf(self.ca.authenticate_tenant(1))
+        self.assertEqual(cache_stats(), {'hits': 2, 'misses': 1, 'refreshes': 0,
+                                         'evictions': 0})
+
+    def test_entry_lasts_until_token_expires(self):
+        """
+        If the authenticator says when tokens expire, an entry lasts until
+        shortly before its token expires rather than for the TTL.
+        """
+        authenticator = iMock(IExpiringAuthenticator)
+        authenticator.authenticate_tenant_with_expiry.side_effect = (
+            lambda tenant_id: succeed(('auth-token', 'catalog', 1000)))
+        ca = CachingAuthenticator(self.clock, authenticator, 10)
+
+        self.assertEqual(self.successResultOf(ca.authenticate_tenant(1)),
+                         ('auth-token', 'catalog'))
+        self.clock.advance(700)
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.assertEqual(authenticator.authenticate_tenant_with_expiry.call_count, 1)
+
+        self.clock.advance(1)
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.assertEqual(authenticator.authenticate_tenant_with_expiry.call_count, 2)
+
+    def test_lifetime_jittered(self):
+        """
+        An entry's lifetime is shortened by a random fraction of up to
+        ``jitter`` of it.
+        """
+        random = patch(self, 'otter.auth.random')
+        random.random.return_value = 0.5
+        ca = CachingAuthenticator(self.clock, self.authenticator, 10, jitter=0.2)
+
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.clock.advance(9)
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.assertEqual(self.auth_function.call_count, 1)
+
+        self.clock.advance(0.5)
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.assertEqual(self.auth_function.call_count, 2)
+
+    def test_refreshes_ahead_of_expiry(self):
+        """
+        An entry used within the refresh window before it expires is returned
+        straight away and refreshed in the background, and the refreshed
+        entry is used from then on.
+        """
+        ca = CachingAuthenticator(self.clock, self.authenticator, 10, refresh_window=3)
+        self.successResultOf(ca.authenticate_tenant(1))
+
+        self.clock.advance(7)
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.assertEqual(self.auth_function.call_count, 1)
+
+        auth_d = Deferred()
+        self.auth_function.side_effect = lambda _: auth_d
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(ca.authenticate_tenant(1)),
+                         ('auth-token', 'catalog'))
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.assertEqual(self.auth_function.call_count, 2)
+
+        auth_d.callback(('auth-token2', 'catalog2'))
+        self.clock.advance(5)
+        self.assertEqual(self.successResultOf(ca.authenticate_tenant(1)),
+                         ('auth-token2', 'catalog2'))
+        self.assertEqual(self.auth_function.call_count, 2)
+        self.assertEqual(self.counts['refreshes'], 1)
+
+    def test_refresh_failure_keeps_entry(self):
+        """
+        If refreshing an entry fails, the failure is logged and the entry is
+        used until it expires.
+        """
+        log = patch(self, 'otter.auth.log')
+        ca = CachingAuthenticator(self.clock, self.authenticator, 10, refresh_window=3)
+        self.successResultOf(ca.authenticate_tenant(1))
+
+        self.auth_function.side_effect = lambda _: fail(APIError(500, '500'))
+        self.clock.advance(8)
+        self.assertEqual(self.successResultOf(ca.authenticate_tenant(1)),
+                         ('auth-token', 'catalog'))
+        log.bind.return_value.bind.return_value.err.assert_called_once_with(
+            CheckFailure(APIError), 'otter.auth.cache.refresh_failed')
+
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(ca.authenticate_tenant(1)),
+                         ('auth-token', 'catalog'))
+
+    def test_evicts_least_recently_used(self):
+        """
+        Beyond ``max_size`` tenants, the least recently used tenant is evicted.
+        """
+        ca = CachingAuthenticator(self.clock, self.authenticator, 10, max_size=2)
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.successResultOf(ca.authenticate_tenant(2))
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.successResultOf(ca.authenticate_tenant(3))
+        self.assertEqual(self.counts['evictions'], 1)
+
+        self.successResultOf(ca.authenticate_tenant(1))
+        self.successResultOf(ca.authenticate_tenant(3))
+        self.assertEqual(self.auth_function.call_count, 3)
+        self.successResultOf(ca.authenticate_tenant(2))
+        self.assertEqual(self.auth_function.mock_calls[-1], mock.call(2))
+        self.assertEqual(self.auth_function.call_count, 4)
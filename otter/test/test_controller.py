@@ -573,9 +573,13 @@ class ObeyConfigChangeTestCase(TestCase):
         self.exec_scale_down = patch(
             self, 'otter.controller.exec_scale_down',
             return_value=defer.succeed(None))
+        self.maintain_warm_pool = patch(
+            self, 'otter.controller.maintain_warm_pool',
+            side_effect=lambda *args: defer.succeed(args[-1]))
 
         self.log = mock.MagicMock()
-        self.state = mock.MagicMock(spec=[])  # so calling anything will fail
+        # so calling anything other than after_save will fail
+        self.state = mock.MagicMock(spec=['after_save'])
 
         self.group = iMock(IScalingGroup, tenant_id='tenant', uuid='group')
         self.group.view_launch_config.return_value = defer.succeed("launch")
@@ -654,6 +658,262 @@ class ObeyConfigChangeTestCase(TestCase):
             self.log.bind.return_value, 'transaction-id', self.state,
             self.group, 5)
 
+    def test_warm_pool_maintained(self):
+        """
+        The group's warm pool is maintained once the servers have been
+        launched or deleted, with the launch config looked up if it is needed
+        """
+        self.calculate_delta.return_value = 0
+        d = controller.obey_config_change(self.log, 'transaction-id',
+                                          {'warmPool': 3}, self.group, self.state)
+        self.assertIs(self.successResultOf(d), self.state)
+        self.maintain_warm_pool.assert_called_once_with(
+            self.log.bind.return_value, 'transaction-id', {'warmPool': 3}, None,
+            self.group, self.state)
+
+    def test_warm_pool_errors_propagated(self):
+        """
+        ``obey_config_change`` propagates any errors ``maintain_warm_pool``
+        raises
+        """
+        self.calculate_delta.return_value = 0
+        self.maintain_warm_pool.side_effect = lambda *args: defer.fail(DummyException())
+        d = controller.obey_config_change(self.log, 'transaction-id',
+                                          'config', self.group, self.state)
+        self.failureResultOf(d, DummyException)
+
+
+class MaintainWarmPoolTests(TestCase):
+    """
+    Tests for :func:`otter.controller.maintain_warm_pool`
+    """
+
+    def setUp(self):
+        """
+        Mock the supervisor, the group and job IDs, and start with a state
+        with an empty warm pool
+        """
+        self.supervisor = iMock(ISupervisor)
+        patch(self, 'otter.controller.get_supervisor', return_value=self.supervisor)
+        self.supervisor.execute_build_server.side_effect = (
+            lambda *args: defer.Deferred())
+        self.group = iMock(IScalingGroup, tenant_id='tenant', uuid='group')
+        self.group.view_launch_config.return_value = defer.succeed('launch')
+        self.job_ids = iter(range(10))
+        patch(self, 'otter.controller.generate_job_id',
+              side_effect=lambda group_id: 'job{0}'.format(next(self.job_ids)))
+        self.log = mock.Mock()
+        self.state = GroupState('tenant', 'group', 'name', {}, {}, None, {}, False,
+                                now=lambda: 'now')
+        self.key = controller.launch_config_key('launch')
+
+    def maintain(self, size, launch=None):
+        """
+        Maintain the warm pool, returning the state it fires with
+        """
+        config = {} if size is None else {'warmPool': size}
+        return self.successResultOf(controller.maintain_warm_pool(
+            self.log, 'transaction-id', config, launch, self.group, self.state))
+
+    def test_no_warm_pool(self):
+        """
+        Nothing is done for a config without a warm pool size and a state
+        without a warm pool
+        """
+        self.assertIs(self.maintain(None), self.state)
+        self.assertFalse(self.group.view_launch_config.called)
+        self.assertEqual(self.state._after_save, [])
+
+    def test_builds_missing_servers(self):
+        """
+        A job building each server missing from the pool is added to the
+        state, and started once the state has been saved
+        """
+        state = self.maintain(2)
+        self.assertIs(state, self.state)
+        self.assertEqual(state.warm_jobs,
+                         {'job0': {'launch': self.key, 'created': 'now'},
+                          'job1': {'launch': self.key, 'created': 'now'}})
+        self.assertFalse(self.supervisor.execute_build_server.called)
+
+        state.saved(self.log)
+        self.assertEqual(self.supervisor.execute_build_server.mock_calls, [
+            mock.call(self.log.bind.return_value, 'transaction-id', self.group,
+                      'launch')] * 2)
+        self.log.bind.assert_any_call(warm_pool_job_id='job0')
+        self.log.bind.assert_any_call(warm_pool_job_id='job1')
+
+    def test_launch_config_given(self):
+        """
+        The launch config given is used rather than looked up
+        """
+        self.maintain(1, 'other')
+        self.assertFalse(self.group.view_launch_config.called)
+        self.assertEqual(self.state.warm_jobs['job0']['launch'],
+                         controller.launch_config_key('other'))
+
+    def test_keeps_wanted_servers_and_jobs(self):
+        """
+        Servers and jobs built from the launch config count towards the pool's
+        size
+        """
+        self.state.add_warm_server('s1', {'server': 'details', 'launch': self.key})
+        self.state.add_warm_job('j1', {'launch': self.key})
+        state = self.maintain(3)
+        self.assertEqual(state.warm_servers.keys(), ['s1'])
+        self.assertEqual(sorted(state.warm_jobs.keys()), ['j1', 'job0'])
+
+    def test_removes_unwanted_servers_and_jobs(self):
+        """
+        Servers and jobs built from another launch config, or more of them
+        than the pool's size, are removed, and the servers deleted once the
+        state has been saved
+        """
+        self.state.add_warm_server('s1', {'server': 'details', 'launch': self.key})
+        self.state.add_warm_server('s2', {'server': 'details', 'launch': 'old'})
+        self.state.add_warm_job('j1', {'launch': self.key})
+        self.state.add_warm_job('j2', {'launch': 'old'})
+        state = self.maintain(1)
+        self.assertEqual(state.warm_servers.keys(), ['s1'])
+        self.assertEqual(state.warm_jobs, {})
+        self.assertFalse(self.supervisor.execute_delete_server.called)
+
+        state.saved(self.log)
+        self.supervisor.execute_delete_server.assert_called_once_with(
+            self.log, 'transaction-id', self.group, {'id': 's2', 'lb_info': {}})
+        self.assertFalse(self.supervisor.execute_build_server.called)
+
+    def test_no_size_empties_pool(self):
+        """
+        Without a warm pool size, the pool is emptied without looking up the
+        launch config
+        """
+        self.state.add_warm_server('s1', {'server': 'details', 'launch': self.key})
+        self.state.add_warm_job('j1', {'launch': self.key})
+        state = self.maintain(None)
+        self.assertEqual((state.warm_servers, state.warm_jobs), ({}, {}))
+        self.assertFalse(self.group.view_launch_config.called)
+        state.saved(self.log)
+        self.supervisor.execute_delete_server.assert_called_once_with(
+            self.log, 'transaction-id', self.group, {'id': 's1', 'lb_info': {}})
+
+
+class ClaimWarmServerTests(TestCase):
+    """
+    Tests for :func:`otter.controller.claim_warm_server`
+    """
+
+    def setUp(self):
+        """
+        A state with a warm pool server built from another launch config
+        """
+        self.state = GroupState('tenant', 'group', 'name', {}, {}, None, {}, False)
+        self.state.add_warm_server(
+            's1', {'server': 'old', 'launch': controller.launch_config_key('old')})
+
+    def test_claims_matching_server(self):
+        """
+        A server built from the launch config is removed from the pool, and
+        its details returned
+        """
+        self.state.add_warm_server(
+            's2', {'server': 'new', 'launch': controller.launch_config_key('new')})
+        self.assertEqual(controller.claim_warm_server(self.state, 'new'), 'new')
+        self.assertEqual(self.state.warm_servers.keys(), ['s1'])
+
+    def test_no_matching_server(self):
+        """
+        ``None`` is returned if no server was built from the launch config
+        """
+        self.assertIsNone(controller.claim_warm_server(self.state, 'new'))
+        self.assertEqual(self.state.warm_servers.keys(), ['s1'])
+
+
+class WarmPoolJobTests(TestCase):
+    """
+    Tests for :class:`otter.controller._WarmPoolJob`
+    """
+
+    def setUp(self):
+        """
+        A job that has been started, and a group whose ``modify_state`` runs
+        the modifier on a state with the job in its warm pool
+        """
+        self.supervisor = iMock(ISupervisor)
+        self.build_d = defer.Deferred()
+        self.supervisor.execute_build_server.return_value = self.build_d
+        self.log = mock.Mock()
+        self.group = iMock(IScalingGroup, tenant_id='tenant', uuid='group')
+        self.state = GroupState('tenant', 'group', 'name', {}, {}, None, {}, False)
+        self.state.add_warm_job('job', {'launch': 'key'})
+
+        def modify_state(modifier):
+            modifier(self.group, self.state)
+            self.state.saved(self.log)
+            return defer.succeed(None)
+
+        self.group.modify_state.side_effect = modify_state
+        self.server = {'server': {'id': 's1'}}
+        self.job = controller._WarmPoolJob(self.log, 'transaction-id', self.group,
+                                           self.supervisor)
+        self.job.start('launch', 'job')
+
+    def test_builds_server(self):
+        """
+        ``start`` builds a server from the launch config
+        """
+        self.log.bind.assert_called_once_with(warm_pool_job_id='job')
+        self.supervisor.execute_build_server.assert_called_once_with(
+            self.log.bind.return_value, 'transaction-id', self.group, 'launch')
+
+    def test_success_adds_warm_server(self):
+        """
+        The server built is added to the warm pool in place of the job
+        """
+        self.build_d.callback(self.server)
+        self.assertEqual(self.state.warm_jobs, {})
+        self.assertEqual(self.state.warm_servers['s1']['server'], self.server)
+        self.assertEqual(self.state.warm_servers['s1']['launch'], 'key')
+        self.assertFalse(self.supervisor.execute_delete_server.called)
+
+    def test_success_job_removed_deletes_server(self):
+        """
+        The server built is deleted if its job has since been removed
+        """
+        self.state.remove_warm_job('job')
+        self.build_d.callback(self.server)
+        self.assertEqual(self.state.warm_servers, {})
+        self.supervisor.execute_delete_server.assert_called_once_with(
+            mock.ANY, 'transaction-id', self.group, {'id': 's1', 'lb_info': {}})
+
+    def test_success_group_deleted_deletes_server(self):
+        """
+        The server built is deleted if the group has since been deleted
+        """
+        self.group.modify_state.side_effect = (
+            lambda modifier: defer.fail(NoSuchScalingGroupError('tenant', 'group')))
+        self.build_d.callback(self.server)
+        self.supervisor.execute_delete_server.assert_called_once_with(
+            mock.ANY, 'transaction-id', self.group, {'id': 's1', 'lb_info': {}})
+
+    def test_failure_removes_job(self):
+        """
+        The job of a server that fails to be built is removed
+        """
+        self.build_d.errback(DummyException())
+        self.assertEqual(self.state.warm_jobs, {})
+        self.assertEqual(self.state.warm_servers, {})
+
+    def test_failure_group_deleted(self):
+        """
+        A failed build for a group that has since been deleted is not an
+        error
+        """
+        self.group.modify_state.side_effect = (
+            lambda modifier: defer.fail(NoSuchScalingGroupError('tenant', 'group')))
+        self.build_d.errback(DummyException())
+        self.assertFalse(self.log.bind.return_value.err.called)
+
 
 class FindPendingJobsToCancelTests(TestCase):
     """
@@ -773,12 +1033,16 @@ class DeleteActiveServersTests(TestCase):
 
     def test_supervisor_called(self):
         """
-        ``otter.supervisor.execute_delete_server`` is called
+        ``otter.supervisor.execute_delete_server`` is called once the state
+        has been saved
         """
         # caching as self.data will get changed from delete_active_servers
         d1, d2, d3 = self.data['1'], self.data['4'], self.data['3']
         controller.delete_active_servers(self.log, 'trans-id', 'group',
                                          3, self.fake_state)
+        self.assertFalse(self.supervisor.execute_delete_server.called)
+
+        self.fake_state.saved(self.log)
         self.assertEqual(
             self.supervisor.execute_delete_server.mock_calls,
             [mock.call(self.log, 'trans-id', 'group', d1),
@@ -794,15 +1058,13 @@ class DeleteActiveServersTests(TestCase):
         for id in ('1', '4', '3'):
             self.assertNotIn(id, self.fake_state.active)
 
-    def test_deferreds_returned(self):
+    def test_supervisor_not_called_if_not_saved(self):
         """
-        List of Deferreds are returned with expected values
+        If the state is never saved, no servers are deleted
         """
-        dl = controller.delete_active_servers(self.log, 'trans-id',
-                                              'group', 3, self.fake_state)
-        for i, d in enumerate(dl):
-            result = self.successResultOf(d)
-            self.assertEqual(result, i)
+        controller.delete_active_servers(self.log, 'trans-id', 'group',
+                                         3, self.fake_state)
+        self.assertFalse(self.supervisor.execute_delete_server.called)
 
     def test_max_delta(self):
         """
@@ -900,21 +1162,23 @@ class MaybeExecuteScalingPolicyTestCase(TestCase):
                                       'otter.controller.{0}'.format(thing),
                                       return_value=return_val)
 
+        self.maintain_warm_pool = patch(
+            self, 'otter.controller.maintain_warm_pool',
+            side_effect=lambda *args: defer.succeed(args[-1]))
+
         self.mock_log = mock.MagicMock()
         self.mock_state = mock.MagicMock(GroupState)
 
         self.group = iMock(IScalingGroup, tenant_id='tenant', uuid='group')
-        self.group.view_config.return_value = defer.succeed("config")
-        self.group.get_policy.return_value = defer.succeed("policy")
-        self.group.view_launch_config.return_value = defer.succeed("launch")
+        self.group.view_execution_bundle.return_value = defer.succeed(
+            ("config", "launch", "policy"))
 
     def test_maybe_execute_scaling_policy_no_such_policy(self):
         """
         If there is no such scaling policy, the whole thing fails and
-        ``NoSuchScalingPolicy`` gets propagated up.  No other model access
-        happens, and the lock is still released.
+        ``NoSuchScalingPolicy`` gets propagated up.  Nothing gets executed.
         """
-        self.group.get_policy.return_value = defer.fail(
+        self.group.view_execution_bundle.return_value = defer.fail(
             NoSuchPolicyError('1', '1', '1'))
 
         d = controller.maybe_execute_scaling_policy(self.mock_log,
@@ -924,8 +1188,24 @@ class MaybeExecuteScalingPolicyTestCase(TestCase):
                                                     'pol1')
         self.failureResultOf(d, NoSuchPolicyError)
 
-        self.assertEqual(len(self.group.view_config.mock_calls), 0)
-        self.assertEqual(len(self.group.view_launch_config.mock_calls), 0)
+        self.group.view_execution_bundle.assert_called_once_with('pol1')
+        self.assertEqual(self.mocks['check_cooldowns'].call_count, 0)
+
+    def test_maybe_execute_scaling_policy_uses_given_state(self):
+        """
+        The config, launch config and policy are read in one bundle, and the
+        state that is checked and modified is the one passed in.
+        """
+        d = controller.maybe_execute_scaling_policy(self.mock_log,
+                                                    'transaction',
+                                                    self.group,
+                                                    self.mock_state,
+                                                    'pol1')
+        self.assertEqual(self.successResultOf(d), self.mock_state)
+        self.group.view_execution_bundle.assert_called_once_with('pol1')
+        self.mocks['check_cooldowns'].assert_called_once_with(
+            self.mock_log.bind.return_value, self.mock_state, "config",
+            "policy", 'pol1')
 
     def test_execute_launch_config_success_on_positive_delta(self):
         """
@@ -1084,74 +1364,97 @@ class ExecuteLaunchConfigTestCase(TestCase):
         """
         self.execute_config_deferreds = []
 
-        def fake_execute(*args, **kwargs):
+        def fake_execute(log, transaction_id, group, launch, job_id, warm_server):
             d = defer.Deferred()
             self.execute_config_deferreds.append(d)
-            return defer.succeed((str(len(self.execute_config_deferreds)), d))
+            return defer.succeed((job_id, d))
 
         self.supervisor = iMock(ISupervisor)
         self.supervisor.execute_config.side_effect = fake_execute
 
         patch(self, 'otter.controller.get_supervisor', return_value=self.supervisor)
 
+        job_ids = iter(range(1, 10))
+        patch(self, 'otter.controller.generate_job_id',
+              side_effect=lambda group_id: str(next(job_ids)))
+
         self.log = mock.MagicMock()
 
         self.group = iMock(IScalingGroup, tenant_id='tenant', uuid='group')
-        self.fake_state = mock.MagicMock(GroupState)
+        self.fake_state = GroupState('tenant', 'group', 'name', {}, {}, None, {}, False)
+
+    def test_jobs_added_to_state(self):
+        """
+        ``execute_launch_config`` adds delta jobs to the state, but does not
+        start them until the state has been saved
+        """
+        d = controller.execute_launch_config(self.log, '1', self.fake_state,
+                                             'launch', self.group, 3)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(sorted(self.fake_state.pending), ['1', '2', '3'])
+        self.assertFalse(self.supervisor.execute_config.called)
 
     def test_positive_delta_execute_config_called_delta_times(self):
         """
         If delta > 0, ``execute_launch_config`` calls
-        ``supervisor.execute_config`` delta times.
+        ``supervisor.execute_config`` delta times once the state has been
+        saved, with the ID of each job added to the state.
         """
         controller.execute_launch_config(self.log, '1', self.fake_state,
                                          'launch', self.group, 5)
+        self.fake_state.saved(self.log)
         self.assertEqual(self.supervisor.execute_config.mock_calls,
-                         [mock.call(self.log, '1',
-                                    self.group, 'launch')] * 5)
+                         [mock.call(self.log.bind.return_value, '1',
+                                    self.group, 'launch', str(i), warm_server=None)
+                          for i in range(1, 6)])
+        self.assertEqual(self.log.bind.call_args_list,
+                         [mock.call(job_id=str(i)) for i in range(1, 6)])
 
-    def test_positive_delta_execute_config_failures_propagated(self):
+    def test_warm_servers_claimed(self):
         """
-        ``execute_launch_config`` fails if ``execute_config`` fails for any one
-        case, and propagates the first ``execute_config`` error.
+        Each job launches a server claimed from the warm pool while there are
+        any built from the launch config
         """
-        class ExecuteException(Exception):
-            pass
-
-        def fake_execute(*args, **kwargs):
-            if len(self.execute_config_deferreds) > 1:
-                return defer.fail(ExecuteException('no more!'))
-            d = defer.Deferred()
-            self.execute_config_deferreds.append(d)
-            return defer.succeed((
-                str(len(self.execute_config_deferreds)), d))
-
-        self.supervisor.execute_config.side_effect = fake_execute
-        d = controller.execute_launch_config(self.log, '1', self.fake_state,
-                                             'launch', self.group, 3)
-        failure = self.failureResultOf(d)
-        self.assertTrue(failure.check(ExecuteException))
+        self.fake_state.add_warm_server(
+            's1', {'server': 'warm', 'launch': controller.launch_config_key('launch')})
+        controller.execute_launch_config(self.log, '1', self.fake_state,
+                                         'launch', self.group, 2)
+        self.assertEqual(self.fake_state.warm_servers, {})
+        self.fake_state.saved(self.log)
+        self.assertEqual(self.supervisor.execute_config.mock_calls,
+                         [mock.call(self.log.bind.return_value, '1', self.group,
+                                    'launch', '1', warm_server='warm'),
+                          mock.call(self.log.bind.return_value, '1', self.group,
+                                    'launch', '2', warm_server=None)])
 
-    def test_add_job_called_with_new_jobs(self):
+    def test_execute_config_failure_removes_job(self):
         """
-        ``execute_launch_config`` calls ``add_job`` on the state for every job
-        that has been started
+        If ``execute_config`` fails for a job, that job is removed from the
+        state again.
         """
+        s = GroupState('tenant', 'group', 'name', {}, {'1': {}}, None, {}, False)
+
+        def fake_modify_state(callback, *args, **kwargs):
+            return defer.maybeDeferred(callback, self.group, s, *args, **kwargs)
+
+        self.group.modify_state.side_effect = fake_modify_state
+        self.supervisor.execute_config.side_effect = (
+            lambda *args, **kwargs: defer.fail(DummyException('no more!')))
+
         controller.execute_launch_config(self.log, '1', self.fake_state,
-                                         'launch', self.group, 3)
-        self.fake_state.add_job.assert_has_calls(
-            [mock.call(str(i)) for i in (1, 2, 3)])
-        self.assertEqual(self.fake_state.add_job.call_count, 3)
+                                         'launch', self.group, 1)
+        self.fake_state.saved(self.log)
+        self.assertEqual(s.pending, {})
+        self.log.bind.return_value.msg.assert_called_with(
+            'Job failed', reason=CheckFailure(DummyException))
 
     def test_propagates_add_job_failures(self):
         """
         ``execute_launch_config`` fails if ``add_job`` raises an error
         """
-        self.fake_state.add_job.side_effect = AssertionError
-        d = controller.execute_launch_config(self.log, '1', self.fake_state,
-                                             'launch', self.group, 1)
-        failure = self.failureResultOf(d)
-        self.assertTrue(failure.check(AssertionError))
+        self.fake_state.add_job('1')
+        self.assertRaises(AssertionError, controller.execute_launch_config,
+                          self.log, '1', self.fake_state, 'launch', self.group, 1)
 
     def test_on_job_completion_modify_state_called(self):
         """
@@ -1161,6 +1464,7 @@ class ExecuteLaunchConfigTestCase(TestCase):
         """
         controller.execute_launch_config(self.log, '1', self.fake_state,
                                          'launch', self.group, 3)
+        self.fake_state.saved(self.log)
 
         self.execute_config_deferreds[0].callback(None)              # job id 1
         self.execute_config_deferreds[1].errback(Exception('meh'))   # job id 2
@@ -1182,6 +1486,7 @@ class ExecuteLaunchConfigTestCase(TestCase):
         self.group.modify_state.side_effect = fake_modify_state
         controller.execute_launch_config(self.log, '1', self.fake_state,
                                          'launch', self.group, 1)
+        self.fake_state.saved(self.log)
 
         self.execute_config_deferreds[0].callback({'id': 's1'})
         self.assertEqual(s.pending, {})  # job removed
@@ -1197,7 +1502,7 @@ class ExecuteLaunchConfigTestCase(TestCase):
         the server finishes building, then ``execute_launch_config`` is called
         to remove the job from pending job list. It then notices that pending
         job_id is not there in job list and calls ``execute_delete_server``
-        to delete the server.
+        to delete the server, once the state has been saved.
         """
         self.supervisor.execute_delete_server.return_value = defer.succeed(None)
 
@@ -1205,10 +1510,13 @@ class ExecuteLaunchConfigTestCase(TestCase):
 
         def fake_modify_state(callback, *args, **kwargs):
             callback(self.group, s, *args, **kwargs)
+            self.assertFalse(self.supervisor.execute_delete_server.called)
+            s.saved(self.log)
 
         self.group.modify_state.side_effect = fake_modify_state
         controller.execute_launch_config(self.log, '1', self.fake_state,
                                          'launch', self.group, 1)
+        self.fake_state.saved(self.log)
 
         s.remove_job('1')
         self.execute_config_deferreds[0].callback({'id': 's1'})
@@ -1234,6 +1542,7 @@ class ExecuteLaunchConfigTestCase(TestCase):
         self.group.modify_state.side_effect = fake_modify_state
         controller.execute_launch_config(self.log, '1', self.fake_state,
                                          'launch', self.group, 1)
+        self.fake_state.saved(self.log)
 
         f = Failure(Exception('meh'))
         self.execute_config_deferreds[0].errback(f)
@@ -1256,6 +1565,7 @@ class ExecuteLaunchConfigTestCase(TestCase):
         self.group.modify_state.side_effect = AssertionError
         controller.execute_launch_config(self.log, '1', self.fake_state,
                                          'launch', self.group, 1)
+        self.fake_state.saved(self.log)
         self.execute_config_deferreds[0].callback({'id': 's1'})
 
         self.log.bind.assert_called_once_with(job_id='1')
@@ -1290,9 +1600,13 @@ class PrivateJobHelperTestCase(TestCase):
         self.supervisor.execute_config.return_value = defer.succeed(
             (self.job_id, self.completion_deferred))
 
+        def saved(state):
+            state.saved(self.log)
+            return state
+
         def fake_modify_state(f, *args, **kwargs):
-            return defer.maybeDeferred(
-                f, self.group, self.state, *args, **kwargs)
+            d = defer.maybeDeferred(f, self.group, self.state, *args, **kwargs)
+            return d.addCallback(saved)
 
         self.group.modify_state.side_effect = fake_modify_state
 
@@ -1306,25 +1620,31 @@ class PrivateJobHelperTestCase(TestCase):
         """
         self.job.job_started = mock.MagicMock()
 
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.supervisor.execute_config.assert_called_once_with(
-            self.log, self.transaction_id, self.group, 'launch')
+            self.log.bind.return_value, self.transaction_id, self.group, 'launch',
+            self.job_id, warm_server=None)
         self.job.job_started.assert_called_once_with(
             (self.job_id, self.completion_deferred))
 
     def test_job_started_not_called_if_supervisor_error(self):
         """
         `job_started` is not called if the supervisor's `execute_config`
-        errbacks, and the failure propagates up.
+        errbacks, and the job is removed from the pending state as if it had
+        failed.
         """
+        self.state = GroupState('tenant', 'group', 'name', {}, {self.job_id: {}}, None,
+                                {}, False)
         self.job.job_started = mock.MagicMock()
         self.supervisor.execute_config.return_value = defer.fail(
             DummyException('e'))
 
-        d = self.job.start('launch')
+        d = self.job.start('launch', self.job_id)
         self.assertEqual(self.job.job_started.call_count, 0)
-        f = self.failureResultOf(d)
-        self.assertTrue(f.check(DummyException))
+        self.successResultOf(d)
+        self.assertEqual(self.state.pending, {})
+        self.log.bind.return_value.msg.assert_called_once_with(
+            'Job failed', reason=CheckFailure(DummyException))
 
     def test_start_callbacks_with_job_id(self):
         """
@@ -1332,7 +1652,7 @@ class PrivateJobHelperTestCase(TestCase):
         ID, without waiting for the `completion_deferred` to fire, and the log
         is bound
         """
-        d = self.job.start('launch')
+        d = self.job.start('launch', self.job_id)
         self.assertEqual(self.successResultOf(d), self.job_id)
         self.assertEqual(self.job.log, self.log.bind.return_value)
 
@@ -1340,7 +1660,7 @@ class PrivateJobHelperTestCase(TestCase):
         """
         If the job succeeded, and modify_state is called
         """
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.assertEqual(self.group.modify_state.call_count, 0)
         self.completion_deferred.callback('blob')
         self.assertEqual(self.group.modify_state.call_count, 1)
@@ -1349,7 +1669,7 @@ class PrivateJobHelperTestCase(TestCase):
         """
         If the job failed, modify_state is called
         """
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.assertEqual(self.group.modify_state.call_count, 0)
         self.completion_deferred.errback(Exception('e'))
         self.assertEqual(self.group.modify_state.call_count, 1)
@@ -1361,7 +1681,7 @@ class PrivateJobHelperTestCase(TestCase):
         """
         self.state = GroupState('tenant', 'group', 'name', {}, {self.job_id: {}}, None,
                                 {}, False)
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.callback({'id': 'active'})
 
         self.assertIs(self.successResultOf(self.completion_deferred),
@@ -1379,7 +1699,7 @@ class PrivateJobHelperTestCase(TestCase):
         """
         self.state = GroupState('tenant', 'group', 'name', {}, {}, None,
                                 {}, False)
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.callback({'id': 'active'})
 
         self.assertIs(self.successResultOf(self.completion_deferred),
@@ -1401,7 +1721,7 @@ class PrivateJobHelperTestCase(TestCase):
         """
         self.state = GroupState('tenant', 'group', 'name', {}, {self.job_id: {}}, None,
                                 {}, False)
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.errback(DummyException('e'))
 
         self.assertIs(self.successResultOf(self.completion_deferred),
@@ -1421,7 +1741,7 @@ class PrivateJobHelperTestCase(TestCase):
         """
         self.state = GroupState('tenant', 'group', 'name', {}, {}, None,
                                 {}, False)
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.errback(DummyException('e'))
 
         self.assertIs(self.successResultOf(self.completion_deferred),
@@ -1442,7 +1762,7 @@ class PrivateJobHelperTestCase(TestCase):
         self.group.modify_state.side_effect = (
             lambda *args: defer.fail(NoSuchScalingGroupError('tenant', 'group')))
 
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.callback({'id': 'active'})
 
         self.supervisor.execute_delete_server.assert_called_once_with(
@@ -1458,7 +1778,7 @@ class PrivateJobHelperTestCase(TestCase):
         self.group.modify_state.side_effect = (
             lambda *args: defer.fail(NoSuchScalingGroupError('tenant', 'group')))
 
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.callback({'id': 'active'})
         self.assertEqual(self.log.bind.return_value.err.call_count, 0)
 
@@ -1470,7 +1790,7 @@ class PrivateJobHelperTestCase(TestCase):
         self.group.modify_state.side_effect = (
             lambda *args: defer.fail(DummyException('e')))
 
-        self.job.start('launch')
+        self.job.start('launch', self.job_id)
         self.completion_deferred.callback({'id': 'active'})
 
         self.log.bind.return_value.err.assert_called_once_with(
@@ -1,6 +1,6 @@
 """ CQL Batch wrapper test """
 from twisted.trial.unittest import TestCase
-from otter.util.cqlbatch import Batch
+from otter.util.cqlbatch import Batch, BatchType
 import mock
 from twisted.internet import defer
 
@@ -69,3 +69,29 @@ class CqlBatchTestCase(TestCase):
         expected += ' INSERT * INTO BLAH APPLY BATCH;'
         self.connection.execute.assert_called_once_with(
             expected, {}, ConsistencyLevel.QUORUM)
+
+    def test_batch_unlogged(self):
+        """
+        Test an unlogged batch
+        """
+        batch = Batch(['INSERT * INTO BLAH'], {}, timestamp=123,
+                      batch_type=BatchType.UNLOGGED)
+        d = batch.execute(self.connection)
+        self.successResultOf(d)
+        expected = 'BEGIN UNLOGGED BATCH USING TIMESTAMP 123'
+        expected += ' INSERT * INTO BLAH APPLY BATCH;'
+        self.connection.execute.assert_called_once_with(expected, {},
+                                                        ConsistencyLevel.ONE)
+
+    def test_batch_counter(self):
+        """
+        Test a counter batch
+        """
+        batch = Batch(['UPDATE BLAH SET c = c + 1'], {},
+                      batch_type=BatchType.COUNTER)
+        d = batch.execute(self.connection)
+        self.successResultOf(d)
+        expected = 'BEGIN COUNTER BATCH'
+        expected += ' UPDATE BLAH SET c = c + 1 APPLY BATCH;'
+        self.connection.execute.assert_called_once_with(expected, {},
+                                                        ConsistencyLevel.ONE)
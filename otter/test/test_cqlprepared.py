@@ -0,0 +1,312 @@
+"""
+Tests for :mod:`otter.util.cqlprepared`
+"""
+from datetime import datetime
+import struct
+
+import mock
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+
+from silverberg.cassandra import ttypes
+from silverberg.client import ConsistencyLevel
+
+from otter.test.utils import DummyException, patch
+from otter.util.cqlprepared import (
+    PreparedStatementCache, PreparedStatementCluster, PreparingCQLClient,
+    is_unprepared, prepared_statements)
+
+
+_ASCII = 'org.apache.cassandra.db.marshal.AsciiType'
+_INT = 'org.apache.cassandra.db.marshal.Int32Type'
+_DATE = 'org.apache.cassandra.db.marshal.DateType'
+
+
+class PreparedStatementsTests(TestCase):
+    """
+    Tests for :func:`prepared_statements`
+    """
+    def test_client_that_can_not_prepare(self):
+        """
+        A client without ``prepare`` and ``execute_prepared`` is used as it is
+        """
+        client = mock.Mock(spec=['execute'])
+        self.assertIs(prepared_statements(client), client)
+        client = mock.Mock(spec=['execute', 'prepare'])
+        self.assertIs(prepared_statements(client), client)
+
+    def test_client_that_can_prepare(self):
+        """
+        A client with ``prepare`` and ``execute_prepared`` is wrapped in a
+        :class:`PreparedStatementCache`
+        """
+        client = mock.Mock(spec=['execute', 'prepare', 'execute_prepared'])
+        cache = prepared_statements(client)
+        self.assertIsInstance(cache, PreparedStatementCache)
+        self.assertIs(cache.client, client)
+
+
+class PreparedStatementCacheTests(TestCase):
+    """
+    Tests for :class:`PreparedStatementCache`
+    """
+    def setUp(self):
+        """
+        A client that prepares each query as its upper cased text
+        """
+        self.client = mock.Mock(spec=['execute', 'prepare', 'execute_prepared'])
+        self.client.prepare.side_effect = lambda query: succeed(query.upper())
+        self.client.execute_prepared.side_effect = lambda *args: succeed('rows')
+        self.cache = PreparedStatementCache(self.client)
+
+    def test_prepares_once(self):
+        """
+        A query is prepared the first time it is executed, and executed as the
+        prepared statement every time
+        """
+        for i in range(2):
+            self.assertEqual(
+                self.successResultOf(self.cache.execute(
+                    'select a', {'b': i}, ConsistencyLevel.ONE)),
+                'rows')
+        self.client.prepare.assert_called_once_with('select a')
+        self.assertEqual(self.client.execute_prepared.mock_calls,
+                         [mock.call('SELECT A', {'b': 0}, ConsistencyLevel.ONE),
+                          mock.call('SELECT A', {'b': 1}, ConsistencyLevel.ONE)])
+        self.assertFalse(self.client.execute.called)
+        self.assertEqual(self.cache.stats(),
+                         {'hits': 1, 'misses': 1, 'statements': 1})
+
+    def test_prepares_each_query(self):
+        """
+        Each distinct query is prepared separately
+        """
+        self.cache.execute('select a', {}, ConsistencyLevel.ONE)
+        self.cache.execute('select b', {}, ConsistencyLevel.ONE)
+        self.assertEqual(self.client.prepare.mock_calls,
+                         [mock.call('select a'), mock.call('select b')])
+
+    def test_prepares_once_at_a_time(self):
+        """
+        A query executed again while it is being prepared waits for it to be
+        prepared rather than preparing it again
+        """
+        prepare_d = Deferred()
+        self.client.prepare.side_effect = lambda query: prepare_d
+        d1 = self.cache.execute('select a', {'b': 1}, ConsistencyLevel.ONE)
+        d2 = self.cache.execute('select a', {'b': 2}, ConsistencyLevel.ONE)
+        self.assertFalse(self.client.execute_prepared.called)
+
+        prepare_d.callback('prepared')
+        self.successResultOf(d1)
+        self.successResultOf(d2)
+        self.assertEqual(self.client.prepare.call_count, 1)
+        self.assertEqual(self.client.execute_prepared.call_count, 2)
+
+    def test_prepare_failure(self):
+        """
+        If preparing a query fails, executing it fails, and it is prepared
+        again the next time it is executed
+        """
+        self.client.prepare.side_effect = lambda query: fail(DummyException('no'))
+        self.failureResultOf(
+            self.cache.execute('select a', {}, ConsistencyLevel.ONE), DummyException)
+
+        self.client.prepare.side_effect = lambda query: succeed('prepared')
+        self.successResultOf(self.cache.execute('select a', {}, ConsistencyLevel.ONE))
+        self.assertEqual(self.client.prepare.call_count, 2)
+
+    def test_batches_not_prepared(self):
+        """
+        Batches, whose text depends on how many statements they contain, are
+        executed as text rather than prepared
+        """
+        self.client.execute.side_effect = lambda *args: succeed('rows')
+        for query in ('BEGIN BATCH a APPLY BATCH;', 'BEGIN UNLOGGED BATCH a APPLY BATCH;'):
+            self.assertEqual(
+                self.successResultOf(self.cache.execute(query, {}, ConsistencyLevel.ONE)),
+                'rows')
+            self.client.execute.assert_called_with(query, {}, ConsistencyLevel.ONE)
+        self.assertFalse(self.client.prepare.called)
+        self.assertEqual(self.cache.stats(), {'hits': 0, 'misses': 0, 'statements': 0})
+
+    def test_reprepares_unprepared_statement(self):
+        """
+        If a node no longer knows a prepared statement, it is prepared again
+        and the query is executed as the new statement
+        """
+        self.successResultOf(self.cache.execute('select a', {}, ConsistencyLevel.ONE))
+        unprepared = DummyException('no')
+        unprepared.code = 0x2500
+        results = [fail(unprepared), succeed('rows')]
+        self.client.execute_prepared.side_effect = lambda *args: results.pop(0)
+        self.client.prepare.side_effect = lambda query: succeed('again')
+
+        self.assertEqual(
+            self.successResultOf(self.cache.execute('select a', {'b': 1}, ConsistencyLevel.ONE)),
+            'rows')
+        self.assertEqual(self.client.prepare.call_count, 2)
+        self.assertEqual(self.client.execute_prepared.mock_calls[1:],
+                         [mock.call('SELECT A', {'b': 1}, ConsistencyLevel.ONE),
+                          mock.call('again', {'b': 1}, ConsistencyLevel.ONE)])
+        self.assertEqual(self.cache._statements, {'select a': 'again'})
+
+    def test_other_execution_failure(self):
+        """
+        If executing a prepared statement fails for any other reason, the
+        failure is propagated and the statement is kept
+        """
+        self.successResultOf(self.cache.execute('select a', {}, ConsistencyLevel.ONE))
+        self.client.execute_prepared.side_effect = lambda *args: fail(DummyException('no'))
+        self.failureResultOf(
+            self.cache.execute('select a', {}, ConsistencyLevel.ONE), DummyException)
+        self.assertEqual(self.client.prepare.call_count, 1)
+        self.assertEqual(self.cache._statements, {'select a': 'SELECT A'})
+
+
+class IsUnpreparedTests(TestCase):
+    """
+    Tests for :func:`is_unprepared`
+    """
+    def test_unprepared_code(self):
+        """
+        An error with the native protocol's Unprepared code is an unprepared
+        statement
+        """
+        error = DummyException()
+        error.code = 0x2500
+        self.assertTrue(is_unprepared(Failure(error)))
+        error.code = 0x2200
+        self.assertFalse(is_unprepared(Failure(error)))
+
+    def test_unknown_prepared_id_message(self):
+        """
+        An error saying the prepared query ID is not found is an unprepared
+        statement
+        """
+        self.assertTrue(is_unprepared(Failure(DummyException(
+            'Prepared query with ID 3 not found'))))
+        self.assertFalse(is_unprepared(Failure(DummyException('timed out'))))
+
+
+class PreparingCQLClientTests(TestCase):
+    """
+    Tests for :class:`PreparingCQLClient`
+    """
+    def setUp(self):
+        """
+        A client whose connection is a mock Thrift client
+        """
+        self.thrift = mock.Mock(spec=['prepare_cql3_query', 'execute_prepared_cql3_query',
+                                      'execute_cql3_query'])
+        self.client = PreparingCQLClient(mock.Mock(), 'keyspace')
+        patch(self, 'otter.util.cqlprepared.PreparingCQLClient._connection',
+              side_effect=lambda: succeed(self.thrift))
+
+    def prepare(self, query, variable_types):
+        """
+        Prepare ``query``, which Cassandra gives the ID 7
+        """
+        self.thrift.prepare_cql3_query.return_value = succeed(ttypes.CqlPreparedResult(
+            itemId=7, count=len(variable_types), variable_types=variable_types))
+        return self.successResultOf(self.client.prepare(query))
+
+    def test_prepare(self):
+        """
+        The query is prepared with its named parameters replaced by markers,
+        and the statement remembers their names and types
+        """
+        prepared = self.prepare('SELECT a FROM t WHERE b = :b AND c = :c;', [_ASCII, _INT])
+        self.thrift.prepare_cql3_query.assert_called_once_with(
+            'SELECT a FROM t WHERE b = ? AND c = ?;', ttypes.Compression.NONE)
+        self.assertEqual((prepared.itemid, prepared.paramnames), (7, ['b', 'c']))
+
+    def test_execute_prepared(self):
+        """
+        A prepared statement is executed with its serialized parameters, in
+        the order of their markers, and the rows are unmarshalled as for
+        ``execute``
+        """
+        prepared = self.prepare('SELECT a FROM t WHERE b = :b AND c = :c AND d = :d;',
+                                [_ASCII, _INT, _DATE])
+        self.thrift.execute_prepared_cql3_query.return_value = succeed(ttypes.CqlResult(
+            type=ttypes.CqlResultType.ROWS,
+            schema=ttypes.CqlMetadata(value_types={'a': _ASCII}),
+            rows=[ttypes.CqlRow(columns=[ttypes.Column(name='a', value='x')])]))
+
+        d = self.client.execute_prepared(
+            prepared, {'d': datetime(1970, 1, 1, 0, 0, 1), 'c': 3, 'b': u'b'},
+            ConsistencyLevel.ONE)
+
+        self.assertEqual(self.successResultOf(d), [{'a': 'x'}])
+        self.thrift.execute_prepared_cql3_query.assert_called_once_with(
+            7, ['b', struct.pack('>i', 3), struct.pack('>q', 1000)], ConsistencyLevel.ONE)
+
+    def test_execute_prepared_without_rows(self):
+        """
+        A statement that returns no rows fires with ``None``
+        """
+        prepared = self.prepare('DELETE FROM t WHERE b = :b;', [_ASCII])
+        self.thrift.execute_prepared_cql3_query.return_value = succeed(
+            ttypes.CqlResult(type=ttypes.CqlResultType.VOID))
+        d = self.client.execute_prepared(prepared, {'b': 'b'}, ConsistencyLevel.ONE)
+        self.assertIsNone(self.successResultOf(d))
+
+    def test_null_parameter_executed_as_text(self):
+        """
+        A statement with a ``None`` parameter, which Thrift can not bind, is
+        executed as text
+        """
+        prepared = self.prepare('INSERT INTO t (a, b) VALUES (:a, :b);', [_ASCII, _ASCII])
+        self.thrift.execute_cql3_query.return_value = succeed(
+            ttypes.CqlResult(type=ttypes.CqlResultType.VOID))
+        d = self.client.execute_prepared(prepared, {'a': 'a', 'b': None},
+                                         ConsistencyLevel.ONE)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertFalse(self.thrift.execute_prepared_cql3_query.called)
+        self.thrift.execute_cql3_query.assert_called_once_with(
+            "INSERT INTO t (a, b) VALUES ('a', None);", ttypes.Compression.NONE,
+            ConsistencyLevel.ONE)
+
+
+class PreparedStatementClusterTests(TestCase):
+    """
+    Tests for :class:`PreparedStatementCluster`
+    """
+    def test_cache_per_node(self):
+        """
+        Each node is connected to by a :class:`PreparingCQLClient` with a
+        cache of its own, and their stats are added up
+        """
+        cluster = PreparedStatementCluster(['e1', 'e2'], 'keyspace')
+        self.assertEqual(len(cluster._seed_clients), 2)
+        for cache in cluster._seed_clients:
+            self.assertIsInstance(cache, PreparedStatementCache)
+            self.assertIsInstance(cache.client, PreparingCQLClient)
+        self.assertIsNot(cluster._seed_clients[0], cluster._seed_clients[1])
+
+        cluster._seed_clients[0].hits = 2
+        cluster._seed_clients[1].misses = 1
+        self.assertEqual(cluster.stats(), {'hits': 2, 'misses': 1, 'statements': 0})
+
+    def test_executes_round_robin_through_caches(self):
+        """
+        Queries are executed through each node's cache in turn
+        """
+        cluster = PreparedStatementCluster(['e1', 'e2'], 'keyspace')
+        caches = [mock.Mock(spec=['execute', 'disconnect']) for _ in range(2)]
+        cluster._seed_clients = caches
+        for cache in caches:
+            cache.execute.return_value = succeed('rows')
+        cluster.execute('q', {}, ConsistencyLevel.ONE)
+        cluster.execute('q', {}, ConsistencyLevel.ONE)
+        for cache in caches:
+            cache.execute.assert_called_once_with('q', {}, ConsistencyLevel.ONE)
+
+        for cache in caches:
+            cache.disconnect.return_value = succeed(None)
+        self.successResultOf(cluster.disconnect())
+        for cache in caches:
+            cache.disconnect.assert_called_once_with()
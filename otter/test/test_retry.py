@@ -8,8 +8,9 @@ from twisted.internet.defer import CancelledError, Deferred, succeed
 from twisted.python.failure import Failure
 from twisted.trial.unittest import TestCase
 
-from otter.util.retry import retry, repeating_interval, transient_errors_except
-from otter.test.utils import CheckFailure, DummyException
+from otter.util.retry import (backoff_interval, retry, repeating_interval,
+                              transient_errors_except)
+from otter.test.utils import CheckFailure, DummyException, patch
 
 
 class RetryTests(TestCase):
@@ -320,3 +321,28 @@ class NextIntervalHelperTests(TestCase):
         next_interval = repeating_interval(3)
         for exception in (DummyException(), NotImplementedError()):
             self.assertEqual(next_interval(Failure(exception)), 3)
+
+    def test_backoff_interval_grows_with_jitter_to_maximum(self):
+        """
+        ``backoff_interval`` returns a random interval between the minimum and
+        the multiple of the previous interval, but no more than the maximum
+        """
+        uniform = patch(self, 'otter.util.retry.random.uniform',
+                        side_effect=lambda low, high: high - 1)
+        next_interval = backoff_interval(2, 30)
+        self.assertEqual([next_interval(Failure(DummyException())) for i in range(4)],
+                         [5, 14, 30, 30])
+        self.assertEqual(uniform.mock_calls, [mock.call(2, 6), mock.call(2, 15),
+                                              mock.call(2, 42), mock.call(2, 90)])
+
+    def test_backoff_interval_per_operation(self):
+        """
+        Each function returned by ``backoff_interval`` keeps track of its own
+        previous interval
+        """
+        patch(self, 'otter.util.retry.random.uniform',
+              side_effect=lambda low, high: high)
+        first = backoff_interval(1, 100, multiplier=2)
+        first(None)
+        first(None)
+        self.assertEqual(backoff_interval(1, 100, multiplier=2)(None), 2)
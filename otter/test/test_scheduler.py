@@ -11,10 +11,10 @@ import mock
 from silverberg.lock import BusyLockError
 from silverberg.cassandra.ttypes import TimedOutException
 
-from otter.scheduler import SchedulerService
+from otter.scheduler import SchedulerService, group_events
 from otter.test.utils import iMock, patch, CheckFailure, mock_log
 from otter.models.interface import (
-    IScalingGroup, IScalingGroupCollection, IScalingScheduleCollection)
+    GroupState, IScalingGroup, IScalingGroupCollection, IScalingScheduleCollection)
 from otter.models.cass import LOCK_TABLE_NAME
 from otter.models.interface import NoSuchPolicyError, NoSuchScalingGroupError
 from otter.controller import CannotExecutePolicyError
@@ -56,15 +56,19 @@ class SchedulerTestCase(TestCase):
             return_value='transaction-id')
 
         # mock out modify state
-        self.mock_state = mock.MagicMock(spec=[])  # so nothing can call it
+        self.mock_state = GroupState('1234', 'scal44', 'name', {}, {}, None, {}, False)
 
         def _mock_modify_state(modifier, *args, **kwargs):
-            modifier(self.mock_group, self.mock_state, *args, **kwargs)
-            return defer.succeed(None)
+            d = defer.maybeDeferred(modifier, self.mock_group, self.mock_state,
+                                    *args, **kwargs)
+            return d.addCallback(lambda _: None)
 
         self.mock_group.modify_state.side_effect = _mock_modify_state
 
         self.maybe_exec_policy = patch(self, 'otter.scheduler.maybe_execute_scaling_policy')
+        # like the real thing, fire with the state the policy was executed against
+        self.maybe_exec_policy.side_effect = (
+            lambda log, transaction_id, group, state, policy_id: defer.succeed(state))
 
         def _mock_with_lock(lock, func, *args, **kwargs):
             return defer.maybeDeferred(func, *args, **kwargs)
@@ -93,16 +97,17 @@ class SchedulerTestCase(TestCase):
         """
         fetch_call_count = len(fetch_returns)
         events = [event for fetch_return in fetch_returns for event in fetch_return]
-        num_events = len(events)
+        groups = [key for fetch_return in fetch_returns for key in group_events(fetch_return)]
         self.assertIsNone(self.successResultOf(d))
         self.assertEqual(self.mock_store.fetch_batch_of_events.call_count, fetch_call_count)
         if update_delete_args:
             self.assertEqual(self.mock_store.update_delete_events.call_args_list,
                              [mock.call(delete_events, update_events)
                               for delete_events, update_events in update_delete_args])
-        self.assertEqual(self.mock_group.modify_state.call_count, num_events)
+        self.assertEqual(self.mock_group.modify_state.call_count, len(groups))
         self.assertEqual(self.mock_store.get_scaling_group.call_args_list,
-                         [mock.call(mock.ANY, e['tenantId'], e['groupId']) for e in events])
+                         [mock.call(mock.ANY, tenant_id, group_id)
+                          for tenant_id, group_id in groups])
         self.assertEqual(self.maybe_exec_policy.mock_calls,
                          [mock.call(mock.ANY, 'transaction-id', self.mock_group,
                           self.mock_state, policy_id=event['policyId']) for event in events])
@@ -150,7 +155,9 @@ class SchedulerTestCase(TestCase):
                  ('Executing policy', dict(tenant_id='1234', policy_id='pol44',
                                            scaling_group_id='scal44')),
                  ('Deleting {policy_ids_deleting} events', dict(policy_ids_deleting=1)),
-                 ('Updating {policy_ids_updating} events', dict(policy_ids_updating=0))]
+                 ('Updating {policy_ids_updating} events', dict(policy_ids_updating=0)),
+                 ('Processed {num_events} events of {num_groups} groups in {time_taken} seconds',
+                  dict(num_events=1, num_groups=1, lock_contention=0, time_taken=0))]
 
         self.log.msg.assert_has_calls(
             [mock.call(msg, scheduler_run_id='transaction-id', utcnow=mock.ANY, **kwargs)
@@ -163,8 +170,7 @@ class SchedulerTestCase(TestCase):
         events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol44',
                    'trigger': 'now', 'cron': 'c1'}]
         self.returns = [events]
-        self.mock_group.modify_state.side_effect = (
-            lambda *_: defer.fail(CannotExecutePolicyError('t', 'g', 'p', 'w')))
+        self.maybe_exec_policy.side_effect = CannotExecutePolicyError('t', 'g', 'p', 'w')
 
         d = self.scheduler_service.check_for_events(100)
 
@@ -365,7 +371,7 @@ class SchedulerTestCase(TestCase):
         """
         events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol44',
                    'trigger': 'now', 'cron': 'c1'},
-                  {'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol45',
+                  {'tenantId': '1234', 'groupId': 'scal45', 'policyId': 'pol45',
                    'trigger': 'now', 'cron': 'c2'},
                   {'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol46',
                    'trigger': 'now', 'cron': 'c3'},
@@ -373,19 +379,22 @@ class SchedulerTestCase(TestCase):
                    'trigger': 'now', 'cron': None}]
         self.returns = [events]
 
-        events_indexes = range(len(events))
+        modify_state = self.mock_group.modify_state.side_effect
 
         def _mock_modify_state(modifier, *args, **kwargs):
-            index = events_indexes.pop(0)
-            if index == 0:
-                return defer.fail(NoSuchPolicyError('1234', 'scal44', 'pol44'))
-            if index == 1:
-                return defer.fail(NoSuchScalingGroupError('1234', 'scal44'))
-            modifier(self.mock_group, self.mock_state, *args, **kwargs)
-            return defer.succeed(None)
+            if self.mock_store.get_scaling_group.call_args[0][2] == 'scal45':
+                return defer.fail(NoSuchScalingGroupError('1234', 'scal45'))
+            return modify_state(modifier, *args, **kwargs)
 
         self.mock_group.modify_state.side_effect = _mock_modify_state
 
+        def _mock_exec_policy(log, transaction_id, group, state, policy_id):
+            if policy_id == 'pol44':
+                raise NoSuchPolicyError('1234', 'scal44', 'pol44')
+            return state
+
+        self.maybe_exec_policy.side_effect = _mock_exec_policy
+
         d = self.scheduler_service.check_for_events(100)
 
         exp_delete_events = ['pol44', 'pol45', 'pol47']
@@ -397,23 +406,367 @@ class SchedulerTestCase(TestCase):
         self.assertEqual(self.mock_store.fetch_batch_of_events.call_count, 1)
         self.mock_store.update_delete_events.assert_called_once_with(exp_delete_events,
                                                                      exp_update_events)
-        self.assertEqual(self.mock_group.modify_state.call_count, len(events))
+        self.assertEqual(self.mock_group.modify_state.call_count, 2)
         self.assertEqual(self.mock_store.get_scaling_group.call_args_list,
-                         [mock.call(mock.ANY, e['tenantId'], e['groupId']) for e in events])
+                         [mock.call(mock.ANY, '1234', 'scal44'),
+                          mock.call(mock.ANY, '1234', 'scal45')])
+        self.assertEqual([c[2]['policy_id'] for c in self.maybe_exec_policy.mock_calls],
+                         ['pol44', 'pol46', 'pol47'])
+
+    def test_same_group_events_executed_in_one_modify_state(self):
+        """
+        Events of the same group are executed one after the other, in the order they
+        were fetched, within a single ``modify_state`` call
+        """
+        events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol{}'.format(i),
+                   'trigger': 'now', 'cron': None} for i in range(3)]
+        self.returns = [events]
+        executions = []
+
+        def _mock_exec_policy(log, transaction_id, group, state, policy_id):
+            executions.append(policy_id)
+            d = defer.Deferred()
+            executions.append(d)
+            return d
+
+        self.maybe_exec_policy.side_effect = _mock_exec_policy
 
-    def test_exec_event_logs(self):
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertNoResult(d)
+        self.assertEqual(self.mock_group.modify_state.call_count, 1)
+        self.assertEqual(executions[0], 'pol0')
+        self.assertEqual(len(executions), 2)
+        executions[1].callback(self.mock_state)
+        self.assertEqual(executions[2], 'pol1')
+        executions[3].callback(self.mock_state)
+        self.assertEqual(executions[4], 'pol2')
+        executions[5].callback(self.mock_state)
+        self.assertIsNone(self.successResultOf(d))
+
+    def test_group_events_continue_after_failure(self):
         """
-        `execute_event` logs error with all the ids bound
+        A policy failing to execute does not stop the rest of the group's events from
+        executing, and the state is still saved
+        """
+        events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol{}'.format(i),
+                   'trigger': 'now', 'cron': None} for i in range(3)]
+        self.returns = [events]
+        self.maybe_exec_policy.side_effect = [
+            self.mock_state, CannotExecutePolicyError('1234', 'scal44', 'pol1', 'meh'),
+            self.mock_state]
+        modifier_results = []
+
+        def _mock_modify_state(modifier, *args, **kwargs):
+            d = modifier(self.mock_group, self.mock_state, *args, **kwargs)
+            return d.addCallback(modifier_results.append)
+
+        self.mock_group.modify_state.side_effect = _mock_modify_state
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.validate_calls(d, [events], [(['pol0', 'pol1', 'pol2'], [])])
+        self.assertEqual(modifier_results, [self.mock_state])
+        self.assertEqual(
+            self.log.msg.mock_calls[3],
+            mock.call('Cannot execute policy', reason=CheckFailure(CannotExecutePolicyError),
+                      scheduler_run_id='transaction-id', utcnow=mock.ANY, tenant_id='1234',
+                      scaling_group_id='scal44', policy_id='pol1'))
+
+    def test_failed_policy_changes_discarded(self):
+        """
+        Each policy is executed against a copy of the state holding the changes
+        of the policies executed before it.  The changes a policy made before
+        failing, including actions to take once the state is saved, are not
+        saved
+        """
+        events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol{}'.format(i),
+                   'trigger': 'now', 'cron': None} for i in range(3)]
+        self.returns = [events]
+        action = mock.Mock()
+        states = []
+
+        def _mock_exec_policy(log, transaction_id, group, state, policy_id):
+            states.append(state)
+            state.active[policy_id] = {}
+            state.after_save(action, policy_id)
+            if policy_id == 'pol1':
+                raise CannotExecutePolicyError('1234', 'scal44', 'pol1', 'meh')
+            return state
+
+        self.maybe_exec_policy.side_effect = _mock_exec_policy
+        modifier_results = []
+
+        def _mock_modify_state(modifier, *args, **kwargs):
+            d = modifier(self.mock_group, self.mock_state, *args, **kwargs)
+            return d.addCallback(modifier_results.append)
+
+        self.mock_group.modify_state.side_effect = _mock_modify_state
+
+        self.successResultOf(self.scheduler_service.check_for_events(100))
+
+        self.assertEqual(self.mock_state.active, {})
+        self.assertIs(states[2].active, modifier_results[0].active)
+        self.assertEqual(modifier_results[0].active, {'pol0': {}, 'pol2': {}})
+        modifier_results[0].saved(self.log)
+        self.assertEqual(action.mock_calls, [mock.call('pol0'), mock.call('pol2')])
+
+    def test_group_state_not_saved_if_all_fail(self):
+        """
+        If none of the group's policies could be executed, the modifier fails so that
+        the state is not saved, and the failures are not logged again
+        """
+        events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol{}'.format(i),
+                   'trigger': 'now', 'cron': None} for i in range(2)]
+        self.returns = [events]
+        self.maybe_exec_policy.side_effect = ValueError('meh')
+        modifier_results = []
+
+        def _mock_modify_state(modifier, *args, **kwargs):
+            d = modifier(self.mock_group, self.mock_state, *args, **kwargs)
+            return d.addBoth(modifier_results.append)
+
+        self.mock_group.modify_state.side_effect = _mock_modify_state
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(modifier_results, [CheckFailure(ValueError)])
+        self.assertEqual(self.log.err.call_count, 2)
+
+    def test_groups_executed_with_bounded_concurrency(self):
+        """
+        Events of different groups are executed concurrently, but no more than
+        ``max_concurrency`` groups at a time
+        """
+        self.scheduler_service.max_concurrency = 2
+        events = [{'tenantId': '1234', 'groupId': 'scal{}'.format(i), 'policyId': 'pol',
+                   'trigger': 'now', 'cron': None} for i in range(3)]
+        self.returns = [events]
+        modifications = []
+
+        def _mock_modify_state(modifier, *args, **kwargs):
+            d = defer.Deferred()
+            modifications.append(d)
+            return d
+
+        self.mock_group.modify_state.side_effect = _mock_modify_state
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertEqual(len(modifications), 2)
+        modifications[1].callback(None)
+        self.assertEqual(len(modifications), 3)
+        modifications[0].callback(None)
+        self.assertNoResult(d)
+        modifications[2].callback(None)
+        self.assertIsNone(self.successResultOf(d))
+        self.mock_store.update_delete_events.assert_called_once_with(['pol'] * 3, [])
+
+    def test_lock_contention_reported(self):
+        """
+        Groups whose lock could not be acquired are counted as contended in the
+        batch report, along with the time taken to process the batch
+        """
+        events = [{'tenantId': '1234', 'groupId': 'scal{}'.format(i), 'policyId': 'pol',
+                   'trigger': 'now', 'cron': None} for i in range(3)]
+        self.returns = [events]
+        pending = defer.Deferred()
+        results = [defer.fail(BusyLockError(LOCK_TABLE_NAME, 'scal0')), pending,
+                   defer.succeed(None)]
+        self.mock_group.modify_state.side_effect = lambda *_: results.pop(0)
+        self.clock.advance(10)
+
+        d = self.scheduler_service.check_for_events(100)
+        self.clock.advance(3)
+        pending.callback(None)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.log.msg.assert_called_with(
+            'Processed {num_events} events of {num_groups} groups in {time_taken} seconds',
+            num_events=3, num_groups=3, lock_contention=1, time_taken=3,
+            scheduler_run_id='transaction-id', utcnow=mock.ANY)
+
+    def test_execute_group_events_logs(self):
+        """
+        `execute_group_events` logs error with all the ids bound
         """
         log = mock_log()
         log.err.return_value = None
-        event = {'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol44',
-                 'trigger': 'now', 'cron': 'c1'}
+        events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol44',
+                   'trigger': 'now', 'cron': 'c1'}]
         self.mock_group.modify_state.side_effect = lambda *_: defer.fail(ValueError('meh'))
 
-        d = self.scheduler_service.execute_event(log, event, mock.Mock())
+        d = self.scheduler_service.execute_group_events(log, '1234', 'scal44', events,
+                                                        mock.Mock())
 
-        self.assertIsNone(self.successResultOf(d))
+        self.assertFalse(self.successResultOf(d))
         log.err.assert_called_once_with(CheckFailure(ValueError),
                                         'Scheduler failed to execute policy', tenant_id='1234',
                                         scaling_group_id='scal44', policy_id='pol44')
+
+    def test_execute_group_events_lock_busy(self):
+        """
+        `execute_group_events` fires with ``True`` if the group's lock was busy
+        """
+        log = mock_log()
+        events = [{'tenantId': '1234', 'groupId': 'scal44', 'policyId': 'pol44',
+                   'trigger': 'now', 'cron': 'c1'}]
+        self.mock_group.modify_state.side_effect = (
+            lambda *_: defer.fail(BusyLockError(LOCK_TABLE_NAME, 'scal44')))
+
+        d = self.scheduler_service.execute_group_events(log, '1234', 'scal44', events,
+                                                        set())
+
+        self.assertTrue(self.successResultOf(d))
+
+
+class BucketedSchedulerTestCase(TestCase):
+    """
+    Tests for :class:`SchedulerService` when events are partitioned into buckets
+    """
+
+    def setUp(self):
+        """
+        Mock the store, the scaling group, locking and policy execution
+        """
+        self.mock_store = iMock(IScalingGroupCollection, IScalingScheduleCollection)
+        self.mock_group = iMock(IScalingGroup)
+        self.mock_store.get_scaling_group.return_value = self.mock_group
+        self.mock_store.reschedule_events.return_value = defer.succeed(None)
+
+        self.events = {}
+
+        def _fetch(bucket, now, size):
+            return defer.succeed(self.events.get(bucket, []))
+
+        self.mock_store.fetch_bucket_events.side_effect = _fetch
+
+        patch(self, 'otter.scheduler.generate_transaction_id', return_value='transaction-id')
+        self.mock_state = GroupState('1234', 'scal44', 'name', {}, {}, None, {}, False)
+
+        def _mock_modify_state(modifier, *args, **kwargs):
+            return defer.maybeDeferred(modifier, self.mock_group, self.mock_state,
+                                       *args, **kwargs)
+
+        self.mock_group.modify_state.side_effect = _mock_modify_state
+        self.maybe_exec_policy = patch(self, 'otter.scheduler.maybe_execute_scaling_policy')
+        # like the real thing, fire with the state the policy was executed against
+        self.maybe_exec_policy.side_effect = (
+            lambda log, transaction_id, group, state, policy_id: defer.succeed(state))
+
+        self.mock_lock = patch(self, 'otter.scheduler.BasicLock')
+        self.mock_with_lock = patch(self, 'otter.scheduler.with_lock')
+        self.mock_with_lock.side_effect = (
+            lambda lock, func, *args: defer.maybeDeferred(func, *args))
+        self.slv_client = mock.MagicMock()
+
+        otter_log = patch(self, 'otter.scheduler.otter_log')
+        self.log = mock_log()
+        otter_log.bind.return_value = self.log
+
+        patch(self, 'otter.scheduler.next_cron_occurrence', return_value='newtrigger')
+
+        self.scheduler_service = SchedulerService(100, 1, self.slv_client, self.mock_store,
+                                                  Clock(), buckets=3)
+
+    def test_buckets_processed_under_own_lock(self):
+        """
+        Each bucket's events are fetched and processed under that bucket's lock
+        """
+        self.events = {1: [{'bucket': 1, 'tenantId': '1234', 'groupId': 'scal44',
+                            'policyId': 'pol44', 'trigger': 'now', 'cron': None}]}
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.mock_lock.mock_calls,
+                         [mock.call(self.slv_client, LOCK_TABLE_NAME, 'schedule_{}'.format(i),
+                                    max_retry=0, log=mock.ANY) for i in range(3)])
+        self.assertEqual(self.mock_store.fetch_bucket_events.mock_calls,
+                         [mock.call(i, mock.ANY, 100) for i in range(3)])
+        self.assertFalse(self.mock_store.fetch_batch_of_events.called)
+        self.maybe_exec_policy.assert_called_once_with(
+            mock.ANY, 'transaction-id', self.mock_group, self.mock_state, policy_id='pol44')
+        self.mock_store.reschedule_events.assert_called_once_with(self.events[1], [])
+
+    def test_buckets_checked_concurrently(self):
+        """
+        The buckets are checked concurrently, at most ``max_concurrency`` of
+        them at a time
+        """
+        locked = []
+
+        def _with_lock(lock, func, *args):
+            locked.append(defer.Deferred())
+            return locked[-1].addCallback(lambda _: func(*args))
+
+        self.mock_with_lock.side_effect = _with_lock
+        self.scheduler_service.max_concurrency = 2
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertNoResult(d)
+        self.assertEqual(len(locked), 2)
+        locked[0].callback(None)
+        self.assertEqual(len(locked), 3)
+        locked[1].callback(None)
+        locked[2].callback(None)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.mock_store.fetch_bucket_events.mock_calls,
+                         [mock.call(i, mock.ANY, 100) for i in range(3)])
+
+    def test_busy_bucket_skipped(self):
+        """
+        A bucket whose lock is held by another scheduler is skipped, and the
+        remaining buckets are still processed
+        """
+        def _with_lock(lock, func, *args):
+            if args[1] == 0:
+                return defer.fail(BusyLockError(LOCK_TABLE_NAME, 'schedule_0'))
+            return defer.maybeDeferred(func, *args)
+
+        self.mock_with_lock.side_effect = _with_lock
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.mock_store.fetch_bucket_events.mock_calls,
+                         [mock.call(i, mock.ANY, 100) for i in (1, 2)])
+
+    def test_cron_events_rescheduled(self):
+        """
+        All processed events are deleted, and cron events of existing policies are
+        added back with their next trigger time
+        """
+        events = [{'bucket': 2, 'tenantId': '1234', 'groupId': 'scal44',
+                   'policyId': 'pol{}'.format(i), 'trigger': 'now', 'cron': 'c'} for i in range(2)]
+        self.events = {2: events}
+        self.maybe_exec_policy.side_effect = [
+            self.mock_state, NoSuchPolicyError('1234', 'scal44', 'pol1')]
+
+        d = self.scheduler_service.check_for_events(100)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.mock_store.reschedule_events.assert_called_once_with(
+            events, [dict(events[0], trigger='newtrigger')])
+        self.assertEqual(events[0]['trigger'], 'now')
+
+    def test_full_bucket_fetched_again(self):
+        """
+        A bucket is fetched again as long as a full batch of events is returned
+        """
+        batches = [[{'bucket': 0, 'tenantId': '1234', 'groupId': 'scal44',
+                     'policyId': 'pol44', 'trigger': 'now', 'cron': None}], []]
+
+        def _fetch(bucket, now, size):
+            return defer.succeed(batches.pop(0) if bucket == 0 else [])
+
+        self.mock_store.fetch_bucket_events.side_effect = _fetch
+
+        d = self.scheduler_service.check_for_events(1)
+
+        self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.mock_store.fetch_bucket_events.mock_calls,
+                         [mock.call(0, mock.ANY, 1), mock.call(0, mock.ANY, 1),
+                          mock.call(1, mock.ANY, 1), mock.call(2, mock.ANY, 1)])
@@ -5,7 +5,7 @@ import mock
 
 from twisted.trial.unittest import TestCase
 from twisted.internet.defer import succeed, fail, Deferred
-from twisted.internet.task import Cooperator
+from twisted.internet.task import Clock, Cooperator
 
 from zope.interface.verify import verifyObject
 
@@ -86,6 +86,17 @@ class LaunchConfigTests(SupervisorTests):
             self.supervisor.execute_config, self.log, 'transaction-id',
             self.group, {'type': 'not-launch_server'})
 
+    def test_execute_config_uses_given_job_id(self):
+        """
+        execute_config uses the job ID it is given rather than generating one
+        """
+        d = self.supervisor.execute_config(self.log, 'transaction-id',
+                                           self.group, self.launch_config,
+                                           'given-job-id')
+        (job_id, completed_d) = self.successResultOf(d)
+        self.assertEqual(job_id, 'given-job-id')
+        self.assertFalse(self.generate_job_id.called)
+
     def test_execute_config_auths(self):
         """
         execute_config asks the provided authentication function for
@@ -134,7 +145,8 @@ class LaunchConfigTests(SupervisorTests):
             self.service_catalog,
             self.auth_token,
             {'server': {}},
-            self.undo)
+            self.undo,
+            warm_server=None)
 
     def test_execute_config_rewinds_undo_stack_on_failure(self):
         """
@@ -205,6 +217,71 @@ class LaunchConfigTests(SupervisorTests):
 
         self.successResultOf(sd)
 
+    def test_execute_config_rate_limited(self):
+        """
+        A tenant's launches are started at most ``worker.rate_limits.servers``
+        per second, and the launches waiting are counted in the stats
+        """
+        set_config_data({'region': 'ORD',
+                         'worker': {'rate_limits': {'servers': {'rate': 1}}}})
+        self.auth_function.side_effect = lambda tenant_id: succeed(
+            (self.auth_token, self.service_catalog))
+        self.launch_server.side_effect = lambda *args, **kwargs: succeed(
+            (self.fake_server_details, {}))
+        clock = Clock()
+        supervisor = SupervisorService(self.auth_function, self.cooperator.coiterate, clock)
+
+        for i in range(2):
+            supervisor.execute_config(self.log, 'transaction-id', self.group,
+                                      self.launch_config)
+        self.assertEqual(self.launch_server.call_count, 1)
+        self.assertEqual(supervisor.rate_limit_stats(),
+                         {'servers.queued': 1, 'servers.served': 1,
+                          'servers.wait_time': 0})
+
+        clock.advance(1)
+        self.assertEqual(self.launch_server.call_count, 2)
+        self.assertEqual(supervisor.rate_limit_stats(),
+                         {'servers.queued': 0, 'servers.served': 2,
+                          'servers.wait_time': 1})
+
+    def test_execute_config_rate_limits_load_balancers(self):
+        """
+        Launches adding servers to load balancers are also limited by
+        ``worker.rate_limits.load_balancers``
+        """
+        set_config_data({'region': 'ORD',
+                         'worker': {'rate_limits': {'load_balancers': {'rate': 0.5}}}})
+        self.auth_function.side_effect = lambda tenant_id: succeed(
+            (self.auth_token, self.service_catalog))
+        self.launch_server.side_effect = lambda *args, **kwargs: succeed(
+            (self.fake_server_details, {}))
+        clock = Clock()
+        supervisor = SupervisorService(self.auth_function, self.cooperator.coiterate, clock)
+
+        self.launch_config['args']['loadBalancers'] = [{'loadBalancerId': 1, 'port': 80}]
+        for i in range(2):
+            supervisor.execute_config(self.log, 'transaction-id', self.group,
+                                      self.launch_config)
+        self.assertEqual(self.launch_server.call_count, 1)
+        clock.advance(2)
+        self.assertEqual(self.launch_server.call_count, 2)
+        self.assertEqual(supervisor.rate_limit_stats()['load_balancers.served'], 2)
+
+    def test_execute_config_not_rate_limited_by_default(self):
+        """
+        Launches are not rate limited unless a rate is configured
+        """
+        self.auth_function.side_effect = lambda tenant_id: succeed(
+            (self.auth_token, self.service_catalog))
+        self.launch_server.side_effect = lambda *args, **kwargs: succeed(
+            (self.fake_server_details, {}))
+        for i in range(3):
+            self.supervisor.execute_config(self.log, 'transaction-id', self.group,
+                                           self.launch_config)
+        self.assertEqual(self.launch_server.call_count, 3)
+        self.assertEqual(self.supervisor.rate_limit_stats(), {})
+
 
 class DeleteServerTests(SupervisorTests):
     """
@@ -261,6 +338,133 @@ class DeleteServerTests(SupervisorTests):
         f = self.failureResultOf(d, ValueError)
         self.assertEqual(f.value, expected)
 
+    def test_execute_delete_bounded_concurrency(self):
+        """
+        At most ``worker.delete_concurrency`` servers are deleted at once, and
+        the rest are deleted as earlier deletions finish
+        """
+        set_config_data({'region': 'ORD', 'worker': {'delete_concurrency': 2}})
+        self.auth_function.side_effect = lambda tenant_id: succeed(
+            (self.auth_token, self.service_catalog))
+        supervisor = SupervisorService(self.auth_function, self.cooperator.coiterate)
+        deletes = [Deferred() for i in range(3)]
+        self.delete_server.side_effect = deletes
+
+        ds = [supervisor.execute_delete_server(self.log, 'transaction-id',
+                                               self.group, self.fake_server)
+              for i in range(3)]
+        self.assertEqual(self.delete_server.call_count, 2)
+        self.log.bind.return_value.msg.assert_any_call(
+            "Queueing server deletion: {deleting} deleting, {waiting} waiting",
+            deleting=2, waiting=0)
+
+        deletes[0].callback(None)
+        self.assertIsNone(self.successResultOf(ds[0]))
+        self.assertEqual(self.delete_server.call_count, 3)
+        self.assertNoResult(ds[2])
+
+    def test_execute_delete_default_concurrency(self):
+        """
+        By default, at most 10 servers are deleted at once
+        """
+        self.assertEqual(self.supervisor.delete_semaphore.limit, 10)
+
+    def test_execute_delete_rate_limited(self):
+        """
+        A tenant's deletions are started at most ``worker.rate_limits.servers``
+        per second
+        """
+        set_config_data({'region': 'ORD',
+                         'worker': {'rate_limits': {'servers': {'rate': 1, 'burst': 2}}}})
+        self.auth_function.side_effect = lambda tenant_id: succeed(
+            (self.auth_token, self.service_catalog))
+        self.delete_server.side_effect = lambda *args: succeed(None)
+        clock = Clock()
+        supervisor = SupervisorService(self.auth_function, self.cooperator.coiterate, clock)
+
+        ds = [supervisor.execute_delete_server(self.log, 'transaction-id',
+                                               self.group, self.fake_server)
+              for i in range(3)]
+        self.assertEqual(self.delete_server.call_count, 2)
+        self.assertNoResult(ds[2])
+
+        clock.advance(1)
+        self.assertEqual(self.delete_server.call_count, 3)
+        self.assertIsNone(self.successResultOf(ds[2]))
+
+
+class BuildServerTests(SupervisorTests):
+    """
+    Tests for :meth:`SupervisorService.execute_build_server`, and for
+    launching a server built by it
+    """
+
+    def setUp(self):
+        """
+        mock worker functions
+        """
+        super(BuildServerTests, self).setUp()
+        self.auth_function.side_effect = lambda tenant_id: succeed(
+            (self.auth_token, self.service_catalog))
+        self.build_server = patch(
+            self, 'otter.supervisor.launch_server_v1.build_server',
+            side_effect=lambda *args: succeed(self.fake_server_details))
+        self.launch_server = patch(
+            self, 'otter.supervisor.launch_server_v1.launch_server',
+            side_effect=lambda *args, **kwargs: succeed((self.fake_server_details, {})))
+        self.launch_config = {'type': 'launch_server',
+                              'args': {'server': {}}}
+
+    def test_builds_server(self):
+        """
+        ``execute_build_server`` authenticates and builds a server from the
+        launch config's args, firing with its details
+        """
+        d = self.supervisor.execute_build_server(self.log, 'transaction-id',
+                                                 self.group, self.launch_config)
+        self.assertEqual(self.successResultOf(d), self.fake_server_details)
+        self.auth_function.assert_called_once_with(11111)
+        self.build_server.assert_called_once_with(
+            mock.ANY, 'ORD', self.group, self.service_catalog, self.auth_token,
+            {'server': {}}, self.undo)
+
+    def test_failed_build_rewound(self):
+        """
+        The undo stack of a server that fails to build is rewound, and the
+        failure is propagated
+        """
+        self.build_server.side_effect = lambda *args: fail(ValueError('no'))
+        d = self.supervisor.execute_build_server(self.log, 'transaction-id',
+                                                 self.group, self.launch_config)
+        self.failureResultOf(d, ValueError)
+        self.undo.rewind.assert_called_once_with()
+
+    def test_build_waited_on(self):
+        """
+        The build is added to the supervisor's deferred pool
+        """
+        build_d = Deferred()
+        self.build_server.side_effect = lambda *args: build_d
+        self.supervisor.execute_build_server(self.log, 'transaction-id',
+                                             self.group, self.launch_config)
+        d = self.supervisor.deferred_pool.notify_when_empty()
+        self.assertNoResult(d)
+        build_d.callback(self.fake_server_details)
+        self.successResultOf(d)
+
+    def test_execute_config_launches_warm_server(self):
+        """
+        ``execute_config`` given a server from the group's warm pool passes it
+        on to ``launch_server``
+        """
+        self.supervisor.execute_config(self.log, 'transaction-id', self.group,
+                                       self.launch_config,
+                                       warm_server={'server': {'id': 'warm'}})
+        self.launch_server.assert_called_once_with(
+            mock.ANY, 'ORD', self.group, self.service_catalog, self.auth_token,
+            {'server': {}}, self.undo, warm_server={'server': {'id': 'warm'}})
+        self.assertFalse(self.build_server.called)
+
 
 class ValidateLaunchConfigTests(SupervisorTests):
     """
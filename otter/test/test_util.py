@@ -5,14 +5,22 @@ from datetime import datetime
 import mock
 
 from twisted.trial.unittest import TestCase
-from twisted.internet.defer import succeed
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
 from twisted.python.failure import Failure
 from twisted.web.http_headers import Headers
+from twisted.web.resource import Resource
+from twisted.web.server import Site
 
 from otter.util.http import (
     append_segments, APIError, check_success, RequestError, headers,
     wrap_request_error)
+from otter.util.cache import LRUCache
 from otter.util.hashkey import generate_capability
+from otter.util.histogram import Histogram
+from otter.util.pool import CountingHTTPConnectionPool, PooledTreq
+from otter.util.ratelimit import TokenBucket
 from otter.util import timestamp, config
 
 from otter.test.utils import patch
@@ -315,3 +323,315 @@ class ConfigTest(TestCase):
         nested dictionaries.
         """
         self.assertIdentical(config.config_value('baz.blah'), None)
+
+
+class LRUCacheTests(TestCase):
+    """
+    Tests for :class:`otter.util.cache.LRUCache`
+    """
+
+    def setUp(self):
+        """
+        A cache of 2 entries that expire after 10 seconds
+        """
+        self.clock = Clock()
+        self.cache = LRUCache(2, 10, self.clock)
+
+    def test_get_set(self):
+        """
+        A value that is set is returned by get and counted as a hit, and a key
+        that was never set returns the default and is counted as a miss
+        """
+        self.cache.set('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('b', 'default'), 'default')
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_expires(self):
+        """
+        Entries expire after the cache's ttl, or the ttl given when setting them
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2, ttl=1)
+        self.clock.advance(1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.clock.advance(9)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_evicts_least_recently_used(self):
+        """
+        When full, the least recently used entry is evicted
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_set_existing_does_not_evict(self):
+        """
+        Setting a key that is already cached replaces it without evicting
+        """
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.set('a', 3)
+        self.assertEqual(self.cache.get('a'), 3)
+        self.assertEqual(self.cache.get('b'), 2)
+        self.assertEqual(self.cache.evictions, 0)
+
+    def test_invalidate(self):
+        """
+        An invalidated entry is no longer returned, and invalidating a key that
+        is not cached does nothing
+        """
+        self.cache.set('a', 1)
+        self.cache.invalidate('a')
+        self.cache.invalidate('b')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.generation, 2)
+
+    def test_invalidate_where(self):
+        """
+        ``invalidate_where`` removes only the entries whose keys match
+        """
+        self.cache.set(('g', 1), 1)
+        self.cache.set(('h', 1), 2)
+        self.cache.invalidate_where(lambda key: key[0] == 'g')
+        self.assertIsNone(self.cache.get(('g', 1)))
+        self.assertEqual(self.cache.get(('h', 1)), 2)
+        self.assertEqual(self.cache.generation, 1)
+
+
+class HistogramTests(TestCase):
+    """
+    Tests for :class:`otter.util.histogram.Histogram`
+    """
+
+    def test_record(self):
+        """
+        Measurements are counted in the first bucket whose bound they do not
+        exceed, or in the unbounded bucket if they exceed every bound
+        """
+        histogram = Histogram((1, 10))
+        for value in (0, 1, 1.5, 10, 11, 100):
+            histogram.record(value)
+        self.assertEqual(histogram.buckets(), [(1, 2), (10, 2), (None, 2)])
+        self.assertEqual(histogram.count, 6)
+        self.assertEqual(histogram.total, 123.5)
+
+
+class PooledTreqTests(TestCase):
+    """
+    Tests for :class:`otter.util.pool.PooledTreq` and
+    :class:`otter.util.pool.CountingHTTPConnectionPool`
+    """
+
+    def setUp(self):
+        """
+        An unconfigured client, whose requests are made with a mock treq client
+        """
+        self.treq = PooledTreq()
+        self.client = patch(self, 'otter.util.pool.HTTPClient').return_value
+        self.addCleanup(config.set_config_data, {})
+
+    def test_configure(self):
+        """
+        ``configure`` makes a persistent pool with the given limits
+        """
+        self.treq.configure(Clock(), max_persistent_per_host=10, idle_timeout=30)
+        self.assertTrue(isinstance(self.treq.pool, CountingHTTPConnectionPool))
+        self.assertTrue(self.treq.pool.persistent)
+        self.assertEqual(self.treq.pool.maxPersistentPerHost, 10)
+        self.assertEqual(self.treq.pool.cachedConnectionTimeout, 30)
+
+    def test_request_configures_from_config(self):
+        """
+        The first request makes the pool from the ``http_pool`` config, and
+        later requests reuse it
+        """
+        config.set_config_data({'http_pool': {'max_persistent_per_host': 20}})
+        response = mock.Mock(length=0)
+        self.client.request.side_effect = lambda *args, **kwargs: succeed(response)
+        self.assertIs(self.successResultOf(self.treq.get('http://a', headers={})), response)
+        pool = self.treq.pool
+        self.assertEqual(pool.maxPersistentPerHost, 20)
+        self.treq.post('http://a', data='d')
+        self.assertIs(self.treq.pool, pool)
+        self.assertEqual(self.client.request.mock_calls, [
+            mock.call('GET', 'http://a', headers={}),
+            mock.call('POST', 'http://a', data='d')])
+
+    def test_in_flight(self):
+        """
+        Requests are counted as in flight until their response's body has
+        been received, unless it has no body, or until they fail
+        """
+        responses = [Deferred(), Deferred(), Deferred()]
+        self.client.request.side_effect = lambda *args, **kwargs: responses[
+            self.client.request.call_count - 1]
+        d1, d2 = self.treq.delete('http://a'), self.treq.head('http://b')
+        d3 = self.treq.get('http://c')
+        self.assertEqual(self.treq.stats()['in_flight'], 3)
+
+        responses[0].callback(mock.Mock(length=0))
+        self.successResultOf(d1)
+        responses[1].errback(ValueError())
+        self.failureResultOf(d2, ValueError)
+        self.assertEqual(self.treq.stats()['in_flight'], 1)
+
+        original = mock.Mock(length=5)
+        responses[2].callback(original)
+        response = self.successResultOf(d3)
+        self.assertEqual(self.treq.stats()['in_flight'], 1)
+        protocol = mock.Mock()
+        response.deliverBody(protocol)
+        body_protocol = original.deliverBody.call_args[0][0]
+        body_protocol.dataReceived('hello')
+        self.assertEqual(self.treq.stats()['in_flight'], 1)
+        body_protocol.connectionLost('done')
+        body_protocol.connectionLost('done')
+        self.assertEqual(self.treq.stats()['in_flight'], 0)
+        protocol.dataReceived.assert_called_once_with('hello')
+        self.assertEqual(protocol.connectionLost.call_count, 2)
+
+    def test_pool_hits_and_misses(self):
+        """
+        Getting a connection is a hit if there is a cached connection for the
+        key, and a miss otherwise
+        """
+        get_connection = patch(
+            self, 'twisted.web.client.HTTPConnectionPool.getConnection',
+            return_value='connection')
+        pool = CountingHTTPConnectionPool(Clock())
+        self.assertEqual(pool.getConnection('key', 'endpoint'), 'connection')
+        pool._connections['key'] = ['cached']
+        pool.getConnection('key', 'endpoint')
+        self.assertEqual((pool.hits, pool.misses), (1, 1))
+        get_connection.assert_called_with(pool, 'key', 'endpoint')
+
+
+class PooledTreqAgentTests(TestCase):
+    """
+    Tests for the agents :class:`otter.util.pool.PooledTreq` makes requests
+    with, against a real HTTP server
+    """
+    def setUp(self):
+        """
+        A server on localhost that redirects ``/redirect`` to ``/target`` and
+        records the Authorization header of each request, and a client
+        """
+        self.requests = []
+        requests = self.requests
+
+        class Target(Resource):
+            isLeaf = True
+
+            def render_GET(self, request):
+                requests.append((request.path, request.getHeader('authorization')))
+                if request.path == '/redirect':
+                    request.setResponseCode(301)
+                    request.setHeader('location', '/target')
+                    return ''
+                return 'target'
+
+        port = reactor.listenTCP(0, Site(Target()), interface='127.0.0.1')
+        self.addCleanup(port.stopListening)
+        self.url = 'http://127.0.0.1:{0}/redirect'.format(port.getHost().port)
+        self.treq = PooledTreq()
+        self.treq.configure(reactor, persistent=False)
+
+    def test_auth_and_no_redirects(self):
+        """
+        ``auth`` is sent as basic authentication, and redirects are not
+        followed if ``allow_redirects`` is false
+        """
+        d = self.treq.get(self.url, auth=('user', 'pass'), allow_redirects=False)
+
+        def check(response):
+            self.assertEqual(response.code, 301)
+            self.assertEqual(self.requests, [
+                ('/redirect', 'Basic {0}'.format('user:pass'.encode('base64').strip()))])
+            return self.treq.content(response)
+
+        d.addCallback(check)
+        return d.addCallback(lambda _: self.assertEqual(self.treq.in_flight, 0))
+
+    def test_redirects_followed(self):
+        """
+        Redirects are followed by default, and no authentication is sent
+        unless asked for
+        """
+        d = self.treq.get(self.url)
+        d.addCallback(self.treq.content)
+
+        def check(body):
+            self.assertEqual(body, 'target')
+            self.assertEqual(self.requests, [('/redirect', None), ('/target', None)])
+            self.assertEqual(self.treq.in_flight, 0)
+
+        return d.addCallback(check)
+
+
+class TokenBucketTests(TestCase):
+    """
+    Tests for :class:`TokenBucket`
+    """
+    def setUp(self):
+        """
+        A bucket of 2 tokens a second, in bursts of up to 3
+        """
+        self.clock = Clock()
+        self.bucket = TokenBucket(2, 3, self.clock)
+
+    def test_burst(self):
+        """
+        Up to the burst can be acquired at once, and then the rest are given
+        out at the rate
+        """
+        ds = [self.bucket.acquire() for i in range(5)]
+        self.assertEqual([d.called for d in ds], [True] * 3 + [False] * 2)
+        self.assertEqual(self.bucket.queued, 2)
+        self.clock.advance(0.5)
+        self.assertEqual([d.called for d in ds], [True] * 4 + [False])
+        self.clock.advance(0.5)
+        self.assertTrue(ds[4].called)
+        self.assertEqual((self.bucket.queued, self.bucket.served, self.bucket.wait_time),
+                         (0, 5, 1.5))
+
+    def test_refills_up_to_burst(self):
+        """
+        Tokens not acquired build up, but only up to the burst
+        """
+        self.clock.advance(60)
+        ds = [self.bucket.acquire() for i in range(4)]
+        self.assertEqual([d.called for d in ds], [True] * 3 + [False])
+
+    def test_fair_across_keys(self):
+        """
+        The queues of different keys take turns getting tokens
+        """
+        [self.bucket.acquire() for i in range(3)]
+        order = []
+        for key, count in (('a', 3), ('b', 2)):
+            for i in range(count):
+                self.bucket.acquire(key).addCallback(lambda _, key=key: order.append(key))
+        self.clock.pump([0.5] * 5)
+        self.assertEqual(order, ['a', 'b', 'a', 'b', 'a'])
+
+    def test_cancel(self):
+        """
+        A cancelled wait gives up its place in the queue
+        """
+        [self.bucket.acquire() for i in range(3)]
+        cancelled = self.bucket.acquire('a')
+        d = self.bucket.acquire('b')
+        cancelled.cancel()
+        self.failureResultOf(cancelled)
+        self.assertEqual(self.bucket.queued, 1)
+        self.clock.advance(0.5)
+        self.assertIsNone(self.successResultOf(d))
@@ -102,7 +102,7 @@ class CassStoreRestScalingGroupTestCase(TestCase, RequestTestMixin, LockMixin):
 
         # patch both the config and the groups
         self.mock_controller = patch(self, 'otter.rest.configs.controller',
-                                     spec=['obey_config_change'])
+                                     spec=['obey_config_change', 'maintain_warm_pool'])
         patch(self, 'otter.rest.groups.controller', new=self.mock_controller)
 
         # Patch supervisor
@@ -115,6 +115,8 @@ class CassStoreRestScalingGroupTestCase(TestCase, RequestTestMixin, LockMixin):
                 state.tenant_id, state.group_id, *self.active_pending_etc))
 
         self.mock_controller.obey_config_change.side_effect = _mock_obey_config_change
+        self.mock_controller.maintain_warm_pool.side_effect = (
+            lambda *args: defer.succeed(args[-1]))
 
         self.lock = self.mock_lock()
         patch(self, 'otter.models.cass.BasicLock', return_value=self.lock)
@@ -74,7 +74,7 @@ class MockStoreRestScalingGroupTestCase(TestCase):
 
         # patch both the config and the groups
         self.mock_controller = patch(self, 'otter.rest.configs.controller',
-                                     spec=['obey_config_change'])
+                                     spec=['obey_config_change', 'maintain_warm_pool'])
         patch(self, 'otter.rest.groups.controller', new=self.mock_controller)
 
         # Patch supervisor
@@ -87,6 +87,8 @@ class MockStoreRestScalingGroupTestCase(TestCase):
                 state.tenant_id, state.group_id, state.group_name, *self.active_pending_etc))
 
         self.mock_controller.obey_config_change.side_effect = _mock_obey_config_change
+        self.mock_controller.maintain_warm_pool.side_effect = (
+            lambda *args: defer.succeed(args[-1]))
 
     def tearDown(self):
         """
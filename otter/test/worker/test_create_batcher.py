@@ -0,0 +1,237 @@
+"""
+Tests for :mod:`otter.worker.create_batcher`
+"""
+import json
+
+import mock
+
+from twisted.internet.defer import succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from otter.test.utils import patch
+from otter.util.http import RequestError
+from otter.worker import create_batcher
+from otter.worker.create_batcher import (
+    ServerCreationBatcher, ServerNotCreated, get_server_creation_batcher)
+
+
+expected_headers = {
+    'content-type': ['application/json'],
+    'accept': ['application/json'],
+    'x-auth-token': ['my-auth-token']
+}
+
+
+def server_config(name):
+    """
+    A server config as prepared by ``launch_server``
+    """
+    return {'name': name, 'imageRef': '1', 'flavorRef': '1',
+            'metadata': {'rax:auto_scaling_group_id': 'group'}}
+
+
+class ServerCreationBatcherTests(TestCase):
+    """
+    Tests for :class:`ServerCreationBatcher`
+    """
+    def setUp(self):
+        """
+        A batcher with a 2 second window, creating at most 3 servers at once
+        """
+        self.treq = patch(self, 'otter.worker.create_batcher.treq')
+        patch(self, 'otter.util.http.treq', new=self.treq)
+        self.posts = []
+        self.gets = []
+        self.treq.post.side_effect = lambda *args, **kwargs: self.posts.pop(0)
+        self.treq.get.side_effect = lambda *args, **kwargs: self.gets.pop(0)
+        self.treq.delete.side_effect = lambda *args, **kwargs: succeed(
+            mock.Mock(code=204, body='', headers=None))
+        self.treq.json_content.side_effect = lambda response: succeed(response.body)
+        self.treq.content.side_effect = lambda response: succeed(response.body)
+
+        self.clock = Clock()
+        self.on_idle = mock.Mock()
+        self.batcher = ServerCreationBatcher('http://url/', 2, 3, self.clock, self.on_idle)
+
+    def respond(self, responses, code, body):
+        """
+        Queue a response to creating or listing servers
+        """
+        responses.append(succeed(mock.Mock(code=code, body=body, headers=None)))
+
+    def posted_server(self, call=-1):
+        """
+        The server config posted in a request
+        """
+        return json.loads(self.treq.post.mock_calls[call][2]['data'])['server']
+
+    def test_creates_servers_in_window_together(self):
+        """
+        Servers created within the window are created with one request, and
+        each caller gets one of the servers with the reservation ID returned
+        """
+        servers = [{'id': 's2', 'name': 'as1-2'}, {'id': 's1', 'name': 'as1-1'}]
+        self.respond(self.posts, 202, {'reservation_id': 'r-1'})
+        self.respond(self.gets, 200, {'servers': servers})
+
+        d1 = self.batcher.create_server('my-auth-token', server_config('as1'))
+        self.clock.advance(1)
+        d2 = self.batcher.create_server('my-auth-token', server_config('as2'))
+        self.clock.advance(0.9)
+        self.assertFalse(self.treq.post.called)
+        self.assertFalse(self.on_idle.called)
+
+        self.clock.advance(0.1)
+        self.treq.post.assert_called_once_with(
+            'http://url/servers', headers=expected_headers, data=mock.ANY)
+        self.assertEqual(self.posted_server(), dict(
+            server_config('as1'), min_count=2, max_count=2,
+            return_reservation_id=True))
+        self.treq.get.assert_called_once_with(
+            'http://url/servers/detail', headers=expected_headers,
+            params={'reservation_id': 'r-1'})
+        self.assertEqual(self.successResultOf(d1), {'server': servers[1]})
+        self.assertEqual(self.successResultOf(d2), {'server': servers[0]})
+        self.on_idle.assert_called_once_with()
+
+    def test_chunked(self):
+        """
+        At most ``size`` servers are created with one request
+        """
+        self.respond(self.posts, 202, {'reservation_id': 'r-1'})
+        self.respond(self.gets, 200, {'servers': [{'id': 's1', 'name': 'as1-1'},
+                                                  {'id': 's2', 'name': 'as1-2'},
+                                                  {'id': 's3', 'name': 'as1-3'}]})
+        self.respond(self.posts, 202, {'server': {'id': 's4'}})
+
+        ds = [self.batcher.create_server('my-auth-token', server_config('as{0}'.format(i)))
+              for i in range(1, 5)]
+        self.clock.advance(2)
+        self.assertEqual(self.treq.post.call_count, 2)
+        self.assertEqual(self.posted_server(0)['max_count'], 3)
+        self.assertEqual(self.posted_server(1), server_config('as4'))
+        self.assertEqual([self.successResultOf(d)['server']['id'] for d in ds],
+                         ['s1', 's2', 's3', 's4'])
+
+    def test_single_server(self):
+        """
+        A server created on its own is created as it would be without the
+        batcher
+        """
+        self.respond(self.posts, 202, {'server': {'id': 's1'}})
+        d = self.batcher.create_server('my-auth-token', server_config('as1'))
+        self.clock.advance(2)
+        self.assertEqual(self.posted_server(), server_config('as1'))
+        self.assertFalse(self.treq.get.called)
+        self.assertEqual(self.successResultOf(d), {'server': {'id': 's1'}})
+
+    def test_failure_fails_all(self):
+        """
+        If creating the servers fails, every caller in the batch fails
+        """
+        self.respond(self.posts, 500, 'error')
+        ds = [self.batcher.create_server('my-auth-token', server_config('as1'))
+              for i in range(2)]
+        self.clock.advance(2)
+        for d in ds:
+            self.failureResultOf(d, RequestError)
+
+    def test_listing_retried(self):
+        """
+        If listing the servers of a reservation fails, or does not find them
+        all, it is retried
+        """
+        servers = [{'id': 's1', 'name': 'as1-1'}, {'id': 's2', 'name': 'as1-2'}]
+        self.respond(self.posts, 202, {'reservation_id': 'r-1'})
+        self.respond(self.gets, 500, 'error')
+        self.respond(self.gets, 200, {'servers': servers[:1]})
+        self.respond(self.gets, 200, {'servers': servers})
+        ds = [self.batcher.create_server('my-auth-token', server_config('as1'))
+              for i in range(2)]
+        self.clock.advance(2)
+        self.clock.pump([self.batcher.max_interval] * 2)
+        self.assertEqual(self.treq.get.call_count, 3)
+        self.assertEqual([self.successResultOf(d) for d in ds],
+                         [{'server': servers[0]}, {'server': servers[1]}])
+        self.assertFalse(self.treq.delete.called)
+
+    def test_servers_not_found_deleted(self):
+        """
+        If the servers of a reservation are not all found in time, every
+        caller in the batch fails with :class:`ServerNotCreated`, and the
+        servers found with the reservation are deleted
+        """
+        self.batcher.timeout = 10
+        self.batcher.cleanup_timeout = 20
+        self.treq.get.side_effect = lambda *args, **kwargs: succeed(mock.Mock(
+            code=200, body={'servers': [{'id': 's1', 'name': 'as1-1'}]}, headers=None))
+        self.respond(self.posts, 202, {'reservation_id': 'r-1'})
+        ds = [self.batcher.create_server('my-auth-token', server_config('as1'))
+              for i in range(2)]
+        self.clock.advance(2)
+        self.clock.pump([1] * 10)
+        for d in ds:
+            f = self.failureResultOf(d, ServerNotCreated)
+            self.assertEqual(f.value.reservation_id, 'r-1')
+        self.assertFalse(self.treq.delete.called)
+
+        self.clock.pump([1] * 20)
+        self.treq.delete.assert_called_once_with(
+            'http://url/servers/s1', headers=expected_headers)
+
+    def test_surplus_servers_deleted(self):
+        """
+        Servers found with the reservation beyond those asked for are deleted
+        """
+        servers = [{'id': 's{0}'.format(i), 'name': 'as1-{0}'.format(i)}
+                   for i in range(1, 4)]
+        self.respond(self.posts, 202, {'reservation_id': 'r-1'})
+        self.respond(self.gets, 200, {'servers': servers})
+        ds = [self.batcher.create_server('my-auth-token', server_config('as1'))
+              for i in range(2)]
+        self.clock.advance(2)
+        self.assertEqual([self.successResultOf(d) for d in ds],
+                         [{'server': servers[0]}, {'server': servers[1]}])
+        self.treq.delete.assert_called_once_with(
+            'http://url/servers/s3', headers=expected_headers)
+
+
+class GetServerCreationBatcherTests(TestCase):
+    """
+    Tests for :func:`get_server_creation_batcher`
+    """
+    def setUp(self):
+        """
+        No batchers to start with
+        """
+        patch(self, 'otter.worker.create_batcher._batchers', new={})
+
+    def test_one_batcher_per_launch_config(self):
+        """
+        The same batcher is returned for server configs that differ only in
+        their names, and a different one for different configs or endpoints
+        """
+        clock = Clock()
+        batcher = get_server_creation_batcher('http://url/', server_config('as1'), 2, 5, clock)
+        self.assertIs(
+            get_server_creation_batcher('http://url/', server_config('as2'), 2, 5, clock),
+            batcher)
+        self.assertIsNot(
+            get_server_creation_batcher('http://url2/', server_config('as1'), 2, 5, clock),
+            batcher)
+        self.assertIsNot(
+            get_server_creation_batcher(
+                'http://url/', dict(server_config('as1'), flavorRef='2'), 2, 5, clock),
+            batcher)
+        self.assertEqual((batcher.server_endpoint, batcher.window, batcher.size),
+                         ('http://url/', 2, 5))
+
+    def test_forgotten_when_started(self):
+        """
+        A batcher is forgotten once it starts creating servers
+        """
+        batcher = get_server_creation_batcher('http://url/', server_config('as1'),
+                                              2, 5, Clock())
+        batcher.on_idle()
+        self.assertEqual(create_batcher._batchers, {})
@@ -7,7 +7,9 @@ import json
 from twisted.trial.unittest import TestCase
 from twisted.internet.defer import Deferred, fail, succeed
 from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 
+from otter.auth import ServiceCatalog
 from otter.worker.launch_server_v1 import (
     private_ip_addresses,
     endpoints,
@@ -17,16 +19,20 @@ from otter.worker.launch_server_v1 import (
     wait_for_active,
     create_server,
     launch_server,
+    build_server,
     prepare_launch_config,
     delete_server,
     remove_from_load_balancer,
     public_endpoint_url,
     UnexpectedServerStatus,
-    verified_delete
+    verified_delete,
+    polling_stats
 )
 
 
+from otter.test.indexer.test_events import server_notification
 from otter.test.utils import DummyException, mock_log, patch, CheckFailure
+from otter.indexer.events import CREATED, DELETED, ServerEventListener
 from otter.util.http import APIError, RequestError, wrap_request_error
 from otter.util.config import set_config_data
 from otter.util.deferredutils import unwrap_first_error, TimedOutError
@@ -103,6 +109,27 @@ class UtilityTests(TestCase):
                                 'DFW'),
             'http://dfw.openstack/')
 
+    def test_public_endpoint_url_indexed(self):
+        """
+        public_endpoint_url looks up the publicURL of a
+        :class:`ServiceCatalog` in its index rather than searching it.
+        """
+        catalog = ServiceCatalog(fake_service_catalog)
+        catalog.endpoint = mock.Mock(return_value={'publicURL': 'http://indexed/'})
+        self.assertEqual(
+            public_endpoint_url(catalog, 'cloudServersOpenStack', 'DFW'),
+            'http://indexed/')
+        catalog.endpoint.assert_called_once_with('cloudServersOpenStack', 'DFW')
+
+    def test_public_endpoint_url_indexed_missing(self):
+        """
+        public_endpoint_url fails as it does for a list if a
+        :class:`ServiceCatalog` has no endpoint for the service in the region.
+        """
+        self.assertRaises(IndexError, public_endpoint_url,
+                          ServiceCatalog(fake_service_catalog),
+                          'cloudLoadBalancers', 'ORD')
+
 
 expected_headers = {
     'content-type': ['application/json'],
@@ -165,6 +192,30 @@ class LoadBalancersTests(TestCase):
 
         self.treq.json_content.assert_called_once_with(response)
 
+    def test_add_to_load_balancer_batched(self):
+        """
+        If ``worker.lb_batch_window`` is configured, add_to_load_balancer adds
+        the node with the load balancer's batcher, and pushes the removal of
+        the node it added onto the undo stack
+        """
+        set_config_data({'worker': {'lb_batch_window': 2}})
+        self.addCleanup(set_config_data, {})
+        batcher = mock.Mock(spec=['add_node'])
+        batcher.add_node.return_value = succeed({'nodes': [{'id': 1}]})
+        get_node_batcher = patch(self, 'otter.worker.launch_server_v1.get_node_batcher',
+                                 return_value=batcher)
+
+        d = add_to_load_balancer('http://url/', 'my-auth-token',
+                                 {'loadBalancerId': 12345, 'port': 80},
+                                 '192.168.1.1', self.undo)
+
+        self.assertEqual(self.successResultOf(d), {'nodes': [{'id': 1}]})
+        get_node_batcher.assert_called_once_with('http://url/', 12345, 2)
+        batcher.add_node.assert_called_once_with('my-auth-token', '192.168.1.1', 80)
+        self.assertFalse(self.treq.post.called)
+        self.undo.push.assert_called_once_with(
+            remove_from_load_balancer, 'http://url/', 'my-auth-token', 12345, 1)
+
     def test_add_to_load_balancer_propagates_api_failure(self):
         """
         add_to_load_balancer will propagate API failures.
@@ -268,55 +319,77 @@ class LoadBalancersTests(TestCase):
 
         results = self.successResultOf(d)
 
-        self.assertEqual(sorted(results), [(12345, (12345, 80)),
-                                           (54321, (54321, 81))])
+        self.assertEqual(results, [(12345, (12345, 80)),
+                                   (54321, (54321, 81))])
 
     @mock.patch('otter.worker.launch_server_v1.add_to_load_balancer')
-    def test_add_to_load_balancers_is_serial(self, add_to_load_balancer):
+    def test_add_to_load_balancers_is_parallel(self, add_to_load_balancer):
         """
-        add_to_load_balancers calls add_to_load_balancer in series.
+        add_to_load_balancers calls add_to_load_balancer for up to
+        ``concurrency`` load balancers at once, starting the next one as soon
+        as one is done.
         """
-        d1 = Deferred()
-        d2 = Deferred()
+        deferreds = [Deferred() for _ in range(3)]
+        add_to_load_balancer.side_effect = lambda *args: deferreds.pop(0)
+        lb_configs = [{'loadBalancerId': lb_id, 'port': 80}
+                      for lb_id in (1, 2, 3)]
+        pending = deferreds[:]
 
-        add_to_load_balancer_deferreds = [d1, d2]
+        d = add_to_load_balancers('http://url/', 'my-auth-token', lb_configs,
+                                  '192.168.1.1', self.undo, concurrency=2)
 
-        def _add_to_load_balancer(*args):
-            return add_to_load_balancer_deferreds.pop(0)
+        self.assertNoResult(d)
+        self.assertEqual(add_to_load_balancer.mock_calls, [
+            mock.call('http://url/', 'my-auth-token', lb_config, '192.168.1.1',
+                      self.undo)
+            for lb_config in lb_configs[:2]])
 
-        add_to_load_balancer.side_effect = _add_to_load_balancer
+        pending[1].callback('r2')
+        add_to_load_balancer.assert_called_with(
+            'http://url/', 'my-auth-token', lb_configs[2], '192.168.1.1', self.undo)
 
-        d = add_to_load_balancers('http://url/', 'my-auth-token',
-                                  [{'loadBalancerId': 12345,
-                                    'port': 80},
-                                   {'loadBalancerId': 54321,
-                                    'port': 81}],
-                                  '192.168.1.1',
-                                  self.undo)
+        pending[2].callback('r3')
+        pending[0].callback('r1')
+        self.assertEqual(self.successResultOf(d), [(1, 'r1'), (2, 'r2'), (3, 'r3')])
 
-        self.assertNoResult(d)
+    @mock.patch('otter.worker.launch_server_v1.add_to_load_balancer')
+    def test_add_to_load_balancers_configured_concurrency(self, add_to_load_balancer):
+        """
+        If no concurrency is given, the configured ``worker.lb_concurrency``
+        is used
+        """
+        set_config_data({'worker': {'lb_concurrency': 1}})
+        self.addCleanup(set_config_data, {})
+        add_to_load_balancer.return_value = Deferred()
 
-        add_to_load_balancer.assert_called_once_with(
-            'http://url/',
-            'my-auth-token',
-            {'loadBalancerId': 12345, 'port': 80},
-            '192.168.1.1',
-            self.undo
-        )
+        d = add_to_load_balancers('http://url/', 'my-auth-token',
+                                  [{'loadBalancerId': 1, 'port': 80},
+                                   {'loadBalancerId': 2, 'port': 80}],
+                                  '192.168.1.1', self.undo)
+        self.assertNoResult(d)
+        self.assertEqual(add_to_load_balancer.call_count, 1)
 
-        d1.callback(None)
+    @mock.patch('otter.worker.launch_server_v1.add_to_load_balancer')
+    def test_add_to_load_balancers_waits_for_all_on_failure(self, add_to_load_balancer):
+        """
+        If adding to a load balancer fails, add_to_load_balancers fails with
+        that failure, but only once all the other adds are done, so that their
+        undo operations have been pushed.
+        """
+        d1 = Deferred()
+        d2 = Deferred()
+        deferreds = [d1, d2]
+        add_to_load_balancer.side_effect = lambda *args: deferreds.pop(0)
 
-        add_to_load_balancer.assert_called_with(
-            'http://url/',
-            'my-auth-token',
-            {'loadBalancerId': 54321, 'port': 81},
-            '192.168.1.1',
-            self.undo
-        )
+        d = add_to_load_balancers('http://url/', 'my-auth-token',
+                                  [{'loadBalancerId': 12345, 'port': 80},
+                                   {'loadBalancerId': 54321, 'port': 81}],
+                                  '192.168.1.1', self.undo)
 
+        d1.errback(DummyException('failed'))
+        self.assertNoResult(d)
         d2.callback(None)
-
-        self.successResultOf(d)
+        self.failureResultOf(d, DummyException)
 
     def test_add_to_load_balancers_no_lb_configs(self):
         """
@@ -591,6 +664,176 @@ class ServerTests(TestCase):
 
         self.assertEqual(result['server']['status'], server_status[0])
 
+    def test_wait_for_active_batched(self):
+        """
+        If ``worker.batch_server_polling`` is configured, wait_for_active waits
+        on the endpoint's status poller, polling again while the server has not
+        changed or is still building, until it is active, and then tells the
+        poller to forget the server
+        """
+        set_config_data(dict(fake_config, worker={'batch_server_polling': True}))
+        clock = Clock()
+        poller = mock.Mock(spec=['server_details', 'forget'])
+        get_poller = patch(self, 'otter.worker.launch_server_v1.get_server_status_poller',
+                           return_value=poller)
+        poller.server_details.side_effect = [
+            succeed(None), succeed({'server': {'status': 'BUILD'}}),
+            succeed({'server': {'status': 'ACTIVE'}})]
+
+        d = wait_for_active(self.log, 'http://url/', 'my-auth-token', 'serverId',
+                            clock=clock)
+        get_poller.assert_called_once_with('http://url/', 5, clock)
+        poller.server_details.assert_called_once_with('my-auth-token', 'serverId')
+        self.assertNoResult(d)
+
+        clock.advance(5)
+        self.assertNoResult(d)
+        self.assertFalse(poller.forget.called)
+        clock.advance(5)
+        self.assertEqual(self.successResultOf(d), {'server': {'status': 'ACTIVE'}})
+        self.assertEqual(poller.server_details.call_count, 3)
+        poller.forget.assert_called_once_with('serverId')
+
+    def test_wait_for_active_batched_errors(self):
+        """
+        If ``worker.batch_server_polling`` is configured and the poller sees
+        the server in an unexpected state, wait_for_active errbacks, and tells
+        the poller to forget the server
+        """
+        set_config_data(dict(fake_config, worker={'batch_server_polling': True}))
+        poller = mock.Mock(spec=['server_details', 'forget'])
+        patch(self, 'otter.worker.launch_server_v1.get_server_status_poller',
+              return_value=poller)
+        poller.server_details.return_value = succeed({'server': {'status': 'ERROR'}})
+
+        d = wait_for_active(self.log, 'http://url/', 'my-auth-token', 'serverId',
+                            clock=Clock())
+        failure = self.failureResultOf(d, UnexpectedServerStatus)
+        self.assertEqual(failure.value.status, 'ERROR')
+        poller.forget.assert_called_once_with('serverId')
+
+    @mock.patch('otter.worker.launch_server_v1.server_details')
+    def test_wait_for_active_on_notification(self, server_details):
+        """
+        If notification feeds are being polled, wait_for_active checks the
+        server's status as soon as Nova says it has been created, and polls
+        only every ``worker.event_fallback_interval`` seconds until then
+        """
+        set_config_data(dict(fake_config, worker={'event_fallback_interval': 30}))
+        listener = ServerEventListener()
+        patch(self, 'otter.worker.launch_server_v1.get_server_event_listener',
+              return_value=listener)
+        clock = Clock()
+        server_details.return_value = succeed({'server': {'status': 'BUILD'}})
+
+        d = wait_for_active(self.log, 'http://url/', 'my-auth-token', 'serverId',
+                            clock=clock)
+        clock.advance(29)
+        self.assertEqual(server_details.call_count, 1)
+        clock.advance(1)
+        self.assertEqual(server_details.call_count, 2)
+
+        server_details.return_value = succeed({'server': {'status': 'ACTIVE'}})
+        clock.advance(10)
+        listener(server_notification(CREATED, 'serverId'))
+        self.assertEqual(self.successResultOf(d), {'server': {'status': 'ACTIVE'}})
+        self.assertEqual(server_details.call_count, 3)
+
+        # polling has stopped
+        clock.advance(60)
+        self.assertEqual(server_details.call_count, 3)
+
+    @mock.patch('otter.worker.launch_server_v1.server_details')
+    def test_wait_for_active_keeps_polling_if_not_active(self, server_details):
+        """
+        If the server is not active after all when Nova says it has been
+        created, wait_for_active carries on polling
+        """
+        listener = ServerEventListener()
+        patch(self, 'otter.worker.launch_server_v1.get_server_event_listener',
+              return_value=listener)
+        clock = Clock()
+        server_details.return_value = succeed({'server': {'status': 'BUILD'}})
+
+        d = wait_for_active(self.log, 'http://url/', 'my-auth-token', 'serverId',
+                            clock=clock)
+        listener(server_notification(CREATED, 'serverId'))
+        self.assertNoResult(d)
+        self.assertEqual(server_details.call_count, 2)
+
+        server_details.return_value = succeed({'server': {'status': 'ACTIVE'}})
+        clock.advance(60)
+        self.assertEqual(self.successResultOf(d), {'server': {'status': 'ACTIVE'}})
+
+    @mock.patch('otter.worker.launch_server_v1.server_details')
+    def test_wait_for_active_backs_off(self, server_details):
+        """
+        If ``worker.polling.build.max_interval`` is configured, wait_for_active
+        backs off with jitter between polls, and counts how many polls the
+        build took once it is active
+        """
+        set_config_data(dict(fake_config, worker={
+            'polling': {'build': {'min_interval': 2, 'max_interval': 10}}}))
+        patch(self, 'otter.worker.launch_server_v1._poll_counts',
+              new={'build': {'jobs': 0, 'polls': 0}, 'delete': {'jobs': 0, 'polls': 0}})
+        patch(self, 'otter.util.retry.random.uniform', side_effect=lambda low, high: high)
+        clock = Clock()
+        server_details.return_value = succeed({'server': {'status': 'BUILD'}})
+
+        d = wait_for_active(self.log, 'http://url/', 'my-auth-token', 'serverId',
+                            clock=clock)
+        calls = []
+        for i in range(4):
+            calls.append(server_details.call_count)
+            clock.advance(1)
+        clock.advance(5)
+        calls.append(server_details.call_count)
+        # polls at 0, 6 and 16 seconds
+        self.assertEqual(calls, [1, 1, 1, 1, 2])
+
+        server_details.return_value = succeed({'server': {'status': 'ACTIVE'}})
+        clock.advance(10)
+        self.successResultOf(d)
+        self.assertEqual(polling_stats(), {'build.jobs': 1, 'build.polls': 3,
+                                           'delete.jobs': 0, 'delete.polls': 0})
+
+    def test_wait_for_active_batched_backs_off_past_margin(self):
+        """
+        If batched polling backs off for longer than the status poller's
+        changes-since margin, a server that became active long before the next
+        poll is still seen as active by it
+        """
+        set_config_data(dict(fake_config, worker={
+            'batch_server_polling': True,
+            'polling': {'build': {'min_interval': 2, 'max_interval': 300}}}))
+        patch(self, 'otter.worker.status_poller._pollers', new={})
+        patch(self, 'otter.util.retry.random.uniform', side_effect=lambda low, high: high)
+        poller_treq = patch(self, 'otter.worker.status_poller.treq')
+        poller_treq.json_content.side_effect = lambda response: succeed(response.body)
+        clock = Clock()
+        clock.advance(3600)
+        # the server becomes active 100 seconds after it started building
+        active_since = '1970-01-01T01:01:40Z'
+
+        def list_changed(path, headers, params):
+            servers = []
+            if params['changes-since'] <= active_since and clock.seconds() >= 3700:
+                servers = [{'id': 'serverId', 'status': 'ACTIVE'}]
+            return succeed(mock.Mock(code=200, body={'servers': servers}))
+
+        poller_treq.get.side_effect = list_changed
+
+        d = wait_for_active(self.log, 'http://url/', 'my-auth-token', 'serverId',
+                            clock=clock)
+        # polls at about 0, 6, 24, 78 and then 240 seconds
+        clock.pump([1] * 200)
+        self.assertNoResult(d)
+        self.assertEqual(poller_treq.get.call_count, 4)
+        clock.pump([1] * 50)
+        self.assertEqual(self.successResultOf(d),
+                         {'server': {'id': 'serverId', 'status': 'ACTIVE'}})
+        self.assertEqual(poller_treq.get.call_count, 5)
+
     @mock.patch('otter.worker.launch_server_v1.server_details')
     def test_wait_for_active_errors(self, server_details):
         """
@@ -783,6 +1026,194 @@ class ServerTests(TestCase):
             'http://dfw.lbaas/', 'my-auth-token', prepared_load_balancers,
             '10.0.0.1', self.undo)
 
+    @mock.patch('otter.worker.launch_server_v1.add_to_load_balancers')
+    @mock.patch('otter.worker.launch_server_v1.create_server')
+    @mock.patch('otter.worker.launch_server_v1.wait_for_active')
+    def test_launch_server_batched(self, wait_for_active, create_server,
+                                   add_to_load_balancers):
+        """
+        If ``worker.create_batch_window`` is configured, launch_server creates
+        the server with the batcher for its launch config, and adds it to load
+        balancers by the name Nova gave it
+        """
+        set_config_data(dict(fake_config, worker={'create_batch_window': 2,
+                                                  'create_batch_size': 5}))
+        get_server_creation_batcher = patch(
+            self, 'otter.worker.launch_server_v1.get_server_creation_batcher')
+        batcher = get_server_creation_batcher.return_value
+
+        launch_config = {'server': {'imageRef': '1', 'flavorRef': '1'},
+                         'loadBalancers': [{'loadBalancerId': 12345, 'port': 80}]}
+        expected_server_config = {
+            'imageRef': '1', 'flavorRef': '1', 'name': 'as000000',
+            'metadata': {
+                'rax:auto_scaling_group_id': '1111111-11111-11111-11111111'}}
+        server_details = {
+            'server': {
+                'id': '1',
+                'name': 'as000000-2',
+                'addresses': {'private': [
+                    {'version': 4, 'addr': '10.0.0.1'}]}}}
+
+        batcher.create_server.return_value = succeed(server_details)
+        wait_for_active.return_value = succeed(server_details)
+        add_to_load_balancers.return_value = succeed([(12345, ('10.0.0.1', 80))])
+
+        d = launch_server(self.log, 'DFW', self.scaling_group,
+                          fake_service_catalog, 'my-auth-token',
+                          launch_config, self.undo)
+
+        self.successResultOf(d)
+        self.assertFalse(create_server.called)
+        get_server_creation_batcher.assert_called_once_with(
+            'http://dfw.openstack/', expected_server_config, 2, 5)
+        batcher.create_server.assert_called_once_with(
+            'my-auth-token', expected_server_config)
+        add_to_load_balancers.assert_called_once_with(
+            'http://dfw.lbaas/', 'my-auth-token',
+            [{'loadBalancerId': 12345, 'port': 80,
+              'metadata': {'rax:auto_scaling_server_name': 'as000000-2',
+                           'rax:auto_scaling_group_id': self.scaling_group_uuid}}],
+            '10.0.0.1', self.undo)
+
+    @mock.patch('otter.worker.launch_server_v1.add_to_load_balancers')
+    @mock.patch('otter.worker.launch_server_v1.create_server')
+    @mock.patch('otter.worker.launch_server_v1.wait_for_active')
+    def test_launch_server_warm(self, wait_for_active, create_server,
+                                add_to_load_balancers):
+        """
+        launch_server given a warm server adds it to the load balancers by its
+        name without creating another, and pushes its deletion onto undo
+        """
+        launch_config = {'server': {'imageRef': '1', 'flavorRef': '1'},
+                         'loadBalancers': [{'loadBalancerId': 12345, 'port': 80}]}
+        warm_server = {
+            'server': {
+                'id': '1',
+                'name': 'as111111',
+                'addresses': {'private': [
+                    {'version': 4, 'addr': '10.0.0.1'}]}}}
+        add_to_load_balancers.return_value = succeed([(12345, ('10.0.0.1', 80))])
+        server_details = patch(self, 'otter.worker.launch_server_v1.server_details',
+                               return_value=succeed(warm_server))
+        warm_server['server']['status'] = 'ACTIVE'
+
+        d = launch_server(self.log, 'DFW', self.scaling_group,
+                          fake_service_catalog, 'my-auth-token',
+                          launch_config, self.undo, warm_server=warm_server)
+
+        self.assertEqual(self.successResultOf(d),
+                         (warm_server, [(12345, ('10.0.0.1', 80))]))
+        server_details.assert_called_once_with(
+            'http://dfw.openstack/', 'my-auth-token', '1')
+        self.assertFalse(create_server.called)
+        self.assertFalse(wait_for_active.called)
+        self.undo.push.assert_called_once_with(
+            verified_delete, mock.ANY, 'http://dfw.openstack/', 'my-auth-token', '1')
+        add_to_load_balancers.assert_called_once_with(
+            'http://dfw.lbaas/', 'my-auth-token',
+            [{'loadBalancerId': 12345, 'port': 80,
+              'metadata': {'rax:auto_scaling_server_name': 'as111111',
+                           'rax:auto_scaling_group_id': self.scaling_group_uuid}}],
+            '10.0.0.1', self.undo)
+
+    def _launch_warm_server_replaced(self, server_details_result):
+        """
+        Launch a server given a warm server whose details are
+        ``server_details_result``, and check that a new server is created and
+        added to the load balancers instead.
+
+        :return: the mock ``verified_delete``
+        """
+        launch_config = {'server': {'imageRef': '1', 'flavorRef': '1'},
+                         'loadBalancers': [{'loadBalancerId': 12345, 'port': 80}]}
+        warm_server = {'server': {'id': '1', 'name': 'as111111'}}
+        new_server = {'server': {'id': '2', 'addresses': {'private': [
+            {'version': 4, 'addr': '10.0.0.2'}]}}}
+        patch(self, 'otter.worker.launch_server_v1.server_details',
+              return_value=server_details_result)
+        verified_delete = patch(self, 'otter.worker.launch_server_v1.verified_delete',
+                                return_value=succeed(None))
+        create_server = patch(self, 'otter.worker.launch_server_v1.create_server',
+                              return_value=succeed(new_server))
+        patch(self, 'otter.worker.launch_server_v1.wait_for_active',
+              return_value=succeed(new_server))
+        add_to_load_balancers = patch(
+            self, 'otter.worker.launch_server_v1.add_to_load_balancers',
+            return_value=succeed([]))
+
+        d = launch_server(self.log, 'DFW', self.scaling_group,
+                          fake_service_catalog, 'my-auth-token',
+                          launch_config, self.undo, warm_server=warm_server)
+
+        self.assertEqual(self.successResultOf(d), (new_server, []))
+        create_server.assert_called_once_with(
+            'http://dfw.openstack/', 'my-auth-token', mock.ANY)
+        add_to_load_balancers.assert_called_once_with(
+            'http://dfw.lbaas/', 'my-auth-token', mock.ANY, '10.0.0.2', self.undo)
+        self.undo.push.assert_called_once_with(
+            verified_delete, mock.ANY, 'http://dfw.openstack/', 'my-auth-token', '2')
+        return verified_delete
+
+    def test_launch_server_warm_not_active(self):
+        """
+        launch_server given a warm server that is no longer active deletes it
+        and creates another server instead
+        """
+        verified_delete = self._launch_warm_server_replaced(
+            succeed({'server': {'id': '1', 'status': 'ERROR'}}))
+        verified_delete.assert_called_once_with(
+            mock.ANY, 'http://dfw.openstack/', 'my-auth-token', '1')
+
+    def test_launch_server_warm_deleted(self):
+        """
+        launch_server given a warm server that no longer exists creates
+        another server instead
+        """
+        verified_delete = self._launch_warm_server_replaced(fail(RequestError(
+            Failure(APIError(404, '')), 'http://dfw.openstack/servers/1')))
+        self.assertFalse(verified_delete.called)
+
+    def test_launch_server_warm_unknown(self):
+        """
+        launch_server given a warm server whose details can not be fetched
+        deletes it and creates another server instead
+        """
+        verified_delete = self._launch_warm_server_replaced(fail(RequestError(
+            Failure(APIError(500, '')), 'http://dfw.openstack/servers/1')))
+        verified_delete.assert_called_once_with(
+            mock.ANY, 'http://dfw.openstack/', 'my-auth-token', '1')
+
+    @mock.patch('otter.worker.launch_server_v1.add_to_load_balancers')
+    @mock.patch('otter.worker.launch_server_v1.create_server')
+    @mock.patch('otter.worker.launch_server_v1.wait_for_active')
+    def test_build_server(self, wait_for_active, create_server,
+                          add_to_load_balancers):
+        """
+        build_server creates a server and waits until it is active, without
+        adding it to any load balancers
+        """
+        launch_config = {'server': {'imageRef': '1', 'flavorRef': '1'},
+                         'loadBalancers': [{'loadBalancerId': 12345, 'port': 80}]}
+        server_details = {'server': {'id': '1'}}
+        create_server.return_value = succeed(server_details)
+        wait_for_active.return_value = succeed(server_details)
+
+        d = build_server(self.log, 'DFW', self.scaling_group,
+                         fake_service_catalog, 'my-auth-token',
+                         launch_config, self.undo)
+
+        self.assertEqual(self.successResultOf(d), server_details)
+        create_server.assert_called_once_with(
+            'http://dfw.openstack/', 'my-auth-token',
+            {'imageRef': '1', 'flavorRef': '1', 'name': 'as000000',
+             'metadata': {'rax:auto_scaling_group_id': self.scaling_group_uuid}})
+        wait_for_active.assert_called_once_with(
+            mock.ANY, 'http://dfw.openstack/', 'my-auth-token', '1')
+        self.undo.push.assert_called_once_with(
+            verified_delete, mock.ANY, 'http://dfw.openstack/', 'my-auth-token', '1')
+        self.assertFalse(add_to_load_balancers.called)
+
     @mock.patch('otter.worker.launch_server_v1.add_to_load_balancers')
     @mock.patch('otter.worker.launch_server_v1.create_server')
     @mock.patch('otter.worker.launch_server_v1.wait_for_active')
@@ -1128,6 +1559,33 @@ class DeleteServerTests(TestCase):
 
         self.assertEqual(remove_from_load_balancer.call_count, 2)
 
+    @mock.patch('otter.worker.launch_server_v1.remove_from_load_balancer')
+    def test_delete_server_batches_node_removal(self, remove_from_load_balancer):
+        """
+        If ``worker.lb_batch_window`` is configured, delete_server removes the
+        nodes with the load balancers' removal batchers
+        """
+        set_config_data(dict(fake_config, worker={'lb_batch_window': 2}))
+        batchers = {12345: mock.Mock(spec=['remove_node']),
+                    54321: mock.Mock(spec=['remove_node'])}
+        for batcher in batchers.values():
+            batcher.remove_node.return_value = succeed(None)
+        get_batcher = patch(
+            self, 'otter.worker.launch_server_v1.get_node_removal_batcher',
+            side_effect=lambda endpoint, lb_id, window: batchers[lb_id])
+        patch(self, 'otter.worker.launch_server_v1.verified_delete',
+              return_value=succeed(None))
+
+        d = delete_server(self.log, 'DFW', fake_service_catalog, 'my-auth-token',
+                          instance_details)
+        self.successResultOf(d)
+
+        get_batcher.assert_has_calls([mock.call('http://dfw.lbaas/', 12345, 2),
+                                      mock.call('http://dfw.lbaas/', 54321, 2)])
+        batchers[12345].remove_node.assert_called_once_with('my-auth-token', 1)
+        batchers[54321].remove_node.assert_called_once_with('my-auth-token', 2)
+        self.assertFalse(remove_from_load_balancer.called)
+
     @mock.patch('otter.worker.launch_server_v1.remove_from_load_balancer')
     def test_delete_server(self, remove_from_load_balancer):
         """
@@ -1268,6 +1726,95 @@ class DeleteServerTests(TestCase):
         clock.advance(5)
         self.assertEqual(self.treq.head.call_count, 2)
 
+    def test_verified_delete_batched(self):
+        """
+        If ``worker.batch_server_polling`` is configured, verified_delete waits
+        on the endpoint's status poller until it sees the server as 'DELETED',
+        and then tells the poller to forget the server
+        """
+        set_config_data(dict(fake_config, worker={'batch_server_polling': True}))
+        clock = Clock()
+        self.treq.delete.return_value = succeed(
+            mock.Mock(spec=['code'], code=204))
+        poller = mock.Mock(spec=['server_details', 'forget'])
+        get_poller = patch(self, 'otter.worker.launch_server_v1.get_server_status_poller',
+                           return_value=poller)
+        poller.server_details.side_effect = [
+            succeed(None), succeed({'server': {'status': 'ACTIVE'}}),
+            succeed({'server': {'status': 'DELETED'}})]
+
+        d = verified_delete(self.log, 'http://url/', 'my-auth-token',
+                            'serverId', interval=5, clock=clock)
+        self.assertIsNone(self.successResultOf(d))
+        get_poller.assert_called_once_with('http://url/', 5, clock)
+        poller.server_details.assert_called_once_with('my-auth-token', 'serverId')
+
+        clock.pump([5, 5])
+        self.assertEqual(poller.server_details.call_count, 3)
+        poller.forget.assert_called_once_with('serverId')
+        self.assertFalse(self.treq.head.called)
+        self.log.msg.assert_called_with('Server deleted successfully: {time_delete} seconds.',
+                                        instance_id='serverId', time_delete=10)
+
+        # the loop has stopped
+        clock.advance(5)
+        self.assertEqual(poller.server_details.call_count, 3)
+
+    def test_verified_delete_on_notification(self):
+        """
+        If notification feeds are being polled, verified_delete verifies the
+        delete as soon as Nova says it has been deleted
+        """
+        listener = ServerEventListener()
+        patch(self, 'otter.worker.launch_server_v1.get_server_event_listener',
+              return_value=listener)
+        clock = Clock()
+        self.treq.delete.return_value = succeed(
+            mock.Mock(spec=['code'], code=204))
+        self.treq.head.return_value = succeed(mock.Mock(spec=['code'], code=204))
+        self.treq.content.side_effect = lambda *args: succeed("")
+
+        verified_delete(self.log, 'http://url/', 'my-auth-token',
+                        'serverId', clock=clock)
+        clock.advance(3)
+        listener(server_notification(DELETED, 'serverId'))
+        self.log.msg.assert_called_with('Server deleted successfully: {time_delete} seconds.',
+                                        instance_id='serverId', time_delete=3)
+
+        # polling has stopped
+        clock.advance(60)
+        self.assertEqual(self.treq.head.call_count, 1)
+
+    def test_verified_delete_backs_off(self):
+        """
+        If ``worker.polling.delete.max_interval`` is configured,
+        verified_delete backs off between verifications, and counts how many
+        verifications the delete took
+        """
+        set_config_data(dict(fake_config, worker={
+            'polling': {'delete': {'max_interval': 60}}}))
+        patch(self, 'otter.worker.launch_server_v1._poll_counts',
+              new={'build': {'jobs': 0, 'polls': 0}, 'delete': {'jobs': 0, 'polls': 0}})
+        patch(self, 'otter.util.retry.random.uniform', side_effect=lambda low, high: high)
+        clock = Clock()
+        self.treq.delete.return_value = succeed(
+            mock.Mock(spec=['code'], code=204))
+        self.treq.content.side_effect = lambda *args: succeed("")
+        self.treq.head.return_value = succeed(mock.Mock(spec=['code'], code=204))
+
+        verified_delete(self.log, 'http://url/', 'my-auth-token',
+                        'serverId', interval=5, clock=clock)
+        clock.advance(14)
+        self.assertEqual(self.treq.head.call_count, 1)
+        clock.advance(1)
+        self.assertEqual(self.treq.head.call_count, 2)
+
+        self.treq.head.return_value = succeed(mock.Mock(spec=['code'], code=404))
+        clock.advance(45)
+        self.assertEqual(self.treq.head.call_count, 3)
+        self.assertEqual(polling_stats()['delete.jobs'], 1)
+        self.assertEqual(polling_stats()['delete.polls'], 3)
+
     def test_verified_delete_retries_verification_until_timeout(self):
         """
         If the verification fails until the timeout, log a failure and do not
@@ -0,0 +1,385 @@
+"""
+Tests for :mod:`otter.worker.lb_batcher`
+"""
+import json
+
+import mock
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+from twisted.trial.unittest import TestCase
+
+from otter.test.utils import patch
+from otter.util.deferredutils import TimedOutError
+from otter.util.http import APIError, RequestError
+from otter.worker import lb_batcher
+from otter.worker.lb_batcher import (
+    NodeBatcher, NodeNotAdded, NodeRemovalBatcher, get_node_batcher,
+    get_node_removal_batcher)
+
+
+expected_headers = {
+    'content-type': ['application/json'],
+    'accept': ['application/json'],
+    'x-auth-token': ['my-auth-token']
+}
+
+
+IMMUTABLE = json.dumps({
+    'message': "Load Balancer '12345' has a status of 'PENDING_UPDATE' and is "
+               "considered immutable.",
+    'code': 422})
+
+
+def node(address, port, node_id):
+    """
+    A node as returned by the load balancer
+    """
+    return {'id': node_id, 'address': address, 'port': port,
+            'condition': 'ENABLED', 'type': 'PRIMARY'}
+
+
+class NodeBatcherTests(TestCase):
+    """
+    Tests for :class:`NodeBatcher`
+    """
+    def setUp(self):
+        """
+        A batcher with a 2 second window
+        """
+        self.treq = patch(self, 'otter.worker.lb_batcher.treq')
+        patch(self, 'otter.util.http.treq', new=self.treq)
+        self.responses = []
+        self.treq.post.side_effect = lambda *args, **kwargs: self.responses.pop(0)
+        self.treq.json_content.side_effect = lambda response: succeed(response.body)
+        self.treq.content.side_effect = lambda response: succeed(response.body)
+        patch(self, 'otter.util.retry.random.uniform', side_effect=lambda low, high: high)
+
+        self.clock = Clock()
+        self.on_idle = mock.Mock()
+        self.batcher = NodeBatcher('http://url/', 12345, 2, self.clock, self.on_idle)
+
+    def respond(self, code, body):
+        """
+        Queue a response to adding nodes
+        """
+        self.responses.append(succeed(mock.Mock(code=code, body=body, headers=None)))
+
+    def posted_nodes(self, call=-1):
+        """
+        The nodes posted in a request
+        """
+        return json.loads(self.treq.post.mock_calls[call][2]['data'])['nodes']
+
+    def test_adds_nodes_in_window_together(self):
+        """
+        Nodes added within the window are added with one request, and each
+        caller gets the response for its own node
+        """
+        self.respond(202, {'nodes': [node('10.0.0.1', 80, 1), node('10.0.0.2', 80, 2)]})
+        d1 = self.batcher.add_node('my-auth-token', '10.0.0.2', 80)
+        self.clock.advance(1)
+        d2 = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        d3 = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        self.clock.advance(0.9)
+        self.assertFalse(self.treq.post.called)
+
+        self.clock.advance(0.1)
+        self.treq.post.assert_called_once_with(
+            'http://url/loadbalancers/12345/nodes', headers=expected_headers,
+            data=mock.ANY)
+        self.assertEqual(self.posted_nodes(), [
+            {'address': '10.0.0.1', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'},
+            {'address': '10.0.0.2', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'}])
+        self.assertEqual(self.successResultOf(d1), {'nodes': [node('10.0.0.2', 80, 2)]})
+        self.assertEqual(self.successResultOf(d2), {'nodes': [node('10.0.0.1', 80, 1)]})
+        self.assertEqual(self.successResultOf(d3), {'nodes': [node('10.0.0.1', 80, 1)]})
+        self.on_idle.assert_called_once_with()
+
+    def test_nodes_added_while_sending_go_in_next_batch(self):
+        """
+        Nodes added while a batch is being sent are added with the next batch,
+        a window after the previous one is done
+        """
+        response = Deferred()
+        self.responses.append(response)
+        self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        self.clock.advance(2)
+        d = self.batcher.add_node('my-auth-token', '10.0.0.2', 80)
+        self.clock.advance(5)
+        self.assertEqual(self.treq.post.call_count, 1)
+
+        self.respond(202, {'nodes': [node('10.0.0.2', 80, 2)]})
+        response.callback(mock.Mock(code=202, body={'nodes': [node('10.0.0.1', 80, 1)]}))
+        self.assertNoResult(d)
+        self.clock.advance(2)
+        self.assertEqual(self.posted_nodes(), [
+            {'address': '10.0.0.2', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'}])
+        self.assertEqual(self.successResultOf(d), {'nodes': [node('10.0.0.2', 80, 2)]})
+
+    def test_retries_while_immutable(self):
+        """
+        A batch is retried, backing off, while the load balancer is immutable
+        """
+        self.respond(422, IMMUTABLE)
+        self.respond(422, IMMUTABLE)
+        self.respond(202, {'nodes': [node('10.0.0.1', 80, 1)]})
+        d = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        self.clock.advance(2)
+        self.clock.advance(3)
+        self.assertEqual(self.treq.post.call_count, 2)
+        self.assertNoResult(d)
+        self.clock.advance(9)
+        self.assertEqual(self.treq.post.call_count, 3)
+        self.assertEqual(self.successResultOf(d), {'nodes': [node('10.0.0.1', 80, 1)]})
+
+    def test_gives_up_retrying(self):
+        """
+        A batch that is still not added after the timeout fails
+        """
+        self.batcher.timeout = 10
+        self.treq.post.side_effect = lambda *args, **kwargs: succeed(
+            mock.Mock(code=422, body=IMMUTABLE, headers=None))
+        d = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        self.clock.pump([2] + [1] * 10)
+        self.failureResultOf(d, TimedOutError)
+
+    def test_failure_fails_all(self):
+        """
+        If adding a batch fails with something other than the load balancer
+        being immutable or a client error, all the nodes in the batch fail
+        """
+        self.respond(500, 'bad')
+        d1 = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        d2 = self.batcher.add_node('my-auth-token', '10.0.0.2', 80)
+        self.clock.advance(2)
+        for d in (d1, d2):
+            failure = self.failureResultOf(d, RequestError)
+            self.assertEqual(failure.value.reason.value.code, 500)
+        self.assertEqual(self.treq.post.call_count, 1)
+        self.on_idle.assert_called_once_with()
+
+    def test_adds_one_by_one_if_batch_rejected(self):
+        """
+        If adding more than one node at once fails with a client error, each
+        node is added on its own, one after the other, and only the ones that
+        fail then fail
+        """
+        self.respond(422, 'Duplicate nodes detected')
+        self.respond(422, 'Duplicate nodes detected')
+        self.respond(202, {'nodes': [node('10.0.0.2', 80, 2)]})
+        d1 = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        d2 = self.batcher.add_node('my-auth-token', '10.0.0.2', 80)
+        self.clock.advance(2)
+        self.assertEqual([self.posted_nodes(i) for i in range(3)], [
+            [{'address': '10.0.0.1', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'},
+             {'address': '10.0.0.2', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'}],
+            [{'address': '10.0.0.1', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'}],
+            [{'address': '10.0.0.2', 'port': 80, 'condition': 'ENABLED', 'type': 'PRIMARY'}]])
+        failure = self.failureResultOf(d1, RequestError)
+        self.assertEqual(failure.value.reason.value.code, 422)
+        self.assertEqual(self.successResultOf(d2), {'nodes': [node('10.0.0.2', 80, 2)]})
+
+    def test_node_missing_from_response(self):
+        """
+        A node missing from the load balancer's response fails
+        """
+        self.respond(202, {'nodes': [node('10.0.0.1', 80, 1)]})
+        d1 = self.batcher.add_node('my-auth-token', '10.0.0.1', 80)
+        d2 = self.batcher.add_node('my-auth-token', '10.0.0.1', 8080)
+        self.clock.advance(2)
+        self.successResultOf(d1)
+        failure = self.failureResultOf(d2, NodeNotAdded)
+        self.assertEqual((failure.value.lb_id, failure.value.port), (12345, 8080))
+
+    def test_is_immutable(self):
+        """
+        Only a 422 response saying the load balancer is immutable is treated
+        as the load balancer being immutable
+        """
+        def request_failure(code, body=IMMUTABLE):
+            return Failure(RequestError(Failure(APIError(code, body)), 'url'))
+
+        self.assertTrue(lb_batcher.is_immutable(request_failure(422)))
+        self.assertTrue(lb_batcher.is_immutable(request_failure(422, 'PENDING_UPDATE')))
+        self.assertFalse(lb_batcher.is_immutable(
+            request_failure(422, 'Duplicate nodes detected')))
+        self.assertFalse(lb_batcher.is_immutable(request_failure(413)))
+        self.assertFalse(lb_batcher.is_immutable(Failure(ValueError())))
+
+    def test_is_node_error(self):
+        """
+        Client errors other than the load balancer being immutable or over
+        its rate limit may be caused by a node
+        """
+        def request_failure(code, body=''):
+            return Failure(RequestError(Failure(APIError(code, body)), 'url'))
+
+        self.assertTrue(lb_batcher.is_node_error(request_failure(400)))
+        self.assertTrue(lb_batcher.is_node_error(request_failure(422)))
+        self.assertFalse(lb_batcher.is_node_error(request_failure(422, IMMUTABLE)))
+        self.assertFalse(lb_batcher.is_node_error(request_failure(413)))
+        self.assertFalse(lb_batcher.is_node_error(request_failure(500)))
+        self.assertFalse(lb_batcher.is_node_error(Failure(ValueError())))
+
+
+class NodeRemovalBatcherTests(TestCase):
+    """
+    Tests for :class:`NodeRemovalBatcher`
+    """
+    def setUp(self):
+        """
+        A removal batcher with a 2 second window
+        """
+        self.treq = patch(self, 'otter.worker.lb_batcher.treq')
+        patch(self, 'otter.util.http.treq', new=self.treq)
+        self.responses = []
+        self.treq.delete.side_effect = lambda *args, **kwargs: self.responses.pop(0)
+        self.treq.content.side_effect = lambda response: succeed(response.body)
+        patch(self, 'otter.util.retry.random.uniform', side_effect=lambda low, high: high)
+        self.log = patch(self, 'otter.worker.lb_batcher.NodeRemovalBatcher.log')
+
+        self.clock = Clock()
+        self.on_idle = mock.Mock()
+        self.batcher = NodeRemovalBatcher('http://url/', 12345, 2, self.clock,
+                                          self.on_idle)
+
+    def respond(self, code, body='error'):
+        """
+        Queue a response to removing nodes
+        """
+        self.responses.append(succeed(mock.Mock(code=code, body=body, headers=None)))
+
+    def removed_ids(self):
+        """
+        The IDs of the nodes removed by each request
+        """
+        return [c[2]['params']['id'] for c in self.treq.delete.mock_calls]
+
+    def test_removes_nodes_in_window_together(self):
+        """
+        Nodes removed within the window are removed with one request, and the
+        batch is logged
+        """
+        self.respond(202)
+        ds = [self.batcher.remove_node('my-auth-token', node_id) for node_id in (2, 1)]
+        self.clock.advance(2)
+        self.treq.delete.assert_called_once_with(
+            'http://url/loadbalancers/12345/nodes', headers=expected_headers,
+            params={'id': ['1', '2']})
+        for d in ds:
+            self.assertIsNone(self.successResultOf(d))
+        self.log.msg.assert_called_once_with(
+            'Removed {removed} nodes from load balancer {lb_id}, {remaining} left to remove',
+            removed=2, lb_id=12345, remaining=0)
+        self.on_idle.assert_called_once_with()
+
+    def test_removes_at_most_max_nodes_at_once(self):
+        """
+        At most :data:`MAX_NODES_REMOVED` nodes are removed by each request
+        """
+        self.respond(202)
+        self.respond(202)
+        ds = [self.batcher.remove_node('my-auth-token', node_id) for node_id in range(12)]
+        self.clock.advance(2)
+        self.assertEqual(self.removed_ids(), [[str(i) for i in range(10)]])
+        self.assertNoResult(ds[10])
+        self.clock.advance(2)
+        self.assertEqual(self.removed_ids()[1], ['10', '11'])
+        self.successResultOf(ds[11])
+
+    def test_retries_while_immutable(self):
+        """
+        Removing is retried while the load balancer is immutable
+        """
+        self.respond(422, IMMUTABLE)
+        self.respond(202)
+        d = self.batcher.remove_node('my-auth-token', 1)
+        self.clock.advance(2)
+        self.assertNoResult(d)
+        self.clock.advance(3)
+        self.successResultOf(d)
+
+    def test_removes_one_by_one_if_batch_fails(self):
+        """
+        If removing more than one node at once fails, each node is removed on
+        its own, one after the other, and only the ones that fail then fail
+        """
+        self.respond(400)
+        self.respond(404)
+        self.respond(202)
+        d1 = self.batcher.remove_node('my-auth-token', 1)
+        d2 = self.batcher.remove_node('my-auth-token', 2)
+        self.clock.advance(2)
+        self.assertEqual(self.removed_ids(), [['1', '2'], ['1'], ['2']])
+        failure = self.failureResultOf(d1, RequestError)
+        self.assertEqual(failure.value.reason.value.code, 404)
+        self.successResultOf(d2)
+
+    def test_batch_fails_if_not_node_error(self):
+        """
+        If removing more than one node at once fails with an error that is not
+        caused by the nodes, they all fail without being removed on their own
+        """
+        self.respond(500)
+        d1 = self.batcher.remove_node('my-auth-token', 1)
+        d2 = self.batcher.remove_node('my-auth-token', 2)
+        self.clock.advance(2)
+        self.assertEqual(self.removed_ids(), [['1', '2']])
+        for d in (d1, d2):
+            failure = self.failureResultOf(d, RequestError)
+            self.assertEqual(failure.value.reason.value.code, 500)
+        self.on_idle.assert_called_once_with()
+
+    def test_single_node_failure(self):
+        """
+        If removing a single node fails, it fails
+        """
+        self.respond(404)
+        d = self.batcher.remove_node('my-auth-token', 1)
+        self.clock.advance(2)
+        self.failureResultOf(d, RequestError)
+        self.assertEqual(self.treq.delete.call_count, 1)
+
+
+class GetNodeBatcherTests(TestCase):
+    """
+    Tests for :func:`get_node_batcher`
+    """
+    def setUp(self):
+        """
+        No batchers to start with
+        """
+        patch(self, 'otter.worker.lb_batcher._batchers', new={})
+
+    def test_one_batcher_per_load_balancer(self):
+        """
+        The same batcher is returned for the same load balancer, and a
+        different one for a different load balancer
+        """
+        clock = Clock()
+        batcher = get_node_batcher('http://url/', 1, 2, clock)
+        self.assertIs(get_node_batcher('http://url/', 1, 2, clock), batcher)
+        self.assertIsNot(get_node_batcher('http://url/', 2, 2, clock), batcher)
+        self.assertEqual((batcher.endpoint, batcher.lb_id, batcher.window),
+                         ('http://url/', 1, 2))
+
+    def test_forgotten_when_idle(self):
+        """
+        A batcher is forgotten once it has no nodes to add
+        """
+        batcher = get_node_batcher('http://url/', 1, 2, Clock())
+        batcher.on_idle()
+        self.assertEqual(lb_batcher._batchers, {})
+
+    def test_removal_batchers_separate(self):
+        """
+        The batcher of the nodes removed from a load balancer is not the
+        batcher of the nodes added to it
+        """
+        clock = Clock()
+        batcher = get_node_removal_batcher('http://url/', 1, 2, clock)
+        self.assertIsInstance(batcher, NodeRemovalBatcher)
+        self.assertIs(get_node_removal_batcher('http://url/', 1, 2, clock), batcher)
+        self.assertIsNot(get_node_batcher('http://url/', 1, 2, clock), batcher)
@@ -0,0 +1,267 @@
+"""
+Tests for :mod:`otter.worker.status_poller`
+"""
+import mock
+
+from twisted.internet.defer import CancelledError, Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import TestCase
+
+from otter.test.utils import patch
+from otter.util.http import APIError, RequestError
+from otter.worker import status_poller
+from otter.worker.status_poller import ServerStatusPoller, get_server_status_poller
+
+
+expected_headers = {
+    'content-type': ['application/json'],
+    'accept': ['application/json'],
+    'x-auth-token': ['my-auth-token']
+}
+
+
+class ServerStatusPollerTests(TestCase):
+    """
+    Tests for :class:`ServerStatusPoller`
+    """
+    def setUp(self):
+        """
+        A poller of an endpoint, with a clock starting at 1 hour past the epoch
+        """
+        self.treq = patch(self, 'otter.worker.status_poller.treq')
+        patch(self, 'otter.util.http.treq', new=self.treq)
+        self.response = Deferred()
+        self.treq.get.side_effect = lambda *args, **kwargs: self.response
+        self.treq.json_content.side_effect = lambda response: succeed(response.body)
+
+        self.clock = Clock()
+        self.clock.advance(3600)
+        self.on_idle = mock.Mock()
+        self.poller = ServerStatusPoller('http://url/', 5, self.clock, self.on_idle)
+
+    def respond(self, *servers):
+        """
+        Respond to the poll with a list of changed servers
+        """
+        self.response.callback(mock.Mock(code=200, body={'servers': list(servers)}))
+        self.response = Deferred()
+
+    def test_polls_once_for_many_servers(self):
+        """
+        Servers waited on together are polled with one request for the servers
+        changed since a margin before the first wait, and each gets its own
+        details, or ``None`` if it has not changed
+        """
+        d1 = self.poller.server_details('my-auth-token', 's1')
+        d2 = self.poller.server_details('my-auth-token', 's2')
+        d3 = self.poller.server_details('my-auth-token', 's1')
+        self.assertFalse(self.treq.get.called)
+
+        self.clock.advance(0)
+        self.treq.get.assert_called_once_with(
+            'http://url/servers/detail', headers=expected_headers,
+            params={'changes-since': '1970-01-01T00:59:00Z'})
+
+        self.respond({'id': 's1', 'status': 'ACTIVE'}, {'id': 's9', 'status': 'BUILD'})
+        self.assertEqual(self.successResultOf(d1),
+                         {'server': {'id': 's1', 'status': 'ACTIVE'}})
+        self.assertEqual(self.successResultOf(d3),
+                         {'server': {'id': 's1', 'status': 'ACTIVE'}})
+        self.assertIsNone(self.successResultOf(d2))
+
+    def test_follows_next_links(self):
+        """
+        If the changed servers are listed on more than one page, the ``next``
+        link of each page is followed, and the servers of every page are
+        passed on
+        """
+        pages = [
+            {'servers': [{'id': 's1'}],
+             'servers_links': [{'rel': 'next', 'href': 'http://url/servers/detail?marker=s1'}]},
+            {'servers': [{'id': 's2'}], 'servers_links': []}]
+        self.treq.get.side_effect = lambda *args, **kwargs: succeed(
+            mock.Mock(code=200, body=pages.pop(0)))
+        d1 = self.poller.server_details('my-auth-token', 's1')
+        d2 = self.poller.server_details('my-auth-token', 's2')
+
+        self.clock.advance(0)
+
+        self.assertEqual(self.treq.get.mock_calls, [
+            mock.call('http://url/servers/detail', headers=expected_headers,
+                      params={'changes-since': '1970-01-01T00:59:00Z'}),
+            mock.call('http://url/servers/detail?marker=s1', headers=expected_headers,
+                      params=None)])
+        self.assertEqual(self.successResultOf(d1), {'server': {'id': 's1'}})
+        self.assertEqual(self.successResultOf(d2), {'server': {'id': 's2'}})
+
+    def test_polls_at_most_every_interval(self):
+        """
+        A server waited on during a poll is polled no sooner than the interval
+        after that poll, with the servers changed since a margin before it
+        """
+        self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(1)
+        d = self.poller.server_details('my-auth-token', 's2')
+        self.clock.advance(1)
+        self.assertEqual(self.treq.get.call_count, 1)
+        self.respond()
+        self.assertNoResult(d)
+
+        self.clock.advance(3)
+        self.assertEqual(self.treq.get.call_count, 1)
+        self.clock.advance(1)
+        self.assertEqual(self.treq.get.call_count, 2)
+        self.assertEqual(self.treq.get.call_args[1]['params'],
+                         {'changes-since': '1970-01-01T00:59:01Z'})
+        self.respond({'id': 's2', 'status': 'DELETED'})
+        self.assertEqual(self.successResultOf(d)['server']['status'], 'DELETED')
+
+    def test_failure_fails_all_waiting(self):
+        """
+        If the poll fails, everything waiting on it fails
+        """
+        d1 = self.poller.server_details('my-auth-token', 's1')
+        d2 = self.poller.server_details('my-auth-token', 's2')
+        self.clock.advance(0)
+        self.treq.content.return_value = succeed('error')
+        self.response.callback(mock.Mock(code=500, headers=None))
+
+        for d in (d1, d2):
+            failure = self.failureResultOf(d, RequestError)
+            self.assertTrue(failure.value.reason.check(APIError))
+
+    def test_cancel(self):
+        """
+        A cancelled wait is not polled for, and a wait cancelled during a poll
+        is not called back by it
+        """
+        d = self.poller.server_details('my-auth-token', 's1')
+        d.cancel()
+        self.failureResultOf(d, CancelledError)
+        self.clock.advance(0)
+        self.assertFalse(self.treq.get.called)
+        self.poller.forget('s1')
+        self.on_idle.assert_called_once_with()
+
+        d = self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(5)
+        d.cancel()
+        self.respond({'id': 's1', 'status': 'ACTIVE'})
+        self.failureResultOf(d, CancelledError)
+
+    def test_latest_auth_token(self):
+        """
+        Each poll uses the most recently given auth token
+        """
+        self.poller.server_details('old-token', 's1')
+        self.poller.server_details('my-auth-token', 's2')
+        self.clock.advance(0)
+        self.assertEqual(self.treq.get.call_args[1]['headers'], expected_headers)
+
+    def test_since_last_poll_seen(self):
+        """
+        A server waited on again, however long after the last poll it saw, is
+        polled for the changes since a margin before that poll, and the poll
+        covers the server that saw a poll longest ago
+        """
+        self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.respond()
+
+        self.clock.advance(600)
+        self.poller.server_details('my-auth-token', 's2')
+        self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.assertEqual(self.treq.get.call_args[1]['params'],
+                         {'changes-since': '1970-01-01T00:59:00Z'})
+        self.respond()
+
+        self.clock.advance(600)
+        self.poller.server_details('my-auth-token', 's2')
+        self.clock.advance(0)
+        self.assertEqual(self.treq.get.call_args[1]['params'],
+                         {'changes-since': '1970-01-01T01:09:00Z'})
+
+    def test_failed_poll_not_seen(self):
+        """
+        A server whose poll failed is polled again for the changes since the
+        last poll it did see
+        """
+        d = self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.treq.content.return_value = succeed('error')
+        self.response.callback(mock.Mock(code=500, headers=None))
+        self.failureResultOf(d, RequestError)
+        self.response = Deferred()
+
+        self.clock.advance(600)
+        self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.assertEqual(self.treq.get.call_args[1]['params'],
+                         {'changes-since': '1970-01-01T00:59:00Z'})
+
+    def test_idle(self):
+        """
+        The poller is idle once a poll finishes with nothing waiting for the
+        next and every server has been forgotten.  A forgotten server is
+        polled for changes since a margin before it is next waited on
+        """
+        self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.respond()
+        self.assertFalse(self.on_idle.called)
+        self.poller.forget('s1')
+        self.on_idle.assert_called_once_with()
+
+        self.clock.advance(600)
+        self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.assertEqual(self.treq.get.call_args[1]['params'],
+                         {'changes-since': '1970-01-01T01:09:00Z'})
+
+    def test_forget_while_polling(self):
+        """
+        A server forgotten while it is being polled is not remembered as
+        having seen the poll, and the poller is idle once the poll finishes
+        """
+        d = self.poller.server_details('my-auth-token', 's1')
+        self.clock.advance(0)
+        self.poller.forget('s1')
+        self.assertFalse(self.on_idle.called)
+        self.respond()
+        self.assertIsNone(self.successResultOf(d))
+        self.on_idle.assert_called_once_with()
+
+
+class GetServerStatusPollerTests(TestCase):
+    """
+    Tests for :func:`get_server_status_poller`
+    """
+    def setUp(self):
+        """
+        No pollers to start with
+        """
+        patch(self, 'otter.worker.status_poller._pollers', new={})
+
+    def test_one_poller_per_endpoint(self):
+        """
+        The same poller is returned for the same endpoint, interval and clock,
+        and a different one if any of them differ
+        """
+        clock = Clock()
+        poller = get_server_status_poller('http://url/', 5, clock)
+        self.assertIs(get_server_status_poller('http://url/', 5, clock), poller)
+        self.assertIsNot(get_server_status_poller('http://other/', 5, clock), poller)
+        self.assertIsNot(get_server_status_poller('http://url/', 10, clock), poller)
+        self.assertIsNot(get_server_status_poller('http://url/', 5, Clock()), poller)
+        self.assertEqual((poller.server_endpoint, poller.interval, poller.clock),
+                         ('http://url/', 5, clock))
+
+    def test_forgotten_when_idle(self):
+        """
+        A poller is forgotten once it is idle
+        """
+        poller = get_server_status_poller('http://url/', 5, Clock())
+        poller.on_idle()
+        self.assertEqual(status_poller._pollers, {})
+        self.assertIsNot(get_server_status_poller('http://url/', 5, Clock()), poller)
@@ -0,0 +1,91 @@
+"""
+In-process caches
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    A bounded mapping whose entries expire after a time-to-live. When full, the
+    least recently used entry is evicted to make room for a new one.
+
+    :ivar int hits: number of lookups that found an unexpired entry
+    :ivar int misses: number of lookups that found no entry, or an expired one
+    :ivar int evictions: number of entries evicted to make room for new ones
+    :ivar int generation: number of times entries have been invalidated, so
+        that a value read before an invalidation can be recognized as possibly
+        stale and not cached
+    """
+
+    def __init__(self, max_size, ttl, clock=None):
+        """
+        :param int max_size: maximum number of entries kept
+        :param ttl: number of seconds an entry is kept, unless given when it is
+            set
+        :param clock: An instance of IReactorTime provider that defaults to
+            reactor if not provided
+        """
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value of ``key`` if it is cached and has not expired,
+        otherwise ``default``
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= self.clock.seconds():
+            self.misses += 1
+            return default
+        # re-inserting makes it the most recently used
+        self._entries[key] = entry
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """
+        Cache ``value`` as the value of ``key``
+
+        :param ttl: number of seconds to keep this entry instead of the
+            cache's ``ttl``
+        """
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        expires = self.clock.seconds() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires, value)
+
+    def invalidate(self, key):
+        """
+        Remove ``key`` from the cache, if it is there
+        """
+        self.generation += 1
+        self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """
+        Remove every entry whose key ``predicate`` returns true for
+        """
+        self.generation += 1
+        for key in [key for key in self._entries if predicate(key)]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        :return: ``dict`` of the hits, misses and evictions counters
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
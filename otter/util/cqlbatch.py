@@ -3,17 +3,37 @@
 from silverberg.client import ConsistencyLevel
 
 
+class BatchType(object):
+    """
+    The types of CQL batch.
+
+    A logged batch is written to the batchlog first, so that all of its
+    statements are applied even if the coordinator fails part way through.
+    An unlogged batch skips the batchlog, which is only safe to rely on when
+    all of its statements write to the same partition, since those are
+    applied together anyway.  A counter batch is an unlogged batch of counter
+    updates.
+    """
+    LOGGED = 'LOGGED'
+    UNLOGGED = 'UNLOGGED'
+    COUNTER = 'COUNTER'
+
+
 class Batch(object):
     """ CQL Batch wrapper"""
     def __init__(self, statements, params, consistency=ConsistencyLevel.ONE,
-                 timestamp=None):
+                 timestamp=None, batch_type=BatchType.LOGGED):
         self.statements = statements
         self.params = params
         self.consistency = consistency
         self.timestamp = timestamp
+        self.batch_type = batch_type
 
     def _generate(self):
-        str = 'BEGIN BATCH '
+        if self.batch_type == BatchType.LOGGED:
+            str = 'BEGIN BATCH '
+        else:
+            str = 'BEGIN {} BATCH '.format(self.batch_type)
         if self.timestamp is not None:
             str += 'USING TIMESTAMP {} '.format(self.timestamp)
         str += ' '.join(self.statements)
@@ -0,0 +1,248 @@
+"""
+Prepared CQL statements, cached by query text.
+
+Cassandra parses every CQL statement it is sent as text.  A client that can
+prepare statements lets Cassandra parse each distinct query once, and then
+execute it by the handle it returns with only the parameters.  Such a client
+provides, besides ``execute(query, params, consistency)``:
+
+- ``prepare(query)``, returning a Deferred that fires with a handle to the
+  prepared statement
+- ``execute_prepared(prepared, params, consistency)``, which is like
+  ``execute`` but takes the handle instead of the query text
+
+Clients that do not keep sending the query text.
+:class:`silverberg.client.CQLClient` can not, but
+:class:`PreparingCQLClient` adds both to it using the Thrift interface's
+``prepare_cql3_query`` and ``execute_prepared_cql3_query``.
+
+Statements are prepared on the connection to one node, so a cluster of them
+needs a cache for each node: :class:`PreparedStatementCluster` is the
+:class:`silverberg.cluster.RoundRobinCassandraCluster` that has one.  It is
+used when ``cassandra.prepared_statements`` is configured.
+"""
+
+import calendar
+from datetime import datetime
+
+from twisted.internet.defer import Deferred
+
+from cql.query import PreparedQuery, prepare_query
+
+from silverberg.cassandra import ttypes
+from silverberg.client import CQLClient
+from silverberg.cluster import RoundRobinCassandraCluster
+from silverberg.marshal import unmarshallers
+
+
+# the error code of the native protocol's Unprepared error
+_UNPREPARED_CODE = 0x2500
+
+
+def prepared_statements(client):
+    """
+    Get a client that executes queries as prepared statements if ``client``
+    can prepare them.
+
+    :param client: a silverberg-like CQL client
+    :return: a :class:`PreparedStatementCache` wrapping ``client``, or
+        ``client`` itself if it can not prepare statements
+    """
+    if (getattr(client, 'prepare', None) is None or
+            getattr(client, 'execute_prepared', None) is None):
+        return client
+    return PreparedStatementCache(client)
+
+
+def is_unprepared(failure):
+    """
+    Whether executing a prepared statement failed because the node does not
+    know the statement, as happens after the node restarts or evicts it from
+    its statement cache.
+
+    :param failure: the :class:`twisted.python.failure.Failure` of executing
+        a prepared statement
+    :return: ``bool``
+    """
+    error = failure.value
+    return (getattr(error, 'code', None) == _UNPREPARED_CODE or
+            'Prepared query with ID' in str(error))
+
+
+class PreparedStatementCache(object):
+    """
+    A CQL client that prepares each distinct query the first time it is
+    executed, and executes it as the prepared statement from then on.
+
+    The queries otter executes are made from a fixed set of templates, so the
+    number of distinct queries, and of prepared statements, is bounded.
+    Batches are the exception, since their text depends on how many
+    statements they contain, so they are always executed as text.
+
+    If a node no longer knows a prepared statement, it is prepared again and
+    the query executed once more.
+
+    :ivar client: the client that prepares and executes the statements
+    :ivar int hits: number of executions of an already prepared statement
+    :ivar int misses: number of statements prepared
+    """
+    def __init__(self, client):
+        self.client = client
+        self._statements = {}
+        self._preparing = {}
+        self.hits = 0
+        self.misses = 0
+
+    def execute(self, query, params, consistency):
+        """
+        Execute ``query`` as a prepared statement, preparing it first if it
+        has not been.  See :meth:`silverberg.client.CQLClient.execute`.
+        """
+        if query.startswith('BEGIN '):
+            return self.client.execute(query, params, consistency)
+
+        if query in self._statements:
+            self.hits += 1
+            statement = self._statements[query]
+            d = self.client.execute_prepared(statement, params, consistency)
+            return d.addErrback(self._reprepare, query, statement, params, consistency)
+
+        d = self._prepare(query)
+        d.addCallback(self.client.execute_prepared, params, consistency)
+        return d
+
+    def _reprepare(self, failure, query, statement, params, consistency):
+        """
+        If ``statement`` failed because it is no longer prepared, forget it,
+        and prepare and execute ``query`` again.
+        """
+        if not is_unprepared(failure):
+            return failure
+        if self._statements.get(query) is statement:
+            del self._statements[query]
+        d = self._prepare(query)
+        d.addCallback(self.client.execute_prepared, params, consistency)
+        return d
+
+    def _prepare(self, query):
+        """
+        Prepare ``query``, with only one request in flight for each query.
+
+        :return: Deferred that fires with the prepared statement
+        """
+        d = Deferred()
+        if query in self._preparing:
+            self._preparing[query].append(d)
+            return d
+        self._preparing[query] = [d]
+        self.misses += 1
+
+        def prepared(statement):
+            self._statements[query] = statement
+            for waiter in self._preparing.pop(query):
+                waiter.callback(statement)
+
+        def not_prepared(failure):
+            for waiter in self._preparing.pop(query):
+                waiter.errback(failure)
+
+        self.client.prepare(query).addCallbacks(prepared, not_prepared)
+        return d
+
+    def disconnect(self):
+        """
+        See :meth:`silverberg.client.CQLClient.disconnect`
+        """
+        return self.client.disconnect()
+
+    def stats(self):
+        """
+        :return: ``dict`` of the number of hits, misses, and statements
+            prepared
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'statements': len(self._statements)}
+
+
+def _bind_value(value):
+    """
+    Convert a parameter to what :mod:`cql.cqltypes` serializes: timestamps as
+    seconds since the epoch, naive datetimes being UTC as silverberg
+    marshals them, and text as bytes.
+    """
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+class PreparingCQLClient(CQLClient):
+    """
+    A :class:`silverberg.client.CQLClient` that can also prepare statements
+    and execute them with only their parameters.
+
+    The Thrift interface binds no nulls, so a query with a ``None`` parameter
+    is executed as text instead, as silverberg would have executed it.
+    """
+    def prepare(self, query):
+        """
+        Prepare ``query``, whose parameters are named as for
+        :meth:`execute`, on the connection.
+
+        :return: Deferred that fires with the :class:`cql.query.PreparedQuery`
+        """
+        text, names = prepare_query(query)
+        d = self._connection()
+        d.addCallback(lambda client: client.prepare_cql3_query(text, ttypes.Compression.NONE))
+        return d.addCallback(lambda result: PreparedQuery(
+            query, result.itemId, result.variable_types, names))
+
+    def execute_prepared(self, prepared, params, consistency):
+        """
+        Execute a statement returned by :meth:`prepare`.  See
+        :meth:`silverberg.client.CQLClient.execute`.
+        """
+        if any(params.get(name) is None for name in prepared.paramnames):
+            return self.execute(prepared.querytext, params, consistency)
+        values = [vartype.to_binary(vartype.validate(_bind_value(params[name])))
+                  for name, vartype in zip(prepared.paramnames, prepared.vartypes)]
+        d = self._connection()
+        d.addCallback(lambda client: client.execute_prepared_cql3_query(
+            prepared.itemid, values, consistency))
+        return d.addCallback(self._process_result)
+
+    def _process_result(self, result):
+        """
+        Unmarshal the result the way :meth:`execute` does
+        """
+        if result.type == ttypes.CqlResultType.ROWS:
+            return self._unmarshal_result(result.schema, result.rows, unmarshallers)
+        elif result.type == ttypes.CqlResultType.INT:
+            return result.num
+        return None
+
+
+class PreparedStatementCluster(RoundRobinCassandraCluster):
+    """
+    A :class:`silverberg.cluster.RoundRobinCassandraCluster` whose clients
+    execute queries as prepared statements, each with a
+    :class:`PreparedStatementCache` of its own since statements are prepared
+    on one node.
+    """
+    def __init__(self, seed_endpoints, keyspace, user=None, password=None):
+        RoundRobinCassandraCluster.__init__(self, [], keyspace, user, password)
+        self._seed_clients = [
+            PreparedStatementCache(PreparingCQLClient(endpoint, keyspace, user, password))
+            for endpoint in seed_endpoints]
+
+    def stats(self):
+        """
+        :return: ``dict`` of the number of hits, misses, and statements
+            prepared, added up over the clients
+        """
+        stats = {'hits': 0, 'misses': 0, 'statements': 0}
+        for client in self._seed_clients:
+            for key, value in client.stats().iteritems():
+                stats[key] += value
+        return stats
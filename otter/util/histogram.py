@@ -0,0 +1,42 @@
+"""
+Histograms of measurements, such as latencies
+"""
+from bisect import bisect_left
+
+
+# Upper bounds, in milliseconds, of the buckets of a latency histogram
+LATENCY_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram(object):
+    """
+    Counts of measurements in buckets with fixed upper bounds.  Measurements
+    greater than the last bound are counted in an extra, unbounded, bucket.
+
+    :ivar tuple bounds: the sorted upper bounds of the buckets
+    :ivar list counts: the number of measurements in each bucket, the last one
+        being the unbounded one
+    :ivar int count: the total number of measurements
+    :ivar total: the sum of all the measurements
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        """
+        Count ``value`` in the first bucket whose bound it does not exceed
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def buckets(self):
+        """
+        :return: ``list`` of ``(bound, count)`` for each bucket, where the
+            bound of the unbounded bucket is ``None``
+        """
+        return zip(self.bounds + (None,), self.counts)
@@ -0,0 +1,215 @@
+"""
+The HTTP connection pool shared by all the requests made to upstream services
+(Nova, load balancers, identity and Bobby).
+
+Modules making such requests use :data:`treq` in place of the :mod:`treq`
+module, so that they all reuse the same persistent connections.
+"""
+import treq as _treq
+from treq.auth import add_auth
+from treq.client import HTTPClient
+from twisted.internet.protocol import Protocol
+from twisted.python.components import proxyForInterface
+from twisted.web.client import (
+    Agent, ContentDecoderAgent, GzipDecoder, HTTPConnectionPool, RedirectAgent)
+from twisted.web.iweb import IResponse
+
+from otter.util.config import config_value
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """
+    An :class:`HTTPConnectionPool` that counts how many connections were
+    reused from the pool and how many had to be made.
+
+    :ivar int hits: number of requests that reused a cached connection
+    :ivar int misses: number of requests that needed a new connection
+    """
+    hits = 0
+    misses = 0
+
+    def getConnection(self, key, endpoint):
+        """
+        See :meth:`HTTPConnectionPool.getConnection`
+        """
+        if self._connections.get(key):
+            self.hits += 1
+        else:
+            self.misses += 1
+        return HTTPConnectionPool.getConnection(self, key, endpoint)
+
+
+class _BodyDoneProtocol(Protocol):
+    """
+    Passes a response's body on to ``protocol``, calling ``done`` when all of
+    it has been received
+    """
+    def __init__(self, protocol, done):
+        self.protocol = protocol
+        self.done = done
+
+    def makeConnection(self, transport):
+        """
+        See :meth:`IProtocol.makeConnection`
+        """
+        self.protocol.makeConnection(transport)
+
+    def dataReceived(self, data):
+        """
+        See :meth:`IProtocol.dataReceived`
+        """
+        self.protocol.dataReceived(data)
+
+    def connectionLost(self, reason):
+        """
+        See :meth:`IProtocol.connectionLost`
+        """
+        self.done()
+        self.protocol.connectionLost(reason)
+
+
+class _BodyDoneResponse(proxyForInterface(IResponse)):
+    """
+    A response that calls ``done`` once its body has been received
+    """
+    def __init__(self, original, done):
+        super(_BodyDoneResponse, self).__init__(original)
+        self.done = done
+
+    def deliverBody(self, protocol):
+        """
+        See :meth:`IResponse.deliverBody`
+        """
+        self.original.deliverBody(_BodyDoneProtocol(protocol, self.done))
+
+
+class PooledTreq(object):
+    """
+    Makes requests like :mod:`treq` does, but always through the same
+    :class:`CountingHTTPConnectionPool`.  The pool is made from the
+    ``http_pool`` config when the first request is made, unless
+    :meth:`configure` was called before.
+
+    Like :mod:`treq`, each request is made with an agent of its own, on the
+    shared pool, so that it can have its own ``allow_redirects`` and ``auth``.
+
+    :ivar pool: the connection pool, or ``None`` if not yet configured
+    :ivar int in_flight: number of requests whose response has not been
+        received in full yet.  A response is in flight until its body has
+        been read, unless it has no body.
+    """
+    json_content = staticmethod(_treq.json_content)
+    content = staticmethod(_treq.content)
+    text_content = staticmethod(_treq.text_content)
+
+    def __init__(self):
+        self.pool = None
+        self.in_flight = 0
+        self._reactor = None
+        self._connect_timeout = None
+
+    def configure(self, reactor=None, persistent=True, max_persistent_per_host=None,
+                  idle_timeout=None, connect_timeout=None):
+        """
+        Make a new pool for the requests from now on
+
+        :param reactor: the reactor to use, or ``None`` for the global one
+        :param bool persistent: whether to keep connections open for reuse
+        :param int max_persistent_per_host: maximum number of idle connections
+            kept open to each host
+        :param idle_timeout: seconds an idle connection is kept open
+        :param connect_timeout: seconds to wait for a connection to be made
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        pool = CountingHTTPConnectionPool(reactor, persistent=persistent)
+        if max_persistent_per_host is not None:
+            pool.maxPersistentPerHost = max_persistent_per_host
+        if idle_timeout is not None:
+            pool.cachedConnectionTimeout = idle_timeout
+        self.pool = pool
+        self._reactor = reactor
+        self._connect_timeout = connect_timeout
+
+    def _client(self, allow_redirects=True, auth=None):
+        """
+        Make a client for one request, as :func:`treq.request` does, but on
+        the shared pool
+        """
+        agent = Agent(self._reactor, connectTimeout=self._connect_timeout, pool=self.pool)
+        if allow_redirects:
+            agent = RedirectAgent(agent)
+        agent = ContentDecoderAgent(agent, [('gzip', GzipDecoder)])
+        if auth:
+            agent = add_auth(agent, auth)
+        return HTTPClient(agent)
+
+    def request(self, method, url, allow_redirects=True, auth=None, **kwargs):
+        """
+        See :func:`treq.request`.  Only the ``persistent`` and ``reactor``
+        arguments are not supported, since those are properties of the pool.
+        """
+        if self.pool is None:
+            self.configure(**(config_value('http_pool') or {}))
+        self.in_flight += 1
+        done = []
+
+        def _body_done():
+            if not done:
+                done.append(True)
+                self.in_flight -= 1
+
+        def _received(response):
+            if method == 'HEAD' or response.length == 0:
+                _body_done()
+                return response
+            return _BodyDoneResponse(response, _body_done)
+
+        def _failed(failure):
+            _body_done()
+            return failure
+
+        d = self._client(allow_redirects, auth).request(method, url, **kwargs)
+        return d.addCallbacks(_received, _failed)
+
+    def get(self, url, **kwargs):
+        """
+        See :func:`treq.get`
+        """
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """
+        See :func:`treq.head`
+        """
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        """
+        See :func:`treq.post`
+        """
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        """
+        See :func:`treq.put`
+        """
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """
+        See :func:`treq.delete`
+        """
+        return self.request('DELETE', url, **kwargs)
+
+    def stats(self):
+        """
+        :return: ``dict`` of the pool's hits and misses, and the requests in
+            flight
+        """
+        pool = self.pool or CountingHTTPConnectionPool
+        return {'hits': pool.hits, 'misses': pool.misses, 'in_flight': self.in_flight}
+
+
+# The client shared by all requests to upstream services
+treq = PooledTreq()
@@ -0,0 +1,96 @@
+"""
+Rate limiting of calls to upstream services
+"""
+from collections import deque, OrderedDict
+
+from twisted.internet import defer
+
+
+class TokenBucket(object):
+    """
+    Meters out tokens to the callers waiting for them, at ``rate`` tokens per
+    second with bursts of up to ``burst`` tokens.
+
+    Callers wait in a queue per key, such as a scaling group, and the queues
+    take turns being served, so that a key with many callers waiting does not
+    hold up the callers of other keys.
+
+    :ivar rate: tokens per second
+    :ivar int burst: the most tokens that can be taken at once
+    :ivar clock: IReactorTime provider
+    :ivar int queued: number of callers waiting for a token
+    :ivar int served: number of callers that have been given a token
+    :ivar wait_time: total seconds the callers given a token waited for it
+    """
+    def __init__(self, rate, burst, clock):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.queued = 0
+        self.served = 0
+        self.wait_time = 0
+        self._tokens = burst
+        self._last_refill = clock.seconds()
+        self._queues = OrderedDict()
+        self._delayed_call = None
+
+    def acquire(self, key=None):
+        """
+        Wait for a token
+
+        :param key: the queue to wait in
+
+        :return: Deferred that fires with None when the caller has a token.
+            Cancelling it stops waiting.
+        """
+        waiter = [None, self.clock.seconds()]
+
+        def cancel(d):
+            queue = self._queues.get(key, ())
+            if waiter in queue:
+                queue.remove(waiter)
+                self.queued -= 1
+                if not queue:
+                    del self._queues[key]
+
+        d = waiter[0] = defer.Deferred(cancel)
+        self._queues.setdefault(key, deque()).append(waiter)
+        self.queued += 1
+        self._drain()
+        return d
+
+    def _refill(self):
+        now = self.clock.seconds()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _drain(self):
+        """
+        Give tokens to as many waiting callers as there are tokens, taking one
+        from each queue in turn, and schedule the next drain for when there
+        will be another token.
+        """
+        self._refill()
+        now = self.clock.seconds()
+        ready = []
+        while self._queues and self._tokens >= 1:
+            key, queue = self._queues.popitem(last=False)
+            d, queued_at = queue.popleft()
+            if queue:
+                self._queues[key] = queue
+            self._tokens -= 1
+            self.queued -= 1
+            self.served += 1
+            self.wait_time += now - queued_at
+            ready.append(d)
+
+        if self._queues and self._delayed_call is None:
+            self._delayed_call = self.clock.callLater(
+                (1 - self._tokens) / float(self.rate), self._wake)
+
+        for d in ready:
+            d.callback(None)
+
+    def _wake(self):
+        self._delayed_call = None
+        self._drain()
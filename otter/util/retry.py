@@ -1,6 +1,7 @@
 """
 Module that provides retrying-at-a-particular-interval functionality.
 """
+import random
 
 from twisted.internet import defer
 
@@ -139,6 +140,29 @@ def repeating_interval(interval):
     return lambda f: interval
 
 
+def backoff_interval(minimum, maximum, multiplier=3):
+    """
+    Returns a ``next_interval`` function for :py:func:`retry` that backs off
+    exponentially from ``minimum`` to ``maximum`` seconds, with decorrelated
+    jitter: each interval is a random number of seconds between ``minimum``
+    and ``multiplier`` times the previous interval, capped at ``maximum``.
+    Operations started together therefore do not keep retrying together.
+
+    Each call returns a new function, keeping track of the intervals of one
+    operation, so it has to be called for each operation retried.
+
+    :return: a function that accepts a :class:`Failure` and returns the next
+        interval
+    """
+    previous = [minimum]
+
+    def next_interval(f):
+        previous[0] = min(maximum, random.uniform(minimum, previous[0] * multiplier))
+        return previous[0]
+
+    return next_interval
+
+
 def retry(do_work, can_retry=None, next_interval=None, clock=None):
     """
     Retries the `do_work` function if it does not succeed and the ``can_retry``
@@ -163,7 +187,7 @@ def retry(do_work, can_retry=None, next_interval=None, clock=None):
         the number of seconds until the next attempt as a float.  Should be
         synchronous.  If None, defaults to something that always returns a 5
         second interval.  Some default functions that can be used are, for
-        instance, :func:`repeating_interval`.
+        instance, :func:`repeating_interval` and :func:`backoff_interval`.
 
     :return: a Deferred which fires with the result of the ``do_work``,
         if successful, or the failure of the ``do_work``, if cannot be retried
@@ -0,0 +1,263 @@
+"""
+Coalescing the servers created for a scaling group.
+
+Scaling up by many servers creates many servers from the same launch config,
+differing only in their names.  A :class:`ServerCreationBatcher` collects the
+servers created from one launch config over a short window and creates them
+with Nova's multi-create, ``min_count``/``max_count`` servers at a time, and
+then tells each job which of the servers created is its own.
+
+A server created this way only has an owner once it has been found by the
+reservation ID, so servers that are never handed to a job are deleted rather
+than left behind.
+"""
+from copy import deepcopy
+import json
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from otter.log import log as otter_log
+from otter.util.deferredutils import retry_and_timeout
+from otter.util.http import (append_segments, headers, check_success,
+                             wrap_request_error)
+from otter.util.pool import treq
+from otter.util.retry import backoff_interval
+
+
+class ServerNotCreated(Exception):
+    """
+    Raised when the servers of a multi-create reservation are not all found in
+    time.
+    """
+    def __init__(self, reservation_id):
+        super(ServerNotCreated, self).__init__(
+            'Server not created with reservation {0}'.format(reservation_id))
+        self.reservation_id = reservation_id
+
+
+def _batch_key(server_config):
+    """
+    The servers whose configs are the same apart from their names can be
+    created together.
+    """
+    config = dict(server_config)
+    config.pop('name', None)
+    return json.dumps(config, sort_keys=True)
+
+
+_batchers = {}
+
+
+def get_server_creation_batcher(server_endpoint, server_config, window=1,
+                                size=10, clock=None):
+    """
+    Get the batcher of the servers created with ``server_config``, making one
+    if there is none.  A batcher is forgotten once it starts creating the
+    servers it collected, and the servers created after that are collected by
+    a new batcher.
+
+    :param str server_endpoint: Server endpoint URI.
+    :param dict server_config: Nova server config.
+    :param window: seconds to collect servers for before creating them, if a
+        batcher has to be made
+    :param int size: the most servers to create with one request, if a
+        batcher has to be made
+    :param clock: An instance of IReactorTime provider that defaults to
+        reactor if not provided
+
+    :return: :class:`ServerCreationBatcher`
+    """
+    key = (server_endpoint, _batch_key(server_config))
+    batcher = _batchers.get(key)
+    if batcher is None:
+        if clock is None:  # pragma: no cover
+            from twisted.internet import reactor
+            clock = reactor
+
+        def forget():
+            if _batchers.get(key) is batcher:
+                del _batchers[key]
+
+        batcher = _batchers[key] = ServerCreationBatcher(
+            server_endpoint, window, size, clock, forget)
+    return batcher
+
+
+class ServerCreationBatcher(object):
+    """
+    Creates the servers created from one launch config within ``window``
+    seconds of each other with ``POST /servers``, ``size`` servers at a time,
+    and finds the servers created with ``GET /servers/detail`` filtered by the
+    reservation ID Nova returns.
+
+    :ivar str server_endpoint: Server endpoint URI.
+    :ivar window: seconds to collect servers for before creating them
+    :ivar int size: the most servers to create with one request
+    :ivar clock: IReactorTime provider used to schedule batches
+    :ivar on_idle: callable called with no arguments when the batcher starts
+        creating the servers it collected
+    :ivar int min_interval: seconds to wait before listing the servers of a
+        reservation again the first time they are not all found, backing off
+        from then on
+    :ivar int max_interval: the most seconds to wait before listing them again
+    :ivar int timeout: seconds after which to stop listing them and fail the
+        servers in the batch
+    :ivar int cleanup_timeout: seconds to keep listing the servers of a failed
+        batch for, to delete them
+    """
+    log = otter_log.bind(system='otter.worker.create_batcher')
+    min_interval = 1
+    max_interval = 30
+    timeout = 300
+    cleanup_timeout = 3600
+
+    def __init__(self, server_endpoint, window, size, clock, on_idle=None):
+        self.server_endpoint = server_endpoint
+        self.window = window
+        self.size = size
+        self.clock = clock
+        self.on_idle = on_idle
+        self._auth_token = None
+        self._pending = []
+        self._delayed_call = None
+
+    def create_server(self, auth_token, server_config):
+        """
+        Create a server with the next batch.
+
+        :param str auth_token: Keystone Auth Token.  The most recently given
+            token is used for each batch.
+        :param dict server_config: Nova server config.  The name of the first
+            server in a batch is used as the name of all the servers in it,
+            which Nova then makes unique.
+
+        :return: Deferred that fires with the CreateServer response as a dict,
+            as if the server had been created on its own.
+        """
+        self._auth_token = auth_token
+        d = defer.Deferred()
+        self._pending.append((d, server_config))
+        if self._delayed_call is None:
+            self._delayed_call = self.clock.callLater(self.window, self._start)
+        return d
+
+    def _start(self):
+        self._delayed_call = None
+        if self.on_idle is not None:
+            self.on_idle()
+        pending = self._pending
+        return defer.gatherResults([
+            self._create(pending[i:i + self.size])
+            for i in range(0, len(pending), self.size)])
+
+    def _post(self, server_config):
+        path = append_segments(self.server_endpoint, 'servers')
+        d = treq.post(path, headers=headers(self._auth_token),
+                      data=json.dumps({'server': server_config}))
+        d.addCallback(check_success, [202])
+        d.addErrback(wrap_request_error, path, 'server_create')
+        return d.addCallback(treq.json_content)
+
+    def _reserved_servers(self, reservation_id):
+        path = append_segments(self.server_endpoint, 'servers', 'detail')
+        d = treq.get(path, headers=headers(self._auth_token),
+                     params={'reservation_id': reservation_id})
+        d.addCallback(check_success, [200])
+        d.addErrback(wrap_request_error, path, 'server_list')
+        d.addCallback(treq.json_content)
+        return d.addCallback(lambda result: result['servers'])
+
+    def _find_servers(self, reservation_id, count, timeout):
+        """
+        List the servers created with ``reservation_id``, retrying until
+        ``count`` of them are found, since Nova may not list them all at first.
+        """
+        def list_servers():
+            d = self._reserved_servers(reservation_id)
+            return d.addCallback(check_count)
+
+        def check_count(servers):
+            if len(servers) < count:
+                raise ServerNotCreated(reservation_id)
+            return servers
+
+        return retry_and_timeout(
+            list_servers, timeout,
+            next_interval=backoff_interval(self.min_interval, self.max_interval),
+            clock=self.clock,
+            deferred_description='Listing servers with reservation {0}'.format(
+                reservation_id))
+
+    def _delete(self, server_id):
+        path = append_segments(self.server_endpoint, 'servers', server_id)
+        d = treq.delete(path, headers=headers(self._auth_token))
+        d.addCallback(check_success, [204, 404])
+        d.addErrback(wrap_request_error, path, 'server_delete')
+        d.addCallback(lambda _: self.log.msg('Deleted server {server_id}',
+                                             server_id=server_id))
+        return d.addErrback(self.log.err, 'Failed to delete server {0}'.format(server_id))
+
+    def _delete_reserved(self, reservation_id, count):
+        """
+        Delete the servers created with ``reservation_id``, which no job is
+        waiting for.  If not all ``count`` of them are found in time, the ones
+        that are found are deleted.
+        """
+        def delete_all(servers):
+            return defer.gatherResults([self._delete(server['id']) for server in servers])
+
+        d = self._find_servers(reservation_id, count, self.cleanup_timeout)
+        d.addErrback(lambda _: self._reserved_servers(reservation_id))
+        d.addCallback(delete_all)
+        d.addErrback(self.log.err, 'Failed to find the servers of reservation {0} '
+                     'to delete them'.format(reservation_id))
+        return d
+
+    def _create(self, pending):
+        """
+        Create one server for each of ``pending``, and pass each server on to
+        one of them.  The servers found with the reservation that are not
+        passed on are deleted, and so are all of them if they can not be
+        found.
+        """
+        if len(pending) == 1:
+            d, server_config = pending[0]
+            return self._post(server_config).addCallbacks(d.callback, d.errback)
+
+        server_config = deepcopy(pending[0][1])
+        server_config.update(min_count=len(pending), max_count=len(pending),
+                             return_reservation_id=True)
+
+        def find_servers(result):
+            reservation_id = result['reservation_id']
+            self.log.msg('Created {count} servers with reservation {reservation_id}',
+                         count=len(pending), reservation_id=reservation_id)
+            d = self._find_servers(reservation_id, len(pending), self.timeout)
+            return d.addCallbacks(fan_out, not_found, callbackArgs=(reservation_id,),
+                                  errbackArgs=(reservation_id,))
+
+        def fan_out(servers, reservation_id):
+            servers = sorted(servers, key=lambda server: server['name'])
+            for (d, _), server in zip(pending, servers):
+                d.callback({'server': server})
+            surplus = servers[len(pending):]
+            if surplus:
+                self.log.msg('Deleting {surplus} servers more than were asked for with '
+                             'reservation {reservation_id}', surplus=len(surplus),
+                             reservation_id=reservation_id)
+                for server in surplus:
+                    self._delete(server['id'])
+
+        def not_found(failure, reservation_id):
+            self.log.msg('Servers with reservation {reservation_id} not found, '
+                         'deleting them', reservation_id=reservation_id, reason=failure)
+            self._delete_reserved(reservation_id, len(pending))
+            return Failure(ServerNotCreated(reservation_id))
+
+        def fail_all(failure):
+            for d, _ in pending:
+                d.errback(failure)
+
+        d = self._post(server_config).addCallback(find_servers)
+        return d.addErrback(fail_all)
@@ -20,17 +20,22 @@ import json
 import itertools
 from copy import deepcopy
 
-from twisted.internet.defer import gatherResults, maybeDeferred
-
-import treq
+from twisted.internet.defer import (Deferred, DeferredList, DeferredSemaphore,
+                                    gatherResults, succeed)
 
+from otter.auth import ServiceCatalog
+from otter.indexer.events import CREATED, DELETED, get_server_event_listener
 from otter.util.config import config_value
-from otter.util.http import (append_segments, headers, check_success,
-                             wrap_request_error)
+from otter.util.http import (APIError, RequestError, append_segments, headers,
+                             check_success, wrap_request_error)
+from otter.util.pool import treq
 from otter.util.hashkey import generate_server_name
 from otter.util.deferredutils import retry_and_timeout
-from otter.util.retry import (repeating_interval, transient_errors_except,
-                              TransientRetryError)
+from otter.util.retry import (backoff_interval, repeating_interval,
+                              transient_errors_except, TransientRetryError)
+from otter.worker.create_batcher import get_server_creation_batcher
+from otter.worker.lb_batcher import get_node_batcher, get_node_removal_batcher
+from otter.worker.status_poller import get_server_status_poller
 
 
 class UnexpectedServerStatus(Exception):
@@ -68,6 +73,96 @@ def server_details(server_endpoint, auth_token, server_id):
     return d.addCallback(treq.json_content)
 
 
+# Number of completed builds and deletes, and how many polls they took
+_poll_counts = {'build': {'jobs': 0, 'polls': 0},
+                'delete': {'jobs': 0, 'polls': 0}}
+
+
+def polling_stats():
+    """
+    :return: ``dict`` of the number of builds and deletes that have been seen
+        to be completed by polling, and of how many polls they took, keyed by
+        ``'<operation>.jobs'`` and ``'<operation>.polls'``
+    """
+    return dict(('{0}.{1}'.format(operation, name), value)
+                for operation, counts in _poll_counts.iteritems()
+                for name, value in counts.iteritems())
+
+
+def _count_polls(operation, polls):
+    counts = _poll_counts[operation]
+    counts['jobs'] += 1
+    counts['polls'] += polls
+
+
+def _polling_interval(operation, interval):
+    """
+    Get the ``next_interval`` function for polling for ``operation``, which is
+    either ``'build'`` or ``'delete'``.
+
+    If ``worker.polling.<operation>.max_interval`` is configured, polling backs
+    off with jitter from ``worker.polling.<operation>.min_interval`` seconds
+    (default ``interval``) up to it, and otherwise it repeats every
+    ``interval`` seconds.
+
+    ``max_interval`` may be longer than
+    :data:`otter.worker.status_poller.CHANGES_SINCE_MARGIN`: a server polled
+    in batches is polled for the changes since the last poll it saw, however
+    long ago that was.
+    """
+    config = config_value('worker.polling.{0}'.format(operation)) or {}
+    if config.get('max_interval'):
+        return backoff_interval(config.get('min_interval') or interval,
+                                config['max_interval'])
+    return repeating_interval(interval)
+
+
+def _forget_polled(result, server_endpoint, interval, clock, server_id):
+    """
+    Tell the :class:`otter.worker.status_poller.ServerStatusPoller` of the
+    endpoint that nothing will wait for ``server_id`` again, once waiting for
+    it is done whichever way, and pass ``result`` on.
+    """
+    get_server_status_poller(server_endpoint, interval, clock).forget(server_id)
+    return result
+
+
+def _complete_early(polled, event, check):
+    """
+    Fire with the result of ``polled``, unless ``event`` fires first and
+    ``check`` then succeeds, in which case fire with the result of ``check``
+    and cancel ``polled``.  Whichever does not win is cancelled.
+
+    :param Deferred polled: Deferred that fires when polling is done
+    :param Deferred event: Deferred that fires when an event says it is done
+    :param check: callable, with no arguments, returning a Deferred that fires
+        with the result of being done, or fails if it is not done after all
+
+    :return: Deferred that fires with the result of whichever is done first
+    """
+    def cancel(_):
+        polled.cancel()
+        event.cancel()
+
+    result = Deferred(cancel)
+
+    def polled_done(polled_result):
+        event.cancel()
+        if not result.called:
+            result.callback(polled_result)
+
+    def checked(check_result):
+        if not result.called:
+            result.callback(check_result)
+            polled.cancel()
+
+    polled.addBoth(polled_done)
+    event.addCallback(lambda _: check())
+    # if the check fails, or the event is cancelled, polling carries on
+    event.addCallbacks(checked, lambda _: None)
+    return result
+
+
 def wait_for_active(log,
                     server_endpoint,
                     auth_token,
@@ -78,6 +173,15 @@ def wait_for_active(log,
     """
     Wait until the server specified by server_id's status is 'ACTIVE'
 
+    If notification feeds are being polled, the server's status is checked as
+    soon as Nova says it has finished creating it, and otherwise only every
+    ``worker.event_fallback_interval`` seconds (default 60) in case the
+    notification is missed.
+
+    If ``worker.batch_server_polling`` is configured, the server's status is
+    checked by the :class:`otter.worker.status_poller.ServerStatusPoller` of
+    the endpoint, along with every other server being waited on.
+
     :param log: A bound logger.
     :param str server_endpoint: Server endpoint URI.
     :param str auth_token: Keystone Auth token.
@@ -86,8 +190,14 @@ def wait_for_active(log,
     :param int timeout: timeout to poll for the server status in seconds.
         Default 3600 (1 hour)
 
+    See :func:`_polling_interval` for backing off between polls.
+
     :return: Deferred that fires when the expected status has been seen.
     """
+    listener = get_server_event_listener()
+    if listener is not None:
+        interval = config_value('worker.event_fallback_interval') or 60
+
     log.msg("Checking instance status every {interval} seconds",
             interval=interval)
 
@@ -96,9 +206,15 @@ def wait_for_active(log,
         clock = reactor
 
     start_time = clock.seconds()
+    polls = [0]
 
     def poll():
+        polls[0] += 1
+
         def check_status(server):
+            if server is None:
+                raise TransientRetryError()  # not changed since last poll
+
             status = server['server']['status']
 
             if status == 'ACTIVE':
@@ -106,6 +222,7 @@ def wait_for_active(log,
                 log.msg(("Server changed from 'BUILD' to 'ACTIVE' within "
                          "{time_building} seconds"),
                         time_building=time_building)
+                _count_polls('build', polls[0])
                 return server
 
             elif status != 'BUILD':
@@ -117,19 +234,29 @@ def wait_for_active(log,
             else:
                 raise TransientRetryError()  # just poll again
 
-        sd = server_details(server_endpoint, auth_token, server_id)
+        if config_value('worker.batch_server_polling'):
+            poller = get_server_status_poller(server_endpoint, interval, clock)
+            sd = poller.server_details(auth_token, server_id)
+        else:
+            sd = server_details(server_endpoint, auth_token, server_id)
         sd.addCallback(check_status)
         return sd
 
     timeout_description = ("Waiting for server <{0}> to change from BUILD "
                            "state to ACTIVE state").format(server_id)
 
-    return retry_and_timeout(
+    polled = retry_and_timeout(
         poll, timeout,
         can_retry=transient_errors_except(UnexpectedServerStatus),
-        next_interval=repeating_interval(interval),
+        next_interval=_polling_interval('build', interval),
         clock=clock,
         deferred_description=timeout_description)
+    if config_value('worker.batch_server_polling'):
+        polled.addBoth(_forget_polled, server_endpoint, interval, clock, server_id)
+
+    if listener is None:
+        return polled
+    return _complete_early(polled, listener.wait_for(CREATED, server_id), poll)
 
 
 def create_server(server_endpoint, auth_token, server_config):
@@ -156,6 +283,10 @@ def add_to_load_balancer(endpoint, auth_token, lb_config, ip_address, undo):
 
     TODO: Handle load balancer node metadata.
 
+    If ``worker.lb_batch_window`` is configured, the node is added along with
+    the other nodes added to the same load balancer within that many seconds,
+    by the load balancer's :class:`otter.worker.lb_batcher.NodeBatcher`.
+
     :param str endpoint: Load balancer endpoint URI.
     :param str auth_token: Keystone Auth Token.
     :param str lb_config: An lb_config dictionary.
@@ -168,15 +299,21 @@ def add_to_load_balancer(endpoint, auth_token, lb_config, ip_address, undo):
     """
     lb_id = lb_config['loadBalancerId']
     port = lb_config['port']
-    path = append_segments(endpoint, 'loadbalancers', str(lb_id), 'nodes')
 
-    d = treq.post(path, headers=headers(auth_token),
-                  data=json.dumps({"nodes": [{"address": ip_address,
-                                              "port": port,
-                                              "condition": "ENABLED",
-                                              "type": "PRIMARY"}]}))
-    d.addCallback(check_success, [200, 202])
-    d.addErrback(wrap_request_error, path, 'add')
+    window = config_value('worker.lb_batch_window')
+    if window:
+        batcher = get_node_batcher(endpoint, lb_id, window)
+        d = batcher.add_node(auth_token, ip_address, port)
+    else:
+        path = append_segments(endpoint, 'loadbalancers', str(lb_id), 'nodes')
+        d = treq.post(path, headers=headers(auth_token),
+                      data=json.dumps({"nodes": [{"address": ip_address,
+                                                  "port": port,
+                                                  "condition": "ENABLED",
+                                                  "type": "PRIMARY"}]}))
+        d.addCallback(check_success, [200, 202])
+        d.addErrback(wrap_request_error, path, 'add')
+        d.addCallback(treq.json_content)
 
     def when_done(result):
         undo.push(remove_from_load_balancer,
@@ -186,40 +323,47 @@ def add_to_load_balancer(endpoint, auth_token, lb_config, ip_address, undo):
                   result['nodes'][0]['id'])
         return result
 
-    return d.addCallback(treq.json_content).addCallback(when_done)
+    return d.addCallback(when_done)
 
 
-def add_to_load_balancers(endpoint, auth_token, lb_configs, ip_address, undo):
+def add_to_load_balancers(endpoint, auth_token, lb_configs, ip_address, undo,
+                          concurrency=None):
     """
     Add the specified IP to mulitple load balancer based on the configs in
-    lb_configs.
+    lb_configs.  The load balancers are added to in parallel, at most
+    ``concurrency`` at a time.
 
     :param str endpoint: Load balancer endpoint URI.
     :param str auth_token: Keystone Auth Token.
     :param list lb_configs: List of lb_config dictionaries.
     :param str ip_address: IP address of the node to add to the load balancer.
     :param IUndoStack undo: An IUndoStack to push any reversable operations onto.
+    :param int concurrency: Maximum number of load balancers to add to at
+        once.  Defaults to the configured ``worker.lb_concurrency``, or 5.
 
     :return: Deferred that fires with a list of 2-tuples of loadBalancerId, and
-        Add Node response.
+        Add Node response, in the same order as lb_configs.  If adding to any
+        load balancer fails, it fails with the first such failure, but only
+        once all the other adds are done, so that every successful add has been
+        pushed onto ``undo``.
     """
-    lb_iter = iter(lb_configs)
+    if concurrency is None:
+        concurrency = config_value('worker.lb_concurrency') or 5
+    sem = DeferredSemaphore(concurrency)
 
-    results = []
+    def add(lb_config):
+        d = sem.run(add_to_load_balancer, endpoint, auth_token, lb_config,
+                    ip_address, undo)
+        return d.addCallback(lambda response: (lb_config['loadBalancerId'], response))
 
-    def add_next(_):
-        try:
-            lb_config = lb_iter.next()
+    def collect_results(results):
+        for success, result in results:
+            if not success:
+                return result
+        return [result for _, result in results]
 
-            d = add_to_load_balancer(endpoint, auth_token, lb_config, ip_address, undo)
-            d.addCallback(lambda response, lb_id: (lb_id, response), lb_config['loadBalancerId'])
-            d.addCallback(results.append)
-            d.addCallback(add_next)
-            return d
-        except StopIteration:
-            return results
-
-    return maybeDeferred(add_next, None)
+    d = DeferredList([add(lb_config) for lb_config in lb_configs], consumeErrors=True)
+    return d.addCallback(collect_results)
 
 
 def endpoints(service_catalog, service_name, region):
@@ -247,12 +391,18 @@ def public_endpoint_url(service_catalog, service_name, region):
     """
     Return the first publicURL for a given service in a given region.
 
-    :param list service_catalog: List of services.
+    :param list service_catalog: List of services.  If it is a
+        :class:`otter.auth.ServiceCatalog`, its index is used rather than
+        searching the list.
     :param str service_name: Name of service.  Example: 'cloudServersOpenStack'
     :param str region: Region of service.  Example: 'ORD'
 
     :return: URL as a string.
     """
+    if isinstance(service_catalog, ServiceCatalog):
+        endpoint = service_catalog.endpoint(service_name, region)
+        if endpoint is not None:
+            return endpoint['publicURL']
     return list(endpoints(service_catalog, service_name, region))[0]['publicURL']
 
 
@@ -305,8 +455,133 @@ def prepare_launch_config(scaling_group_uuid, launch_config):
     return launch_config
 
 
+def _create_active_server(log, server_endpoint, auth_token, server_config,
+                          lb_config, undo):
+    """
+    Create a server and wait for it to become active, pushing its deletion
+    onto ``undo`` once it has an ID.
+
+    If ``worker.create_batch_window`` is configured, the server is created
+    along with the other servers launched from the same launch config within
+    that many seconds, at most ``worker.create_batch_size`` (default 10) with
+    one request, by a :class:`otter.worker.create_batcher.ServerCreationBatcher`.
+    Nova then names the server after the first server in its batch, and the
+    server name in the metadata of ``lb_config`` is changed to match.
+
+    :return: Deferred that fires with the server details once it is active.
+    """
+    window = config_value('worker.create_batch_window')
+    if window:
+        batcher = get_server_creation_batcher(
+            server_endpoint, server_config, window,
+            config_value('worker.create_batch_size') or 10)
+        d = batcher.create_server(auth_token, server_config)
+        d.addCallback(_rename_lb_nodes, lb_config)
+    else:
+        d = create_server(server_endpoint, auth_token, server_config)
+
+    def wait_for_server(server):
+        server_id = server['server']['id']
+
+        undo.push(
+            verified_delete, log, server_endpoint, auth_token, server_id)
+
+        ilog = log.bind(instance_id=server_id)
+        return wait_for_active(
+            ilog,
+            server_endpoint,
+            auth_token,
+            server_id)
+
+    return d.addCallback(wait_for_server)
+
+
+def _rename_lb_nodes(server, lb_config):
+    """
+    Set the server name in the metadata of the load balancer configs to the
+    name ``server`` actually has.
+    """
+    for lb in lb_config:
+        lb['metadata']['rax:auto_scaling_server_name'] = server['server']['name']
+    return server
+
+
+def _check_warm_server(log, server_endpoint, auth_token, warm_server):
+    """
+    Get the current details of a server from the warm pool, since it may have
+    been deleted or errored since it was built.
+
+    If it no longer exists, or can not be seen to be active, it is deleted
+    (if it exists) and ``None`` returned so that a new server is built
+    instead.
+
+    :return: Deferred that fires with the server details if it is active, and
+        ``None`` otherwise
+    """
+    server_id = warm_server['server']['id']
+    d = server_details(server_endpoint, auth_token, server_id)
+
+    def check_active(server):
+        status = server['server']['status']
+        if status == 'ACTIVE':
+            return server
+        log.msg("Server from warm pool is {status}, building another instead",
+                status=status)
+        verified_delete(log, server_endpoint, auth_token, server_id).addErrback(log.err)
+
+    def check_failed(f):
+        reason = f.value.reason if f.check(RequestError) else f
+        if reason.check(APIError) and reason.value.code == 404:
+            log.msg("Server from warm pool no longer exists, building another instead")
+        else:
+            log.msg("Could not check server from warm pool, building another instead",
+                    reason=f)
+            verified_delete(log, server_endpoint, auth_token, server_id).addErrback(log.err)
+
+    return d.addCallbacks(check_active, check_failed)
+
+
+def _server_endpoint(log, service_catalog, region):
+    cloudServersOpenStack = config_value('cloudServersOpenStack')
+
+    log.msg("Looking for cloud servers endpoint",
+            service_name=cloudServersOpenStack,
+            region=region)
+
+    return public_endpoint_url(service_catalog,
+                               cloudServersOpenStack,
+                               region)
+
+
+def build_server(log, region, scaling_group, service_catalog, auth_token,
+                 launch_config, undo):
+    """
+    Build a server from the launch config for a scaling group's warm pool,
+    without adding it to any load balancers.
+
+    :param BoundLog log: A bound logger.
+    :param str region: A rackspace region as found in the service catalog.
+    :param IScalingGroup scaling_group: The scaling group to build the server
+        for.
+    :param list service_catalog: A list of services as returned by the auth apis.
+    :param str auth_token: The user's auth token.
+    :param dict launch_config: A launch_config args structure as defined for
+        the launch_server_v1 type.
+    :param IUndoStack undo: The stack that will be rewound if undo fails.
+
+    :return: Deferred that fires with the server details once it is active.
+    """
+    launch_config = prepare_launch_config(scaling_group.uuid, launch_config)
+    server_endpoint = _server_endpoint(log, service_catalog, region)
+    server_config = launch_config['server']
+
+    log = log.bind(server_name=server_config['name'])
+    return _create_active_server(log, server_endpoint, auth_token, server_config,
+                                 [], undo)
+
+
 def launch_server(log, region, scaling_group, service_catalog, auth_token,
-                  launch_config, undo):
+                  launch_config, undo, warm_server=None):
     """
     Launch a new server given the launch config auth tokens and service catalog.
     Possibly adding the newly launched server to a load balancer.
@@ -320,6 +595,10 @@ def launch_server(log, region, scaling_group, service_catalog, auth_token,
     :param dict launch_config: A launch_config args structure as defined for
         the launch_server_v1 type.
     :param IUndoStack undo: The stack that will be rewound if undo fails.
+    :param dict warm_server: The details of an active server built by
+        :func:`build_server` from the same launch config, to use instead of
+        creating a new server if it is still active.  Only adding it to load
+        balancers is left.
 
     :return: Deferred that fires with a 2-tuple of server details and the
         list of load balancer responses from add_to_load_balancers.
@@ -328,7 +607,6 @@ def launch_server(log, region, scaling_group, service_catalog, auth_token,
 
     lb_region = config_value('regionOverrides.cloudLoadBalancers') or region
     cloudLoadBalancers = config_value('cloudLoadBalancers')
-    cloudServersOpenStack = config_value('cloudServersOpenStack')
 
     log.msg("Looking for load balancer endpoint",
             service_name=cloudLoadBalancers,
@@ -338,36 +616,35 @@ def launch_server(log, region, scaling_group, service_catalog, auth_token,
                                       cloudLoadBalancers,
                                       lb_region)
 
-    log.msg("Looking for cloud servers endpoint",
-            service_name=cloudServersOpenStack,
-            region=region)
-
-    server_endpoint = public_endpoint_url(service_catalog,
-                                          cloudServersOpenStack,
-                                          region)
+    server_endpoint = _server_endpoint(log, service_catalog, region)
 
     lb_config = launch_config.get('loadBalancers', [])
 
     server_config = launch_config['server']
 
-    log = log.bind(server_name=server_config['name'])
-
-    d = create_server(server_endpoint, auth_token, server_config)
+    def create_active_server(_):
+        create_log = log.bind(server_name=server_config['name'])
+        return _create_active_server(create_log, server_endpoint, auth_token,
+                                     server_config, lb_config, undo)
 
-    def wait_for_server(server):
+    def launch_warm_server(server):
+        if server is None:
+            return create_active_server(None)
         server_id = server['server']['id']
-
+        warm_log = log.bind(server_name=server['server']['name'],
+                            instance_id=server_id)
+        warm_log.msg("Launching server from warm pool")
         undo.push(
-            verified_delete, log, server_endpoint, auth_token, server_id)
+            verified_delete, warm_log, server_endpoint, auth_token, server_id)
+        return _rename_lb_nodes(server, lb_config)
 
-        ilog = log.bind(instance_id=server_id)
-        return wait_for_active(
-            ilog,
-            server_endpoint,
-            auth_token,
-            server_id)
-
-    d.addCallback(wait_for_server)
+    if warm_server is None:
+        d = create_active_server(None)
+    else:
+        d = _check_warm_server(
+            log.bind(instance_id=warm_server['server']['id']), server_endpoint,
+            auth_token, warm_server)
+        d.addCallback(launch_warm_server)
 
     def add_lb(server):
         ip_address = private_ip_addresses(server)[0]
@@ -419,6 +696,11 @@ def delete_server(log, region, service_catalog, auth_token, instance_details):
 
     TODO: Load balancer draining.
 
+    If ``worker.lb_batch_window`` is configured, the server's nodes are removed
+    along with the other nodes removed from the same load balancers within
+    that many seconds, by the load balancers'
+    :class:`otter.worker.lb_batcher.NodeRemovalBatcher`.
+
     :param str region: A rackspace region as found in the service catalog.
     :param list service_catalog: A list of services as returned by the auth apis.
     :param str auth_token: The user's auth token.
@@ -461,9 +743,17 @@ def delete_server(log, region, service_catalog, auth_token, instance_details):
         *[[(loadbalancer_id, node['id']) for node in node_details['nodes']]
           for (loadbalancer_id, node_details) in loadbalancer_details])
 
-    d = gatherResults(
-        [remove_from_load_balancer(lb_endpoint, auth_token, loadbalancer_id, node_id)
-         for (loadbalancer_id, node_id) in node_info], consumeErrors=True)
+    window = config_value('worker.lb_batch_window')
+
+    def remove(loadbalancer_id, node_id):
+        if window:
+            batcher = get_node_removal_batcher(lb_endpoint, loadbalancer_id, window)
+            return batcher.remove_node(auth_token, node_id)
+        return remove_from_load_balancer(lb_endpoint, auth_token,
+                                         loadbalancer_id, node_id)
+
+    d = gatherResults([remove(loadbalancer_id, node_id)
+                       for (loadbalancer_id, node_id) in node_info], consumeErrors=True)
 
     def when_removed_from_loadbalancers(_ignore):
         return verified_delete(log, server_endpoint, auth_token, server_id)
@@ -489,6 +779,16 @@ def verified_delete(log,
     Time out attempting to verify deletes after a period of time and log an
     error.
 
+    If ``worker.batch_server_polling`` is configured, the delete is verified
+    by the :class:`otter.worker.status_poller.ServerStatusPoller` of the
+    endpoint seeing the server's status change to 'DELETED', rather than by
+    getting the server.
+
+    If notification feeds are being polled, the delete is verified as soon as
+    Nova says it has finished deleting the server, and otherwise only every
+    ``worker.event_fallback_interval`` seconds (default 60) in case the
+    notification is missed.
+
     :param log: A bound logger.
     :param str server_endpoint: Server endpoint URI.
     :param str auth_token: Keystone Auth token.
@@ -500,6 +800,8 @@ def verified_delete(log,
         the server is building, the delete will not happen until immediately
         after it has finished building.
 
+    See :func:`_polling_interval` for backing off between verifications.
+
     :return: Deferred that fires when the expected status has been seen.
     """
     del_log = log.bind(instance_id=server_id)
@@ -514,8 +816,24 @@ def verified_delete(log,
         from twisted.internet import reactor
         clock = reactor
 
+    listener = get_server_event_listener()
+    if listener is not None:
+        interval = config_value('worker.event_fallback_interval') or 60
+
     def verify(_):
+        polls = [0]
+
+        def check_deleted(server):
+            if server is None or server['server']['status'] != 'DELETED':
+                raise TransientRetryError()
+
         def check_status():
+            polls[0] += 1
+            if config_value('worker.batch_server_polling'):
+                poller = get_server_status_poller(server_endpoint, interval, clock)
+                check_d = poller.server_details(auth_token, server_id)
+                return check_d.addCallback(check_deleted)
+
             check_d = treq.head(
                 append_segments(server_endpoint, 'servers', server_id),
                 headers=headers(auth_token))
@@ -528,14 +846,20 @@ def verified_delete(log,
             "Waiting for Nova to actually delete server {0}".format(server_id))
 
         verify_d = retry_and_timeout(check_status, timeout,
-                                     next_interval=repeating_interval(interval),
+                                     next_interval=_polling_interval('delete', interval),
                                      clock=clock,
                                      deferred_description=timeout_description)
+        if config_value('worker.batch_server_polling'):
+            verify_d.addBoth(_forget_polled, server_endpoint, interval, clock, server_id)
+        if listener is not None:
+            verify_d = _complete_early(verify_d, listener.wait_for(DELETED, server_id),
+                                       lambda: succeed(None))
 
         def on_success(_):
             time_delete = clock.seconds() - start_time
             del_log.msg('Server deleted successfully: {time_delete} seconds.',
                         time_delete=time_delete)
+            _count_polls('delete', polls[0])
 
         verify_d.addCallback(on_success)
         verify_d.addErrback(del_log.err)
@@ -0,0 +1,357 @@
+"""
+Coalescing the nodes added to and removed from a Cloud Load Balancer.
+
+A load balancer is immutable while it adds or removes a node, so changing many
+of its nodes one at a time mostly gets 422 responses.  A :class:`NodeBatcher`
+collects the nodes added to a load balancer over a short window and adds them
+all with one request, and a :class:`NodeRemovalBatcher` does the same for the
+nodes removed, both retrying while the load balancer is immutable.
+"""
+import json
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from otter.log import log as otter_log
+from otter.util.deferredutils import retry_and_timeout
+from otter.util.http import (append_segments, headers, check_success,
+                             wrap_request_error, APIError, RequestError)
+from otter.util.pool import treq
+from otter.util.retry import backoff_interval
+
+# The most nodes a load balancer removes with one request
+MAX_NODES_REMOVED = 10
+
+
+class NodeNotAdded(Exception):
+    """
+    Raised when a load balancer's response to adding a batch of nodes does not
+    include one of the nodes.
+    """
+    def __init__(self, lb_id, address, port):
+        super(NodeNotAdded, self).__init__(
+            'Node {0}:{1} not added to load balancer {2}'.format(address, port, lb_id))
+        self.lb_id = lb_id
+        self.address = address
+        self.port = port
+
+
+def _api_error(failure):
+    """
+    The :class:`APIError` a load balancer request failed with, if it failed
+    with one.
+    """
+    if failure.check(RequestError) and failure.value.reason.check(APIError):
+        return failure.value.reason.value
+
+
+def is_immutable(failure):
+    """
+    Whether a request failed because the load balancer is immutable (busy
+    with a previous change), so that it can be retried.  The load balancer
+    says so with a 422 response whose message mentions its ``PENDING_UPDATE``
+    status or that it is immutable; other 422 responses, such as for
+    duplicate nodes, are not retried.
+
+    :param failure: :class:`Failure` of a load balancer request
+    """
+    error = _api_error(failure)
+    return bool(error is not None and error.code == 422 and
+                ('immutable' in str(error.body) or 'PENDING_UPDATE' in str(error.body)))
+
+
+def is_node_error(failure):
+    """
+    Whether a request failed with a client error that is not the load
+    balancer being immutable or over its rate limit, and so may have been
+    caused by one of the nodes in it.
+
+    :param failure: :class:`Failure` of a load balancer request
+    """
+    error = _api_error(failure)
+    return bool(error is not None and 400 <= error.code < 500 and error.code != 413 and
+                not is_immutable(failure))
+
+
+_batchers = {}
+
+
+def _get_batcher(batcher_class, endpoint, lb_id, window, clock):
+    key = (batcher_class, endpoint, lb_id)
+    batcher = _batchers.get(key)
+    if batcher is None:
+        if clock is None:  # pragma: no cover
+            from twisted.internet import reactor
+            clock = reactor
+
+        def forget():
+            if _batchers.get(key) is batcher:
+                del _batchers[key]
+
+        batcher = _batchers[key] = batcher_class(endpoint, lb_id, window, clock, forget)
+    return batcher
+
+
+def get_node_batcher(endpoint, lb_id, window=1, clock=None):
+    """
+    Get the batcher of the nodes added to load balancer ``lb_id``, making one
+    if there is none.  A batcher is forgotten once it has no nodes to add.
+
+    :param str endpoint: Load balancer endpoint URI.
+    :param lb_id: The load balancer ID.
+    :param window: seconds to collect nodes for before adding them, if a
+        batcher has to be made
+    :param clock: An instance of IReactorTime provider that defaults to
+        reactor if not provided
+
+    :return: :class:`NodeBatcher`
+    """
+    return _get_batcher(NodeBatcher, endpoint, lb_id, window, clock)
+
+
+def get_node_removal_batcher(endpoint, lb_id, window=1, clock=None):
+    """
+    Get the batcher of the nodes removed from load balancer ``lb_id``, making
+    one if there is none.  A batcher is forgotten once it has no nodes to
+    remove.
+
+    :param str endpoint: Load balancer endpoint URI.
+    :param lb_id: The load balancer ID.
+    :param window: seconds to collect nodes for before removing them, if a
+        batcher has to be made
+    :param clock: An instance of IReactorTime provider that defaults to
+        reactor if not provided
+
+    :return: :class:`NodeRemovalBatcher`
+    """
+    return _get_batcher(NodeRemovalBatcher, endpoint, lb_id, window, clock)
+
+
+class _Batcher(object):
+    """
+    Collects changes to one load balancer for ``window`` seconds, and then
+    sends them with as few requests as possible.  Changes made while a batch is
+    being sent are sent with the next batch.
+
+    This is an abstract base class: it is never instantiated itself.
+    Subclasses queue a change with :meth:`_wait`, and define ``_send()``,
+    which is called with no arguments to send a batch.
+
+    ``self._pending`` maps the key of each change to the list of Deferreds
+    waiting on it.  ``_send`` takes the changes it sends out of it, leaving
+    any others for the next batch, and fires their Deferreds with the result
+    or failure of sending them.  It returns a Deferred that fires when the
+    batch is done, and must not fail, since sending failures are passed on to
+    the waiting Deferreds instead and the next batch is only scheduled once
+    it fires.
+
+    :ivar str endpoint: Load balancer endpoint URI.
+    :ivar lb_id: The load balancer ID.
+    :ivar window: seconds to collect changes for before sending them
+    :ivar clock: IReactorTime provider used to schedule batches
+    :ivar on_idle: callable called with no arguments when a batch is done and
+        there are no more changes to send
+    :ivar int min_interval: seconds to wait before retrying a request the
+        first time the load balancer is immutable, backing off from then on
+    :ivar int max_interval: the most seconds to wait before retrying a request
+    :ivar int timeout: seconds after which to stop retrying a request
+    """
+    min_interval = 1
+    max_interval = 30
+    timeout = 300
+
+    def __init__(self, endpoint, lb_id, window, clock, on_idle=None):
+        self.endpoint = endpoint
+        self.lb_id = lb_id
+        self.window = window
+        self.clock = clock
+        self.on_idle = on_idle
+        self._auth_token = None
+        self._pending = {}
+        self._delayed_call = None
+        self._sending = False
+
+    def _wait(self, auth_token, key):
+        self._auth_token = auth_token
+        d = defer.Deferred()
+        self._pending.setdefault(key, []).append(d)
+        self._schedule()
+        return d
+
+    def _schedule(self):
+        if self._sending or self._delayed_call is not None:
+            return
+        self._delayed_call = self.clock.callLater(self.window, self._start)
+
+    def _start(self):
+        self._delayed_call = None
+        self._sending = True
+        return self._send().addCallback(lambda _: self._done())
+
+    def _done(self):
+        self._sending = False
+        if self._pending:
+            self._schedule()
+        elif self.on_idle is not None:
+            self.on_idle()
+
+    def _retry(self, request, description):
+        """
+        Make a request, retrying it while the load balancer is immutable
+        """
+        return retry_and_timeout(
+            request, self.timeout,
+            can_retry=is_immutable,
+            next_interval=backoff_interval(self.min_interval, self.max_interval),
+            clock=self.clock,
+            deferred_description='{0} load balancer {1}'.format(description, self.lb_id))
+
+
+class NodeBatcher(_Batcher):
+    """
+    Adds the nodes added to one load balancer within ``window`` seconds of each
+    other with one ``POST /loadbalancers/{id}/nodes``.
+
+    If adding more than one node at once fails with a client error, for
+    instance because one of them is already on the load balancer, each of them
+    is added on its own so that one node can not stop the others from being
+    added.
+    """
+    def add_node(self, auth_token, address, port):
+        """
+        Add a node to the load balancer with the next batch.  Adding the same
+        address and port more than once in a batch adds one node.
+
+        :param str auth_token: Keystone Auth Token.  The most recently given
+            token is used for each batch.
+        :param str address: the IP address of the node
+        :param int port: the port of the node
+
+        :return: Deferred that fires with the Add Node response as a dict
+            containing only this node, as if it had been added on its own.
+        """
+        return self._wait(auth_token, (address, port))
+
+    def _add(self, nodes):
+        path = append_segments(self.endpoint, 'loadbalancers', str(self.lb_id), 'nodes')
+        data = json.dumps({'nodes': [{'address': address,
+                                      'port': port,
+                                      'condition': 'ENABLED',
+                                      'type': 'PRIMARY'}
+                                     for address, port in nodes]})
+
+        def post():
+            d = treq.post(path, headers=headers(self._auth_token), data=data)
+            d.addCallback(check_success, [200, 202])
+            d.addErrback(wrap_request_error, path, 'add')
+            return d.addCallback(treq.json_content)
+
+        return self._retry(post, 'Adding nodes to')
+
+    def _send(self):
+        """
+        Add all the nodes collected with one request, and pass each node's part
+        of the response on.
+        """
+        pending, self._pending = self._pending, {}
+        nodes = sorted(pending)
+
+        def fire(result, nodes):
+            if isinstance(result, Failure):
+                added = {}
+            else:
+                added = dict(((node['address'], node['port']), node)
+                             for node in result['nodes'])
+            for address, port in nodes:
+                node = added.get((address, port))
+                for d in pending[(address, port)]:
+                    if isinstance(result, Failure):
+                        d.errback(result)
+                    elif node is None:
+                        d.errback(NodeNotAdded(self.lb_id, address, port))
+                    else:
+                        d.callback({'nodes': [node]})
+
+        def add_one_by_one(failure):
+            if len(nodes) == 1 or not is_node_error(failure):
+                return fire(failure, nodes)
+            d = defer.succeed(None)
+            for node in nodes:
+                d.addCallback(lambda _, node=node:
+                              self._add([node]).addBoth(fire, [node]))
+            return d
+
+        return self._add(nodes).addCallbacks(fire, add_one_by_one, callbackArgs=(nodes,))
+
+
+class NodeRemovalBatcher(_Batcher):
+    """
+    Removes the nodes removed from one load balancer within ``window`` seconds
+    of each other with ``DELETE /loadbalancers/{id}/nodes?id=...``, at most
+    :data:`MAX_NODES_REMOVED` nodes at a time.
+
+    If removing more than one node at once fails with a client error, for
+    instance because one of them has already been removed, each of them is
+    removed on its own so that one node can not stop the others from being
+    removed.
+    """
+    log = otter_log.bind(system='otter.worker.lb_batcher')
+
+    def remove_node(self, auth_token, node_id):
+        """
+        Remove a node from the load balancer with the next batch.
+
+        :param str auth_token: Keystone Auth Token.  The most recently given
+            token is used for each batch.
+        :param node_id: The ID of the node to remove.
+
+        :return: Deferred that fires with None when the node has been removed,
+            or fails with a :class:`RequestError`.
+        """
+        return self._wait(auth_token, node_id)
+
+    def _remove(self, node_ids):
+        path = append_segments(self.endpoint, 'loadbalancers', str(self.lb_id), 'nodes')
+
+        def delete():
+            d = treq.delete(path, headers=headers(self._auth_token),
+                            params={'id': [str(node_id) for node_id in node_ids]})
+            d.addCallback(check_success, [200, 202])
+            return d.addErrback(wrap_request_error, path, 'remove')
+
+        return self._retry(delete, 'Removing nodes from')
+
+    def _send(self):
+        """
+        Remove up to :data:`MAX_NODES_REMOVED` of the nodes collected, leaving
+        the rest for the next batch.
+        """
+        node_ids = sorted(self._pending)[:MAX_NODES_REMOVED]
+        pending = dict((node_id, self._pending.pop(node_id)) for node_id in node_ids)
+
+        def fire(result, node_id):
+            for d in pending[node_id]:
+                if isinstance(result, Failure):
+                    d.errback(result)
+                else:
+                    d.callback(None)
+
+        def removed(result):
+            for node_id in node_ids:
+                fire(result, node_id)
+            self.log.msg('Removed {removed} nodes from load balancer {lb_id}, '
+                         '{remaining} left to remove', removed=len(node_ids),
+                         lb_id=self.lb_id, remaining=len(self._pending))
+
+        def remove_one_by_one(failure):
+            if len(node_ids) == 1 or not is_node_error(failure):
+                for node_id in node_ids:
+                    fire(failure, node_id)
+                return
+            d = defer.succeed(None)
+            for node_id in node_ids:
+                d.addCallback(lambda _, node_id=node_id:
+                              self._remove([node_id]).addBoth(fire, node_id))
+            return d
+
+        return self._remove(node_ids).addCallbacks(removed, remove_one_by_one)
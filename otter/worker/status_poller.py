@@ -0,0 +1,210 @@
+"""
+Polling the status of many servers with one request to Nova.
+
+Rather than getting the details of every server being waited on, a
+:class:`ServerStatusPoller` lists the details of all the servers of an endpoint
+that have changed since it last looked, and passes each server's details on to
+whatever is waiting for them.
+
+Each server is polled for the changes since the last poll it saw, however long
+ago that was, so a server must be forgotten with
+:meth:`ServerStatusPoller.forget` once nothing will wait for it again.
+"""
+from datetime import datetime
+
+from twisted.internet import defer
+
+from otter.util.http import (append_segments, headers, check_success,
+                             wrap_request_error)
+from otter.util.pool import treq
+
+
+# How many seconds each list of changed servers overlaps the previous one, so
+# that changes are not missed due to the clocks here and in Nova differing
+CHANGES_SINCE_MARGIN = 60
+
+_pollers = {}
+
+
+def get_server_status_poller(server_endpoint, interval=5, clock=None):
+    """
+    Get the poller of the servers of ``server_endpoint`` that polls every
+    ``interval`` seconds with ``clock``, making one if there is none.  A poller
+    is forgotten once nothing is waiting on it, and every server it polled
+    has been forgotten.
+
+    :param str server_endpoint: Server endpoint URI.
+    :param int interval: minimum number of seconds between polls
+    :param clock: An instance of IReactorTime provider that defaults to
+        reactor if not provided
+
+    :return: :class:`ServerStatusPoller`
+    """
+    if clock is None:  # pragma: no cover
+        from twisted.internet import reactor
+        clock = reactor
+
+    key = (server_endpoint, interval, clock)
+    poller = _pollers.get(key)
+    if poller is None:
+        def forget():
+            if _pollers.get(key) is poller:
+                del _pollers[key]
+
+        poller = _pollers[key] = ServerStatusPoller(server_endpoint, interval, clock, forget)
+    return poller
+
+
+def _changes_since(seconds):
+    return "{0}Z".format(datetime.utcfromtimestamp(seconds).replace(microsecond=0).isoformat())
+
+
+class ServerStatusPoller(object):
+    """
+    Polls the servers of one Nova endpoint that have changed, with at most one
+    ``GET /servers/detail?changes-since=...`` every ``interval`` seconds
+    however many servers are being waited on.
+
+    :ivar str server_endpoint: Server endpoint URI.
+    :ivar int interval: minimum number of seconds between polls
+    :ivar clock: IReactorTime provider used to schedule polls
+    :ivar on_idle: callable called with no arguments when a poll finishes and
+        nothing is waiting for the next one, and every server polled has been
+        forgotten
+    """
+    def __init__(self, server_endpoint, interval, clock, on_idle=None):
+        self.server_endpoint = server_endpoint
+        self.interval = interval
+        self.clock = clock
+        self.on_idle = on_idle
+        self._auth_token = None
+        self._waiting = {}
+        self._seen = {}
+        self._last_poll = None
+        self._delayed_call = None
+        self._polling = False
+
+    def server_details(self, auth_token, server_id):
+        """
+        Wait for the next poll to see whether a server has changed since the
+        last poll that was waited on for it, or since now if there was none.
+
+        :param str auth_token: Keystone Auth token.  The most recently given
+            token is used for each poll.
+        :param str server_id: Opaque nova server id.
+
+        :return: Deferred that fires with the server's details, as returned by
+            :func:`otter.worker.launch_server_v1.server_details`, if the server
+            has changed recently, or with ``None`` if it has not.  It fails if
+            the poll fails.
+        """
+        self._auth_token = auth_token
+        self._seen.setdefault(server_id, self.clock.seconds())
+
+        def cancel(d):
+            waiting = self._waiting.get(server_id, [])
+            if d in waiting:
+                waiting.remove(d)
+                if not waiting:
+                    del self._waiting[server_id]
+
+        d = defer.Deferred(cancel)
+        self._waiting.setdefault(server_id, []).append(d)
+        self._schedule()
+        return d
+
+    def forget(self, server_id):
+        """
+        Stop keeping track of the last poll seen for a server, once nothing
+        will wait for it again.
+
+        :param str server_id: Opaque nova server id.
+        """
+        self._seen.pop(server_id, None)
+        if not self._polling and self._delayed_call is None:
+            self._done()
+
+    def _schedule(self):
+        """
+        Schedule the next poll, if it is not already scheduled or in progress,
+        for no sooner than ``interval`` seconds after the previous one.
+        """
+        if self._polling or self._delayed_call is not None:
+            return
+        delay = 0
+        if self._last_poll is not None:
+            delay = max(0, self._last_poll + self.interval - self.clock.seconds())
+        self._delayed_call = self.clock.callLater(delay, self._poll)
+
+    def _poll(self):
+        """
+        List the servers that have changed, and pass each waiting server's
+        details on.
+        """
+        self._delayed_call = None
+        waiting, self._waiting = self._waiting, {}
+        if not waiting:
+            return self._done()
+
+        self._polling = True
+        self._last_poll = now = self.clock.seconds()
+        since = min(self._seen.get(server_id, now) for server_id in waiting)
+
+        path = append_segments(self.server_endpoint, 'servers', 'detail')
+        params = {'changes-since': _changes_since(since - CHANGES_SINCE_MARGIN)}
+        d = self._list_changed(path, params, [])
+
+        def fan_out(servers):
+            for server_id in waiting:
+                if server_id in self._seen:
+                    self._seen[server_id] = now
+            changed = dict((server['id'], server) for server in servers)
+            for server_id, ds in waiting.iteritems():
+                server = changed.get(server_id)
+                result = None if server is None else {'server': server}
+                for d in ds:
+                    if not d.called:
+                        d.callback(result)
+
+        def fail_all(failure):
+            for ds in waiting.itervalues():
+                for d in ds:
+                    if not d.called:
+                        d.errback(failure)
+
+        d.addCallbacks(fan_out, fail_all)
+        d.addCallback(lambda _: self._done())
+        return d
+
+    def _list_changed(self, path, params, servers):
+        """
+        List the servers that have changed, following the ``next`` links of
+        the listing until the last page.
+
+        :param str path: the URL of the page to get
+        :param params: the query parameters to add to ``path``, or ``None`` if
+            it already has them, as ``next`` links do
+        :param list servers: the servers listed on the pages before this one
+
+        :return: Deferred that fires with the list of all the servers listed
+        """
+        d = treq.get(path, headers=headers(self._auth_token), params=params)
+        d.addCallback(check_success, [200, 203])
+        d.addErrback(wrap_request_error, path, 'server_status_poll')
+        d.addCallback(treq.json_content)
+
+        def next_page(body):
+            servers.extend(body['servers'])
+            for link in body.get('servers_links', []):
+                if link.get('rel') == 'next':
+                    return self._list_changed(link['href'], None, servers)
+            return servers
+
+        return d.addCallback(next_page)
+
+    def _done(self):
+        self._polling = False
+        if self._waiting:
+            self._schedule()
+        elif not self._seen and self.on_idle is not None:
+            self.on_idle()
@@ -3,7 +3,6 @@ Contains code to validate launch config
 """
 
 from twisted.internet import defer
-import treq
 import base64
 import re
 import itertools
@@ -12,6 +11,7 @@ from otter.worker.launch_server_v1 import public_endpoint_url
 from otter.util.config import config_value
 from otter.util.http import (append_segments, headers, check_success,
                              RequestError, APIError, wrap_request_error)
+from otter.util.pool import treq
 
 
 b64_chars_re = re.compile("^[+/=a-zA-Z0-9]+$")
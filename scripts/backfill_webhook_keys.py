@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+"""
+Copies the webhook key of every existing webhook in the policy_webhooks table
+into the webhook_keys table.  It is safe to run more than once.
+"""
+
+import argparse
+
+from cql.connection import connect
+
+
+the_parser = argparse.ArgumentParser(
+    description="Backfill the webhook_keys table from policy_webhooks.")
+
+the_parser.add_argument(
+    '--keyspace', type=str, default='otter',
+    help='The name of the keyspace.  Default: otter')
+
+the_parser.add_argument(
+    '--host', type=str, default='localhost',
+    help='The host of the cluster to connect to. Default: localhost')
+
+the_parser.add_argument(
+    '--port', type=int, default=9160,
+    help='The port of the cluster to connect to. Default: 9160')
+
+the_parser.add_argument(
+    '--page-size', type=int, default=1000,
+    help='The number of webhooks to read at a time. Default: 1000')
+
+the_parser.add_argument(
+    '--dry-run', action='store_true',
+    help="If this option is passed, no webhook keys are written.")
+
+the_parser.add_argument(
+    '--verbose', '-v', action='count', default=0, help="How verbose to be")
+
+
+_select = ('SELECT "tenantId", "groupId", "policyId", "webhookId", "webhookKey" '
+           'FROM policy_webhooks ')
+
+
+def read_webhooks(cursor, page_size):
+    """
+    Yield every webhook in the policy_webhooks table, reading ``page_size`` of
+    them at a time in token order of their tenant ID.  A page can end part
+    way through the webhooks of a tenant, so the rest of them are read before
+    going on to the next tenant.
+    """
+    # without a LIMIT, CQL 3 only returns the first 10000 rows
+    cursor.execute(_select + 'LIMIT :size;', {'size': page_size})
+    while True:
+        webhooks = cursor.fetchall()
+        for webhook in webhooks:
+            yield webhook
+        if len(webhooks) < page_size:
+            return
+
+        # a tenant's webhooks are ordered by the rest of their key, so the
+        # ones not yet read are those after the last one read
+        tenant_id, last = webhooks[-1][0], webhooks[-1][1:4]
+        cursor.execute(_select + 'WHERE "tenantId" = :tenantId;', {'tenantId': tenant_id})
+        for webhook in cursor.fetchall():
+            if webhook[1:4] > last:
+                yield webhook
+
+        cursor.execute(_select + 'WHERE token("tenantId") > token(:tenantId) LIMIT :size;',
+                       {'tenantId': tenant_id, 'size': page_size})
+
+
+def run(args):
+    """
+    Add a webhook_keys row for every webhook
+    """
+    if args.verbose > 0:
+        print "Attempting to connect to {0}:{1}".format(args.host, args.port)
+
+    connection = connect(args.host, args.port, cql_version='3.0.4')
+    cursor = connection.cursor()
+    cursor.execute('USE {0};'.format(args.keyspace), {})
+
+    # webhooks are read with a cursor of their own, so that the queries made
+    # while copying them do not replace the page being read
+    reader = connection.cursor()
+    reader.execute('USE {0};'.format(args.keyspace), {})
+
+    copied = 0
+    for tenant_id, group_id, policy_id, webhook_id, webhook_key in read_webhooks(
+            reader, args.page_size):
+        if args.verbose > 1:
+            print "Copying webhook key of policy {0}".format(policy_id)
+        if not args.dry_run:
+            cursor.execute('INSERT INTO webhook_keys("webhookKey", "tenantId", "groupId", '
+                           '"policyId") VALUES (:webhookKey, :tenantId, :groupId, :policyId);',
+                           {'webhookKey': webhook_key, 'tenantId': tenant_id,
+                            'groupId': group_id, 'policyId': policy_id})
+        copied += 1
+
+    print "Copied {0} webhook keys".format(copied)
+
+    reader.close()
+    cursor.close()
+    connection.close()
+
+
+args = the_parser.parse_args()
+run(args)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+Times writing single partition batches, shaped like those written by
+``update_config`` and ``create_policies``, as logged batches (as they were
+always written before) and as the unlogged batches the store now picks for
+them.  Each batch is one round trip, so the difference is the cost of the
+batchlog.
+
+It writes to the scaling_group and scaling_policies tables of the given
+keyspace for a tenant that should not exist, and deletes what it wrote at the
+end, so point it at a development cluster.
+"""
+
+import argparse
+import json
+import time
+
+from cql.connection import connect
+from twisted.internet.defer import succeed
+
+from otter.util.cqlbatch import Batch, BatchType
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark logged and unlogged single partition batches.")
+
+the_parser.add_argument(
+    '--keyspace', type=str, default='otter',
+    help='The name of the keyspace.  Default: otter')
+
+the_parser.add_argument(
+    '--host', type=str, default='localhost',
+    help='The host of the cluster to connect to. Default: localhost')
+
+the_parser.add_argument(
+    '--port', type=int, default=9160,
+    help='The port of the cluster to connect to. Default: 9160')
+
+the_parser.add_argument(
+    '--number', type=int, default=1000,
+    help='The number of batches of each kind to write.  Default: 1000')
+
+the_parser.add_argument(
+    '--tenant', type=str, default='batch-benchmark',
+    help='The tenant ID to write as.  Default: batch-benchmark')
+
+
+class CursorClient(object):
+    """
+    Executes the queries of a :class:`Batch` with a cql cursor, and records
+    how long each took
+    """
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.latencies = []
+
+    def execute(self, query, params, consistency):
+        """
+        Execute the query, ignoring the consistency
+        """
+        start = time.time()
+        self.cursor.execute(query, params)
+        self.latencies.append(time.time() - start)
+        return succeed(None)
+
+
+def batches(tenant_id, i):
+    """
+    The statements and parameters of a batch updating a group config, and of
+    one creating three policies
+    """
+    params = {'tenantId': tenant_id, 'groupId': 'group{0}'.format(i),
+              'scaling': json.dumps({'name': 'benchmark', '_ver': 1})}
+    yield (['INSERT INTO scaling_group("tenantId", "groupId", group_config) '
+            'VALUES (:tenantId, :groupId, :scaling)'], params)
+
+    statements = []
+    params = {'tenantId': tenant_id, 'groupId': 'group{0}'.format(i)}
+    for p in range(3):
+        name = 'policy{0}'.format(p)
+        statements.append('INSERT INTO scaling_policies("tenantId", "groupId", "policyId", data) '
+                          'VALUES (:tenantId, :groupId, :{0}Id, :{0})'.format(name))
+        params[name + 'Id'] = name
+        params[name] = json.dumps({'name': name, '_ver': 1})
+    yield (statements, params)
+
+
+def summary(latencies):
+    """
+    The mean, median and 99th percentile of the latencies, in milliseconds
+    """
+    latencies = sorted(latencies)
+    return (sum(latencies) * 1000 / len(latencies),
+            latencies[len(latencies) / 2] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000)
+
+
+def run(args):
+    """
+    Write the batches, and print their latencies
+    """
+    connection = connect(args.host, args.port, cql_version='3.0.4')
+    cursor = connection.cursor()
+    cursor.execute('USE {0};'.format(args.keyspace), {})
+
+    print "{0:<10}{1:>12}{2:>12}{3:>12}{4:>12}".format(
+        'batch', 'round trips', 'mean (ms)', 'p50 (ms)', 'p99 (ms)')
+    for batch_type in (BatchType.LOGGED, BatchType.UNLOGGED):
+        client = CursorClient(cursor)
+        for i in range(args.number):
+            for statements, params in batches(args.tenant, i):
+                Batch(statements, params, batch_type=batch_type).execute(client)
+        print "{0:<10}{1:>12}{2:>12.2f}{3:>12.2f}{4:>12.2f}".format(
+            batch_type.lower(), len(client.latencies), *summary(client.latencies))
+
+    for table in ('scaling_group', 'scaling_policies'):
+        cursor.execute('DELETE FROM {0} WHERE "tenantId" = :tenantId;'.format(table),
+                       {'tenantId': args.tenant})
+    cursor.close()
+    connection.close()
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Counts the CQL statements Cassandra has to parse, and times the client side of
+executing them, for ``modify_state`` (with optimistic concurrency) and
+``webhook_info_by_hash`` (missing the webhook cache), executing the queries as
+text as silverberg does, and as statements prepared once and cached by
+otter.util.cqlprepared.
+
+No Cassandra is needed: the clients answer each query with a canned row.  The
+text client substitutes the parameters into the query as silverberg does, and
+the preparing client marshals each parameter as a driver binding them would.
+"""
+
+import argparse
+import json
+import timeit
+
+from twisted.internet.defer import succeed
+
+from silverberg.marshal import marshal, prepare
+
+from otter.log import log
+from otter.models.cass import CassScalingGroupCollection
+from otter.util.config import set_config_data
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark executing CQL as text and as prepared statements.")
+
+the_parser.add_argument(
+    '--number', type=int, default=2000,
+    help='The number of times to run each operation.  Default: 2000')
+
+
+_state_row = {
+    'tenantId': 'tenant', 'groupId': 'group',
+    'group_config': json.dumps({'name': 'group', '_ver': 1}),
+    'active': '{"_ver": 1}', 'pending': '{"_ver": 1}',
+    'groupTouched': None, 'policyTouched': '{"_ver": 1}',
+    'paused': '\x00', 'version': 1, 'created_at': 1}
+
+_webhook_row = {'tenantId': 'tenant', 'groupId': 'group', 'policyId': 'policy'}
+
+
+def _respond(query):
+    if query.startswith('UPDATE'):
+        return [{'[applied]': True}]
+    if '"webhookKey"' in query:
+        return [_webhook_row]
+    return [_state_row]
+
+
+class TextClient(object):
+    """
+    Executes queries as text, like :class:`silverberg.client.CQLClient`
+    """
+    def __init__(self):
+        self.parsed = 0
+
+    def execute(self, query, params, consistency):
+        """
+        Substitute the parameters into the query, which Cassandra parses
+        """
+        prepare(query, params)
+        self.parsed += 1
+        return succeed(_respond(query))
+
+
+class PreparingClient(TextClient):
+    """
+    Also prepares queries, executing them with only their parameters
+    """
+    def prepare(self, query):
+        """
+        Cassandra parses the query once, returning its handle
+        """
+        self.parsed += 1
+        return succeed(query)
+
+    def execute_prepared(self, prepared, params, consistency):
+        """
+        Marshal the parameters, and execute the statement without parsing it
+        """
+        for value in params.itervalues():
+            marshal(value)
+        return succeed(_respond(prepared))
+
+
+def modify_state(collection, i):
+    """
+    Modify a group's state, writing it with a compare-and-set
+    """
+    group = collection.get_scaling_group(log, 'tenant', 'group')
+    return group.modify_state(lambda group, state: state)
+
+
+def webhook_info_by_hash(collection, i):
+    """
+    Look up a webhook that is not in the webhook cache
+    """
+    return collection.webhook_info_by_hash(log, 'hash{0}'.format(i))
+
+
+def run(args):
+    """
+    Print the statements parsed and the time taken per operation
+    """
+    set_config_data({'cassandra': {'state_concurrency': 'optimistic',
+                                   'webhook_cache': {'size': 1}}})
+    print "{0:<22}{1:<10}{2:>18}{3:>12}".format(
+        'operation', 'client', 'parsed per op', 'time (us)')
+    for operation in (modify_state, webhook_info_by_hash):
+        for client_class in (TextClient, PreparingClient):
+            client = client_class()
+            collection = CassScalingGroupCollection(client)
+            count = iter(xrange(10 ** 9))
+            timer = timeit.Timer(lambda: operation(collection, next(count)))
+            elapsed = min(timer.repeat(3, args.number))
+            print "{0:<22}{1:<10}{2:>18.3f}{3:>12.1f}".format(
+                operation.__name__, client_class.__name__[:-6].lower(),
+                float(client.parsed) / (3 * args.number),
+                elapsed * 1e6 / args.number)
+    set_config_data({})
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
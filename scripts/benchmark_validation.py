@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Times validating the example payloads in otter.json_schema.group_examples,
+making a new validator for each payload as jsonschema.validate does, and with
+the validators otter.json_schema keeps for each schema.
+"""
+
+import argparse
+import timeit
+
+import jsonschema
+
+from otter.json_schema import (format_checker, group_examples, group_schemas,
+                               rest_schemas, validate)
+
+
+the_parser = argparse.ArgumentParser(
+    description="Benchmark validating request bodies against their schemas.")
+
+the_parser.add_argument(
+    '--number', type=int, default=1000,
+    help='The number of times to validate each payload.  Default: 1000')
+
+
+def valid(examples, schema):
+    """
+    The examples that are valid against the schema.  Some examples, such as
+    policies scheduled at a time that has passed, stop being valid.
+    """
+    def is_valid(example):
+        try:
+            validate(example, schema)
+        except jsonschema.ValidationError:
+            return False
+        return True
+
+    return filter(is_valid, examples)
+
+
+def payloads():
+    """
+    The example payloads to validate, and the schemas to validate them against
+    """
+    policies = valid(group_examples.policy(), group_schemas.policy)
+    groups = [{'groupConfiguration': config,
+               'launchConfiguration': launch,
+               'scalingPolicies': policies}
+              for config in group_examples.config()
+              for launch in group_examples.launch_server_config()]
+    return [
+        ('group config', group_schemas.config, group_examples.config()),
+        ('launch config', group_schemas.launch_config,
+         group_examples.launch_server_config()),
+        ('policy', group_schemas.policy, policies),
+        ('create group request', rest_schemas.create_group_request, groups)
+    ]
+
+
+def uncached(example, schema):
+    """
+    Validate the way ``jsonschema.validate`` does
+    """
+    jsonschema.validate(example, schema, cls=jsonschema.Draft3Validator,
+                        format_checker=format_checker)
+
+
+def run(args):
+    """
+    Print the time taken to validate each kind of payload once, on average
+    """
+    print "{0:<22}{1:>16}{2:>16}{3:>10}".format(
+        'payload', 'uncached (us)', 'cached (us)', 'speedup')
+    for name, schema, examples in payloads():
+        times = []
+        for validate_example in (uncached, validate):
+            timer = timeit.Timer(
+                lambda: [validate_example(example, schema) for example in examples])
+            times.append(min(timer.repeat(3, args.number)) * 1e6 /
+                         (args.number * len(examples)))
+        print "{0:<22}{1:>16.1f}{2:>16.1f}{3:>9.1f}x".format(
+            name, times[0], times[1], times[0] / times[1])
+
+
+if __name__ == '__main__':
+    run(the_parser.parse_args())
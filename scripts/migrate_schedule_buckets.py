@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+Copies scheduled events from the scaling_schedule table into their buckets in
+the scaling_schedule_buckets table, recording the bucket and trigger of each
+in scaling_schedule_bucket_triggers.  Run this when switching an existing
+deployment to bucketed schedules (setting cassandra.schedule_buckets), with the
+same number of buckets.
+"""
+
+import argparse
+
+from cql.connection import connect
+
+from otter.models.cass import schedule_bucket
+
+
+the_parser = argparse.ArgumentParser(
+    description="Copy scheduled events into the bucketed schedule table.")
+
+the_parser.add_argument(
+    'buckets', type=int, metavar='buckets',
+    help='The number of buckets, as configured in cassandra.schedule_buckets')
+
+the_parser.add_argument(
+    '--keyspace', type=str, default='otter',
+    help='The name of the keyspace.  Default: otter')
+
+the_parser.add_argument(
+    '--host', type=str, default='localhost',
+    help='The host of the cluster to connect to. Default: localhost')
+
+the_parser.add_argument(
+    '--port', type=int, default=9160,
+    help='The port of the cluster to connect to. Default: 9160')
+
+the_parser.add_argument(
+    '--page-size', type=int, default=1000,
+    help='The number of events to read at a time. Default: 1000')
+
+the_parser.add_argument(
+    '--dry-run', action='store_true',
+    help="If this option is passed, no events are written.")
+
+the_parser.add_argument(
+    '--verbose', '-v', action='count', default=0, help="How verbose to be")
+
+
+_select = 'SELECT "tenantId", "groupId", "policyId", trigger, cron FROM scaling_schedule '
+
+
+def read_events(cursor, page_size):
+    """
+    Yield every event in the scaling_schedule table, reading ``page_size`` of
+    them at a time in token order of their policy ID.  A page can end part
+    way through the events of a policy, so the rest of them are read before
+    going on to the next policy.
+    """
+    # without a LIMIT, CQL 3 only returns the first 10000 rows
+    cursor.execute(_select + 'LIMIT :size;', {'size': page_size})
+    while True:
+        events = cursor.fetchall()
+        for event in events:
+            yield event
+        if len(events) < page_size:
+            return
+
+        policy_id, trigger = events[-1][2], events[-1][3]
+        cursor.execute(_select + 'WHERE "policyId" = :policyId AND trigger > :trigger;',
+                       {'policyId': policy_id, 'trigger': trigger})
+        for event in cursor.fetchall():
+            yield event
+
+        cursor.execute(_select + 'WHERE token("policyId") > token(:policyId) LIMIT :size;',
+                       {'policyId': policy_id, 'size': page_size})
+
+
+def run(args):
+    """
+    Copy every event of an existing policy into its bucket
+    """
+    if args.verbose > 0:
+        print "Attempting to connect to {0}:{1}".format(args.host, args.port)
+
+    connection = connect(args.host, args.port, cql_version='3.0.4')
+    cursor = connection.cursor()
+    cursor.execute('USE {0};'.format(args.keyspace), {})
+
+    # events are read with a cursor of their own, so that the queries made
+    # while copying them do not replace the page being read
+    reader = connection.cursor()
+    reader.execute('USE {0};'.format(args.keyspace), {})
+
+    copied = total = 0
+    for tenant_id, group_id, policy_id, trigger, cron in read_events(reader, args.page_size):
+        total += 1
+        cursor.execute('SELECT "policyId" FROM scaling_policies WHERE "tenantId" = :tenantId AND '
+                       '"groupId" = :groupId AND "policyId" = :policyId;',
+                       {'tenantId': tenant_id, 'groupId': group_id, 'policyId': policy_id})
+        if cursor.fetchone() is None:
+            if args.verbose > 1:
+                print "Skipping event of deleted policy {0}".format(policy_id)
+            continue
+
+        params = {'bucket': schedule_bucket(policy_id, args.buckets),
+                  'tenantId': tenant_id, 'groupId': group_id, 'policyId': policy_id,
+                  'trigger': trigger}
+        if cron:
+            params['cron'] = cron
+            query = ('INSERT INTO scaling_schedule_buckets(bucket, "tenantId", "groupId", '
+                     '"policyId", trigger, cron) VALUES (:bucket, :tenantId, '
+                     ':groupId, :policyId, :trigger, :cron) ')
+        else:
+            query = ('INSERT INTO scaling_schedule_buckets(bucket, "tenantId", "groupId", '
+                     '"policyId", trigger) VALUES (:bucket, :tenantId, '
+                     ':groupId, :policyId, :trigger) ')
+        query = ('BEGIN BATCH ' + query +
+                 'INSERT INTO scaling_schedule_bucket_triggers("policyId", bucket, trigger) '
+                 'VALUES (:policyId, :bucket, :trigger) APPLY BATCH;')
+
+        if args.verbose > 1:
+            print "Copying event of policy {0} to bucket {1}".format(policy_id, params['bucket'])
+        if not args.dry_run:
+            cursor.execute(query, params)
+        copied += 1
+
+    print "Copied {0} of {1} events".format(copied, total)
+
+    reader.close()
+    cursor.close()
+    connection.close()
+
+
+args = the_parser.parse_args()
+run(args)